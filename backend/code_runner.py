@@ -1,45 +1,420 @@
 import subprocess
 import tempfile
 import os
+import codecs
+import json
+import math
+import queue
+import select
+import selectors
+import signal
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 
-def run_code_safely(code: str) -> dict:
+from backend import code_worker, disk_cache, metrics
+
+DEFAULT_TIMEOUT = 15  # seconds, to prevent infinite loops
+PYTHON_EXECUTABLE = "python3"
+# Output kept per run; anything beyond this is read and discarded
+MAX_OUTPUT_BYTES = 1024 * 1024
+
+# Opt-in result cache for deterministic snippets
+CACHE_DIR = "data/code_cache"
+CACHE_BUDGET_BYTES = 64 * 1024 * 1024
+
+@metrics.timed()
+def run_code_safely(code: str, timeout: float = DEFAULT_TIMEOUT, use_pool: bool = False,
+                    use_cache: bool = False, max_output_bytes: int = MAX_OUTPUT_BYTES) -> dict:
     """
-    Runs Python code in a temporary file and captures the output.
+    Runs Python code in a separate process and captures the output.
     This provides a basic level of sandboxing.
 
     Args:
         code: A string containing the Python code to execute.
+        timeout: Wall-clock limit in seconds.
+        use_pool: Run on a pre-warmed worker from get_pool() instead of
+            spawning a fresh interpreter.
+        use_cache: Return the stored result if this exact code already ran
+            successfully on this interpreter (only for deterministic code).
+        max_output_bytes: Output beyond this is dropped.
 
     Returns:
         A dictionary with "stdout", "stderr", and "returncode".
     """
+    output = {"stdout": [], "stderr": []}
+    returncode = -1
+    for stream, data in stream_code(code, timeout, use_pool, use_cache, max_output_bytes):
+        if stream == "exit":
+            returncode = data
+        else:
+            output[stream].append(data)
+    return {
+        "stdout": "".join(output["stdout"]),
+        "stderr": "".join(output["stderr"]),
+        "returncode": returncode
+    }
+
+@metrics.timed()
+def stream_code(code: str, timeout: float = DEFAULT_TIMEOUT, use_pool: bool = False,
+                use_cache: bool = False, max_output_bytes: int = MAX_OUTPUT_BYTES):
+    """
+    Runs Python code and yields its output while it runs.
+
+    Yields:
+        ("stdout", text) and ("stderr", text) chunks as they are produced, then
+        ("exit", returncode) once. Arguments are the same as run_code_safely().
+    """
+    cache_key = _cache_key(code) if use_cache else None
+    if cache_key is not None:
+        cached = get_cache().get(cache_key)
+        if cached is not None:
+            result = json.loads(cached)
+            if result["stdout"]:
+                yield "stdout", result["stdout"]
+            if result["stderr"]:
+                yield "stderr", result["stderr"]
+            yield "exit", result["returncode"]
+            return
+
+    chunks = _stream_pool(code, timeout, max_output_bytes) if use_pool else \
+        _stream_subprocess(code, timeout, max_output_bytes)
+    if cache_key is None:
+        yield from chunks
+        return
+
+    # Keep a copy to store if the run succeeds
+    recorded = {"stdout": [], "stderr": []}
+    for stream, data in chunks:
+        if stream == "exit":
+            if data == 0:
+                get_cache().put(cache_key, json.dumps({
+                    "stdout": "".join(recorded["stdout"]),
+                    "stderr": "".join(recorded["stderr"]),
+                    "returncode": 0,
+                }).encode())
+        else:
+            recorded[stream].append(data)
+        yield stream, data
+
+def _stream_subprocess(code: str, timeout: float, max_output_bytes: int):
     # Create a temporary file to write the code to
+    filepath = None
+    process = None
     try:
         with tempfile.NamedTemporaryFile(mode='w', suffix='.py', delete=False) as tmp_file:
             filepath = tmp_file.name
             tmp_file.write(code)
-        
-        # Execute the python script as a separate process with a timeout
-        result = subprocess.run(
-            ['python3', filepath],
-            capture_output=True,
-            text=True,
-            timeout=15  # 15-second timeout to prevent infinite loops
+
+        # Execute the python script as a separate process; -u so output isn't held in buffers
+        process = subprocess.Popen(
+            [PYTHON_EXECUTABLE, "-u", filepath],
+            stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+            start_new_session=True,
         )
-        
-        # Clean up the temporary file
-        os.remove(filepath)
-        
-        return {
-            "stdout": result.stdout,
-            "stderr": result.stderr,
-            "returncode": result.returncode
-        }
+        names = {process.stdout.fileno(): "stdout", process.stderr.fileno(): "stderr"}
+        decoders = {fd: codecs.getincrementaldecoder("utf-8")(errors="replace") for fd in names}
+        selector = selectors.DefaultSelector()
+        for fd in names:
+            selector.register(fd, selectors.EVENT_READ)
+        deadline = time.monotonic() + timeout
+        output_bytes = 0
+        truncated = False
+        open_fds = len(names)
+        while open_fds:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                os.killpg(process.pid, signal.SIGKILL)
+                process.wait()
+                yield "stderr", f"Error: Code execution timed out after {timeout} seconds."
+                yield "exit", -1
+                return
+            for key, _ in selector.select(remaining):
+                data = os.read(key.fd, 65536)
+                if not data:
+                    selector.unregister(key.fd)
+                    open_fds -= 1
+                    continue
+                if output_bytes + len(data) > max_output_bytes:
+                    data = data[:max(0, max_output_bytes - output_bytes)]
+                    truncated = True
+                output_bytes += len(data)
+                text = decoders[key.fd].decode(data)
+                if text:
+                    yield names[key.fd], text
+        selector.close()
+        returncode = process.wait(timeout=max(0.1, deadline - time.monotonic()))
+        if truncated:
+            yield "stderr", f"\n[Output truncated after {max_output_bytes} bytes]"
+        yield "exit", returncode
     except subprocess.TimeoutExpired:
-        os.remove(filepath) # Ensure cleanup even on timeout
-        return {"stdout": "", "stderr": "Error: Code execution timed out after 15 seconds.", "returncode": -1}
+        os.killpg(process.pid, signal.SIGKILL)
+        process.wait()
+        yield "stderr", f"Error: Code execution timed out after {timeout} seconds."
+        yield "exit", -1
     except Exception as e:
-        # If the temp file was created, try to remove it
-        if 'filepath' in locals() and os.path.exists(filepath):
+        yield "stderr", f"An unexpected error occurred: {e}"
+        yield "exit", -1
+    finally:
+        # Stopped early (e.g. the page was left): don't leave the process running
+        if process is not None and process.poll() is None:
+            os.killpg(process.pid, signal.SIGKILL)
+            process.wait()
+        if process is not None:
+            process.stdout.close()
+            process.stderr.close()
+        # Clean up the temporary file
+        if filepath and os.path.exists(filepath):
             os.remove(filepath)
-        return {"stdout": "", "stderr": f"An unexpected error occurred: {e}", "returncode": -1}
\ No newline at end of file
+
+def _stream_pool(code: str, timeout: float, max_output_bytes: int):
+    return get_pool().stream(code, timeout=timeout, max_output_bytes=max_output_bytes)
+
+# --- Result cache ---
+
+_interpreter_version = None
+_cache = None
+
+def _cache_key(code: str) -> str:
+    global _interpreter_version
+    if _interpreter_version is None:
+        _interpreter_version = subprocess.run(
+            [PYTHON_EXECUTABLE, "-c", "import sys; print(sys.version)"],
+            capture_output=True, text=True, timeout=30,
+        ).stdout.strip()
+    return disk_cache.make_key("code", _interpreter_version, code)
+
+def get_cache() -> disk_cache.DiskCache:
+    global _cache
+    if _cache is None:
+        _cache = disk_cache.DiskCache(CACHE_DIR, CACHE_BUDGET_BYTES, suffix=".json")
+    return _cache
+
+# --- Pre-warmed worker pool ---
+
+class CodeWorker:
+    """One long-lived worker process (see code_worker.py) and its pipes."""
+
+    def __init__(self, preload=(), python: str = PYTHON_EXECUTABLE):
+        self.process = subprocess.Popen(
+            [python, code_worker.__file__, "--preload", ",".join(preload)],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+            bufsize=0,  # unbuffered, so select() on stdout sees every pending message
+        )
+        self.jobs_done = 0
+        ready = self._read(timeout=60)
+        if not ready or not ready.get("ready"):
+            self.kill()
+            raise RuntimeError("Code worker failed to start")
+
+    def _read(self, timeout: float):
+        readable, _, _ = select.select([self.process.stdout], [], [], timeout)
+        if not readable:
+            return None
+        return code_worker.read_message(self.process.stdout)
+
+    def run(self, job: dict) -> dict:
+        code_worker.write_message(self.process.stdin, job)
+        # The worker enforces the job timeout itself; this only guards against a stuck worker
+        result = self._read(timeout=job["timeout"] + 10)
+        if result is None:
+            raise RuntimeError("Code worker stopped responding")
+        self.jobs_done += 1
+        return result
+
+    def stream(self, job: dict):
+        """Like run(), for a job with "stream": True: yields the output messages, then the result."""
+        code_worker.write_message(self.process.stdin, job)
+        deadline = time.monotonic() + job["timeout"] + 10
+        while True:
+            message = self._read(timeout=max(0.0, deadline - time.monotonic()))
+            if message is None:
+                raise RuntimeError("Code worker stopped responding")
+            if "stream" not in message:
+                self.jobs_done += 1
+            yield message
+            if "stream" not in message:
+                return
+
+    def alive(self) -> bool:
+        return self.process.poll() is None
+
+    def kill(self):
+        if self.alive():
+            self.process.kill()
+        self.process.wait()
+
+    def close(self):
+        try:
+            self.process.stdin.close()  # EOF tells the worker to exit
+            self.process.wait(timeout=2)
+        except Exception:
+            self.kill()
+
+
+class WorkerPool:
+    """
+    A pool of pre-started interpreter processes for running snippets.
+
+    Each worker imports `preload` once at start-up and then forks a fresh child
+    per job, so snippets skip interpreter startup and those imports but can't
+    see each other's state. Jobs run under a wall-clock timeout, a CPU-time
+    limit of ceil(timeout) + 1 seconds (so only a snippet that outlives its
+    timeout can hit it) and an optional address-space limit. A worker is
+    replaced after `max_jobs_per_worker` jobs or as soon as it crashes.
+
+    Args:
+        size: Number of workers (and of snippets that can run in parallel).
+        preload: Module names to import in every worker.
+        max_jobs_per_worker: Recycle a worker after this many jobs.
+        cpu_seconds: Upper bound on the per-job RLIMIT_CPU (None = the job's timeout only).
+        memory_mb: RLIMIT_AS per job (None = no limit; not enforced on macOS).
+    """
+
+    def __init__(self, size: int = 2, preload=(), max_jobs_per_worker: int = 100,
+                 cpu_seconds: int | None = None, memory_mb: int | None = 1024):
+        self.size = size
+        self.preload = tuple(preload)
+        self.max_jobs_per_worker = max_jobs_per_worker
+        self.cpu_seconds = cpu_seconds
+        self.memory_mb = memory_mb
+        self._idle = queue.Queue()
+        self._executor = ThreadPoolExecutor(max_workers=size, thread_name_prefix="code-pool")
+        self._closed = False
+        self.workers_started = 0
+        # Start the workers in the background so creating the pool doesn't block
+        for _ in range(size):
+            threading.Thread(target=self._add_worker, daemon=True).start()
+
+    def _add_worker(self):
+        try:
+            worker = CodeWorker(self.preload)
+        except Exception as e:
+            print(f"Error starting code worker: {e}")
+            self._idle.put(None)  # lets a waiting caller retry instead of hanging
+            return
+        self.workers_started += 1
+        self._idle.put(worker)
+
+    def _checkout(self) -> CodeWorker:
+        while True:
+            worker = self._idle.get()
+            if worker is not None and worker.alive():
+                return worker
+            if worker is not None:
+                worker.kill()
+            # Dead or failed worker: start a replacement on this thread
+            worker = CodeWorker(self.preload)
+            self.workers_started += 1
+            return worker
+
+    def _job(self, code, timeout, max_output_bytes, stream=False) -> dict:
+        if self._closed:
+            raise RuntimeError("Worker pool is closed")
+        cpu_seconds = math.ceil(timeout) + 1
+        if self.cpu_seconds is not None:
+            cpu_seconds = min(cpu_seconds, self.cpu_seconds)
+        return {"code": code, "timeout": timeout, "cpu_seconds": cpu_seconds,
+                "memory_mb": self.memory_mb, "max_output_bytes": max_output_bytes, "stream": stream}
+
+    def _release(self, worker: CodeWorker, healthy: bool = True):
+        if not healthy:
+            worker.kill()
+            threading.Thread(target=self._add_worker, daemon=True).start()
+        elif worker.jobs_done >= self.max_jobs_per_worker:
+            worker.close()
+            threading.Thread(target=self._add_worker, daemon=True).start()
+        else:
+            self._idle.put(worker)
+
+    @staticmethod
+    def _epilogue(result: dict, job: dict) -> tuple[str, int]:
+        """Extra stderr text and the returncode to report for a finished job."""
+        if result.get("timed_out"):
+            return f"Error: Code execution timed out after {job['timeout']} seconds.", -1
+        if result["returncode"] == -signal.SIGXCPU:
+            return f"Error: Code execution exceeded its CPU time limit of {job['cpu_seconds']} seconds.", result["returncode"]
+        if result.get("truncated"):
+            return f"\n[Output truncated after {job['max_output_bytes']} bytes]", result["returncode"]
+        return "", result["returncode"]
+
+    def run(self, code: str, timeout: float = DEFAULT_TIMEOUT,
+            max_output_bytes: int = MAX_OUTPUT_BYTES) -> dict:
+        """Runs one snippet on a worker. Same result format as run_code_safely()."""
+        job = self._job(code, timeout, max_output_bytes)
+        try:
+            worker = self._checkout()
+        except Exception as e:
+            return {"stdout": "", "stderr": f"An unexpected error occurred: {e}", "returncode": -1}
+        try:
+            result = worker.run(job)
+        except Exception as e:
+            self._release(worker, healthy=False)
+            return {"stdout": "", "stderr": f"An unexpected error occurred: code worker crashed ({e})", "returncode": -1}
+        self._release(worker)
+        extra_stderr, returncode = self._epilogue(result, job)
+        return {"stdout": result["stdout"], "stderr": result["stderr"] + extra_stderr, "returncode": returncode}
+
+    def stream(self, code: str, timeout: float = DEFAULT_TIMEOUT,
+               max_output_bytes: int = MAX_OUTPUT_BYTES):
+        """Runs one snippet on a worker, yielding output like code_runner.stream_code()."""
+        job = self._job(code, timeout, max_output_bytes, stream=True)
+        try:
+            worker = self._checkout()
+        except Exception as e:
+            yield "stderr", f"An unexpected error occurred: {e}"
+            yield "exit", -1
+            return
+        result = None
+        try:
+            for message in worker.stream(job):
+                if "stream" in message:
+                    yield message["stream"], message["data"]
+                else:
+                    result = message
+        except Exception as e:
+            yield "stderr", f"An unexpected error occurred: code worker crashed ({e})"
+            yield "exit", -1
+            return
+        finally:
+            # A worker abandoned mid-job (error, or the caller stopped reading) is out of sync
+            self._release(worker, healthy=result is not None)
+        extra_stderr, returncode = self._epilogue(result, job)
+        if extra_stderr:
+            yield "stderr", extra_stderr
+        yield "exit", returncode
+
+    def submit(self, code: str, timeout: float = DEFAULT_TIMEOUT):
+        """Runs a snippet in the background and returns a Future of its result dict."""
+        return self._executor.submit(self.run, code, timeout)
+
+    def run_many(self, snippets: list[str], timeout: float = DEFAULT_TIMEOUT) -> list[dict]:
+        """Runs several snippets in parallel (up to `size` at a time), results in order."""
+        return [future.result() for future in [self.submit(code, timeout) for code in snippets]]
+
+    def close(self):
+        self._closed = True
+        self._executor.shutdown(wait=True)
+        while True:
+            try:
+                worker = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            if worker is not None:
+                worker.close()
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_pool() -> WorkerPool:
+    """
+    Returns the shared worker pool, starting it on first use. Configured with
+    SAHILGPT_CODE_POOL_SIZE and SAHILGPT_CODE_PRELOAD (comma-separated modules).
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            preload = [m for m in os.environ.get("SAHILGPT_CODE_PRELOAD", "").split(",") if m]
+            _pool = WorkerPool(size=int(os.environ.get("SAHILGPT_CODE_POOL_SIZE", "2")), preload=preload)
+        return _pool
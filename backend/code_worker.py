@@ -0,0 +1,200 @@
+"""
+A pre-warmed worker process for code_runner.WorkerPool.
+
+Run as `python3 code_worker.py [--preload mod1,mod2]`. The worker imports the
+preload modules once, then reads jobs from stdin and writes results to
+stdout, each as a 4-byte big-endian length followed by a JSON object (jobs
+with "stream": true also get one message per output chunk). Every
+job runs in a child forked from the worker, so it starts with the modules
+already imported but can't change the worker's state, and it gets its own
+CPU, memory and wall-clock limits.
+"""
+import argparse
+import codecs
+import importlib
+import json
+import os
+import resource
+import selectors
+import signal
+import struct
+import sys
+import time
+import traceback
+
+
+def _read_exact(stream, size: int) -> bytes:
+    # Unbuffered pipes can return fewer bytes than asked for
+    data = b""
+    while len(data) < size:
+        chunk = stream.read(size - len(data))
+        if not chunk:
+            break
+        data += chunk
+    return data
+
+
+def read_message(stream):
+    header = _read_exact(stream, 4)
+    if len(header) < 4:
+        return None
+    (length,) = struct.unpack(">I", header)
+    return json.loads(_read_exact(stream, length))
+
+
+def write_message(stream, message: dict):
+    body = json.dumps(message).encode()
+    stream.write(struct.pack(">I", len(body)) + body)
+    stream.flush()
+
+
+def _run_child(code: str, cpu_seconds, memory_mb, out_w: int, err_w: int):
+    """Runs in the forked child; never returns."""
+    os.setsid()  # own process group, so a timeout can kill anything it spawns
+    if cpu_seconds:
+        resource.setrlimit(resource.RLIMIT_CPU, (cpu_seconds, cpu_seconds + 1))
+    if memory_mb:
+        limit = int(memory_mb * 1024 * 1024)
+        try:
+            resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+        except (ValueError, OSError):
+            pass  # not enforceable on every platform (e.g. macOS)
+    devnull = os.open(os.devnull, os.O_RDONLY)
+    os.dup2(devnull, 0)
+    os.dup2(out_w, 1)
+    os.dup2(err_w, 2)
+    # The fork inherits every descriptor of the worker, the protocol streams
+    # included; a snippet must see nothing but its own stdin/stdout/stderr
+    os.closerange(3, os.sysconf("SC_OPEN_MAX"))
+    sys.stdin = open(0, "r", closefd=False)
+    sys.stdout = open(1, "w", buffering=1, closefd=False)
+    sys.stderr = open(2, "w", buffering=1, closefd=False)
+    sys.argv = ["<snippet>"]
+
+    returncode = 0
+    try:
+        exec(compile(code, "<snippet>", "exec"), {"__name__": "__main__", "__builtins__": __builtins__})
+    except SystemExit as e:
+        if e.code is None:
+            returncode = 0
+        elif isinstance(e.code, int):
+            returncode = e.code
+        else:
+            print(e.code, file=sys.stderr)
+            returncode = 1
+    except BaseException as e:
+        # Skip this function's frame so the traceback starts at the snippet
+        traceback.print_exception(type(e), e, e.__traceback__.tb_next)
+        returncode = 1
+    try:
+        sys.stdout.flush()
+        sys.stderr.flush()
+    finally:
+        os._exit(returncode)
+
+
+def run_job(job: dict, emit=None) -> dict:
+    """
+    Runs one job in a forked child and returns its result. With `emit`, output
+    is passed on as {"stream": "stdout"|"stderr", "data": text} messages while
+    the job runs instead of being collected into the result. At most
+    job["max_output_bytes"] bytes of output are kept or emitted; the rest is
+    read and dropped so the child never blocks on a full pipe.
+    """
+    timeout = job.get("timeout") or 15
+    max_output = job.get("max_output_bytes")
+    out_r, out_w = os.pipe()
+    err_r, err_w = os.pipe()
+    start = time.perf_counter()
+    pid = os.fork()
+    if pid == 0:
+        os.close(out_r)
+        os.close(err_r)
+        _run_child(job["code"], job.get("cpu_seconds"), job.get("memory_mb"), out_w, err_w)
+    os.close(out_w)
+    os.close(err_w)
+
+    names = {out_r: "stdout", err_r: "stderr"}
+    decoders = {fd: codecs.getincrementaldecoder("utf-8")(errors="replace") for fd in names}
+    collected = {"stdout": [], "stderr": []}
+    output_bytes = 0
+    truncated = False
+    selector = selectors.DefaultSelector()
+    selector.register(out_r, selectors.EVENT_READ)
+    selector.register(err_r, selectors.EVENT_READ)
+    deadline = start + timeout
+    timed_out = False
+    open_fds = 2
+    while open_fds:
+        remaining = deadline - time.perf_counter()
+        if remaining <= 0:
+            timed_out = True
+            break
+        for key, _ in selector.select(remaining):
+            data = os.read(key.fd, 65536)
+            if not data:
+                selector.unregister(key.fd)
+                open_fds -= 1
+                continue
+            if max_output is not None and output_bytes + len(data) > max_output:
+                data = data[:max(0, max_output - output_bytes)]
+                truncated = True
+            output_bytes += len(data)
+            text = decoders[key.fd].decode(data)
+            if not text:
+                continue
+            if emit is not None:
+                emit({"stream": names[key.fd], "data": text})
+            else:
+                collected[names[key.fd]].append(text)
+
+    if timed_out:
+        try:
+            os.killpg(pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+    _, status = os.waitpid(pid, 0)
+    selector.close()
+    os.close(out_r)
+    os.close(err_r)
+
+    returncode = -os.WTERMSIG(status) if os.WIFSIGNALED(status) else os.WEXITSTATUS(status)
+    return {
+        "stdout": "".join(collected["stdout"]),
+        "stderr": "".join(collected["stderr"]),
+        "returncode": returncode,
+        "timed_out": timed_out,
+        "truncated": truncated,
+        "duration": time.perf_counter() - start,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--preload", default="", help="comma-separated modules to import up front")
+    args = parser.parse_args()
+
+    # Keep the protocol streams private; stray prints from preloaded modules go nowhere
+    requests_in = os.fdopen(os.dup(0), "rb")
+    results_out = os.fdopen(os.dup(1), "wb")
+    devnull = os.open(os.devnull, os.O_RDWR)
+    os.dup2(devnull, 0)
+    os.dup2(devnull, 1)
+
+    for name in filter(None, (m.strip() for m in args.preload.split(","))):
+        try:
+            importlib.import_module(name)
+        except Exception as e:
+            print(f"code_worker: could not preload {name}: {e}", file=sys.stderr)
+
+    write_message(results_out, {"ready": True, "pid": os.getpid()})
+    while True:
+        job = read_message(requests_in)
+        if job is None:
+            return
+        emit = (lambda message: write_message(results_out, message)) if job.get("stream") else None
+        write_message(results_out, run_job(job, emit))
+
+
+if __name__ == "__main__":
+    main()
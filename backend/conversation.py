@@ -0,0 +1,221 @@
+import os
+import threading
+import time
+
+from backend import llm_client, llm_utils, metrics
+from backend.llm_utils import estimate_tokens
+
+# Multi-turn chat on Ollama's /api/chat.
+#
+# Ollama keeps the KV cache of recent prompts and only evaluates what comes
+# after the longest cached prefix, so a conversation is cheap to continue as
+# long as the front of the prompt doesn't change. A window that drops the
+# oldest turn every turn would shift the whole prompt and make Ollama
+# re-evaluate all of it on every turn. Instead the window grows until it
+# passes the token budget, then a block of old turns is handed to a background
+# summarization and, once the summary is ready, dropped at once; the summary
+# goes into the system message. Between compactions the prefix stays the same.
+# The summary request is only sent once the turn's reply has finished: on a
+# single-slot Ollama it would otherwise run first and delay that reply.
+
+DEFAULT_SYSTEM = "You are SAHILGPT, a helpful AI assistant running locally on the user's computer."
+TOKEN_BUDGET = int(os.environ.get("SAHILGPT_CHAT_TOKEN_BUDGET", 3000))  # window size that triggers a compaction
+KEEP_FRACTION = 0.5   # share of the budget kept verbatim after a compaction
+HARD_LIMIT = 1.25     # x budget: past this, old turns are dropped even if their summary isn't ready
+SUMMARY_TOKENS = 256  # num_predict for a summary
+# None uses the client's keep_alive (llm_client.DEFAULT_KEEP_ALIVE)
+KEEP_ALIVE = os.environ.get("SAHILGPT_CHAT_KEEP_ALIVE")
+
+SUMMARY_PROMPT = (
+    "Summarize the conversation below between a user and an AI assistant in a few sentences. "
+    "Keep names, facts, decisions and open questions; the summary replaces the original turns.\n\n"
+    "Summary so far:\n{summary}\n\nNew turns:\n{turns}\n\nUpdated summary:"
+)
+
+
+class Conversation:
+    """
+    One chat thread: the full history, the window sent to the model and a
+    rolling summary of the turns that left the window.
+
+    Args:
+        system: System prompt.
+        model, options, keep_alive: Passed to every /api/chat request
+            (None = the client's defaults).
+        token_budget: Estimated tokens (system + summary + window) at which
+            older turns are summarized and dropped.
+        summarize: False drops old turns without summarizing them.
+        use_cache: Reuse the stored reply when the same window was sent
+            before (see llm_cache; needs deterministic options).
+    """
+
+    def __init__(self, system: str = DEFAULT_SYSTEM, model: str | None = None, options: dict | None = None,
+                 keep_alive=KEEP_ALIVE, token_budget: int = TOKEN_BUDGET, summarize: bool = True,
+                 use_cache: bool = False):
+        self.system = system
+        self.model = model
+        self.options = options
+        self.keep_alive = keep_alive
+        self.token_budget = token_budget
+        self.summarize = summarize
+        self.use_cache = use_cache
+        self.messages = []      # every {"role", "content"} of the conversation
+        self.start = 0          # messages[start:] are sent verbatim
+        self.summary = ""       # covers messages[:start]
+        self.turns = []         # per-turn stats, see stream()
+        self._summarizing = None  # thread summarizing messages[start:end]
+        self._due = None          # (end, summary, messages, generation) to summarize after the reply
+        self._ready = None        # (end, summary) waiting to be applied
+        self._generation = 0      # bumped by reset() so a late summary is discarded
+        self._lock = threading.Lock()
+
+    # --- Window ---
+
+    def _system_message(self) -> dict:
+        content = self.system
+        if self.summary:
+            content += f"\n\nSummary of the earlier conversation:\n{self.summary}"
+        return {"role": "system", "content": content}
+
+    def _tokens(self, start: int) -> int:
+        return (estimate_tokens(self._system_message()["content"])
+                + sum(estimate_tokens(m["content"]) for m in self.messages[start:]))
+
+    def window_tokens(self) -> int:
+        with self._lock:
+            return self._tokens(self.start)
+
+    def _cut_point(self) -> int:
+        """First message to keep so the window fits KEEP_FRACTION of the budget (at a user turn, never the newest)."""
+        target = self.token_budget * KEEP_FRACTION
+        last = len(self.messages) - 1
+        for i in range(self.start + 1, last + 1):
+            if self.messages[i]["role"] == "user" and self._tokens(i) <= target:
+                return i
+        return last
+
+    def _compact(self):
+        """Called with the lock held, after the user's message was appended."""
+        if self._ready is not None:
+            end, summary = self._ready
+            self._ready = None
+            self.summary = summary
+            self.start = max(self.start, end)
+        tokens = self._tokens(self.start)
+        if tokens <= self.token_budget:
+            return
+        end = self._cut_point()
+        if end <= self.start:
+            return
+        if self.summarize and self._summarizing is None:
+            self._due = (end, self.summary, self.messages[self.start:end], self._generation)
+        if not self.summarize or tokens > self.token_budget * HARD_LIMIT:
+            # The summary is late (or off): don't let the window outgrow the model's context
+            if self.summarize:
+                print(f"Conversation: dropping {end - self.start} messages before their summary is ready")
+            self.start = end
+
+    def _start_summary(self):
+        """Called with the lock held once the reply is complete: starts the summary _compact asked for."""
+        due, self._due = self._due, None
+        if due is None or self._summarizing is not None or due[0] > len(self.messages):
+            return
+        self._summarizing = threading.Thread(target=self._summarize, args=due, name="conversation-summary",
+                                             daemon=True)
+        self._summarizing.start()
+
+    def _summarize(self, end: int, summary: str, messages: list[dict], generation: int):
+        turns = "\n".join(f"{m['role'].capitalize()}: {m['content']}" for m in messages)
+        prompt = SUMMARY_PROMPT.format(summary=summary or "(none)", turns=turns)
+        try:
+            with metrics.timer("conversation.summarize"):
+                reply = llm_client.get_client().generate(
+                    prompt, model=self.model, keep_alive=self.keep_alive,
+                    options={**(self.options or {}), "num_predict": SUMMARY_TOKENS})
+            new_summary = reply.get("response", "").strip()
+        except Exception as e:
+            print(f"Conversation summary failed: {e}")
+            new_summary = ""
+        with self._lock:
+            if generation != self._generation:
+                return
+            if new_summary:
+                self._ready = (end, new_summary)
+            self._summarizing = None
+
+    def wait_for_summary(self, timeout: float | None = None):
+        """Blocks until a running summarization has finished (for tests and benchmarks)."""
+        thread = self._summarizing
+        if thread is not None:
+            thread.join(timeout)
+
+    def request_messages(self, context: str | None = None) -> list[dict]:
+        """The messages the next request sends; context is put in front of the newest user message."""
+        with self._lock:
+            messages = [self._system_message()] + self.messages[self.start:]
+        if context and messages[-1]["role"] == "user":
+            messages[-1] = {"role": "user", "content": f"{context}\n\n{messages[-1]['content']}"}
+        return messages
+
+    # --- Turns ---
+
+    def stream(self, text: str, stats: dict | None = None, context: str | None = None):
+        """
+        Sends the user's message with the conversation so far and yields the
+        reply's tokens (errors are yielded as text, like
+        llm_utils.stream_llm_response). The reply is added to the history
+        when the stream ends, also if it is closed early.
+
+        Args:
+            text: The user's message, as kept in the history.
+            stats: Optional dict filled like stream_llm_response's, plus
+                "window_tokens" and "summarized" (messages covered by the summary).
+            context: Extra text for this turn only (e.g. recalled memories).
+                It isn't kept in the history, so it doesn't grow the window
+                (the next turn re-evaluates this one message without it).
+        """
+        if stats is None:
+            stats = {}
+        with self._lock:
+            self.messages.append({"role": "user", "content": text})
+            self._compact()
+            stats["window_tokens"] = self._tokens(self.start)
+            stats["summarized"] = self.start
+        reply = []
+        try:
+            for token in llm_utils.stream_chat(self.request_messages(context), stats, use_cache=self.use_cache,
+                                               model=self.model, options=self.options, keep_alive=self.keep_alive):
+                if not stats.get("error"):
+                    reply.append(token)
+                yield token
+        finally:
+            with self._lock:
+                if not reply:
+                    # Nothing came back (an error, or closed before the first token): forget
+                    # the turn so the history keeps alternating and doesn't resend an empty reply
+                    self.messages.pop()
+                    self.start = min(self.start, len(self.messages))
+                else:
+                    self.messages.append({"role": "assistant", "content": "".join(reply).strip()})
+                self._start_summary()
+                self.turns.append({
+                    "time": time.time(), "window_tokens": stats["window_tokens"],
+                    "prompt_eval_count": stats.get("prompt_eval_count"),
+                    "prompt_eval_time": stats.get("prompt_eval_time"), "ttft": stats.get("ttft"),
+                    "summarized": stats["summarized"], "error": stats.get("error"),
+                })
+
+    def send(self, text: str, stats: dict | None = None, context: str | None = None) -> str:
+        """Non-streaming stream(): returns the whole reply."""
+        return "".join(self.stream(text, stats, context)).strip()
+
+    def reset(self):
+        with self._lock:
+            self.messages.clear()
+            self.turns.clear()
+            self.start = 0
+            self.summary = ""
+            self._ready = None
+            self._summarizing = None
+            self._due = None
+            self._generation += 1
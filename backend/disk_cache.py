@@ -0,0 +1,126 @@
+import hashlib
+import os
+import threading
+
+
+def make_key(*parts) -> str:
+    """SHA-256 hex digest of the parts (converted to str), separated so ("ab", "c") != ("a", "bc")."""
+    digest = hashlib.sha256()
+    for part in parts:
+        data = part if isinstance(part, bytes) else str(part).encode("utf-8")
+        digest.update(len(data).to_bytes(8, "little"))
+        digest.update(data)
+    return digest.hexdigest()
+
+
+class DiskCache:
+    """
+    A directory of content-addressed files with a total size budget.
+
+    Entries are stored as <directory>/<key[:2]>/<key><suffix>. Reading an entry
+    bumps its mtime, and when the directory grows past budget_bytes the entries
+    with the oldest mtime are deleted first (LRU). Keys are usually make_key()
+    digests of everything that determines the cached value.
+    """
+
+    def __init__(self, directory: str, budget_bytes: int, suffix: str = ".bin"):
+        self.directory = directory
+        self.budget_bytes = budget_bytes
+        self.suffix = suffix
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._size = None  # computed on first write
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], key + self.suffix)
+
+    def get_path(self, key: str) -> str | None:
+        """Returns the entry's file path (and marks it as recently used), or None."""
+        path = self.path(key)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return path
+
+    def get(self, key: str) -> bytes | None:
+        path = self.get_path(key)
+        if path is None:
+            return None
+        try:
+            with open(path, "rb") as f:
+                return f.read()
+        except FileNotFoundError:  # evicted in between
+            return None
+
+    def put(self, key: str, data: bytes) -> str:
+        """Stores data under key (atomically) and returns the file path."""
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        with self._lock:
+            old_size = os.path.getsize(path) if os.path.exists(path) else 0
+            os.replace(tmp_path, path)
+            if self._size is None:
+                self._size = self._scan_size()
+            else:
+                self._size += len(data) - old_size
+            if self._size > self.budget_bytes:
+                self._evict(keep=path)
+        return path
+
+    def delete(self, key: str):
+        path = self.path(key)
+        with self._lock:
+            try:
+                size = os.path.getsize(path)
+                os.remove(path)
+            except FileNotFoundError:
+                return
+            if self._size is not None:
+                self._size -= size
+
+    def _entries(self):
+        for shard in os.scandir(self.directory):
+            if not shard.is_dir():
+                continue
+            for entry in os.scandir(shard.path):
+                if entry.name.endswith(self.suffix):
+                    stat = entry.stat()
+                    yield entry.path, stat.st_mtime, stat.st_size
+
+    def _scan_size(self) -> int:
+        return sum(size for _, _, size in self._entries())
+
+    def _evict(self, keep: str | None = None):
+        entries = sorted(self._entries(), key=lambda e: e[1])
+        total = sum(size for _, _, size in entries)
+        for path, _, size in entries:
+            if total <= self.budget_bytes:
+                break
+            if path == keep:
+                continue
+            try:
+                os.remove(path)
+                self.evictions += 1
+                total -= size
+            except FileNotFoundError:
+                pass
+        self._size = total
+
+    def size_bytes(self) -> int:
+        with self._lock:
+            if self._size is None:
+                self._size = self._scan_size()
+            return self._size
+
+    def stats(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+                "size_bytes": self.size_bytes(), "budget_bytes": self.budget_bytes}
@@ -0,0 +1,180 @@
+import time
+from collections import deque
+
+import numpy as np
+
+from backend import face_utils
+from backend.model_registry import registry
+
+# Defaults for live login
+DEFAULT_DOWNSCALE = 0.5        # detect on a half-resolution frame
+DEFAULT_DETECTOR = "hog"       # "hog" (fast on CPU) or "cnn" (more robust, needs a GPU to be live)
+DEFAULT_KEYFRAME_INTERVAL = 5  # run the detector every Nth processed frame, track in between
+DEFAULT_WINDOW = 7             # frames considered by the vote
+DEFAULT_MIN_VOTES = 4          # matching frames in the window needed to accept
+DEFAULT_REJECT_AFTER = 45      # processed frames without a decision before rejecting
+
+
+def prepare_frame(frame_bgr: np.ndarray) -> np.ndarray:
+    """
+    Mirrors a BGR frame and converts it to RGB in one step, without copying.
+    The result is a strided view; slice it down before making it contiguous.
+    """
+    return frame_bgr[:, ::-1, ::-1]
+
+
+def downscale(image: np.ndarray, factor: float) -> tuple[np.ndarray, int]:
+    """
+    Shrinks an image by an integer stride (nearest neighbour) and returns a
+    contiguous copy plus the stride, so boxes can be mapped back with `* step`.
+    """
+    step = max(1, int(round(1 / factor))) if factor and factor < 1 else 1
+    return np.ascontiguousarray(image[::step, ::step]), step
+
+
+def _face_recognition_detector(image, model):
+    return registry.get(face_utils.FACE_MODELS_NAME).face_locations(image, model=model)
+
+
+def _face_recognition_encoder(image, boxes):
+    return registry.get(face_utils.FACE_MODELS_NAME).face_encodings(image, boxes)
+
+
+class LiveFaceVerifier:
+    """
+    Verifies a face over a stream of webcam frames.
+
+    Per processed frame: mirror + BGR->RGB as a view, detect on a downscaled
+    copy only on keyframes (the last face box is reused in between), encode a
+    full-resolution crop around the box and match it against the cached
+    gallery. The accept/reject decision is a vote over the last `window`
+    frames, so one blurry or lucky frame doesn't decide a login.
+
+    Args:
+        downscale: Scale applied before detection (0.5 = half width/height).
+        detector: "hog" or "cnn", passed to face_recognition.face_locations.
+        keyframe_interval: Run the detector every N processed frames (1 = always).
+        frame_skip: Only process every Nth submitted frame (1 = all).
+        window: Number of recent votes considered.
+        min_votes: Matching votes in the window needed to accept.
+        reject_after: Processed frames without acceptance before rejecting.
+        tolerance: Maximum gallery distance that counts as a match.
+        detect_fn / encode_fn: Replacements for the face_recognition calls
+            (used by the benchmark's stand-ins).
+    """
+
+    def __init__(self, downscale: float = DEFAULT_DOWNSCALE, detector: str = DEFAULT_DETECTOR,
+                 keyframe_interval: int = DEFAULT_KEYFRAME_INTERVAL, frame_skip: int = 1,
+                 window: int = DEFAULT_WINDOW, min_votes: int = DEFAULT_MIN_VOTES,
+                 reject_after: int = DEFAULT_REJECT_AFTER,
+                 tolerance: float = face_utils.MATCH_TOLERANCE,
+                 detect_fn=None, encode_fn=None, gallery=None):
+        if detector not in ("hog", "cnn"):
+            raise ValueError("detector must be 'hog' or 'cnn'")
+        self.downscale = downscale
+        self.detector = detector
+        self.keyframe_interval = max(1, keyframe_interval)
+        self.frame_skip = max(1, frame_skip)
+        self.window = window
+        self.min_votes = min_votes
+        self.reject_after = reject_after
+        self.tolerance = tolerance
+        self.detect_fn = detect_fn or _face_recognition_detector
+        self.encode_fn = encode_fn or _face_recognition_encoder
+        self.gallery = gallery or face_utils.gallery
+        self.reset()
+
+    def reset(self):
+        """Forgets the tracked face and all votes (e.g. when a new login attempt starts)."""
+        self.votes = deque(maxlen=self.window)
+        self.box = None
+        self.frames_seen = 0
+        self.frames_processed = 0
+        self.since_keyframe = 0
+        self.decision = None
+        self.identity = None
+        self.started_at = None
+        self.decided_at = None
+
+    def _detect(self, rgb: np.ndarray):
+        small, step = downscale(rgb, self.downscale)
+        boxes = self.detect_fn(small, self.detector)
+        if not boxes:
+            return None
+        # Largest face wins; map back to full-resolution coordinates
+        top, right, bottom, left = max(boxes, key=lambda b: (b[2] - b[0]) * (b[1] - b[3]))
+        return (top * step, right * step, bottom * step, left * step)
+
+    def _encode(self, rgb: np.ndarray, box):
+        # Only the region around the face is copied out of the full-res view
+        top, right, bottom, left = box
+        height, width = rgb.shape[:2]
+        pad = (bottom - top) // 4
+        y0, y1 = max(0, top - pad), min(height, bottom + pad)
+        x0, x1 = max(0, left - pad), min(width, right + pad)
+        crop = np.ascontiguousarray(rgb[y0:y1, x0:x1])
+        encodings = self.encode_fn(crop, [(top - y0, right - x0, bottom - y0, left - x0)])
+        return encodings[0] if len(encodings) else None
+
+    def process(self, frame_bgr: np.ndarray) -> dict:
+        """
+        Feeds one BGR frame. Returns a dict with "processed", "keyframe",
+        "face" (bool), "identity", "distance", "vote" and "decision"
+        ("accept", "reject" or None while undecided).
+        """
+        if self.started_at is None:
+            self.started_at = time.perf_counter()
+        self.frames_seen += 1
+        result = {"processed": False, "keyframe": False, "face": False, "identity": None,
+                  "distance": None, "vote": None, "decision": self.decision}
+        if self.decision is not None or (self.frames_seen - 1) % self.frame_skip:
+            return result
+
+        self.frames_processed += 1
+        result["processed"] = True
+        rgb = prepare_frame(frame_bgr)
+
+        if self.box is None or self.since_keyframe >= self.keyframe_interval - 1:
+            self.box = self._detect(rgb)
+            self.since_keyframe = 0
+            result["keyframe"] = True
+        else:
+            self.since_keyframe += 1
+
+        match = None
+        if self.box is not None:
+            result["face"] = True
+            encoding = self._encode(rgb, self.box)
+            if encoding is not None:
+                match = self.gallery.match(encoding)
+        if match is not None:
+            result["identity"], result["distance"] = match
+        vote = match is not None and match[1] <= self.tolerance
+        if not vote:
+            # Lost or wrong face: don't keep trusting the tracked box
+            self.since_keyframe = self.keyframe_interval
+        result["vote"] = vote
+        self.votes.append((vote, result["identity"]))
+        self._decide()
+        result["decision"] = self.decision
+        return result
+
+    def _decide(self):
+        counts = {}
+        for vote, identity in self.votes:
+            if vote:
+                counts[identity] = counts.get(identity, 0) + 1
+        if counts:
+            identity, count = max(counts.items(), key=lambda item: item[1])
+            if count >= self.min_votes:
+                self.decision, self.identity = "accept", identity
+        if self.decision is None and self.frames_processed >= self.reject_after:
+            self.decision = "reject"
+        if self.decision is not None:
+            self.decided_at = time.perf_counter()
+
+    @property
+    def time_to_decision(self) -> float | None:
+        if self.decided_at is None or self.started_at is None:
+            return None
+        return self.decided_at - self.started_at
@@ -1,15 +1,47 @@
-import face_recognition
 import numpy as np
 from cryptography.fernet import Fernet
+import functools
+import multiprocessing
 import os
-from PIL import Image
+import struct
+import sys
+import threading
+from typing import NamedTuple
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
+from PIL import Image, ImageOps
 import io
 
+from backend import metrics, result_cache
+from backend.model_registry import registry
+
 # Define file paths
 DATA_DIR = "data"
 KEY_PATH = os.path.join(DATA_DIR, "secret.key")
 ENCODING_PATH = os.path.join(DATA_DIR, "user_face_encoding.enc")
 
+# --- Face models ---
+# Importing face_recognition loads dlib's HOG and CNN detectors, the landmark
+# predictors and the encoder network. It's done through the model registry so
+# the models are only resident while face login/enrollment is being used.
+FACE_MODELS_NAME = "face_models"
+
+def _load_face_models():
+    import face_recognition
+    return face_recognition
+
+def _unload_face_models(module):
+    # The dlib models are module globals; dropping the modules releases them
+    for name in list(sys.modules):
+        if name == "face_recognition" or name.startswith("face_recognition."):
+            del sys.modules[name]
+
+registry.register(FACE_MODELS_NAME, _load_face_models, _unload_face_models)
+
+def warmup():
+    """Starts loading the face models in the background (e.g. when the login page opens)."""
+    return registry.warmup(FACE_MODELS_NAME)
+
 # --- Key Management (Unchanged) ---
 def generate_key():
     if not os.path.exists(DATA_DIR):
@@ -34,46 +66,356 @@ def decrypt_data(encrypted_data, key):
     f = Fernet(key)
     return f.decrypt(encrypted_data)
 
-# --- Face Enrollment (Unchanged, uses flipped image) ---
-def enroll_face(image_files):
-    face_encodings = []
-    for image_file in image_files:
-        try:
-            image_pil = Image.open(image_file)
-            image_pil_flipped = image_pil.transpose(Image.FLIP_LEFT_RIGHT)
-            image = np.array(image_pil_flipped)
-            
-            encodings = face_recognition.face_encodings(image)
-            
-            if encodings:
-                face_encodings.append(encodings[0])
-        except Exception as e:
-            print(f"Error processing an image: {e}")
-            continue
+# --- Encoding Gallery ---
+# The encrypted encoding file holds every enrolled identity: one encoding per
+# enrollment photo plus their centroid. Decrypted layout (little-endian):
+#   b"SGFG" | version u8 | identity count u16
+#   per identity: name length u16 | utf-8 name | encoding count u32 |
+#                 centroid 128 x float32 | count x 128 float32
+# Version 1 files stored count x 128 float64 and no centroid. Files written
+# before galleries existed hold a single raw 128 x float64 encoding; those load
+# as one identity named DEFAULT_IDENTITY.
+GALLERY_MAGIC = b"SGFG"
+GALLERY_VERSION = 2
+ENCODING_SIZE = 128
+DEFAULT_IDENTITY = "user"
+MATCH_TOLERANCE = 0.5
 
-    if not face_encodings:
-        return False 
+def pack_gallery(identities: dict) -> bytes:
+    """Serializes {identity: (n, 128) array of encodings} into the gallery layout."""
+    parts = [GALLERY_MAGIC, struct.pack("<BH", GALLERY_VERSION, len(identities))]
+    for name, encodings in identities.items():
+        encodings = np.asarray(encodings, dtype=np.float64).reshape(-1, ENCODING_SIZE)
+        centroid = encodings.mean(axis=0) if len(encodings) else np.zeros(ENCODING_SIZE)
+        name_bytes = name.encode("utf-8")
+        parts.append(struct.pack("<H", len(name_bytes)))
+        parts.append(name_bytes)
+        parts.append(struct.pack("<I", len(encodings)))
+        parts.append(centroid.astype("<f4").tobytes())
+        parts.append(encodings.astype("<f4").tobytes())
+    return b"".join(parts)
+
+def unpack_gallery(data: bytes, with_centroids: bool = False):
+    """
+    Inverse of pack_gallery(): {identity: (n, 128) float64 encodings}, or
+    (identities, {identity: centroid}) with with_centroids. Also accepts the
+    version 1 and legacy single-encoding layouts.
+    """
+    if not data.startswith(GALLERY_MAGIC):
+        identities = {DEFAULT_IDENTITY: np.frombuffer(data, dtype=np.float64).reshape(-1, ENCODING_SIZE)}
+        return (identities, {}) if with_centroids else identities
+    version, count = struct.unpack_from("<BH", data, 4)
+    if version not in (1, GALLERY_VERSION):
+        raise ValueError(f"Unsupported face gallery version {version}")
+    dtype = "<f8" if version == 1 else "<f4"
+    item_size = np.dtype(dtype).itemsize
+    offset = 7
+    identities, centroids = {}, {}
+    for _ in range(count):
+        (name_len,) = struct.unpack_from("<H", data, offset)
+        offset += 2
+        name = data[offset:offset + name_len].decode("utf-8")
+        offset += name_len
+        (n,) = struct.unpack_from("<I", data, offset)
+        offset += 4
+        if version > 1:
+            centroids[name] = np.frombuffer(data, dtype=dtype, count=ENCODING_SIZE, offset=offset).astype(np.float64)
+            offset += ENCODING_SIZE * item_size
+        identities[name] = np.frombuffer(data, dtype=dtype, count=n * ENCODING_SIZE,
+                                         offset=offset).reshape(n, ENCODING_SIZE).astype(np.float64)
+        offset += n * ENCODING_SIZE * item_size
+    return (identities, centroids) if with_centroids else identities
+
+def _file_signature(path):
+    try:
+        st = os.stat(path)
+        return (st.st_mtime_ns, st.st_size)
+    except FileNotFoundError:
+        return None
+
+class GallerySnapshot(NamedTuple):
+    """One loaded generation of the gallery; never modified after it's published."""
+    identities: list
+    matrix: np.ndarray  # (n, 128) float64, one row per encoding
+    labels: np.ndarray  # index into identities per row
+    sq_norms: np.ndarray
+    offsets: np.ndarray  # identity i is matrix[offsets[i]:offsets[i + 1]]
+    centroids: np.ndarray  # (identities, 128)
+    radii: np.ndarray  # largest distance from each centroid to one of its encodings
+
+class FaceGallery:
+    """
+    In-memory copy of the enrolled encodings.
+
+    The encrypted file is read and decrypted once, then kept as one contiguous
+    (n, 128) float64 matrix with a parallel array of identity labels, plus each
+    identity's centroid and radius (largest distance from the centroid to one of
+    its encodings). The copy is reloaded when the key or encoding file's
+    mtime/size changes, so matching a frame costs one matrix-vector product
+    instead of a disk read and a decrypt.
+
+    A reload builds a new GallerySnapshot and publishes it in one assignment;
+    readers take the snapshot once, so they never mix two generations.
+    """
+
+    def __init__(self, encoding_path: str = ENCODING_PATH, key_path: str = KEY_PATH):
+        self.encoding_path = encoding_path
+        self.key_path = key_path
+        self._snapshot = GallerySnapshot([], np.empty((0, ENCODING_SIZE), dtype=np.float64),
+                                         np.empty(0, dtype=np.intp), np.empty(0, dtype=np.float64),
+                                         np.zeros(1, dtype=np.intp), np.empty((0, ENCODING_SIZE), dtype=np.float64),
+                                         np.empty(0, dtype=np.float64))
+        self._signature = None
+        self._lock = threading.Lock()
+
+    @property
+    def identities(self) -> list:
+        return self._snapshot.identities
+
+    @property
+    def matrix(self) -> np.ndarray:
+        return self._snapshot.matrix
+
+    @property
+    def labels(self) -> np.ndarray:
+        return self._snapshot.labels
+
+    @property
+    def centroids(self) -> np.ndarray:
+        return self._snapshot.centroids
+
+    @property
+    def radii(self) -> np.ndarray:
+        return self._snapshot.radii
+
+    def snapshot(self) -> GallerySnapshot:
+        """The current gallery, reloaded first if the files changed."""
+        self.refresh()
+        return self._snapshot
+
+    def _current_signature(self):
+        return (_file_signature(self.encoding_path), _file_signature(self.key_path))
+
+    def invalidate(self):
+        with self._lock:
+            self._signature = None
+
+    def refresh(self):
+        """Reloads the gallery if the files changed since the last load."""
+        signature = self._current_signature()
+        if signature == self._signature:
+            return
+        with self._lock:
+            if signature == self._signature:
+                return
+            identities, centroids = {}, {}
+            if signature[0] is not None and signature[1] is not None:
+                with open(self.key_path, "rb") as f:
+                    key = f.read()
+                with open(self.encoding_path, "rb") as f:
+                    identities, centroids = unpack_gallery(decrypt_data(f.read(), key), with_centroids=True)
+            self._set(identities, centroids)
+            self._signature = signature
+
+    def _set(self, identities: dict, centroids: dict | None = None):
+        centroids = centroids or {}
+        names = [name for name, enc in identities.items() if len(enc)]
+        if names:
+            matrix = np.concatenate([identities[name] for name in names]).astype(np.float64)
+            labels = np.concatenate([np.full(len(identities[name]), i, dtype=np.intp)
+                                     for i, name in enumerate(names)])
+        else:
+            matrix = np.empty((0, ENCODING_SIZE), dtype=np.float64)
+            labels = np.empty(0, dtype=np.intp)
+        matrix = np.ascontiguousarray(matrix)
+        # Rows of one identity are contiguous: identity i is matrix[offsets[i]:offsets[i + 1]]
+        offsets = np.concatenate([[0], np.cumsum([len(identities[name]) for name in names])]).astype(np.intp)
+        centroid_matrix = np.array([centroids[name] if name in centroids else identities[name].mean(axis=0)
+                                    for name in names], dtype=np.float64).reshape(-1, ENCODING_SIZE)
+        radii = np.array([np.linalg.norm(matrix[start:end] - centroid, axis=1).max()
+                          for start, end, centroid in zip(offsets, offsets[1:], centroid_matrix)])
+        sq_norms = np.einsum("ij,ij->i", matrix, matrix)
+        for array in (matrix, labels, sq_norms, offsets, centroid_matrix, radii):
+            array.flags.writeable = False
+        self._snapshot = GallerySnapshot(names, matrix, labels, sq_norms, offsets, centroid_matrix, radii)
 
-    avg_encoding = np.mean(face_encodings, axis=0)
-    encoding_bytes = avg_encoding.tobytes()
+    def as_dict(self) -> dict:
+        """Returns {identity: (n, 128) encodings} for the current gallery."""
+        snapshot = self.snapshot()
+        return {name: snapshot.matrix[snapshot.labels == i] for i, name in enumerate(snapshot.identities)}
+
+    def __len__(self):
+        return len(self.snapshot().matrix)
+
+    def match(self, encoding) -> tuple[str, float] | None:
+        """
+        Finds the closest enrolled encoding.
+
+        Returns:
+            (identity, euclidean distance) of the best match, or None if nothing is enrolled.
+        """
+        snapshot = self.snapshot()
+        if not len(snapshot.matrix):
+            return None
+        encoding = np.asarray(encoding, dtype=np.float64)
+        # |a - b|^2 = |a|^2 - 2ab + |b|^2, with |a|^2 precomputed per row
+        sq_dists = snapshot.sq_norms - 2.0 * (snapshot.matrix @ encoding) + encoding @ encoding
+        best = int(np.argmin(sq_dists))
+        return snapshot.identities[snapshot.labels[best]], float(np.sqrt(max(sq_dists[best], 0.0)))
+
+    def identify(self, encoding, tolerance: float = MATCH_TOLERANCE) -> tuple[str, float] | None:
+        """
+        Like match(), but returns None unless the closest encoding is within
+        tolerance. By the triangle inequality no encoding of an identity can be
+        closer than (distance to its centroid - its radius), so identities
+        outside that bound are skipped without comparing their encodings, and a
+        stranger's face is usually rejected on the centroids alone.
+        """
+        snapshot = self.snapshot()
+        if not len(snapshot.matrix):
+            return None
+        encoding = np.asarray(encoding, dtype=np.float64)
+        centroid_dists = np.linalg.norm(snapshot.centroids - encoding, axis=1)
+        best = None
+        for i in np.flatnonzero(centroid_dists - snapshot.radii <= tolerance):
+            start, end = snapshot.offsets[i], snapshot.offsets[i + 1]
+            sq_dists = snapshot.sq_norms[start:end] - 2.0 * (snapshot.matrix[start:end] @ encoding) + encoding @ encoding
+            distance = float(np.sqrt(max(sq_dists.min(), 0.0)))
+            if distance <= tolerance and (best is None or distance < best[1]):
+                best = (snapshot.identities[i], distance)
+        return best
+
+gallery = FaceGallery()
+
+def save_gallery(identities: dict):
+    """Encrypts and writes {identity: encodings}, replacing the old file atomically."""
     key = load_key()
-    encrypted_encoding = encrypt_data(encoding_bytes, key)
-    
-    with open(ENCODING_PATH, "wb") as f:
-        f.write(encrypted_encoding)
-        
+    encrypted = encrypt_data(pack_gallery(identities), key)
+    tmp_path = ENCODING_PATH + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(encrypted)
+    os.replace(tmp_path, ENCODING_PATH)
+    gallery.invalidate()
+    result_cache.invalidate("enrollment")
+
+def identify_encoding(encoding, tolerance: float = MATCH_TOLERANCE) -> tuple[str, float] | None:
+    """Returns (identity, distance) if the encoding matches someone enrolled within tolerance."""
+    return gallery.identify(encoding, tolerance)
+
+# --- Face Enrollment (uses flipped image) ---
+# Photos are decoded straight to a reduced size (JPEG DCT scaling through
+# Image.draft, then a thumbnail) and detected without upsampling, since the face
+# fills much of an enrollment photo. Photos with no face, several faces or a
+# blurry face are skipped. Several photos are processed in a process pool
+# (dlib holds the GIL), each worker loading its own copy of the face models.
+ENROLL_MAX_SIDE = 800
+ENROLL_UPSAMPLE = 0
+ENROLL_WORKERS = int(os.environ.get("SAHILGPT_ENROLL_WORKERS", min(4, os.cpu_count() or 1)))
+BLUR_THRESHOLD = 40.0  # variance of the Laplacian of the face, resampled to BLUR_SAMPLE_SIZE
+BLUR_SAMPLE_SIZE = 128
+
+def load_enrollment_image(source, max_side: int | None = ENROLL_MAX_SIDE) -> np.ndarray:
+    """Decodes a photo (path, bytes or file object) to a mirrored RGB array at most max_side wide/high."""
+    if isinstance(source, (bytes, bytearray)):
+        source = io.BytesIO(source)
+    image = Image.open(source)
+    if max_side:
+        image.draft("RGB", (max_side, max_side))
+    image = ImageOps.exif_transpose(image).convert("RGB")
+    if max_side:
+        image.thumbnail((max_side, max_side))
+    return np.array(image.transpose(Image.FLIP_LEFT_RIGHT))
+
+def blur_score(image: np.ndarray, box) -> float:
+    """Sharpness of the face in box (top, right, bottom, left); low means blurry."""
+    top, right, bottom, left = box
+    face = Image.fromarray(np.ascontiguousarray(image[max(0, top):bottom, max(0, left):right])).convert("L")
+    gray = np.asarray(face.resize((BLUR_SAMPLE_SIZE, BLUR_SAMPLE_SIZE), Image.BILINEAR), dtype=np.float64)
+    laplacian = gray[1:-1, :-2] + gray[1:-1, 2:] + gray[:-2, 1:-1] + gray[2:, 1:-1] - 4 * gray[1:-1, 1:-1]
+    return float(laplacian.var())
+
+def _detect_enrollment_faces(image):
+    return registry.get(FACE_MODELS_NAME).face_locations(image, number_of_times_to_upsample=ENROLL_UPSAMPLE)
+
+def _encode_enrollment_faces(image, boxes):
+    return registry.get(FACE_MODELS_NAME).face_encodings(image, boxes)
+
+def extract_enrollment_encoding(source, max_side: int | None = ENROLL_MAX_SIDE, detect_fn=None, encode_fn=None):
+    """
+    Encodes the face in one enrollment photo.
+
+    Returns:
+        (encoding, None) for a usable photo, or (None, reason) with reason one
+        of "unreadable", "no face", "several faces" or "blurry".
+    """
+    try:
+        image = load_enrollment_image(source, max_side)
+    except Exception as e:
+        print(f"Error processing an image: {e}")
+        return None, "unreadable"
+    boxes = (detect_fn or _detect_enrollment_faces)(image)
+    if not boxes:
+        return None, "no face"
+    if len(boxes) > 1:
+        return None, "several faces"
+    if blur_score(image, boxes[0]) < BLUR_THRESHOLD:
+        return None, "blurry"
+    # The box is passed on so the encoder doesn't detect the face again
+    encodings = (encode_fn or _encode_enrollment_faces)(image, boxes)
+    if not len(encodings):
+        return None, "no face"
+    return np.asarray(encodings[0], dtype=np.float64), None
+
+def extract_enrollment_encodings(sources, workers: int | None = None, max_side: int | None = ENROLL_MAX_SIDE,
+                                 detect_fn=None, encode_fn=None) -> list:
+    """
+    extract_enrollment_encoding() for every source, in order. Sources must be
+    paths or bytes when more than one worker is used.
+    """
+    workers = min(workers or ENROLL_WORKERS, len(sources))
+    task = functools.partial(extract_enrollment_encoding, max_side=max_side, detect_fn=detect_fn, encode_fn=encode_fn)
+    if workers <= 1:
+        models = registry.use(FACE_MODELS_NAME) if detect_fn is None or encode_fn is None else nullcontext()
+        with models:
+            return [task(source) for source in sources]
+    # spawn, not fork: the parent has Streamlit's threads (and maybe dlib) running
+    with ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+        return list(pool.map(task, sources))
+
+@metrics.timed()
+def enroll_face(image_files, identity: str = DEFAULT_IDENTITY, report: dict | None = None):
+    """
+    Enrolls (or re-enrolls) one identity from a set of photos, keeping one
+    encoding per usable photo. Other enrolled identities are kept.
+    If a dict is passed as report, it gets "used" (number of photos enrolled)
+    and "skipped" ({reason: number of photos}).
+    """
+    sources = [image_file if isinstance(image_file, (str, bytes)) else image_file.read()
+               for image_file in image_files]
+    results = extract_enrollment_encodings(sources)
+    face_encodings = [encoding for encoding, _ in results if encoding is not None]
+    if report is not None:
+        skipped = {}
+        for _, reason in results:
+            if reason:
+                skipped[reason] = skipped.get(reason, 0) + 1
+        report.update(used=len(face_encodings), skipped=skipped)
+
+    if not face_encodings:
+        return False
+
+    identities = gallery.as_dict() if is_user_enrolled() else {}
+    identities[identity] = np.stack(face_encodings)
+    save_gallery(identities)
     return True
 
-# --- Face Login/Matching (Unchanged, for file uploads) ---
+# --- Face Login/Matching (for file uploads) ---
+@metrics.timed()
 def verify_face(login_image_file):
     if not os.path.exists(ENCODING_PATH):
         return False
     try:
-        key = load_key()
-        with open(ENCODING_PATH, "rb") as f:
-            encrypted_encoding = f.read()
-        decrypted_encoding_bytes = decrypt_data(encrypted_encoding, key)
-        stored_encoding = np.frombuffer(decrypted_encoding_bytes)
+        face_recognition = registry.get(FACE_MODELS_NAME)
         
         login_image_pil = Image.open(login_image_file)
         login_image_pil_flipped = login_image_pil.transpose(Image.FLIP_LEFT_RIGHT)
@@ -83,48 +425,42 @@ def verify_face(login_image_file):
         if not login_encodings:
             return False
         
-        matches = face_recognition.compare_faces([stored_encoding], login_encodings[0], tolerance=0.5)
-        return matches[0]
+        return identify_encoding(login_encodings[0]) is not None
     except Exception as e:
         print(f"Error during verification: {e}")
         return False
 
 # --- *** NEW FUNCTION FOR LIVE VIDEO *** ---
-def verify_face_from_frame(frame: np.ndarray) -> bool:
+@metrics.timed()
+def verify_face_from_frame(frame: np.ndarray, model: str = "cnn") -> bool:
     """
-    Verifies a face from a live video frame (numpy array).
+    Verifies a face from a single live video frame (numpy array).
+    For a continuous camera feed use face_pipeline.LiveFaceVerifier, which
+    downscales, tracks the face between detections and votes over frames.
     """
     if not os.path.exists(ENCODING_PATH):
         return False # No user enrolled
 
     try:
-        # 1. Load the stored (encrypted) encoding
-        key = load_key()
-        with open(ENCODING_PATH, "rb") as f:
-            encrypted_encoding = f.read()
-        decrypted_encoding_bytes = decrypt_data(encrypted_encoding, key)
-        stored_encoding = np.frombuffer(decrypted_encoding_bytes)
+        # 1. The enrolled encodings come from the in-memory gallery
+        face_recognition = registry.get(FACE_MODELS_NAME)
 
         # 2. Flip the video frame to match the mirrored enrollment
         # (face_recognition needs RGB, but streamlit-webrtc gives BGR, so convert)
-        frame_rgb = frame[:, :, ::-1] # Convert BGR to RGB
-        frame_pil = Image.fromarray(frame_rgb)
-        frame_pil_flipped = frame_pil.transpose(Image.FLIP_LEFT_RIGHT)
-        login_image = np.array(frame_pil_flipped)
+        # Both happen in one strided view, then a single contiguous copy for dlib
+        login_image = np.ascontiguousarray(frame[:, ::-1, ::-1])
 
         # 3. Find faces in the flipped frame
         # We find locations first as it's faster
-        login_face_locations = face_recognition.face_locations(login_image, model="cnn")
+        login_face_locations = face_recognition.face_locations(login_image, model=model)
         if not login_face_locations:
             return False
             
         # 4. Get encodings for the found faces
         login_encodings = face_recognition.face_encodings(login_image, login_face_locations)
 
-        # 5. Compare against the stored encoding
-        matches = face_recognition.compare_faces([stored_encoding], login_encodings[0], tolerance=0.5)
-        
-        return matches[0]
+        # 5. Compare against every enrolled encoding in one matrix op
+        return identify_encoding(login_encodings[0]) is not None
 
     except Exception as e:
         # This will fail often on blurry frames, so we just print and continue
@@ -132,6 +468,7 @@ def verify_face_from_frame(frame: np.ndarray) -> bool:
         return False
 
 # --- Helper Functions (Unchanged) ---
+@result_cache.cached(ttl=60, tags=("enrollment",))
 def is_user_enrolled():
     return os.path.exists(ENCODING_PATH)
 
@@ -139,4 +476,6 @@ def reset_enrollment():
     if os.path.exists(KEY_PATH):
         os.remove(KEY_PATH)
     if os.path.exists(ENCODING_PATH):
-        os.remove(ENCODING_PATH)
\ No newline at end of file
+        os.remove(ENCODING_PATH)
+    gallery.invalidate()
+    result_cache.invalidate("enrollment")
\ No newline at end of file
@@ -1,24 +1,38 @@
+import json
 import os
+import secrets
+import threading
 import time
-from diffusers import DiffusionPipeline
-import torch
+from io import BytesIO
 
-# --- This is the new part ---
-# Check if your Mac's GPU (Metal Performance Shaders) is available
-if torch.backends.mps.is_available():
-    device = "mps"
-else:
-    device = "cpu"
-
-print(f"Using device for image generation: {device.upper()}")
-# ---------------------------
+from backend import metrics
+from backend.disk_cache import DiskCache, make_key
+from backend.model_registry import registry
 
 model_id = "runwayml/stable-diffusion-v1-5"
 model_cache_path = "data/sd_model_cache"
 os.makedirs("data", exist_ok=True)
 
-print("Loading Stable Diffusion model... This may take a few minutes.")
-try:
+MODEL_NAME = "stable_diffusion"
+
+# torch and diffusers are imported when the pipeline is loaded, so the job
+# scheduler and the pages can use this module without them.
+def get_device() -> str:
+    import torch
+
+    # Check if your Mac's GPU (Metal Performance Shaders) is available
+    if torch.backends.mps.is_available():
+        return "mps"
+    return "cpu"
+
+def load_pipeline():
+    """Loads Stable Diffusion. Called by the model registry on first use, not at import."""
+    import torch
+    from diffusers import DiffusionPipeline
+
+    device = get_device()
+    print(f"Using device for image generation: {device.upper()}")
+    print("Loading Stable Diffusion model... This may take a few minutes.")
     pipe = DiffusionPipeline.from_pretrained(
         model_id,
         cache_dir=model_cache_path,
@@ -31,30 +45,302 @@ try:
     # ---------------------------
     
     print("Stable Diffusion model loaded successfully.")
-except Exception as e:
-    print(f"Error loading Stable Diffusion model: {e}")
-    pipe = None
+    return pipe
+
+registry.register(MODEL_NAME, load_pipeline)
+
+def warmup():
+    """Starts loading the pipeline in the background so the first generation doesn't wait for it."""
+    return registry.warmup(MODEL_NAME)
+
+# Default generation parameters (Stable Diffusion 1.5's own defaults)
+DEFAULT_STEPS = 50
+DEFAULT_SIZE = 512
+DEFAULT_GUIDANCE = 7.5
+
+# --- Performance profiles ---
+# Stable Diffusion at 50 steps and 512x512 takes minutes on a CPU. A profile
+# trades some quality for speed: fewer steps with a faster multistep
+# scheduler, a smaller resolution, sliced/tiled attention and VAE (lower peak
+# memory), channels-last tensors and bfloat16 where the CPU has native
+# support. torch.compile is opt-in (SAHILGPT_TORCH_COMPILE=1) because the
+# first call compiles for minutes. Explicit steps/width/height still win.
+
+PROFILES = {
+    "quality": {"steps": 50, "size": 512, "scheduler": "pndm", "attention_slicing": False,
+                "vae_slicing": False, "vae_tiling": False, "channels_last": False, "bf16": False},
+    "balanced": {"steps": 25, "size": 512, "scheduler": "dpm++", "attention_slicing": False,
+                 "vae_slicing": True, "vae_tiling": False, "channels_last": True, "bf16": False},
+    "fast": {"steps": 15, "size": 384, "scheduler": "dpm++", "attention_slicing": True,
+             "vae_slicing": True, "vae_tiling": False, "channels_last": True, "bf16": True},
+    "draft": {"steps": 8, "size": 256, "scheduler": "dpm++", "attention_slicing": True,
+              "vae_slicing": True, "vae_tiling": True, "channels_last": True, "bf16": True},
+}
+DEFAULT_PROFILE = os.environ.get("SAHILGPT_IMAGE_PROFILE", "balanced")
+if DEFAULT_PROFILE not in PROFILES:
+    print(f"Unknown SAHILGPT_IMAGE_PROFILE '{DEFAULT_PROFILE}' (expected one of {', '.join(PROFILES)}); "
+          "using 'balanced'.")
+    DEFAULT_PROFILE = "balanced"
+TORCH_COMPILE = os.environ.get("SAHILGPT_TORCH_COMPILE") == "1"
+TORCH_THREADS = int(os.environ.get("SAHILGPT_TORCH_THREADS", "0"))  # 0 = torch's default
+
+SCHEDULERS = {
+    "pndm": "PNDMScheduler",  # SD 1.5's default
+    "dpm++": "DPMSolverMultistepScheduler",  # similar quality in ~20-25 steps
+    "euler_a": "EulerAncestralDiscreteScheduler",
+}
+
+_bf16_supported = None
+
+def cpu_supports_bf16() -> bool:
+    """True if the CPU has native bfloat16 instructions (AVX512-BF16 or AMX)."""
+    global _bf16_supported
+    if _bf16_supported is None:
+        try:
+            with open("/proc/cpuinfo") as f:
+                flags = f.read()
+            _bf16_supported = "avx512_bf16" in flags or "amx_bf16" in flags
+        except OSError:
+            _bf16_supported = False
+    return _bf16_supported
+
+def precision(profile: str) -> str:
+    return "bf16" if PROFILES[profile]["bf16"] and cpu_supports_bf16() else "fp32"
+
+def resolve_params(profile: str | None = None, steps: int | None = None, width: int | None = None,
+                   height: int | None = None, guidance_scale: float = DEFAULT_GUIDANCE) -> dict:
+    """Fills in steps/width/height from the profile. Raises KeyError for unknown profiles."""
+    profile = profile or DEFAULT_PROFILE
+    settings = PROFILES[profile]
+    return {"profile": profile, "steps": steps or settings["steps"], "width": width or settings["size"],
+            "height": height or settings["size"], "guidance_scale": guidance_scale}
+
+def apply_profile(pipe, profile: str):
+    """
+    Reconfigures a loaded pipeline for a profile. Only settings that differ
+    from the pipeline's current state are changed, so switching back and
+    forth between profiles is cheap (compilation happens once).
+    """
+    import diffusers
+    import torch
+
+    settings = PROFILES[profile]
+    state = getattr(pipe, "_sahilgpt_profile_state", None)
+    if state is None:
+        state = pipe._sahilgpt_profile_state = {"scheduler": "pndm", "attention_slicing": False,
+                                                "vae_slicing": False, "vae_tiling": False,
+                                                "channels_last": False, "precision": "fp32", "compiled": False}
+    on_cpu = pipe.device.type == "cpu"
+
+    if TORCH_THREADS and torch.get_num_threads() != TORCH_THREADS:
+        torch.set_num_threads(TORCH_THREADS)
+    if state["scheduler"] != settings["scheduler"]:
+        scheduler_class = getattr(diffusers, SCHEDULERS[settings["scheduler"]])
+        pipe.scheduler = scheduler_class.from_config(pipe.scheduler.config)
+        state["scheduler"] = settings["scheduler"]
+    for name in ("attention_slicing", "vae_slicing", "vae_tiling"):
+        if state[name] != settings[name]:
+            getattr(pipe, ("enable_" if settings[name] else "disable_") + name)()
+            state[name] = settings[name]
+    wanted_precision = precision(profile) if on_cpu else "fp32"
+    if state["precision"] != wanted_precision:
+        pipe.to(dtype=torch.bfloat16 if wanted_precision == "bf16" else torch.float32)
+        state["precision"] = wanted_precision
+    channels_last = settings["channels_last"] and on_cpu
+    if state["channels_last"] != channels_last:
+        memory_format = torch.channels_last if channels_last else torch.contiguous_format
+        pipe.unet.to(memory_format=memory_format)
+        pipe.vae.to(memory_format=memory_format)
+        state["channels_last"] = channels_last
+    if TORCH_COMPILE and not state["compiled"]:
+        print("Compiling the UNet with torch.compile (the first generation will be slow)...")
+        pipe.unet = torch.compile(pipe.unet)
+        state["compiled"] = True
+
+# --- Seeds ---
+# Every image is generated from an explicit seed, so it can be reproduced
+# (and served from the cache) by asking for the same seed again.
+
+MAX_SEED = 2**32 - 1
+
+def random_seed() -> int:
+    return secrets.randbelow(MAX_SEED + 1)
+
+def make_generators(seeds: list[int]):
+    import torch
+
+    # CPU generators give the same noise whichever device the pipeline runs on
+    return [torch.Generator(device="cpu").manual_seed(int(seed)) for seed in seeds]
+
+@metrics.timed()
+def run_pipeline(pipe, prompts: list[str], steps: int = DEFAULT_STEPS, width: int = DEFAULT_SIZE,
+                 height: int = DEFAULT_SIZE, guidance_scale: float = DEFAULT_GUIDANCE, on_step=None,
+                 seeds: list[int] | None = None, profile: str | None = None):
+    """
+    Runs one (possibly batched) pipeline call and returns the PIL images.
+    seeds holds one seed per prompt. profile (if given) is applied to the
+    pipeline first. on_step(step, total_steps) is called after every
+    denoising step; raising from it aborts the call.
+    """
+    if profile is not None:
+        apply_profile(pipe, profile)
+    kwargs = {}
+    if seeds is not None:
+        kwargs["generator"] = make_generators(seeds)
+    last_step = time.perf_counter()  # the first step's time also covers prompt encoding
+    def callback(pipe, step_index, timestep, callback_kwargs):
+        nonlocal last_step
+        now = time.perf_counter()
+        metrics.observe("image_gen.step", now - last_step)
+        last_step = now
+        if on_step is not None:
+            # Some schedulers (PNDM) run one extra warm-up step
+            on_step(min(step_index + 1, steps), steps)
+        return callback_kwargs
+    kwargs["callback_on_step_end"] = callback
+    return pipe(prompts, num_inference_steps=steps, width=width, height=height,
+                guidance_scale=guidance_scale, **kwargs).images
 
-def generate_image(prompt: str) -> str:
-    if pipe is None:
-        return "Error: Stable Diffusion model could not be loaded."
+# --- Image cache ---
+# Generated images are stored under a hash of everything that determines the
+# pixels, so asking for the same prompt/seed/parameters again is a file lookup.
+# The directory has a size budget; least recently used images are evicted.
+
+IMAGE_CACHE_DIR = "data/images"
+IMAGE_CACHE_BUDGET_BYTES = int(os.environ.get("SAHILGPT_IMAGE_CACHE_MB", "1024")) * 1024 * 1024
+
+def image_key(prompt: str, seed: int, steps: int = DEFAULT_STEPS, width: int = DEFAULT_SIZE,
+              height: int = DEFAULT_SIZE, guidance_scale: float = DEFAULT_GUIDANCE,
+              profile: str = DEFAULT_PROFILE, model: str = model_id) -> str:
+    # The profile's scheduler and precision change the pixels; its other settings don't
+    return make_key("image-v2", model, prompt, int(seed), int(steps), int(width), int(height),
+                    float(guidance_scale), PROFILES[profile]["scheduler"], precision(profile))
+
+class ImageCache:
+    """
+    Content-addressed PNG store with a metadata index.
+
+    The PNGs live in a DiskCache (LRU eviction on a byte budget); index.json
+    maps each key to the parameters that produced it, and the parameters are
+    also written into the PNG's text chunks. Index entries whose image has
+    been evicted are dropped the next time the index is written or listed.
+    """
+
+    def __init__(self, directory: str = IMAGE_CACHE_DIR, budget_bytes: int = IMAGE_CACHE_BUDGET_BYTES):
+        self.files = DiskCache(directory, budget_bytes, suffix=".png")
+        self.index_path = os.path.join(directory, "index.json")
+        self._lock = threading.Lock()
+        try:
+            with open(self.index_path) as f:
+                self._index = json.load(f)
+        except (FileNotFoundError, ValueError):
+            self._index = {}
+
+    def get(self, key: str) -> str | None:
+        """Returns the cached image's path, or None."""
+        return self.files.get_path(key)
+
+    def put(self, key: str, image, metadata: dict) -> str:
+        from PIL.PngImagePlugin import PngInfo
+
+        info = PngInfo()
+        for name, value in metadata.items():
+            info.add_text(name, str(value))
+        buffer = BytesIO()
+        image.save(buffer, format="PNG", pnginfo=info)
+        path = self.files.put(key, buffer.getvalue())
+        with self._lock:
+            self._index[key] = dict(metadata, created_at=time.time())
+            self._prune()
+            self._write_index()
+        print(f"Image saved to: {path}")
+        return path
+
+    def metadata(self, key: str) -> dict | None:
+        with self._lock:
+            return self._index.get(key)
+
+    def entries(self) -> list[dict]:
+        """Index entries that still have an image, newest first."""
+        with self._lock:
+            if self._prune():
+                self._write_index()
+            entries = [dict(meta, key=key, path=self.files.path(key)) for key, meta in self._index.items()]
+        return sorted(entries, key=lambda e: e["created_at"], reverse=True)
+
+    def stats(self) -> dict:
+        return dict(self.files.stats(), entries=len(self._index))
+
+    def _prune(self) -> bool:
+        stale = [key for key in self._index if not os.path.exists(self.files.path(key))]
+        for key in stale:
+            del self._index[key]
+        return bool(stale)
+
+    def _write_index(self):
+        tmp_path = self.index_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self._index, f)
+        os.replace(tmp_path, self.index_path)
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_cache() -> ImageCache:
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = ImageCache()
+        return _cache
+
+def store_image(image, prompt: str, seed: int, **params) -> str:
+    """Saves a generated image to the cache and returns its path. params as returned by resolve_params()."""
+    key = image_key(prompt, seed, **params)
+    return get_cache().put(key, image, dict(params, prompt=prompt, seed=seed, model=model_id,
+                                            precision=precision(params["profile"])))
+
+def cached_image(prompt: str, seed: int, **params) -> str | None:
+    """Path of a previously generated image with exactly these inputs, or None."""
+    return get_cache().get(image_key(prompt, seed, **params))
+
+@metrics.timed()
+def generate_image(prompt: str, seed: int | None = None, profile: str | None = None, steps: int | None = None,
+                   width: int | None = None, height: int | None = None,
+                   guidance_scale: float = DEFAULT_GUIDANCE) -> str:
+    """
+    Generates one image synchronously and returns its file path (or an error
+    message starting with "Error"/"An error"). A random seed is picked when
+    none is given; steps and size default to the performance profile's. The
+    UI uses image_jobs instead, which doesn't block the page.
+    """
+    if seed is None:
+        seed = random_seed()
+    try:
+        params = resolve_params(profile, steps, width, height, guidance_scale)
+    except KeyError:
+        return f"Error: unknown performance profile '{profile}'."
+    path = cached_image(prompt, seed, **params)
+    if path is not None:
+        print(f"Using cached image for prompt: '{prompt}' (seed {seed})")
+        return path
+
+    try:
+        with registry.use(MODEL_NAME) as pipe:
+            print(f"Generating image for prompt: '{prompt}' (seed {seed}, profile {params['profile']})")
+            
+            # This will now run on the GPU and be much faster
+            image = run_pipeline(pipe, [prompt], seeds=[seed], **params)[0]
+            
+            print("Image generation complete.")
+    except Exception as e:
+        if not registry.is_loaded(MODEL_NAME):
+            print(f"Error loading Stable Diffusion model: {e}")
+            return "Error: Stable Diffusion model could not be loaded."
+        print(f"Error during image generation: {e}")
+        return f"An error occurred: {e}"
 
     try:
-        print(f"Generating image for prompt: '{prompt}'")
-        
-        # This will now run on the GPU and be much faster
-        image = pipe(prompt).images[0]
-        
-        print("Image generation complete.")
-        
-        timestamp = int(time.time())
-        image_filename = f"generated_image_{timestamp}.png"
-        image_filepath = os.path.join("data", image_filename)
-        
-        image.save(image_filepath)
-        print(f"Image saved to: {image_filepath}")
-        return image_filepath
-        
+        return store_image(image, prompt, seed, **params)
     except Exception as e:
         print(f"Error during image generation: {e}")
-        return f"An error occurred: {e}"
\ No newline at end of file
+        return f"An error occurred: {e}"
@@ -0,0 +1,232 @@
+import threading
+import time
+import uuid
+from collections import deque
+
+from backend import image_gen
+from backend.model_registry import registry
+
+MAX_BATCH = 4          # prompts per pipeline call
+MAX_FINISHED_JOBS = 200  # finished jobs kept for status queries
+
+
+class JobCancelled(Exception):
+    """Raised from the step callback to abort a pipeline call."""
+
+
+class ImageJob:
+    def __init__(self, prompt: str, seed: int, params: dict):
+        self.id = uuid.uuid4().hex[:12]
+        self.prompt = prompt
+        self.seed = seed
+        self.params = params
+        self.status = "queued"  # queued -> running -> done | failed | cancelled
+        self.step = 0
+        self.total_steps = params["steps"]
+        self.batch_size = 0
+        self.result = None
+        self.error = None
+        self.cancel_requested = False
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+
+    @property
+    def batch_key(self) -> tuple:
+        # Jobs can share a pipeline call only if everything but the prompt and seed matches
+        return tuple(sorted(self.params.items()))
+
+    def as_dict(self) -> dict:
+        return {
+            "id": self.id, "prompt": self.prompt, "seed": self.seed, "params": dict(self.params),
+            "status": self.status, "step": self.step, "total_steps": self.total_steps,
+            "progress": self.step / self.total_steps if self.total_steps else 0.0,
+            "batch_size": self.batch_size, "result": self.result, "error": self.error,
+            "created_at": self.created_at, "started_at": self.started_at, "finished_at": self.finished_at,
+        }
+
+
+class ImageJobScheduler:
+    """
+    Runs image generation jobs on one dedicated worker thread.
+
+    submit() returns a job id immediately. The worker takes the oldest queued
+    job plus up to max_batch - 1 other queued jobs with identical parameters
+    and renders them in one batched pipeline call, updating every job's
+    progress from the pipeline's step callback. A job whose image is already
+    in image_gen's cache finishes immediately. A cancelled job is dropped
+    from the queue, or, if its batch is already running, its image is
+    discarded; the call is aborted once every job in it is cancelled.
+
+    Args:
+        pipeline: Callable returning a context manager that yields the
+            pipeline. Defaults to the model registry's Stable Diffusion.
+        render: Callable(pipe, prompts, on_step=..., seeds=..., **params) -> images.
+        save: Callable(image, prompt, seed, **params) -> file path.
+        lookup: Callable(prompt, seed, **params) -> cached file path or None.
+        max_batch: Maximum prompts per pipeline call.
+    """
+
+    def __init__(self, pipeline=None, render=None, save=None, lookup=None, max_batch: int = MAX_BATCH):
+        self.pipeline = pipeline or (lambda: registry.use(image_gen.MODEL_NAME))
+        self.render = render or image_gen.run_pipeline
+        self.save = save or image_gen.store_image
+        self.lookup = lookup or image_gen.cached_image
+        self.max_batch = max_batch
+        self._jobs = {}
+        self._queue = deque()
+        self._finished = deque()
+        self._cond = threading.Condition()
+        self._thread = threading.Thread(target=self._run, name="image-jobs", daemon=True)
+        self._thread.start()
+
+    def submit(self, prompt: str, seed: int | None = None, profile: str | None = None, steps: int | None = None,
+               width: int | None = None, height: int | None = None,
+               guidance_scale: float = image_gen.DEFAULT_GUIDANCE) -> str:
+        """
+        Queues a job and returns its id. A random seed is picked if none is
+        given; steps and size default to the performance profile's.
+        Raises KeyError for an unknown profile.
+        """
+        if seed is None:
+            seed = image_gen.random_seed()
+        job = ImageJob(prompt, seed, image_gen.resolve_params(profile, steps, width, height, guidance_scale))
+        cached = self.lookup(prompt, seed, **job.params)
+        with self._cond:
+            self._jobs[job.id] = job
+            if cached is not None:
+                job.step = job.total_steps
+                self._finish(job, "done", result=cached)
+                return job.id
+            self._queue.append(job)
+            self._cond.notify()
+        return job.id
+
+    def status(self, job_id: str) -> dict | None:
+        with self._cond:
+            job = self._jobs.get(job_id)
+            return job.as_dict() if job else None
+
+    def queue_position(self, job_id: str) -> int | None:
+        """0-based position among queued jobs, or None if it isn't queued."""
+        with self._cond:
+            for position, job in enumerate(self._queue):
+                if job.id == job_id:
+                    return position
+        return None
+
+    def queued(self) -> int:
+        """Number of jobs waiting for the worker."""
+        with self._cond:
+            return len(self._queue)
+
+    def cancel(self, job_id: str) -> bool:
+        with self._cond:
+            job = self._jobs.get(job_id)
+            if job is None or job.status not in ("queued", "running"):
+                return False
+            job.cancel_requested = True
+            if job.status == "queued":
+                self._queue.remove(job)
+                self._finish(job, "cancelled")
+            return True
+
+    def wait(self, job_id: str, timeout: float | None = None) -> dict | None:
+        """Blocks until the job has finished (or timeout) and returns its status; None for an unknown job."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while True:
+                job = self._jobs.get(job_id)  # gone once purged past MAX_FINISHED_JOBS
+                if job is None:
+                    return None
+                if job.status not in ("queued", "running"):
+                    break
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            return job.as_dict()
+
+    def _finish(self, job: ImageJob, status: str, result=None, error=None):
+        # Called with self._cond held
+        job.status, job.result, job.error = status, result, error
+        job.finished_at = time.time()
+        self._finished.append(job.id)
+        while len(self._finished) > MAX_FINISHED_JOBS:
+            self._jobs.pop(self._finished.popleft(), None)
+        self._cond.notify_all()
+
+    def _next_batch(self) -> list[ImageJob]:
+        # Called with self._cond held and a non-empty queue
+        first = self._queue.popleft()
+        batch = [first]
+        for job in list(self._queue):
+            if len(batch) >= self.max_batch:
+                break
+            if job.batch_key == first.batch_key:
+                self._queue.remove(job)
+                batch.append(job)
+        now = time.time()
+        for job in batch:
+            job.status, job.started_at, job.batch_size = "running", now, len(batch)
+        return batch
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._queue:
+                    self._cond.wait()
+                batch = self._next_batch()
+            self._run_batch(batch)
+
+    def _run_batch(self, batch: list[ImageJob]):
+        def on_step(step, total_steps):
+            with self._cond:
+                for job in batch:
+                    job.step, job.total_steps = step, total_steps
+                if all(job.cancel_requested for job in batch):
+                    raise JobCancelled()
+
+        prompts = [job.prompt for job in batch]
+        print(f"Generating {len(batch)} image(s) in one batch: {prompts}")
+        try:
+            with self.pipeline() as pipe:
+                images = self.render(pipe, prompts, on_step=on_step, seeds=[job.seed for job in batch],
+                                     **batch[0].params)
+        except JobCancelled:
+            with self._cond:
+                for job in batch:
+                    self._finish(job, "cancelled")
+            return
+        except Exception as e:
+            print(f"Error during image generation: {e}")
+            with self._cond:
+                for job in batch:
+                    self._finish(job, "failed", error=str(e))
+            return
+
+        for job, image in zip(batch, images):
+            if job.cancel_requested:
+                with self._cond:
+                    self._finish(job, "cancelled")
+                continue
+            try:
+                path = self.save(image, job.prompt, job.seed, **job.params)
+            except Exception as e:
+                with self._cond:
+                    self._finish(job, "failed", error=str(e))
+                continue
+            with self._cond:
+                self._finish(job, "done", result=path)
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+def get_scheduler() -> ImageJobScheduler:
+    """Returns the shared scheduler used by the Image Generation page."""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = ImageJobScheduler()
+        return _scheduler
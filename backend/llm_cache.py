@@ -0,0 +1,280 @@
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+from backend import llm_client, metrics
+from backend.disk_cache import make_key
+
+# Replies of the model, reused when the same request comes again: the user
+# asks a question they asked before, or a page replays a chat. Requests opt
+# in with use_cache=True (llm_utils) and are keyed by kind (generate or
+# chat), model, options and the prompt or messages. A request whose text
+# only differs in case, whitespace or trailing punctuation matches too
+# ("normalized" hit). Sampled replies (temperature > 0 without a fixed seed)
+# are not reused unless SAHILGPT_LLM_CACHE_SAMPLED=1: asking again is how the
+# user gets a different answer.
+#
+# Entries live in SQLite (TTL, least recently used evicted past the size
+# budget) with the most recent ones in memory in front of it. Streamed
+# replies keep their token boundaries, so a hit replays the same tokens.
+
+CACHE_PATH = os.environ.get("SAHILGPT_LLM_CACHE_PATH", "data/llm_cache.db")
+TTL = float(os.environ.get("SAHILGPT_LLM_CACHE_TTL_HOURS", "168")) * 3600
+BUDGET_BYTES = int(float(os.environ.get("SAHILGPT_LLM_CACHE_MB", "64")) * 1024 * 1024)
+CACHE_SAMPLED = os.environ.get("SAHILGPT_LLM_CACHE_SAMPLED", "0") == "1"
+HOT_ENTRIES = 256
+TOUCH_INTERVAL = 60  # seconds; last_used is written at most this often per entry
+KEY_VERSION = "llm-v1"
+# Ollama's own default when the request sets no temperature
+DEFAULT_TEMPERATURE = 0.8
+
+_SPACE = re.compile(r"\s+")
+_TRAILING = re.compile(r"[\s.!?。！？]+$")
+_TOKEN = re.compile(r"\s*\S+")
+
+
+def normalize(text: str) -> str:
+    """Case, Unicode form, runs of whitespace and trailing punctuation don't change the question."""
+    text = unicodedata.normalize("NFKC", text).casefold()
+    return _TRAILING.sub("", _SPACE.sub(" ", text).strip())
+
+
+def is_deterministic(options: dict) -> bool:
+    return options.get("temperature", DEFAULT_TEMPERATURE) == 0 or options.get("seed") is not None
+
+
+def split_tokens(text: str) -> list[str]:
+    """Word-sized pieces to replay a reply that was stored without its token boundaries."""
+    return _TOKEN.findall(text) or [text]
+
+
+class RequestKey:
+    """The exact and the normalized key of one request."""
+
+    def __init__(self, kind: str, body, model: str | None = None, options: dict | None = None, **extra):
+        client = llm_client.get_client()
+        self.model = model or client.model
+        self.options = {**client.options, **(options or {})}
+        # keep_alive only says how long the model stays loaded; it doesn't change the reply
+        extra = {k: v for k, v in extra.items() if v is not None and k != "keep_alive"}
+        params = json.dumps([self.options, extra], sort_keys=True, default=str)
+        if kind == "chat":
+            normalized = [{**m, "content": normalize(m.get("content", ""))} for m in body]
+        else:
+            normalized = normalize(body)
+        self.exact = make_key(KEY_VERSION, kind, self.model, params, json.dumps(body, sort_keys=True))
+        self.normalized = make_key(KEY_VERSION, kind, self.model, params, json.dumps(normalized, sort_keys=True))
+        self.deterministic = is_deterministic(self.options)
+
+
+class LLMCache:
+    """
+    SQLite table of replies with an in-memory LRU in front of it.
+
+    get() looks for the exact request first and then for a normalized match;
+    entries older than ttl seconds are misses. put() stores a reply and, when
+    the table grows past budget_bytes, deletes the least recently used
+    entries until it is back under 90% of it.
+    """
+
+    def __init__(self, path: str = CACHE_PATH, ttl: float = TTL, budget_bytes: int = BUDGET_BYTES,
+                 hot_entries: int = HOT_ENTRIES):
+        self.path = path
+        self.ttl = ttl
+        self.budget_bytes = budget_bytes
+        self.hot_entries = hot_entries
+        self.hits = {"hot": 0, "exact": 0, "normalized": 0}
+        self.misses = 0
+        self.bypassed = 0
+        self.evictions = 0
+        self._hot = OrderedDict()  # exact or "n:" + normalized key -> entry
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS replies (
+                key TEXT PRIMARY KEY,
+                normalized_key TEXT NOT NULL,
+                model TEXT NOT NULL,
+                created REAL NOT NULL,
+                last_used REAL NOT NULL,
+                hits INTEGER NOT NULL DEFAULT 0,
+                response TEXT NOT NULL,
+                token_lengths TEXT,
+                meta TEXT,
+                size INTEGER NOT NULL
+            )""")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS ix_replies_normalized ON replies (normalized_key, last_used)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS ix_replies_last_used ON replies (last_used)")
+        self._size = self._conn.execute("SELECT coalesce(sum(size), 0) FROM replies").fetchone()[0]
+
+    # --- Lookups ---
+
+    def _hot_get(self, key: str, now: float):
+        entry = self._hot.get(key)
+        if entry is None:
+            return None
+        if entry["created"] + self.ttl <= now:
+            del self._hot[key]
+            return None
+        self._hot.move_to_end(key)
+        return entry
+
+    def _hot_put(self, entry: dict):
+        for key in (entry["key"], "n:" + entry["normalized_key"]):
+            self._hot[key] = entry
+            self._hot.move_to_end(key)
+        while len(self._hot) > self.hot_entries * 2:  # two keys per entry
+            self._hot.popitem(last=False)
+
+    def get(self, key: RequestKey) -> dict | None:
+        """The stored reply ({"response", "tokens", "meta", "match"}) or None."""
+        start = time.perf_counter()
+        now = time.time()
+        with self._lock:
+            entry = self._hot_get(key.exact, now) or self._hot_get("n:" + key.normalized, now)
+            match = "hot"
+            if entry is None:
+                row = self._conn.execute(
+                    "SELECT key, normalized_key, created, last_used, response, token_lengths, meta FROM replies "
+                    "WHERE key = ? AND created > ?", (key.exact, now - self.ttl)).fetchone()
+                match = "exact"
+                if row is None:
+                    row = self._conn.execute(
+                        "SELECT key, normalized_key, created, last_used, response, token_lengths, meta FROM replies "
+                        "WHERE normalized_key = ? AND created > ? ORDER BY last_used DESC LIMIT 1",
+                        (key.normalized, now - self.ttl)).fetchone()
+                    match = "normalized"
+                if row is None:
+                    self.misses += 1
+                    metrics.increment("llm_cache.miss")
+                    metrics.observe("llm_cache.lookup", time.perf_counter() - start)
+                    return None
+                entry = {"key": row[0], "normalized_key": row[1], "created": row[2], "last_used": row[3],
+                         "response": row[4], "token_lengths": json.loads(row[5]) if row[5] else None,
+                         "meta": json.loads(row[6]) if row[6] else {}}
+                self._hot_put(entry)
+            self.hits[match] += 1
+            if now - entry["last_used"] > TOUCH_INTERVAL:
+                entry["last_used"] = now
+                self._conn.execute("UPDATE replies SET last_used = ?, hits = hits + 1 WHERE key = ?",
+                                   (now, entry["key"]))
+        metrics.increment(f"llm_cache.hit_{match}")
+        metrics.observe("llm_cache.lookup", time.perf_counter() - start)
+        return {"response": entry["response"], "tokens": self._tokens(entry), "meta": entry["meta"], "match": match}
+
+    @staticmethod
+    def _tokens(entry: dict) -> list[str]:
+        lengths, text = entry["token_lengths"], entry["response"]
+        if not lengths:
+            return split_tokens(text)
+        tokens, offset = [], 0
+        for length in lengths:
+            tokens.append(text[offset:offset + length])
+            offset += length
+        return tokens
+
+    # --- Writes ---
+
+    def put(self, key: RequestKey, response: str, tokens: list[str] | None = None, meta: dict | None = None):
+        """Stores a complete reply. tokens (the streamed pieces, joined = response) are kept for replay."""
+        now = time.time()
+        token_lengths = json.dumps([len(t) for t in tokens]) if tokens else None
+        meta_json = json.dumps(meta) if meta else None
+        size = len(response.encode("utf-8")) + len(token_lengths or "") + len(meta_json or "") + 200
+        entry = {"key": key.exact, "normalized_key": key.normalized, "created": now, "last_used": now,
+                 "response": response, "token_lengths": json.loads(token_lengths) if token_lengths else None,
+                 "meta": meta or {}}
+        with self._lock:
+            old = self._conn.execute("SELECT size FROM replies WHERE key = ?", (key.exact,)).fetchone()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO replies (key, normalized_key, model, created, last_used, hits, response, "
+                "token_lengths, meta, size) VALUES (?, ?, ?, ?, ?, 0, ?, ?, ?, ?)",
+                (key.exact, key.normalized, key.model, now, now, response, token_lengths, meta_json, size))
+            self._size += size - (old[0] if old else 0)
+            self._hot_put(entry)
+            if self._size > self.budget_bytes:
+                self._evict()
+
+    def _evict(self):
+        """Called with the lock held: expired entries first, then least recently used down to 90% of the budget."""
+        self._conn.execute("BEGIN")
+        try:
+            expired = self._conn.execute("DELETE FROM replies WHERE created <= ?", (time.time() - self.ttl,)).rowcount
+            self._size = self._conn.execute("SELECT coalesce(sum(size), 0) FROM replies").fetchone()[0]
+            target = self.budget_bytes * 0.9
+            removed = []
+            for key, size in self._conn.execute("SELECT key, size FROM replies ORDER BY last_used").fetchall():
+                if self._size <= target:
+                    break
+                removed.append((key,))
+                self._size -= size
+            self._conn.executemany("DELETE FROM replies WHERE key = ?", removed)
+            self._conn.execute("COMMIT")
+        except Exception:
+            self._conn.execute("ROLLBACK")
+            raise
+        self.evictions += expired + len(removed)
+        metrics.increment("llm_cache.evictions", expired + len(removed))
+        self._hot.clear()
+
+    def bypass(self):
+        with self._lock:
+            self.bypassed += 1
+        metrics.increment("llm_cache.bypass")
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM replies")
+            self._size = 0
+            self._hot.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries = self._conn.execute("SELECT count(*) FROM replies").fetchone()[0]
+            hits = sum(self.hits.values())
+            calls = hits + self.misses
+            return {"hits": hits, **{f"{match}_hits": n for match, n in self.hits.items()}, "misses": self.misses,
+                    "bypassed": self.bypassed, "hit_rate": hits / calls if calls else 0.0, "entries": entries,
+                    "size_bytes": self._size, "budget_bytes": self.budget_bytes, "evictions": self.evictions}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_cache() -> LLMCache:
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = LLMCache()
+        return _cache
+
+# --- Helpers for llm_utils ---
+
+def key_for(kind: str, body, **request) -> RequestKey | None:
+    """The cache key of a request, or None if its reply shouldn't be reused (sampled, see CACHE_SAMPLED)."""
+    key = RequestKey(kind, body, **request)
+    if not key.deterministic and not CACHE_SAMPLED:
+        get_cache().bypass()
+        return None
+    return key
+
+
+def get(key: RequestKey | None) -> dict | None:
+    return get_cache().get(key) if key is not None else None
+
+
+def put(key: RequestKey | None, response: str, tokens: list[str] | None = None, meta: dict | None = None):
+    if key is not None and response:
+        get_cache().put(key, response, tokens, meta)
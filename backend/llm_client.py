@@ -0,0 +1,215 @@
+import asyncio
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+OLLAMA_BASE_URL = "http://localhost:11434"
+DEFAULT_MODEL = "llama3.1:70b"
+# How long Ollama keeps the model loaded after a request. Without this the
+# 70B model can get unloaded between chat turns and has to be reloaded.
+DEFAULT_KEEP_ALIVE = "30m"
+
+
+class OllamaError(Exception):
+    """Raised when Ollama answers with an error status or an error payload."""
+
+    def __init__(self, message: str, status_code: int | None = None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class OllamaClient:
+    """
+    A shared client for the local Ollama server.
+
+    Keeps a pool of keep-alive HTTP connections, retries connection failures and
+    "server busy" responses with exponential backoff, and limits how many
+    requests are in flight at once across every thread (and every Streamlit
+    session) that uses it. Blocking methods are safe to call from any thread;
+    the `a*` methods are the asyncio interface.
+
+    Args:
+        base_url: Where Ollama is listening.
+        model: Default model for requests that don't pass one.
+        keep_alive: Default `keep_alive` sent to Ollama (e.g. "30m", -1, 0).
+        options: Default model options (temperature, num_ctx, ...).
+        max_in_flight: Maximum number of concurrent requests to Ollama.
+        retries: How many times to retry a failed connection or 502/503/504.
+        backoff: Backoff factor in seconds (0.5 -> 0.5s, 1s, 2s, ...).
+        timeout: (connect, read) timeout in seconds. The read timeout is the
+            maximum gap between bytes, not the total generation time.
+    """
+
+    def __init__(self, base_url: str = OLLAMA_BASE_URL, model: str = DEFAULT_MODEL,
+                 keep_alive=DEFAULT_KEEP_ALIVE, options: dict | None = None,
+                 max_in_flight: int = 4, retries: int = 2, backoff: float = 0.5,
+                 timeout=(5, 120)):
+        self.base_url = base_url.rstrip("/")
+        self.model = model
+        self.keep_alive = keep_alive
+        self.options = dict(options or {})
+        self.max_in_flight = max_in_flight
+        self.timeout = timeout
+
+        retry = Retry(
+            total=retries, connect=retries, read=0, status=retries,
+            backoff_factor=backoff, status_forcelist=(502, 503, 504),
+            allowed_methods=frozenset({"GET", "POST"}), raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_in_flight, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        self._slots = threading.BoundedSemaphore(max_in_flight)
+        self._executor = ThreadPoolExecutor(max_workers=max_in_flight, thread_name_prefix="ollama")
+
+    # --- Request building ---
+
+    def _payload(self, model: str | None, options: dict | None, keep_alive, stream: bool, **extra) -> dict:
+        payload = {
+            "model": model or self.model,
+            "stream": stream,
+            "keep_alive": self.keep_alive if keep_alive is None else keep_alive,
+        }
+        merged_options = {**self.options, **(options or {})}
+        if merged_options:
+            payload["options"] = merged_options
+        payload.update({k: v for k, v in extra.items() if v is not None})
+        return payload
+
+    def _post(self, path: str, payload: dict, stream: bool = False) -> requests.Response:
+        response = self.session.post(f"{self.base_url}{path}", json=payload,
+                                     stream=stream, timeout=self.timeout)
+        if response.status_code != 200:
+            response.close()
+            raise OllamaError(f"Ollama returned status code {response.status_code}",
+                              status_code=response.status_code)
+        return response
+
+    def _stream(self, path: str, payload: dict):
+        with self._slots:
+            response = self._post(path, payload, stream=True)
+            try:
+                # chunk_size=None hands over each HTTP chunk (one token) as soon as it arrives
+                for line in response.iter_lines(chunk_size=None):
+                    if not line:
+                        continue
+                    chunk = json.loads(line)
+                    if "error" in chunk:
+                        raise OllamaError(chunk["error"])
+                    yield chunk
+                    if chunk.get("done"):
+                        break
+            finally:
+                response.close()
+
+    def _request(self, path: str, payload: dict) -> dict:
+        with self._slots:
+            response = self._post(path, payload)
+            data = response.json()
+        if "error" in data:
+            raise OllamaError(data["error"])
+        return data
+
+    # --- Blocking interface ---
+
+    def generate(self, prompt: str, model: str | None = None, options: dict | None = None,
+                 keep_alive=None, **extra) -> dict:
+        """
+        Sends one non-streaming /api/generate request and returns Ollama's JSON reply.
+        Extra keyword arguments (system, context, format, ...) are passed through.
+        """
+        payload = self._payload(model, options, keep_alive, stream=False, prompt=prompt, **extra)
+        return self._request("/api/generate", payload)
+
+    def stream_generate(self, prompt: str, model: str | None = None, options: dict | None = None,
+                        keep_alive=None, **extra):
+        """
+        Sends a streaming /api/generate request and yields each NDJSON chunk as a dict.
+        The in-flight slot and the connection are released when the generator
+        finishes or is closed.
+        """
+        payload = self._payload(model, options, keep_alive, stream=True, prompt=prompt, **extra)
+        yield from self._stream("/api/generate", payload)
+
+    def chat(self, messages: list[dict], model: str | None = None, options: dict | None = None,
+             keep_alive=None, **extra) -> dict:
+        """
+        Sends one non-streaming /api/chat request. messages is a list of
+        {"role": "system"|"user"|"assistant", "content": text} dicts.
+        """
+        payload = self._payload(model, options, keep_alive, stream=False, messages=messages, **extra)
+        return self._request("/api/chat", payload)
+
+    def stream_chat(self, messages: list[dict], model: str | None = None, options: dict | None = None,
+                    keep_alive=None, **extra):
+        """Streaming /api/chat; yields each NDJSON chunk (the text is in chunk["message"]["content"])."""
+        payload = self._payload(model, options, keep_alive, stream=True, messages=messages, **extra)
+        yield from self._stream("/api/chat", payload)
+
+    def embed(self, text: str, model: str) -> list[float]:
+        """Returns the embedding vector of `text` from /api/embeddings."""
+        payload = {"model": model, "prompt": text, "keep_alive": self.keep_alive}
+        return self._request("/api/embeddings", payload)["embedding"]
+
+    def generate_many(self, prompts: list[str], **kwargs) -> list:
+        """
+        Submits several prompts concurrently (bounded by max_in_flight) and
+        returns the replies in order. A failed prompt yields its exception
+        instead of a reply.
+        """
+        futures = [self._executor.submit(self.generate, prompt, **kwargs) for prompt in prompts]
+        results = []
+        for future in futures:
+            try:
+                results.append(future.result())
+            except Exception as e:
+                results.append(e)
+        return results
+
+    # --- asyncio interface ---
+
+    async def agenerate(self, prompt: str, **kwargs) -> dict:
+        """Async version of generate(); runs on the client's bounded worker threads."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, lambda: self.generate(prompt, **kwargs))
+
+    async def agenerate_many(self, prompts: list[str], **kwargs) -> list:
+        """Async version of generate_many()."""
+        return await asyncio.gather(*(self.agenerate(p, **kwargs) for p in prompts),
+                                    return_exceptions=True)
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+        self.session.close()
+
+
+# --- Shared client ---
+
+_default_client = None
+_default_client_lock = threading.Lock()
+
+def get_client() -> OllamaClient:
+    """Returns the process-wide client, creating it on first use."""
+    global _default_client
+    with _default_client_lock:
+        if _default_client is None:
+            _default_client = OllamaClient()
+        return _default_client
+
+def configure(**kwargs) -> OllamaClient:
+    """
+    Replaces the process-wide client, e.g. configure(model="llama3.1:8b", keep_alive=-1,
+    options={"num_ctx": 8192}, max_in_flight=2). Accepts OllamaClient's arguments.
+    """
+    global _default_client
+    with _default_client_lock:
+        old, _default_client = _default_client, OllamaClient(**kwargs)
+    if old is not None:
+        old.close()
+    return _default_client
@@ -1,30 +1,181 @@
 import requests
-import json
 import time
 
-OLLAMA_API_URL = "http://localhost:11434/api/generate"
+from backend import llm_cache, llm_client, metrics
+from backend.llm_client import OllamaError
 
-def get_llm_response(prompt: str) -> str:
+# Stats for the most recent streamed response (see stream_llm_response)
+last_stream_stats = {}
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count for budgeting prompts (Llama averages ~4 characters per token)."""
+    return max(1, len(text) // 4) if text else 0
+
+@metrics.timed()
+def get_llm_response(prompt: str, use_cache: bool = False) -> str:
     """
     Connects to the local Ollama server to get a response.
+    With use_cache, a stored reply to the same prompt is returned instead (see llm_cache).
     """
+    key = llm_cache.key_for("generate", prompt) if use_cache else None
+    cached = llm_cache.get(key)
+    if cached is not None:
+        return cached["response"].strip()
     try:
-        payload = {
-            "model": "llama3.1:70b",  # <-- THIS IS THE UPGRADE
-            "prompt": prompt,
-            "stream": False
-        }
-        
-        response = requests.post(OLLAMA_API_URL, json=payload, timeout=60)
-        
-        if response.status_code == 200:
-            response_data = response.json()
-            full_response = response_data.get("response", "Sorry, I got an empty response from the model.")
-            return full_response.strip()
-        else:
-            return f"Error: Could not connect to Ollama. Status code: {response.status_code}"
-            
+        response_data = llm_client.get_client().generate(prompt)
+        full_response = response_data.get("response", "Sorry, I got an empty response from the model.")
+        if response_data.get("response"):
+            llm_cache.put(key, response_data["response"], meta={"eval_count": response_data.get("eval_count")})
+        return full_response.strip()
+    except OllamaError as e:
+        if e.status_code is not None:
+            return f"Error: Could not connect to Ollama. Status code: {e.status_code}"
+        return f"Error from Ollama: {e}"
     except requests.exceptions.ConnectionError:
         return "Error: Could not connect to Ollama. Please make sure it's running."
     except Exception as e:
-        return f"An unexpected error occurred: {e}"
\ No newline at end of file
+        return f"An unexpected error occurred: {e}"
+
+# --- Streaming ---
+
+@metrics.timed()
+def stream_llm_response(prompt: str, stats: dict | None = None, use_cache: bool = False):
+    """
+    Streams a response from the local Ollama server, yielding text tokens as they arrive.
+
+    Ollama answers `"stream": True` requests with newline-delimited JSON, one object
+    per token, and a final object with `"done": true`. Errors are yielded as text
+    (like get_llm_response returns them) so the chat page can show them inline.
+    Closing the generator early (e.g. the user interrupts the page) closes the
+    HTTP connection, which makes Ollama stop generating.
+
+    Args:
+        prompt: The user's prompt.
+        stats: Optional dict that is filled with timing information:
+            "ttft" (seconds to first token), "tokens", "tokens_per_sec",
+            "total_time", "prompt_eval_count" and "prompt_eval_time" (prompt
+            tokens Ollama had to evaluate and the seconds it took), "done",
+            "cancelled", "error" and "cached" (None, or how the reply cache
+            matched: "hot", "exact" or "normalized").
+        use_cache: Replay the stored tokens of an earlier reply to the same
+            prompt if there is one, and store this reply (see llm_cache).
+
+    Yields:
+        Chunks of response text.
+    """
+    key = llm_cache.key_for("generate", prompt) if use_cache else None
+    cached = llm_cache.get(key)
+    if cached is not None:
+        yield from _replay(cached, stats)
+        return
+    chunks = llm_client.get_client().stream_generate(prompt)
+    yield from _stream_tokens(chunks, stats, lambda chunk: chunk.get("response", ""), key)
+
+@metrics.timed()
+def stream_chat(messages: list[dict], stats: dict | None = None, use_cache: bool = False, **request):
+    """
+    stream_llm_response() for a conversation on /api/chat: messages is a list
+    of {"role", "content"} dicts; request (model, options, keep_alive) is
+    passed on to the client.
+    """
+    key = llm_cache.key_for("chat", messages, **request) if use_cache else None
+    cached = llm_cache.get(key)
+    if cached is not None:
+        yield from _replay(cached, stats)
+        return
+    chunks = llm_client.get_client().stream_chat(messages, **request)
+    yield from _stream_tokens(chunks, stats, lambda chunk: chunk.get("message", {}).get("content", ""), key)
+
+def _reset_stats(stats: dict | None) -> dict:
+    global last_stream_stats
+    if stats is None:
+        stats = {}
+    stats.update(ttft=None, tokens=0, tokens_per_sec=None, total_time=None, prompt_eval_count=None,
+                 prompt_eval_time=None, done=False, cancelled=False, error=None, cached=None)
+    last_stream_stats = stats
+    return stats
+
+def _replay(cached: dict, stats):
+    """Yields a cached reply's tokens with the same stats a live stream fills in (nothing was evaluated)."""
+    stats = _reset_stats(stats)
+    stats.update(cached=cached["match"], prompt_eval_count=0, prompt_eval_time=0.0)
+    start = time.perf_counter()
+    try:
+        for token in cached["tokens"]:
+            if stats["ttft"] is None:
+                stats["ttft"] = time.perf_counter() - start
+                metrics.observe("llm_utils.time_to_first_token", stats["ttft"])
+            stats["tokens"] += 1
+            yield token
+        stats["done"] = True
+    except GeneratorExit:
+        stats["cancelled"] = True
+        raise
+    finally:
+        stats["total_time"] = time.perf_counter() - start
+
+def _stream_tokens(chunks, stats, text_of, cache_key=None):
+    stats = _reset_stats(stats)
+    received = []  # the tokens, kept for the reply cache
+
+    start = time.perf_counter()
+    first_token_at = None
+    eval_count = eval_duration = None
+    error = None
+
+    try:
+        for chunk in chunks:
+            token = text_of(chunk)
+            if token:
+                if first_token_at is None:
+                    first_token_at = time.perf_counter()
+                    stats["ttft"] = first_token_at - start
+                stats["tokens"] += 1
+                if cache_key is not None:
+                    received.append(token)
+                yield token
+            if chunk.get("done"):
+                stats["done"] = True
+                eval_count = chunk.get("eval_count")
+                eval_duration = chunk.get("eval_duration")  # nanoseconds
+                stats["prompt_eval_count"] = chunk.get("prompt_eval_count", 0)
+                if chunk.get("prompt_eval_duration") is not None:
+                    stats["prompt_eval_time"] = chunk["prompt_eval_duration"] / 1e9
+    except GeneratorExit:
+        stats["cancelled"] = True
+        raise
+    except OllamaError as e:
+        if e.status_code is not None:
+            error = f"Error: Could not connect to Ollama. Status code: {e.status_code}"
+        else:
+            error = f"Error from Ollama: {e}"
+    except requests.exceptions.ConnectionError:
+        if stats["tokens"]:
+            error = "Error: Lost connection to Ollama mid-response."
+        else:
+            error = "Error: Could not connect to Ollama. Please make sure it's running."
+    except requests.exceptions.Timeout:
+        error = "Error: Ollama stopped responding (timed out)."
+    except Exception as e:
+        error = f"An unexpected error occurred: {e}"
+    finally:
+        chunks.close()
+        end = time.perf_counter()
+        stats["total_time"] = end - start
+        if eval_count and eval_duration:
+            stats["tokens_per_sec"] = eval_count / (eval_duration / 1e9)
+        elif first_token_at is not None and stats["tokens"] > 1 and end > first_token_at:
+            stats["tokens_per_sec"] = (stats["tokens"] - 1) / (end - first_token_at)
+        if stats["ttft"] is not None:
+            metrics.observe("llm_utils.time_to_first_token", stats["ttft"])
+        metrics.increment("llm.tokens", stats["tokens"])
+        if stats["prompt_eval_count"] is not None:
+            metrics.increment("llm.prompt_eval_tokens", stats["prompt_eval_count"])
+        if stats["prompt_eval_time"] is not None:
+            metrics.observe("llm_utils.prompt_eval", stats["prompt_eval_time"])
+
+    if error:
+        stats["error"] = error
+        yield f"\n\n{error}" if stats["tokens"] else error
+    elif stats["done"] and received:
+        llm_cache.put(cache_key, "".join(received), received, meta={"eval_count": eval_count})
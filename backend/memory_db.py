@@ -1,19 +1,47 @@
 import sqlalchemy as db
 from sqlalchemy.orm import sessionmaker, declarative_base
-from sqlalchemy import Column, Integer, String, DateTime
+from sqlalchemy import Column, Integer, String, DateTime, Index, event, insert, text, tuple_
+import atexit
 import datetime
 import os
+import queue
+import threading
+import time
 
-# Define database path
-DB_PATH = "data/memory.db"
+from backend import metrics, result_cache
+
+# Define database path (SAHILGPT_DB_PATH overrides it, e.g. for benchmarks)
+DB_PATH = os.environ.get("SAHILGPT_DB_PATH", "data/memory.db")
 DB_URL = f"sqlite:///{DB_PATH}"
+# Reads are cached between Streamlit reruns; every write invalidates them, the
+# TTL only bounds staleness from writes made by other processes
+MEMORY_CACHE_TTL = 60
 
 # Ensure the data directory exists
-os.makedirs(os.path.dirname(DB_PATH), exist_ok=True)
+os.makedirs(os.path.dirname(DB_PATH) or ".", exist_ok=True)
 
 # SQLAlchemy setup
 engine = db.create_engine(DB_URL)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+@event.listens_for(engine, "connect")
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    # WAL lets readers (the Memories page) run while a write is in progress, and
+    # synchronous=NORMAL only fsyncs at checkpoints instead of on every commit.
+    # auto_vacuum has to be set before anything is written to a new file (it
+    # is ignored for existing ones; memory_retention converts those once) and
+    # lets memory_retention give freed pages back to the OS a step at a time.
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA auto_vacuum=INCREMENTAL")
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute("PRAGMA busy_timeout=5000")
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.execute("PRAGMA cache_size=-16000")  # 16 MB
+    cursor.close()
+
+# expire_on_commit=False keeps a committed Memory's fields readable after the
+# session closes, so add_memory doesn't need an extra SELECT to refresh it
+SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine, expire_on_commit=False)
 Base = declarative_base()
 
 # Define the Memory table model
@@ -22,9 +50,50 @@ class Memory(Base):
     id = Column(Integer, primary_key=True, index=True)
     timestamp = Column(DateTime, default=datetime.datetime.utcnow)
     content = Column(String, nullable=False)
+    # Newest-first listing and keyset pagination walk (timestamp, id)
+    __table_args__ = (Index("ix_memories_timestamp_id", "timestamp", "id"),)
 
 # Create the table if it doesn't exist
 Base.metadata.create_all(bind=engine)
+# create_all skips indexes of tables that already exist (databases from older versions)
+for _index in Memory.__table__.indexes:
+    _index.create(bind=engine, checkfirst=True)
+
+# --- Full-text index ---
+# An external-content FTS5 table over memories.content, kept in sync by
+# triggers, so every insert path (including bulk inserts) updates it.
+FTS_TABLE = "memories_fts"
+
+def _setup_fts() -> bool:
+    with engine.begin() as conn:
+        try:
+            exists = conn.execute(text(
+                "SELECT 1 FROM sqlite_master WHERE type='table' AND name=:name"), {"name": FTS_TABLE}).first()
+            conn.execute(text(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} "
+                "USING fts5(content, content='memories', content_rowid='id')"))
+        except db.exc.OperationalError as e:
+            print(f"SQLite FTS5 is not available, memory search will use LIKE: {e}")
+            return False
+        conn.execute(text(f"""
+            CREATE TRIGGER IF NOT EXISTS memories_fts_insert AFTER INSERT ON memories BEGIN
+                INSERT INTO {FTS_TABLE}(rowid, content) VALUES (new.id, new.content);
+            END"""))
+        conn.execute(text(f"""
+            CREATE TRIGGER IF NOT EXISTS memories_fts_delete AFTER DELETE ON memories BEGIN
+                INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, content) VALUES ('delete', old.id, old.content);
+            END"""))
+        conn.execute(text(f"""
+            CREATE TRIGGER IF NOT EXISTS memories_fts_update AFTER UPDATE OF content ON memories BEGIN
+                INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, content) VALUES ('delete', old.id, old.content);
+                INSERT INTO {FTS_TABLE}(rowid, content) VALUES (new.id, new.content);
+            END"""))
+        if not exists:
+            # Index the rows that were written before the FTS table existed
+            conn.execute(text(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')"))
+    return True
+
+FTS_AVAILABLE = _setup_fts()
 
 def get_db():
     """Generator to get a database session."""
@@ -34,20 +103,302 @@ def get_db():
     finally:
         db_session.close()
 
+# --- Change hooks ---
+_listeners = []
+_removal_listeners = []
+
+def on_memories_added(callback):
+    """
+    Registers callback(rows) to run after new memories are committed, where rows
+    is a list of (id, content) tuples. Can be used as a decorator. Callbacks run
+    on the writing thread, so they should be quick or hand work off.
+    """
+    _listeners.append(callback)
+    return callback
+
+def _notify_added(rows: list[tuple[int, str]]):
+    result_cache.invalidate("memories")
+    for callback in list(_listeners):
+        try:
+            callback(rows)
+        except Exception as e:
+            print(f"Error in memory listener {callback!r}: {e}")
+
+def on_memories_removed(callback):
+    """Registers callback(ids) to run after memories were deleted (e.g. archived by memory_retention)."""
+    _removal_listeners.append(callback)
+    return callback
+
+def notify_removed(ids: list[int]):
+    """Called by code that deletes memories, after its transaction committed."""
+    result_cache.invalidate("memories")
+    for callback in list(_removal_listeners):
+        try:
+            callback(ids)
+        except Exception as e:
+            print(f"Error in memory listener {callback!r}: {e}")
+
+# --- Write-behind mode ---
+
+class MemoryWriter:
+    """
+    Buffers new memories in a bounded queue and inserts them from a background
+    thread, one transaction per batch. A batch is written when it reaches
+    batch_size rows or flush_interval seconds after its first row, whichever
+    comes first. When the queue is full, callers block for up to put_timeout
+    seconds (backpressure) and then write their row synchronously.
+
+    A batch that fails with a transient error (database locked past
+    busy_timeout, e.g. while memory_retention deletes archived rows) is retried
+    `retries` times with exponential backoff and then kept for the next batch,
+    so memories are only lost if the database still refuses them at exit.
+    """
+
+    def __init__(self, batch_size: int = 256, flush_interval: float = 0.5,
+                 max_queue: int = 10000, put_timeout: float = 1.0, retries: int = 4, backoff: float = 0.1):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.put_timeout = put_timeout
+        self.retries = retries
+        self.backoff = backoff
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._held = []  # rows of batches that failed, written with the next one
+        self._stop = threading.Event()
+        self._flush_lock = threading.Lock()
+        self.rows_written = 0
+        self.batches_written = 0
+        self._thread = threading.Thread(target=self._run, name="memory-writer", daemon=True)
+        self._thread.start()
+
+    def submit(self, content: str) -> Memory:
+        row = {"content": content, "timestamp": datetime.datetime.utcnow()}
+        try:
+            self._queue.put(row, timeout=self.put_timeout)
+        except queue.Full:
+            # The flusher can't keep up; write this row on the caller's thread
+            self._write([row])
+        return Memory(**row)
+
+    def _insert(self, rows: list[dict]) -> list[int]:
+        """Inserts rows in one transaction and returns their ids, in the order of rows."""
+        with self._flush_lock:
+            db_session = SessionLocal()
+            try:
+                # RETURNING doesn't promise input order; sort_by_parameter_order makes SQLAlchemy restore it
+                ids = db_session.scalars(insert(Memory).returning(Memory.id, sort_by_parameter_order=True), rows).all()
+                db_session.commit()
+            except Exception:
+                db_session.rollback()
+                raise
+            finally:
+                db_session.close()
+            self.rows_written += len(rows)
+            self.batches_written += 1
+            return ids
+
+    def _write(self, rows: list[dict]) -> bool:
+        """Writes a batch, retrying transient errors; a batch that still fails is held for the next one."""
+        if not rows:
+            return True
+        for attempt in range(self.retries + 1):
+            try:
+                ids = self._insert(rows)
+                break
+            except db.exc.OperationalError as e:
+                if attempt == self.retries:
+                    print(f"Error writing {len(rows)} memories, keeping them for the next batch: {e}")
+                    metrics.increment("memory_db.write_retry_exhausted")
+                    with self._flush_lock:
+                        self._held.extend(rows)
+                    return False
+                time.sleep(self.backoff * 2 ** attempt)
+            except Exception as e:
+                print(f"Error writing {len(rows)} memories: {e}")
+                return False
+        _notify_added([(memory_id, row["content"]) for memory_id, row in zip(ids, rows)])
+        return True
+
+    def _take_held(self) -> list[dict]:
+        with self._flush_lock:
+            rows, self._held = self._held, []
+        return rows
+
+    def _drain(self, first=None) -> list[dict]:
+        rows = [] if first is None else [first]
+        deadline = time.monotonic() + self.flush_interval
+        while len(rows) < self.batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0 or self._stop.is_set():
+                break
+            try:
+                rows.append(self._queue.get(timeout=timeout))
+            except queue.Empty:
+                break
+        # Take whatever else is already waiting without blocking
+        while len(rows) < self.batch_size:
+            try:
+                rows.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return rows
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                first = self._queue.get(timeout=0.2)
+            except queue.Empty:
+                if not self._held:
+                    continue
+                first = None  # retry the held rows, with whatever arrives within flush_interval
+            held = self._take_held()
+            self._write(held + self._drain(first))
+        self.flush()
+
+    def flush(self):
+        """Writes everything that is queued right now (called on shutdown)."""
+        held = self._take_held()
+        if held and not self._write(held):
+            held = self._take_held()
+            print(f"Lost {len(held)} memories: the database kept refusing them.")
+        while True:
+            rows = []
+            while len(rows) < self.batch_size:
+                try:
+                    rows.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            if not rows:
+                return
+            self._write(rows)
+
+    def pending(self) -> int:
+        return self._queue.qsize() + len(self._held)
+
+    def close(self):
+        self._stop.set()
+        self._thread.join()
+        self.flush()
+
+_writer = None
+
+def enable_write_behind(**kwargs) -> MemoryWriter:
+    """
+    Switches add_memory to write-behind mode. Accepts MemoryWriter's arguments.
+    Queued rows are flushed when disable_write_behind() is called or the process exits.
+    """
+    global _writer
+    if _writer is None:
+        _writer = MemoryWriter(**kwargs)
+    return _writer
+
+def disable_write_behind():
+    """Flushes the queue and goes back to writing each memory synchronously."""
+    global _writer
+    writer, _writer = _writer, None
+    if writer is not None:
+        writer.close()
+
+atexit.register(disable_write_behind)
+
+if os.environ.get("SAHILGPT_WRITE_BEHIND") == "1":
+    enable_write_behind()
+
+# --- Public API ---
+
+@metrics.timed()
 def add_memory(content: str):
-    """Adds a new memory entry to the database."""
+    """
+    Adds a new memory entry to the database.
+    In write-behind mode the entry is queued and the returned Memory has no id yet.
+    """
+    if _writer is not None:
+        return _writer.submit(content)
     db_session = next(get_db())
     new_memory = Memory(content=content)
     db_session.add(new_memory)
     db_session.commit()
-    db_session.refresh(new_memory)
     db_session.close()
+    _notify_added([(new_memory.id, new_memory.content)])
     return new_memory
 
+@metrics.timed()
+@result_cache.cached(ttl=MEMORY_CACHE_TTL, tags=("memories",))
 def list_memories(limit: int = 50):
     """Retrieves the most recent memories from the database."""
     db_session = next(get_db())
-    memories = db_session.query(Memory).order_by(Memory.timestamp.desc()).limit(limit).all()
+    memories = db_session.query(Memory).order_by(Memory.timestamp.desc(), Memory.id.desc()).limit(limit).all()
     db_session.close()
     return memories
-    
\ No newline at end of file
+
+@metrics.timed()
+def get_memories(ids) -> dict:
+    """Returns {id: Memory} for the given ids (missing ids are left out)."""
+    ids = list(ids)
+    if not ids:
+        return {}
+    db_session = next(get_db())
+    memories = db_session.query(Memory).filter(Memory.id.in_(ids)).all()
+    db_session.close()
+    return {memory.id: memory for memory in memories}
+
+def iter_memories_after(last_id: int, batch_size: int = 5000):
+    """Yields lists of (id, content) for every memory with id > last_id, in id order."""
+    while True:
+        db_session = next(get_db())
+        rows = (db_session.query(Memory.id, Memory.content).filter(Memory.id > last_id)
+                .order_by(Memory.id).limit(batch_size).all())
+        db_session.close()
+        if not rows:
+            return
+        yield [(row.id, row.content) for row in rows]
+        last_id = rows[-1].id
+
+def _fts_query(query: str) -> str:
+    # Quote every word so user input can't inject FTS syntax; the trailing *
+    # makes each word a prefix match ("proj" finds "project")
+    terms = [term.replace('"', '""') for term in query.split()]
+    return " ".join(f'"{term}"*' for term in terms)
+
+@metrics.timed()
+@result_cache.cached(ttl=MEMORY_CACHE_TTL, tags=("memories",))
+def search_memories(query: str | None = None, start: datetime.datetime | None = None,
+                    end: datetime.datetime | None = None, cursor: tuple | None = None,
+                    limit: int = 50):
+    """
+    Returns one page of memories, newest first.
+
+    Args:
+        query: Words that must all appear in the content (prefix match).
+        start / end: Only memories with start <= timestamp < end.
+        cursor: The next_cursor returned for the previous page, or None for the first page.
+        limit: Page size.
+
+    Returns:
+        (memories, next_cursor). next_cursor is None on the last page.
+    """
+    db_session = next(get_db())
+    try:
+        q = db_session.query(Memory)
+        if query and query.strip():
+            if FTS_AVAILABLE:
+                q = q.filter(text(
+                    f"memories.id IN (SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH :fts_query)"
+                )).params(fts_query=_fts_query(query))
+            else:
+                for term in query.split():
+                    q = q.filter(Memory.content.ilike(f"%{term}%"))
+        if start is not None:
+            q = q.filter(Memory.timestamp >= start)
+        if end is not None:
+            q = q.filter(Memory.timestamp < end)
+        if cursor is not None:
+            # Keyset pagination: continue right after the last row of the previous page
+            q = q.filter(tuple_(Memory.timestamp, Memory.id) < tuple_(*cursor))
+        memories = q.order_by(Memory.timestamp.desc(), Memory.id.desc()).limit(limit + 1).all()
+    finally:
+        db_session.close()
+    if len(memories) > limit:
+        memories = memories[:limit]
+        last = memories[-1]
+        return memories, (last.timestamp, last.id)
+    return memories, None
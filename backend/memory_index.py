@@ -0,0 +1,361 @@
+import hashlib
+import json
+import os
+import queue
+import re
+import threading
+
+import numpy as np
+
+from backend import llm_client, llm_utils, memory_db
+
+INDEX_DIR = "data/memory_index"
+# "hashing" (offline, deterministic) or "ollama" (uses EMBED_MODEL on the local server)
+EMBEDDER = os.environ.get("SAHILGPT_EMBEDDER", "hashing")
+EMBED_MODEL = os.environ.get("SAHILGPT_EMBED_MODEL", "nomic-embed-text")
+# Store vectors as int8 with a per-row scale (4x smaller, slightly less precise)
+QUANTIZE = os.environ.get("SAHILGPT_INDEX_INT8") == "1"
+
+SEARCH_CHUNK_ROWS = 65536  # rows scored per matrix-vector product (bounds temporary memory)
+# int8 rows are converted to float32 before scoring; small chunks keep that copy in cache
+SEARCH_CHUNK_ROWS_INT8 = 8192
+REMOVED_ID = 0  # id of a removed row (SQLite ids start at 1)
+
+# --- Embedders ---
+
+class HashingEmbedder:
+    """
+    Deterministic, dependency-free embeddings: words and word bigrams are hashed
+    into `dim` signed buckets and the vector is L2-normalized. Good enough to
+    recall memories that share vocabulary with the prompt, and used in tests
+    and benchmarks.
+    """
+
+    def __init__(self, dim: int = 256):
+        self.dim = dim
+        self.name = f"hashing-{dim}"
+
+    def _features(self, text: str):
+        words = re.findall(r"[a-z0-9]+", text.lower())
+        return words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+
+    def embed(self, texts: list[str]) -> np.ndarray:
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for feature in self._features(text):
+                digest = int.from_bytes(hashlib.blake2b(feature.encode(), digest_size=8).digest(), "little")
+                vectors[row, digest % self.dim] += 1.0 if digest >> 63 else -1.0
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.maximum(norms, 1e-12)
+
+
+class OllamaEmbedder:
+    """Embeddings from an Ollama embedding model (e.g. nomic-embed-text)."""
+
+    def __init__(self, model: str = EMBED_MODEL, dim: int | None = None):
+        self.model = model
+        self.name = f"ollama-{model}"
+        self.dim = dim or len(self._embed_one("dimension probe"))
+
+    def _embed_one(self, text: str) -> list[float]:
+        return llm_client.get_client().embed(text, self.model)
+
+    def embed(self, texts: list[str]) -> np.ndarray:
+        vectors = np.asarray([self._embed_one(t) for t in texts], dtype=np.float32).reshape(-1, self.dim)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.maximum(norms, 1e-12)
+
+
+def make_embedder(name: str = EMBEDDER):
+    if name == "ollama":
+        return OllamaEmbedder()
+    return HashingEmbedder()
+
+# --- Vector index ---
+
+class VectorIndex:
+    """
+    An append-only matrix of normalized embeddings on disk, memory-mapped so
+    that millions of rows don't have to fit in RAM.
+
+    Files in `directory`: vectors.f32 or vectors.i8 (capacity x dim), scales.f32
+    (int8 only, one scale per row), ids.i64 (memory id per row) and meta.json
+    (row count, dim, dtype, embedder name). The files grow by doubling.
+    Removed rows stay in place with id REMOVED_ID and a zero vector.
+    """
+
+    def __init__(self, directory: str, dim: int, embedder_name: str, quantize: bool = False,
+                 initial_capacity: int = 4096):
+        self.directory = directory
+        self.dim = dim
+        self.embedder_name = embedder_name
+        self.quantize = quantize
+        self._lock = threading.RLock()
+        os.makedirs(directory, exist_ok=True)
+
+        meta = self._read_meta()
+        if meta and (meta["dim"] != dim or meta["embedder"] != embedder_name or meta["int8"] != quantize):
+            print(f"Memory index in {directory} was built with different settings; rebuilding it.")
+            meta = None
+        self.count = meta["count"] if meta else 0
+        self.capacity = max(initial_capacity, meta["capacity"] if meta else 0)
+        self._open(create=meta is None)
+        self.max_id = int(self.ids[:self.count].max()) if self.count else 0
+
+    # File handling
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    def _read_meta(self):
+        try:
+            with open(self._path("meta.json")) as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    def _write_meta(self):
+        meta = {"count": self.count, "capacity": self.capacity, "dim": self.dim,
+                "embedder": self.embedder_name, "int8": self.quantize}
+        tmp = self._path("meta.json.tmp")
+        with open(tmp, "w") as f:
+            json.dump(meta, f)
+        os.replace(tmp, self._path("meta.json"))
+
+    def _memmap(self, name, dtype, shape, create):
+        path = self._path(name)
+        size = int(np.prod(shape)) * np.dtype(dtype).itemsize
+        if create or not os.path.exists(path) or os.path.getsize(path) < size:
+            with open(path, "r+b" if os.path.exists(path) and not create else "wb") as f:
+                f.truncate(size)
+        return np.memmap(path, dtype=dtype, mode="r+", shape=shape)
+
+    def _open(self, create=False):
+        vector_dtype = np.int8 if self.quantize else np.float32
+        self.vectors = self._memmap("vectors.i8" if self.quantize else "vectors.f32",
+                                    vector_dtype, (self.capacity, self.dim), create)
+        self.scales = self._memmap("scales.f32", np.float32, (self.capacity,), create) if self.quantize else None
+        self.ids = self._memmap("ids.i64", np.int64, (self.capacity,), create)
+
+    def _grow(self, needed):
+        capacity = self.capacity
+        while capacity < needed:
+            capacity *= 2
+        self.flush()
+        # The old maps stay valid (the files only grow), so a search holding them can finish
+        self.capacity = capacity
+        self._open()
+
+    # Updates and queries
+    def contains(self, ids) -> np.ndarray:
+        """For each id, whether it already has a row."""
+        ids = np.asarray(ids, dtype=np.int64)
+        with self._lock:
+            if not self.count or ids.min() > self.max_id:
+                return np.zeros(len(ids), dtype=bool)
+            return np.isin(ids, self.ids[:self.count])
+
+    def remove(self, ids) -> int:
+        """Blanks the rows of the given memory ids, so search() no longer returns them. Returns the rows removed."""
+        ids = np.asarray(list(ids), dtype=np.int64)
+        with self._lock:
+            if not self.count or not len(ids):
+                return 0
+            rows = np.flatnonzero(np.isin(self.ids[:self.count], ids))
+            if len(rows):
+                self.ids[rows] = REMOVED_ID
+                self.vectors[rows] = 0
+                if self.scales is not None:
+                    self.scales[rows] = 0
+            return len(rows)
+
+    def add(self, ids, vectors: np.ndarray):
+        """Appends rows. Vectors must be L2-normalized float32 (n, dim)."""
+        vectors = np.asarray(vectors, dtype=np.float32)
+        n = len(vectors)
+        if not n:
+            return
+        with self._lock:
+            if self.count + n > self.capacity:
+                self._grow(self.count + n)
+            rows = slice(self.count, self.count + n)
+            if self.quantize:
+                scales = np.maximum(np.abs(vectors).max(axis=1), 1e-12) / 127.0
+                self.vectors[rows] = np.round(vectors / scales[:, None]).astype(np.int8)
+                self.scales[rows] = scales
+            else:
+                self.vectors[rows] = vectors
+            ids = np.asarray(ids, dtype=np.int64)
+            self.ids[rows] = ids
+            self.count += n
+            self.max_id = max(self.max_id, int(ids.max()))
+            self._write_meta()
+
+    def flush(self):
+        with self._lock:
+            self.vectors.flush()
+            self.ids.flush()
+            if self.scales is not None:
+                self.scales.flush()
+
+    def search(self, query: np.ndarray, k: int = 5) -> list[tuple[int, float]]:
+        """Top-k (memory id, cosine similarity), best first."""
+        query = np.asarray(query, dtype=np.float32).reshape(-1)
+        # A grow swaps the maps; take the ones that go with count under the lock
+        with self._lock:
+            count, vectors, scales, ids = self.count, self.vectors, self.scales, self.ids
+        if not count or k <= 0:
+            return []
+        best_scores = np.empty(0, dtype=np.float32)
+        best_rows = np.empty(0, dtype=np.int64)
+        chunk_rows = SEARCH_CHUNK_ROWS_INT8 if self.quantize else SEARCH_CHUNK_ROWS
+        for start in range(0, count, chunk_rows):
+            stop = min(count, start + chunk_rows)
+            chunk = vectors[start:stop]
+            if self.quantize:
+                scores = (chunk.astype(np.float32) @ query) * scales[start:stop]
+            else:
+                scores = chunk @ query
+            if len(scores) > k:
+                top = np.argpartition(scores, -k)[-k:]
+            else:
+                top = np.arange(len(scores))
+            best_scores = np.concatenate([best_scores, scores[top]])
+            best_rows = np.concatenate([best_rows, top + start])
+            if len(best_scores) > k:
+                keep = np.argpartition(best_scores, -k)[-k:]
+                best_scores, best_rows = best_scores[keep], best_rows[keep]
+        order = np.argsort(-best_scores)
+        return [(int(ids[best_rows[i]]), float(best_scores[i])) for i in order if ids[best_rows[i]] != REMOVED_ID]
+
+
+class MemoryIndex:
+    """
+    Keeps a VectorIndex in step with the memories table. New memories arrive
+    through memory_db's insert hook and are embedded in batches on a background
+    thread, so add_memory never waits on the embedder. Memories deleted from
+    the table (archived by memory_retention) are removed through the same
+    queue. On start it also catches up on memories written while the app
+    wasn't running.
+    """
+
+    def __init__(self, directory: str = INDEX_DIR, embedder=None, quantize: bool = QUANTIZE):
+        self.embedder = embedder or make_embedder()
+        self.index = VectorIndex(directory, self.embedder.dim, self.embedder.name, quantize)
+        self._queue = queue.Queue()
+        self._pending = 0
+        self._pending_changed = threading.Condition()
+        self._thread = threading.Thread(target=self._run, name="memory-index", daemon=True)
+        self._thread.start()
+        memory_db.on_memories_added(self.enqueue)
+        memory_db.on_memories_removed(self.enqueue_removal)
+        self.enqueue(None)  # catch-up marker
+
+    def enqueue(self, rows: list[tuple[int, str]] | tuple | None):
+        with self._pending_changed:
+            self._pending += 1
+        self._queue.put(rows)
+
+    def enqueue_removal(self, ids: list[int]):
+        self.enqueue(("remove", list(ids)))
+
+    def _add(self, rows):
+        # Notifications can arrive out of id order (concurrent sessions, write-behind
+        # and direct writes), so skip only the ids that are actually indexed
+        rows = sorted(dict(rows).items())
+        if not rows:
+            return
+        stored = self.index.contains([i for i, _ in rows])
+        rows = [row for row, done in zip(rows, stored) if not done]
+        if rows:
+            self.index.add([i for i, _ in rows], self.embedder.embed([c for _, c in rows]))
+
+    def catch_up(self):
+        for rows in memory_db.iter_memories_after(self.index.max_id):
+            self._add(rows)
+        self.index.flush()
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            batch = [item]
+            while True:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                if any(item is None for item in batch):
+                    self.catch_up()
+                # In queue order, so a memory is never added back after its removal
+                rows = []
+                for item in batch:
+                    if isinstance(item, tuple):  # ("remove", ids)
+                        self._add(rows)
+                        rows = []
+                        self.index.remove(item[1])
+                    elif item is not None:
+                        rows.extend(item)
+                self._add(rows)
+            except Exception as e:
+                print(f"Error updating memory index: {e}")
+            with self._pending_changed:
+                self._pending -= len(batch)
+                self._pending_changed.notify_all()
+
+    def wait_until_current(self, timeout: float | None = None) -> bool:
+        """Blocks until queued memories are indexed (used by benchmarks)."""
+        with self._pending_changed:
+            return self._pending_changed.wait_for(lambda: self._pending == 0, timeout)
+
+    def search(self, text: str, k: int = 5) -> list[tuple[int, float]]:
+        return self.index.search(self.embedder.embed([text])[0], k)
+
+
+_memory_index = None
+_memory_index_lock = threading.Lock()
+
+def get_index() -> MemoryIndex:
+    """Returns the shared index, opening it (and starting its updater) on first use."""
+    global _memory_index
+    with _memory_index_lock:
+        if _memory_index is None:
+            _memory_index = MemoryIndex()
+        return _memory_index
+
+# --- Recall for chat ---
+
+def recall(prompt: str, k: int = 5, token_budget: int = 400, min_score: float = 0.25) -> list:
+    """
+    Returns up to k memories relevant to `prompt` as (Memory, score), best
+    first, whose combined content fits in `token_budget` tokens.
+    """
+    hits = [(memory_id, score) for memory_id, score in get_index().search(prompt, k) if score >= min_score]
+    memories = memory_db.get_memories(memory_id for memory_id, _ in hits)
+    selected, used = [], 0
+    for memory_id, score in hits:
+        memory = memories.get(memory_id)
+        if memory is None:  # deleted since it was indexed
+            continue
+        cost = llm_utils.estimate_tokens(memory.content)
+        if used + cost > token_budget:
+            continue
+        selected.append((memory, score))
+        used += cost
+    return selected
+
+def memory_context(prompt: str, k: int = 5, token_budget: int = 400) -> str:
+    """The most relevant memories as a block of text for the model, or "" if there are none."""
+    try:
+        recalled = recall(prompt, k, token_budget)
+    except Exception as e:
+        print(f"Memory recall failed: {e}")
+        return ""
+    if not recalled:
+        return ""
+    lines = [f"- [{m.timestamp.strftime('%Y-%m-%d %H:%M')}] {m.content}" for m, _ in recalled]
+    return "Things you remember about the user (use them only if relevant):\n" + "\n".join(lines)
+
+def build_prompt(prompt: str, k: int = 5, token_budget: int = 400) -> str:
+    """Prefixes the prompt with the most relevant memories, if there are any."""
+    context = memory_context(prompt, k, token_budget)
+    return f"{context}\n\nUser: {prompt}" if context else prompt
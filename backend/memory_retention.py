@@ -0,0 +1,425 @@
+import datetime
+import fcntl
+import json
+import os
+import struct
+import threading
+import time
+import zlib
+
+from sqlalchemy import Column, Date, DateTime, Integer, String, text
+
+from backend import memory_db, metrics, result_cache
+from backend.memory_db import Memory
+
+# Retention for the memories table, which otherwise grows by one row per
+# event forever. compact() moves rows out of the live table in three ways:
+#
+# - rollup: events that carry no information beyond their type ("User ran
+#   code.", logins) are reduced to counts per day after ROLLUP_AFTER_DAYS;
+# - age: everything older than RETENTION_DAYS leaves the live table;
+# - size: while the live data is over MAX_DB_MB, the oldest month leaves too.
+#
+# Rows that leave are first appended to a compressed segment file per month
+# (memory_archive/YYYY-MM.seg) and counted per day and event type in the
+# memory_rollups table, so nothing is lost: search_archive() reads the
+# segments on demand and rollup_counts() answers "how often" questions.
+# Deletes run in short batches (WAL lets writers and readers in between),
+# then freed pages are returned with incremental VACUUM.
+
+ARCHIVE_DIR = os.environ.get("SAHILGPT_MEMORY_ARCHIVE_DIR",
+                             os.path.join(os.path.dirname(memory_db.DB_PATH) or ".", "memory_archive"))
+RETENTION_DAYS = float(os.environ.get("SAHILGPT_MEMORY_RETENTION_DAYS", "365"))   # 0 = no age limit
+ROLLUP_AFTER_DAYS = float(os.environ.get("SAHILGPT_MEMORY_ROLLUP_DAYS", "30"))    # 0 = no rollups
+MAX_DB_MB = float(os.environ.get("SAHILGPT_MEMORY_MAX_MB", "0"))                   # 0 = no size limit
+RETENTION_INTERVAL = float(os.environ.get("SAHILGPT_RETENTION_INTERVAL", str(6 * 3600)))  # seconds between runs
+BATCH_ROWS = 2000          # rows archived and deleted per transaction
+VACUUM_STEP_PAGES = 1024   # pages returned per incremental_vacuum call
+PAUSE = 0.005              # seconds between batches, so writers get the database
+
+# Events with nothing but their type in them: only their daily counts are kept after ROLLUP_AFTER_DAYS
+ROLLUP_EVENTS = {
+    "code_run": "User ran code.",
+    "login": "User logged in successfully via face scan.",
+    "failed_login": "Failed login attempt via face scan.",
+}
+# Event types counted per day when rows are archived; a trailing % matches any rest
+COUNTED_EVENTS = {
+    **ROLLUP_EVENTS,
+    "chat": "Chat: User said %",
+    "image": "User generated image with prompt: %",
+    "project": "User action: Open project %",
+    "enrolled": "User enrolled face.",
+}
+
+
+def classify(content: str) -> str:
+    """The COUNTED_EVENTS name of a memory, or "other"."""
+    for name, pattern in COUNTED_EVENTS.items():
+        if content == pattern or (pattern.endswith("%") and content.startswith(pattern[:-1])):
+            return name
+    return "other"
+
+
+class MemoryRollup(memory_db.Base):
+    __tablename__ = "memory_rollups"
+    day = Column(Date, primary_key=True)
+    event = Column(String, primary_key=True)
+    count = Column(Integer, nullable=False)
+    first_seen = Column(DateTime)
+    last_seen = Column(DateTime)
+
+MemoryRollup.__table__.create(bind=memory_db.engine, checkfirst=True)
+
+# --- Archive segments ---
+# A segment is a sequence of blocks: a fixed header (magic, rows, first and
+# last id, first and last timestamp in µs, payload length) and a zlib
+# compressed JSON list of [id, timestamp µs, content]. Blocks are only ever
+# appended; a block torn by a crash is cut off before the next append. A row
+# archived twice (crash between the append and the delete) is returned once.
+
+SEGMENT_MAGIC = b"SGMA"
+_BLOCK_HEADER = struct.Struct("<4sIqqqqI")
+_EPOCH = datetime.datetime(1970, 1, 1)
+
+
+def _to_us(timestamp: datetime.datetime) -> int:
+    return (timestamp - _EPOCH) // datetime.timedelta(microseconds=1)
+
+
+def _from_us(us: int) -> datetime.datetime:
+    return _EPOCH + datetime.timedelta(microseconds=us)
+
+
+def segment_path(month: str) -> str:
+    return os.path.join(ARCHIVE_DIR, f"{month}.seg")
+
+
+def _scan(path: str) -> tuple[list[tuple], int]:
+    """([(offset, rows, first_id, last_id, first_us, last_us, length)], end of the last whole block)."""
+    blocks, offset = [], 0
+    size = os.path.getsize(path)
+    with open(path, "rb") as f:
+        while offset + _BLOCK_HEADER.size <= size:
+            header = f.read(_BLOCK_HEADER.size)
+            magic, rows, first_id, last_id, first_us, last_us, length = _BLOCK_HEADER.unpack(header)
+            if magic != SEGMENT_MAGIC or offset + _BLOCK_HEADER.size + length > size:
+                break
+            blocks.append((offset + _BLOCK_HEADER.size, rows, first_id, last_id, first_us, last_us, length))
+            offset += _BLOCK_HEADER.size + length
+            f.seek(offset)
+    return blocks, offset
+
+
+_block_index = {}  # path -> ((size, mtime), blocks)
+_block_index_lock = threading.Lock()
+
+def _blocks(path: str) -> list[tuple]:
+    stat = os.stat(path)
+    key = (stat.st_size, stat.st_mtime_ns)
+    with _block_index_lock:
+        cached = _block_index.get(path)
+        if cached is not None and cached[0] == key:
+            return cached[1]
+    blocks, _ = _scan(path)
+    with _block_index_lock:
+        _block_index[path] = (key, blocks)
+    return blocks
+
+
+def append_block(month: str, rows: list[tuple]):
+    """Appends (id, timestamp, content) rows to the month's segment and fsyncs it."""
+    os.makedirs(ARCHIVE_DIR, exist_ok=True)
+    path = segment_path(month)
+    if os.path.exists(path):
+        _, valid_end = _scan(path)
+        if valid_end < os.path.getsize(path):
+            os.truncate(path, valid_end)  # a torn block from an interrupted run
+    stamps = [_to_us(timestamp) for _, timestamp, _ in rows]
+    payload = zlib.compress(json.dumps([[memory_id, us, content] for (memory_id, _, content), us
+                                        in zip(rows, stamps)], separators=(",", ":")).encode(), 9)
+    header = _BLOCK_HEADER.pack(SEGMENT_MAGIC, len(rows), min(r[0] for r in rows), max(r[0] for r in rows),
+                                min(stamps), max(stamps), len(payload))
+    with open(path, "ab") as f:
+        f.write(header + payload)
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def _read_block(path: str, block: tuple) -> list:
+    offset, *_, length = block
+    with open(path, "rb") as f:
+        f.seek(offset)
+        return json.loads(zlib.decompress(f.read(length)))
+
+
+def _month_range(month: str) -> tuple[datetime.datetime, datetime.datetime]:
+    start = datetime.datetime.strptime(month, "%Y-%m")
+    return start, (start + datetime.timedelta(days=32)).replace(day=1)
+
+
+def archived_months() -> list[str]:
+    """Months with a segment, newest first."""
+    if not os.path.isdir(ARCHIVE_DIR):
+        return []
+    return sorted((name[:-4] for name in os.listdir(ARCHIVE_DIR) if name.endswith(".seg")), reverse=True)
+
+
+@metrics.timed()
+def search_archive(query: str | None = None, start: datetime.datetime | None = None,
+                   end: datetime.datetime | None = None, limit: int = 100) -> list[Memory]:
+    """
+    Archived memories, newest first, like memory_db.search_memories: every
+    word of query must appear in the content (case-insensitive) and
+    start <= timestamp < end. Only the segments and blocks overlapping the
+    range are decompressed. The returned Memory objects aren't in the database.
+    """
+    terms = [term.lower() for term in (query or "").split()]
+    start_us = _to_us(start) if start is not None else None
+    end_us = _to_us(end) if end is not None else None
+    found, seen = [], set()
+    for month in archived_months():
+        month_start, month_end = _month_range(month)
+        if (start is not None and month_end <= start) or (end is not None and month_start >= end):
+            continue
+        if len(found) >= limit:
+            break  # every later month is older than what we have
+        path = segment_path(month)
+        for block in _blocks(path):
+            _, _, _, _, first_us, last_us, _ = block
+            if (start_us is not None and last_us < start_us) or (end_us is not None and first_us >= end_us):
+                continue
+            for memory_id, us, content in _read_block(path, block):
+                if memory_id in seen or (start_us is not None and us < start_us) or \
+                        (end_us is not None and us >= end_us):
+                    continue
+                lowered = content.lower()
+                if all(term in lowered for term in terms):
+                    seen.add(memory_id)
+                    found.append(Memory(id=memory_id, timestamp=_from_us(us), content=content))
+    found.sort(key=lambda memory: (memory.timestamp, memory.id), reverse=True)
+    return found[:limit]
+
+
+def archive_stats() -> dict:
+    months = archived_months()
+    paths = [segment_path(month) for month in months]
+    return {"segments": len(months), "bytes": sum(os.path.getsize(path) for path in paths),
+            "rows": sum(block[1] for path in paths for block in _blocks(path)),
+            "oldest": months[-1] if months else None, "newest": months[0] if months else None}
+
+
+@result_cache.cached(ttl=memory_db.MEMORY_CACHE_TTL, tags=("memories",))
+def rollup_counts(start: datetime.date | None = None, end: datetime.date | None = None) -> list[dict]:
+    """Per-day event counts of archived and rolled-up memories (start <= day < end), newest first."""
+    db_session = next(memory_db.get_db())
+    try:
+        q = db_session.query(MemoryRollup.day, MemoryRollup.event, MemoryRollup.count,
+                             MemoryRollup.first_seen, MemoryRollup.last_seen)
+        if start is not None:
+            q = q.filter(MemoryRollup.day >= start)
+        if end is not None:
+            q = q.filter(MemoryRollup.day < end)
+        return [row._asdict() for row in q.order_by(MemoryRollup.day.desc(), MemoryRollup.event)]
+    finally:
+        db_session.close()
+
+# --- Compaction ---
+
+def database_size() -> dict:
+    """Bytes of the database file and its WAL, and of the pages actually in use."""
+    files = sum(os.path.getsize(path) for path in (memory_db.DB_PATH, memory_db.DB_PATH + "-wal")
+                if os.path.exists(path))
+    with memory_db.engine.connect() as conn:
+        page_size = conn.exec_driver_sql("PRAGMA page_size").scalar()
+        pages = conn.exec_driver_sql("PRAGMA page_count").scalar()
+        free = conn.exec_driver_sql("PRAGMA freelist_count").scalar()
+    return {"file_bytes": files, "used_bytes": (pages - free) * page_size, "free_bytes": free * page_size}
+
+
+_UPSERT_ROLLUP = text("""
+    INSERT INTO memory_rollups (day, event, count, first_seen, last_seen)
+    VALUES (:day, :event, :count, :first_seen, :last_seen)
+    ON CONFLICT (day, event) DO UPDATE SET
+        count = count + excluded.count,
+        first_seen = min(first_seen, excluded.first_seen),
+        last_seen = max(last_seen, excluded.last_seen)
+""")
+
+
+def _archive_where(*conditions) -> int:
+    """Archives, counts and deletes every live memory matching the conditions, in batches. Returns the rows moved."""
+    moved, last_id = 0, 0
+    while True:
+        db_session = next(memory_db.get_db())
+        try:
+            rows = (db_session.query(Memory.id, Memory.timestamp, Memory.content)
+                    .filter(Memory.id > last_id, *conditions).order_by(Memory.id).limit(BATCH_ROWS).all())
+            if not rows:
+                return moved
+            by_month, counts = {}, {}
+            for row in rows:
+                by_month.setdefault(row.timestamp.strftime("%Y-%m"), []).append(tuple(row))
+                key = (row.timestamp.date(), classify(row.content))
+                count, first, last = counts.get(key, (0, row.timestamp, row.timestamp))
+                counts[key] = (count + 1, min(first, row.timestamp), max(last, row.timestamp))
+            # Segments first: if we crash before the delete, the rows are still live (and archived twice)
+            for month, month_rows in by_month.items():
+                append_block(month, month_rows)
+            # Rollup timestamps are stored in SQLAlchemy's text format so they compare with the ORM's
+            db_session.execute(_UPSERT_ROLLUP, [
+                {"day": day.isoformat(), "event": event, "count": count,
+                 "first_seen": first.isoformat(" ", "microseconds"), "last_seen": last.isoformat(" ", "microseconds")}
+                for (day, event), (count, first, last) in counts.items()])
+            db_session.query(Memory).filter(Memory.id.in_([row.id for row in rows])).delete(synchronize_session=False)
+            db_session.commit()
+        except Exception:
+            db_session.rollback()
+            raise
+        finally:
+            db_session.close()
+        memory_db.notify_removed([row.id for row in rows])  # also takes them out of memory_index
+        moved += len(rows)
+        last_id = rows[-1].id
+        time.sleep(PAUSE)
+
+
+def _oldest_month() -> tuple[datetime.datetime, datetime.datetime] | None:
+    db_session = next(memory_db.get_db())
+    try:
+        oldest = db_session.query(Memory.timestamp).order_by(Memory.timestamp).limit(1).scalar()
+    finally:
+        db_session.close()
+    return _month_range(oldest.strftime("%Y-%m")) if oldest is not None else None
+
+
+def incremental_vacuum(step_pages: int = VACUUM_STEP_PAGES) -> int:
+    """
+    Returns free pages to the OS a step at a time, so writers can get in
+    between steps, then truncates the WAL. A database created without
+    auto_vacuum is converted with one full VACUUM first (run it after the
+    rows have been archived, when it is fast). Returns the pages freed.
+    """
+    freed = 0
+    with memory_db.engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        if conn.exec_driver_sql("PRAGMA auto_vacuum").scalar() != 2:
+            print("Converting the memory database to incremental auto-vacuum (one-time VACUUM)...")
+            freed = conn.exec_driver_sql("PRAGMA freelist_count").scalar()
+            conn.exec_driver_sql("PRAGMA auto_vacuum=INCREMENTAL")
+            conn.exec_driver_sql("VACUUM")
+        # Each step of the pragma frees one page and the sqlite3 module only steps once per
+        # execute(); executescript() runs it to the end
+        raw = conn.connection.driver_connection
+        free = conn.exec_driver_sql("PRAGMA freelist_count").scalar()
+        while free:
+            raw.executescript(f"PRAGMA incremental_vacuum({step_pages});")
+            left = conn.exec_driver_sql("PRAGMA freelist_count").scalar()
+            if left >= free:
+                break  # nothing more can be freed right now
+            freed += free - left
+            free = left
+            time.sleep(PAUSE)
+        conn.exec_driver_sql("PRAGMA wal_checkpoint(TRUNCATE)").fetchall()
+    return freed
+
+
+def optimize_fts():
+    """
+    Merges the full-text index into one segment. FTS5 keeps deleted rows as
+    tombstones until then, so without it archiving neither shrinks the index
+    nor speeds up search. One short write transaction (well under a second
+    for a year of memories).
+    """
+    with memory_db.engine.begin() as conn:
+        conn.exec_driver_sql(f"INSERT INTO {memory_db.FTS_TABLE}({memory_db.FTS_TABLE}) VALUES ('optimize')")
+
+
+_compact_lock = threading.Lock()
+
+@metrics.timed()
+def compact(now: datetime.datetime | None = None, retention_days: float = RETENTION_DAYS,
+            rollup_after_days: float = ROLLUP_AFTER_DAYS, max_db_mb: float = MAX_DB_MB) -> dict:
+    """
+    Runs the rollup, age and size policies and the incremental vacuum once.
+    Returns what it did, or {"skipped": ...} if another thread or process is
+    already compacting this database.
+    """
+    now = now or datetime.datetime.utcnow()
+    os.makedirs(ARCHIVE_DIR, exist_ok=True)
+    with open(os.path.join(ARCHIVE_DIR, ".lock"), "w") as lock_file:
+        if not _compact_lock.acquire(blocking=False):
+            return {"skipped": "already running"}
+        try:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                return {"skipped": "already running in another process"}
+            start = time.perf_counter()
+            report = {"size_before": database_size()}
+            if rollup_after_days:
+                cutoff = now - datetime.timedelta(days=rollup_after_days)
+                report["rolled_up"] = _archive_where(Memory.timestamp < cutoff,
+                                                     Memory.content.in_(list(ROLLUP_EVENTS.values())))
+            if retention_days:
+                report["archived_by_age"] = _archive_where(Memory.timestamp < now - datetime.timedelta(days=retention_days))
+            if max_db_mb:
+                report["archived_by_size"] = 0
+                current_month = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+                while database_size()["used_bytes"] > max_db_mb * 1024 * 1024:
+                    month = _oldest_month()
+                    if month is None or month[0] >= current_month:
+                        break  # never archive the current month
+                    report["archived_by_size"] += _archive_where(Memory.timestamp < month[1])
+            moved = sum(report.get(key, 0) for key in ("rolled_up", "archived_by_age", "archived_by_size"))
+            if moved and memory_db.FTS_AVAILABLE:
+                optimize_fts()
+            report["vacuumed_pages"] = incremental_vacuum()
+            report["size_after"] = database_size()
+            report["seconds"] = time.perf_counter() - start
+            metrics.increment("memory_retention.rows_archived", moved)
+            print(f"Memory retention: moved {moved} rows to the archive, database "
+                  f"{report['size_before']['file_bytes'] / 1e6:.1f} -> {report['size_after']['file_bytes'] / 1e6:.1f} MB "
+                  f"in {report['seconds']:.1f}s")
+            return report
+        finally:
+            _compact_lock.release()
+
+# --- Background runs ---
+
+class RetentionWorker:
+    """Calls compact() every interval seconds on a daemon thread, the first time after first_delay."""
+
+    def __init__(self, interval: float = RETENTION_INTERVAL, first_delay: float = 60.0):
+        self.interval = interval
+        self.first_delay = first_delay
+        self.last_report = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="memory-retention", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        delay = self.first_delay
+        while not self._stop.wait(delay):
+            try:
+                self.last_report = compact()
+            except Exception as e:
+                print(f"Memory retention failed: {e}")
+            delay = self.interval
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+
+_worker = None
+_worker_lock = threading.Lock()
+
+def start_background() -> RetentionWorker | None:
+    """Starts the shared background worker (once per process). SAHILGPT_RETENTION=0 turns it off."""
+    global _worker
+    if os.environ.get("SAHILGPT_RETENTION") == "0":
+        return None
+    with _worker_lock:
+        if _worker is None:
+            _worker = RetentionWorker()
+        return _worker
@@ -0,0 +1,181 @@
+import bisect
+import functools
+import inspect
+import json
+import math
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+# Timing for the backend operations: a histogram per operation, named
+# counters and a ring buffer of the most recent spans. Recording a span costs
+# two perf_counter() calls, a bisect and a lock (about 5 µs with @timed).
+# The Performance page reads snapshot(); export_json()/export_prometheus()
+# serialize it. SAHILGPT_METRICS=0 turns recording off.
+
+ENABLED = os.environ.get("SAHILGPT_METRICS", "1") != "0"
+RECENT_SPANS = 1000
+
+# Bucket upper bounds in seconds: 50 µs to ~30 min, 12% apart, so a percentile
+# read from the buckets is within about 6% of the true value
+BUCKETS = [50e-6 * 1.12 ** i for i in range(math.ceil(math.log(1800 / 50e-6, 1.12)) + 1)]
+# Fixed, coarser bounds for the Prometheus export (the fine buckets are folded into them)
+EXPORT_BUCKETS = [0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600]
+
+
+class Histogram:
+    """Bucketed latency distribution with exact count/sum/min/max."""
+
+    __slots__ = ("counts", "count", "sum", "min", "max", "errors")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)  # last bucket = overflow
+        self.count = 0
+        self.sum = 0.0
+        self.min = float("inf")
+        self.max = 0.0
+        self.errors = 0
+
+    def observe(self, seconds: float, error: bool = False):
+        self.counts[bisect.bisect_left(BUCKETS, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+        if seconds < self.min:
+            self.min = seconds
+        if seconds > self.max:
+            self.max = seconds
+        if error:
+            self.errors += 1
+
+    def percentile(self, pct: float) -> float:
+        """Upper bound of the bucket holding the pct-th percentile (clamped to the observed max)."""
+        if not self.count:
+            return float("nan")
+        rank = max(1, round(pct / 100 * self.count))
+        seen = 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if seen >= rank:
+                return min(BUCKETS[i], self.max) if i < len(BUCKETS) else self.max
+        return self.max
+
+    def summary(self) -> dict:
+        return {"count": self.count, "errors": self.errors,
+                "p50_ms": self.percentile(50) * 1000, "p95_ms": self.percentile(95) * 1000,
+                "p99_ms": self.percentile(99) * 1000,
+                "mean_ms": self.sum / self.count * 1000 if self.count else float("nan"),
+                "max_ms": self.max * 1000}
+
+
+_histograms = {}
+_counters = {}
+_spans = deque(maxlen=RECENT_SPANS)
+_lock = threading.Lock()
+
+def observe(name: str, seconds: float, error: bool = False, started: float | None = None):
+    """Records one timing for operation `name` (and a span, if started is given as time.time())."""
+    if not ENABLED:
+        return
+    with _lock:
+        histogram = _histograms.get(name)
+        if histogram is None:
+            histogram = _histograms[name] = Histogram()
+        histogram.observe(seconds, error)
+        if started is not None:
+            _spans.append((name, started, seconds, error, threading.current_thread().name))
+
+def increment(name: str, value: float = 1):
+    if not ENABLED:
+        return
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + value
+
+@contextmanager
+def timer(name: str):
+    """Times the with-block as one span of operation `name`; exceptions count as errors."""
+    started, start = time.time(), time.perf_counter()
+    error = False
+    try:
+        yield
+    except BaseException as e:
+        error = not isinstance(e, GeneratorExit)
+        raise
+    finally:
+        observe(name, time.perf_counter() - start, error, started)
+
+def timed(name: str | None = None):
+    """
+    Decorator version of timer(). The name defaults to module.function
+    without the "backend." prefix. Generator functions are timed until the
+    generator is exhausted or closed.
+    """
+    def decorator(fn):
+        op = name or f"{fn.__module__.removeprefix('backend.')}.{fn.__name__}"
+        if inspect.isgeneratorfunction(fn):
+            @functools.wraps(fn)
+            def generator_wrapper(*args, **kwargs):
+                with timer(op):
+                    return (yield from fn(*args, **kwargs))
+            return generator_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with timer(op):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+# --- Reading and export ---
+
+def snapshot() -> dict:
+    with _lock:
+        operations = {name: histogram.summary() for name, histogram in sorted(_histograms.items())}
+        counters = dict(sorted(_counters.items()))
+    return {"operations": operations, "counters": counters}
+
+def recent_spans(limit: int = 100) -> list[dict]:
+    """Newest first."""
+    with _lock:
+        spans = list(_spans)[-limit:]
+    return [{"operation": name, "started": started, "duration_ms": seconds * 1000, "error": error, "thread": thread}
+            for name, started, seconds, error, thread in reversed(spans)]
+
+def reset():
+    with _lock:
+        _histograms.clear()
+        _counters.clear()
+        _spans.clear()
+
+def export_json() -> str:
+    return json.dumps(dict(snapshot(), exported_at=time.time(), spans=recent_spans(RECENT_SPANS)), indent=2)
+
+def _metric_name(name: str) -> str:
+    return "sahilgpt_" + "".join(ch if ch.isalnum() else "_" for ch in name)
+
+def export_prometheus() -> str:
+    """Prometheus text exposition format: one histogram family for all operations, plus the counters."""
+    with _lock:
+        histograms = {name: (list(h.counts), h.count, h.sum, h.errors) for name, h in sorted(_histograms.items())}
+        counters = dict(sorted(_counters.items()))
+    lines = ["# HELP sahilgpt_operation_seconds Latency of backend operations.",
+             "# TYPE sahilgpt_operation_seconds histogram"]
+    for name, (counts, count, total, _) in histograms.items():
+        cumulative, i = 0, 0
+        for bound in EXPORT_BUCKETS:
+            while i < len(BUCKETS) and BUCKETS[i] <= bound:
+                cumulative += counts[i]
+                i += 1
+            lines.append(f'sahilgpt_operation_seconds_bucket{{operation="{name}",le="{bound:g}"}} {cumulative}')
+        lines.append(f'sahilgpt_operation_seconds_bucket{{operation="{name}",le="+Inf"}} {count}')
+        lines.append(f'sahilgpt_operation_seconds_sum{{operation="{name}"}} {total:.9g}')
+        lines.append(f'sahilgpt_operation_seconds_count{{operation="{name}"}} {count}')
+    lines += ["# HELP sahilgpt_operation_errors_total Failed backend operations.",
+              "# TYPE sahilgpt_operation_errors_total counter"]
+    for name, (_, _, _, errors) in histograms.items():
+        lines.append(f'sahilgpt_operation_errors_total{{operation="{name}"}} {errors}')
+    for name, value in counters.items():
+        lines.append(f"# TYPE {_metric_name(name)}_total counter")
+        lines.append(f"{_metric_name(name)}_total {value:.9g}")
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,533 @@
+import argparse
+import http.client
+import importlib
+import io
+import json
+import os
+import socket
+import sys
+import threading
+import time
+from urllib.parse import urlencode, urlparse
+
+# Thin client for the model daemon (backend/model_server.py).
+#
+# The daemon owns Whisper, the face models, Stable Diffusion, the TTS engines
+# and the code worker pool, so they stay loaded across Streamlit restarts and
+# are shared by every session with a concurrency limit per model. The app and
+# the command line use get_backend(), which returns a DaemonClient when the
+# daemon is running and otherwise a LocalBackend that runs everything in this
+# process, the way the app worked before. Both have the same methods.
+#
+# This module only imports the backend modules it needs when a LocalBackend
+# method runs, so talking to the daemon doesn't load numpy, torch or dlib.
+
+SOCKET_PATH = os.environ.get("SAHILGPT_DAEMON_SOCKET", "data/daemon.sock")
+# http://host:port of a daemon started with --port, instead of the socket
+DAEMON_URL = os.environ.get("SAHILGPT_DAEMON_URL")
+# Shared secret of a TCP daemon (the Unix socket is protected by its file mode
+# instead): SAHILGPT_DAEMON_TOKEN, or the file the daemon writes it to
+TOKEN_PATH = os.environ.get("SAHILGPT_DAEMON_TOKEN_FILE", "data/daemon.token")
+# auto = use the daemon if it's running, off = always in-process, required = fail without it
+DAEMON_MODE = os.environ.get("SAHILGPT_DAEMON", "auto")
+PROBE_INTERVAL = 5.0   # seconds between checks whether the daemon came up or went away
+BUSY_RETRIES = 3       # retries of a 503 (queue full) response, with exponential backoff
+REQUEST_TIMEOUT = 600  # seconds; image generation and long transcriptions are slow on a CPU
+
+# Short model names used by warmup() -> (module that registers the model, registry name)
+MODELS = {
+    "face": ("face_utils", "face_models"),
+    "whisper": ("voice_utils", "whisper"),
+    "image": ("image_gen", "stable_diffusion"),
+}
+
+
+class DaemonError(Exception):
+    """Raised when the daemon can't be reached or answers with an error status."""
+
+    def __init__(self, message: str, status_code: int | None = None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class DaemonBusy(DaemonError):
+    """The model's queue was still full after the client's retries."""
+
+
+def read_token(path: str = TOKEN_PATH) -> str | None:
+    """The TCP daemon's token: SAHILGPT_DAEMON_TOKEN or the contents of path, or None."""
+    token = os.environ.get("SAHILGPT_DAEMON_TOKEN")
+    if token:
+        return token
+    try:
+        with open(path) as f:
+            return f.read().strip() or None
+    except OSError:
+        return None
+
+
+def _read_bytes(source) -> bytes:
+    """Bytes of an upload (Streamlit UploadedFile or any file-like object), a path or bytes."""
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return bytes(source)
+    if isinstance(source, str):
+        with open(source, "rb") as f:
+            return f.read()
+    if hasattr(source, "getvalue"):
+        return source.getvalue()
+    return source.read()
+
+
+# --- In-process backend ---
+
+class LocalBackend:
+    """Runs every request in this process, on the calling thread."""
+
+    remote = False
+
+    def warmup(self, *names: str) -> list[str]:
+        """Starts loading the named models ("face", "whisper", "image", "code") unless they're loaded."""
+        from backend.model_registry import registry
+
+        started = []
+        for name in names:
+            if name == "code":
+                from backend import code_runner
+                code_runner.get_pool()
+                continue
+            module, model = MODELS[name]
+            importlib.import_module(f"backend.{module}")  # registers the model
+            if registry.warmup(model) is not None:
+                started.append(name)
+        return started
+
+    def status(self) -> dict:
+        from backend.model_registry import registry
+
+        return {"remote": False, "models": registry.status(), "resident_mb": registry.resident_mb(),
+                "budget_mb": registry.budget_mb, "queues": {}}
+
+    def verify_face(self, image) -> bool:
+        from backend import face_utils
+
+        return face_utils.verify_face(io.BytesIO(_read_bytes(image)))
+
+    def transcribe(self, audio, sample_rate: int | None = None, **options) -> str:
+        from backend import voice_utils
+
+        return voice_utils.transcribe(audio, sample_rate, **options)
+
+    def whisper(self):
+        """The model to give voice_utils' streaming transcriber (None = the registry's Whisper)."""
+        return None
+
+    def tts_engine(self, name: str | None = None):
+        from backend import tts
+
+        return tts.get_engine(name)
+
+    def synthesize(self, text: str, engine: str | None = None, voice: str | None = None,
+                   use_cache: bool = True) -> bytes:
+        from backend import tts
+
+        return tts.synthesize(text, tts.get_engine(engine), voice, use_cache)
+
+    def stream_code(self, code: str, timeout: float | None = None, use_cache: bool = False):
+        """Yields ("stdout"/"stderr", text) chunks, then ("exit", returncode), like code_runner.stream_code."""
+        from backend import code_runner
+
+        yield from code_runner.stream_code(code, timeout or code_runner.DEFAULT_TIMEOUT, use_pool=True,
+                                           use_cache=use_cache)
+
+    def run_code(self, code: str, timeout: float | None = None, use_cache: bool = False) -> dict:
+        output = {"stdout": [], "stderr": []}
+        returncode = -1
+        for stream, data in self.stream_code(code, timeout, use_cache):
+            if stream == "exit":
+                returncode = data
+            else:
+                output[stream].append(data)
+        return {"stdout": "".join(output["stdout"]), "stderr": "".join(output["stderr"]), "returncode": returncode}
+
+    def submit_image(self, prompt: str, seed: int | None = None, profile: str | None = None, **params) -> str:
+        """Queues an image job and returns its id. Raises KeyError for an unknown profile."""
+        from backend import image_jobs
+
+        return image_jobs.get_scheduler().submit(prompt, seed=seed, profile=profile, **params)
+
+    def image_status(self, job_id: str) -> dict | None:
+        """The job's status (see image_jobs.ImageJob.as_dict) plus its "queue_position", or None."""
+        from backend import image_jobs
+
+        scheduler = image_jobs.get_scheduler()
+        job = scheduler.status(job_id)
+        if job is not None:
+            job["queue_position"] = scheduler.queue_position(job_id)
+        return job
+
+    def pending_images(self) -> int:
+        from backend import image_jobs
+
+        return image_jobs.get_scheduler().queued()
+
+    def cancel_image(self, job_id: str) -> bool:
+        from backend import image_jobs
+
+        return image_jobs.get_scheduler().cancel(job_id)
+
+    def image_bytes(self, job_id: str) -> bytes | None:
+        """The finished job's PNG, or None (not done, or evicted from the image cache)."""
+        job = self.image_status(job_id)
+        if job is None or job["status"] != "done" or not os.path.exists(job["result"]):
+            return None
+        with open(job["result"], "rb") as f:
+            return f.read()
+
+
+# --- Daemon client ---
+
+class _UnixConnection(http.client.HTTPConnection):
+    """HTTP over a Unix domain socket."""
+
+    def __init__(self, socket_path: str, timeout: float):
+        super().__init__("localhost", timeout=timeout)
+        self.socket_path = socket_path
+
+    def connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        try:
+            sock.connect(self.socket_path)
+        except OSError:
+            sock.close()
+            raise
+        self.sock = sock
+
+
+class RemoteTTSEngine:
+    """Stands in for a tts.TTSEngine in tts.SpeechStream; synthesis (and its cache) runs in the daemon."""
+
+    def __init__(self, client: "DaemonClient", info: dict):
+        self.client = client
+        self.name = info["name"]
+        self.audio_format = info["audio_format"]
+        self.default_voice = info["default_voice"]
+
+    def available(self) -> bool:
+        return True
+
+    def synthesize(self, text: str, voice: str | None = None) -> bytes:
+        return self.client.synthesize(text, self.name, voice)
+
+
+class RemoteWhisper:
+    """Stands in for the Whisper model in voice_utils.transcribe() and StreamingTranscriber."""
+
+    def __init__(self, client: "DaemonClient"):
+        self.client = client
+
+    def transcribe(self, samples, **options) -> dict:
+        return {"text": self.client.transcribe(samples, **options)}
+
+
+class DaemonClient:
+    """
+    Talks to the model daemon over its Unix socket (or url, for a daemon on
+    a TCP port). Each thread keeps one keep-alive connection. A 503 (the
+    model's queue is full) is retried with exponential backoff; other
+    failures raise DaemonError.
+    """
+
+    remote = True
+
+    def __init__(self, socket_path: str = SOCKET_PATH, url: str | None = DAEMON_URL,
+                 timeout: float = REQUEST_TIMEOUT, busy_retries: int = BUSY_RETRIES, backoff: float = 0.2):
+        self.socket_path = socket_path
+        self.url = urlparse(url) if url else None
+        self.timeout = timeout
+        self.busy_retries = busy_retries
+        self.backoff = backoff
+        self._auth = {}
+        if self.url is not None:
+            token = read_token()
+            self._auth = {"Authorization": f"Bearer {token}"} if token else {}
+        self._local = threading.local()
+
+    def _new_connection(self, timeout: float | None = None) -> http.client.HTTPConnection:
+        timeout = timeout or self.timeout
+        if self.url is not None:
+            return http.client.HTTPConnection(self.url.hostname, self.url.port, timeout=timeout)
+        return _UnixConnection(self.socket_path, timeout)
+
+    def _connection(self) -> http.client.HTTPConnection:
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = self._local.connection = self._new_connection()
+        return connection
+
+    def _request(self, method: str, path: str, body: bytes | None = None, headers: dict | None = None,
+                 connection: http.client.HTTPConnection | None = None) -> http.client.HTTPResponse:
+        """Sends one request and returns the response (body unread). Raises DaemonError on an error status."""
+        shared = connection is None
+        for attempt in range(self.busy_retries + 1):
+            if shared:
+                connection = self._connection()
+            try:
+                connection.request(method, path, body=body, headers={**self._auth, **(headers or {})})
+                response = connection.getresponse()
+            except (OSError, http.client.HTTPException) as e:
+                connection.close()
+                if shared:
+                    self._local.connection = None
+                # A keep-alive connection the daemon closed (e.g. it restarted): retry once on a new one
+                if attempt == 0 and shared and isinstance(e, (http.client.RemoteDisconnected, ConnectionResetError,
+                                                              BrokenPipeError)):
+                    continue
+                raise DaemonError(f"Model daemon unreachable: {e}") from e
+            if response.status < 400:
+                return response
+            data = response.read()
+            try:
+                message = json.loads(data)["error"]
+            except (ValueError, KeyError, TypeError):
+                message = data.decode(errors="replace") or response.reason
+            if response.status == 503:
+                if attempt < self.busy_retries:
+                    time.sleep(self.backoff * 2 ** attempt)
+                    continue
+                raise DaemonBusy(message, 503)
+            raise DaemonError(message, response.status)
+        raise DaemonError("Model daemon unreachable")
+
+    def _json(self, method: str, path: str, payload=None) -> dict:
+        body = json.dumps(payload).encode() if payload is not None else None
+        headers = {"Content-Type": "application/json"} if body is not None else {}
+        return json.loads(self._request(method, path, body, headers).read())
+
+    def ping(self, timeout: float = 1.0) -> bool:
+        """True if the daemon answers its health check within timeout."""
+        connection = self._new_connection(timeout)
+        try:
+            connection.request("GET", "/v1/health", headers=self._auth)
+            response = connection.getresponse()
+            response.read()
+            return response.status == 200
+        except (OSError, http.client.HTTPException):
+            return False
+        finally:
+            connection.close()
+
+    def warmup(self, *names: str) -> list[str]:
+        return self._json("POST", "/v1/warmup", {"models": list(names)})["started"]
+
+    def status(self) -> dict:
+        return self._json("GET", "/v1/status")
+
+    def verify_face(self, image) -> bool:
+        try:
+            response = self._request("POST", "/v1/face/verify", _read_bytes(image),
+                                     {"Content-Type": "application/octet-stream"})
+            return json.loads(response.read())["verified"]
+        except DaemonError as e:
+            print(f"Error during verification: {e}")
+            return False
+
+    def transcribe(self, audio, sample_rate: int | None = None, **options) -> str:
+        """
+        Transcribes one clip: WAV or raw 16-bit PCM bytes (pass sample_rate)
+        are sent as they are; arrays and other files are converted to 16 kHz
+        float32 here first.
+        """
+        query = {}
+        if isinstance(audio, str) and audio.lower().endswith(".wav"):
+            audio = _read_bytes(audio)
+        if isinstance(audio, (bytes, bytearray, memoryview)):
+            body, content_type = bytes(audio), "application/octet-stream"
+            if sample_rate:
+                query["sample_rate"] = sample_rate
+        else:
+            from backend import voice_utils
+            body, content_type = voice_utils.load_audio(audio, sample_rate).astype("<f4").tobytes(), "audio/x-float32"
+        headers = {"Content-Type": content_type, "X-Whisper-Options": json.dumps(options)}
+        path = "/v1/transcribe" + (f"?{urlencode(query)}" if query else "")
+        return json.loads(self._request("POST", path, body, headers).read())["text"]
+
+    def whisper(self) -> RemoteWhisper:
+        self.warmup("whisper")
+        return RemoteWhisper(self)
+
+    def tts_engine(self, name: str | None = None) -> RemoteTTSEngine:
+        return RemoteTTSEngine(self, self._json("GET", "/v1/tts" + (f"?{urlencode({'engine': name})}" if name else "")))
+
+    def synthesize(self, text: str, engine: str | None = None, voice: str | None = None,
+                   use_cache: bool = True) -> bytes:
+        payload = {"text": text, "engine": engine, "voice": voice, "use_cache": use_cache}
+        return self._request("POST", "/v1/tts", json.dumps(payload).encode(),
+                             {"Content-Type": "application/json"}).read()
+
+    def stream_code(self, code: str, timeout: float | None = None, use_cache: bool = False):
+        """Yields the output chunks as the daemon streams them; connection errors end with an "Error:" on stderr."""
+        # A dedicated connection: the thread's shared one can't be used until this response is read
+        connection = self._new_connection()
+        try:
+            response = self._request("POST", "/v1/code",
+                                     json.dumps({"code": code, "timeout": timeout, "use_cache": use_cache}).encode(),
+                                     {"Content-Type": "application/json"}, connection=connection)
+            for line in response:
+                stream, data = json.loads(line)
+                yield stream, data
+        except (DaemonError, OSError, http.client.HTTPException, ValueError) as e:
+            yield "stderr", f"Error: {e}"
+            yield "exit", -1
+        finally:
+            connection.close()
+
+    run_code = LocalBackend.run_code
+
+    def submit_image(self, prompt: str, seed: int | None = None, profile: str | None = None, **params) -> str:
+        try:
+            return self._json("POST", "/v1/image/jobs", {"prompt": prompt, "seed": seed, "profile": profile,
+                                                         **params})["id"]
+        except DaemonError as e:
+            if e.status_code == 400:
+                raise KeyError(str(e)) from None
+            raise
+
+    def image_status(self, job_id: str) -> dict | None:
+        try:
+            return self._json("GET", f"/v1/image/jobs/{job_id}")
+        except DaemonError as e:
+            if e.status_code == 404:
+                return None
+            raise
+
+    def cancel_image(self, job_id: str) -> bool:
+        return self._json("DELETE", f"/v1/image/jobs/{job_id}")["cancelled"]
+
+    def image_bytes(self, job_id: str) -> bytes | None:
+        try:
+            return self._request("GET", f"/v1/image/jobs/{job_id}/image").read()
+        except DaemonError as e:
+            if e.status_code == 404:
+                return None
+            raise
+
+
+# --- Backend selection ---
+
+_backend = None
+_checked_at = 0.0
+_backend_lock = threading.Lock()
+
+def get_backend():
+    """
+    The daemon's client if it is running (SAHILGPT_DAEMON=auto), otherwise an
+    in-process LocalBackend. Rechecked every PROBE_INTERVAL seconds, so a
+    daemon started (or stopped) while the app runs is picked up.
+    SAHILGPT_DAEMON=off never uses the daemon, =required raises DaemonError
+    when it isn't running.
+    """
+    global _backend, _checked_at
+    with _backend_lock:
+        if _backend is not None and (DAEMON_MODE == "off" or time.monotonic() - _checked_at < PROBE_INTERVAL):
+            return _backend
+        _checked_at = time.monotonic()
+        client = DaemonClient()
+        if DAEMON_MODE != "off" and client.ping():
+            if not isinstance(_backend, DaemonClient):
+                print(f"Using the model daemon at {DAEMON_URL or SOCKET_PATH}.")
+                _backend = client
+        elif DAEMON_MODE == "required":
+            raise DaemonError(f"Model daemon is not running at {DAEMON_URL or SOCKET_PATH}")
+        elif not isinstance(_backend, LocalBackend):
+            _backend = LocalBackend()
+        return _backend
+
+
+def reprobe():
+    """Makes the next get_backend() check for the daemon again (e.g. after a request found it gone)."""
+    global _checked_at
+    with _backend_lock:
+        _checked_at = 0.0
+
+
+# --- Command line ---
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m backend.model_client",
+        description="Command-line client for the SAHILGPT model daemon (runs in-process when it isn't running).")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("status", help="loaded models and queue statistics")
+    warmup = commands.add_parser("warmup", help="start loading models")
+    warmup.add_argument("models", nargs="+", choices=[*MODELS, "code"])
+    verify = commands.add_parser("verify", help="check a photo against the enrolled face")
+    verify.add_argument("image")
+    transcribe = commands.add_parser("transcribe", help="transcribe an audio file")
+    transcribe.add_argument("audio")
+    speak = commands.add_parser("tts", help="synthesize speech")
+    speak.add_argument("text")
+    speak.add_argument("-o", "--output", required=True)
+    speak.add_argument("--engine")
+    speak.add_argument("--voice")
+    image = commands.add_parser("image", help="generate an image and wait for it")
+    image.add_argument("prompt")
+    image.add_argument("-o", "--output", required=True)
+    image.add_argument("--seed", type=int)
+    image.add_argument("--profile")
+    code = commands.add_parser("code", help="run a Python file (- for stdin) in the sandbox")
+    code.add_argument("file")
+    code.add_argument("--timeout", type=float)
+    args = parser.parse_args(argv)
+
+    try:
+        return _run_command(args)
+    except DaemonError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+
+
+def _run_command(args) -> int:
+    backend = get_backend()
+    print(f"({'daemon' if backend.remote else 'in-process'})", file=sys.stderr)
+    if args.command == "status":
+        print(json.dumps(backend.status(), indent=2, default=str))
+    elif args.command == "warmup":
+        print("Loading: " + (", ".join(backend.warmup(*args.models)) or "nothing (already loaded)"))
+    elif args.command == "verify":
+        verified = backend.verify_face(args.image)
+        print("Face recognized." if verified else "Face not recognized.")
+        return 0 if verified else 1
+    elif args.command == "transcribe":
+        print(backend.transcribe(args.audio))
+    elif args.command == "tts":
+        audio = backend.synthesize(args.text, args.engine, args.voice)
+        with open(args.output, "wb") as f:
+            f.write(audio)
+        print(f"Wrote {len(audio)} bytes to {args.output}")
+    elif args.command == "image":
+        job_id = backend.submit_image(args.prompt, seed=args.seed, profile=args.profile)
+        while (job := backend.image_status(job_id))["status"] in ("queued", "running"):
+            print(f"\r{job['status']} step {job['step']}/{job['total_steps']}", end="", file=sys.stderr)
+            time.sleep(1)
+        print(file=sys.stderr)
+        if job["status"] != "done":
+            print(f"Image generation {job['status']}: {job['error'] or ''}")
+            return 1
+        with open(args.output, "wb") as f:
+            f.write(backend.image_bytes(job_id))
+        print(f"Wrote {args.output} (seed {job['seed']})")
+    elif args.command == "code":
+        source = sys.stdin.read() if args.file == "-" else _read_bytes(args.file).decode()
+        returncode = -1
+        for stream, data in backend.stream_code(source, args.timeout):
+            if stream == "exit":
+                returncode = data
+            else:
+                print(data, end="", file=sys.stdout if stream == "stdout" else sys.stderr, flush=True)
+        return returncode
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
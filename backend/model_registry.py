@@ -0,0 +1,289 @@
+import gc
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+# Memory budget for all registered models together, in MB (0 = unlimited)
+MODEL_BUDGET_MB = float(os.environ.get("SAHILGPT_MODEL_BUDGET_MB", "0"))
+# Unload a model after it has not been used for this many seconds (0 = never)
+MODEL_IDLE_SECONDS = float(os.environ.get("SAHILGPT_MODEL_IDLE_SECONDS", "900"))
+# warmup() doesn't try a model again for this many seconds after its load failed (get() always does)
+WARMUP_RETRY_SECONDS = float(os.environ.get("SAHILGPT_MODEL_RETRY_SECONDS", "60"))
+
+
+def _process_rss_mb() -> float | None:
+    """Current resident set size of this process in MB, if the platform tells us."""
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss / (1024 * 1024)
+    except ImportError:
+        pass
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def _torch_size_mb(model) -> float | None:
+    """Size of a torch module's (or a diffusers pipeline's) parameters and buffers in MB."""
+    modules = []
+    if hasattr(model, "components"):  # diffusers pipelines
+        modules = [m for m in model.components.values() if hasattr(m, "parameters")]
+    elif hasattr(model, "parameters") and hasattr(model, "buffers"):
+        modules = [model]
+    if not modules:
+        return None
+    total = 0
+    for module in modules:
+        for tensor in list(module.parameters()) + list(module.buffers()):
+            total += tensor.numel() * tensor.element_size()
+    return total / (1024 * 1024)
+
+
+class _Entry:
+    def __init__(self, name, loader, unloader, size_mb):
+        self.name = name
+        self.loader = loader
+        self.unloader = unloader
+        self.declared_size_mb = size_mb
+        self.model = None
+        self.loaded = False
+        self.size_mb = 0.0
+        self.in_use = 0
+        self.last_used = 0.0
+        self.loads = 0
+        self.unloads = 0
+        self.last_load_seconds = None
+        self.last_unload_seconds = None
+        self.error = None
+        self.failed_at = None  # time.monotonic() of the last failed load
+        self.loading = False   # a load is running or a warm-up is about to start one
+        self.lock = threading.Lock()  # serializes load/unload of this model
+
+
+class ModelRegistry:
+    """
+    Loads heavy models on first use and unloads them again when they are idle
+    or when the loaded models together exceed a memory budget.
+
+    Each model is registered with a zero-argument loader. get()/use() load it
+    on demand, warmup() loads it on a background thread ahead of time. Models
+    that are in use (inside a use() block) are never evicted. When the budget
+    is exceeded the least recently used idle models are unloaded first.
+
+    Sizes are taken from the model's torch parameters when possible, otherwise
+    from the process RSS growth while loading, or from the size_mb hint given
+    at registration.
+    """
+
+    def __init__(self, budget_mb: float = MODEL_BUDGET_MB, idle_seconds: float = MODEL_IDLE_SECONDS,
+                 reap_interval: float = 30.0):
+        self.budget_mb = budget_mb
+        self.idle_seconds = idle_seconds
+        self.reap_interval = reap_interval
+        self._entries = {}
+        self._lock = threading.RLock()
+        self._reaper = None
+
+    def register(self, name: str, loader, unloader=None, size_mb: float | None = None):
+        """
+        Registers a model. Registering the same name again replaces the loader
+        (and unloads the old model).
+
+        Args:
+            name: Key used with get()/use().
+            loader: Callable returning the loaded model. May raise.
+            unloader: Optional callable(model) to release it (e.g. move to CPU).
+            size_mb: Size hint used when the size can't be measured.
+        """
+        with self._lock:
+            if name in self._entries:
+                self.unload(name)
+            self._entries[name] = _Entry(name, loader, unloader, size_mb)
+
+    def _entry(self, name: str) -> _Entry:
+        try:
+            return self._entries[name]
+        except KeyError:
+            raise KeyError(f"No model registered under '{name}'") from None
+
+    def _load(self, entry: _Entry):
+        rss_before = _process_rss_mb()
+        start = time.perf_counter()
+        model = entry.loader()
+        entry.last_load_seconds = time.perf_counter() - start
+        size = _torch_size_mb(model)
+        if size is None and entry.declared_size_mb is not None:
+            size = entry.declared_size_mb
+        if size is None:
+            rss_after = _process_rss_mb()
+            size = max(0.0, rss_after - rss_before) if rss_before is not None and rss_after is not None else 0.0
+        entry.model = model
+        entry.size_mb = size
+        entry.loaded = True
+        entry.loads += 1
+        entry.error = None
+        print(f"Model '{entry.name}' loaded in {entry.last_load_seconds:.1f}s (~{size:.0f} MB).")
+
+    def get(self, name: str):
+        """Returns the model, loading it first if needed. Raises if loading fails."""
+        entry = self._entry(name)
+        with entry.lock:
+            # No load is running once we hold the lock (also clears a warm-up's mark if the model got loaded meanwhile)
+            try:
+                if not entry.loaded:
+                    entry.loading = True
+                    self._load(entry)
+                    entry.failed_at = None
+            except Exception as e:
+                entry.error = str(e)
+                entry.failed_at = time.monotonic()
+                raise
+            finally:
+                entry.loading = False
+            entry.last_used = time.time()
+            model = entry.model
+        self._enforce_budget(keep=name)
+        self._start_reaper()
+        return model
+
+    @contextmanager
+    def use(self, name: str):
+        """Context manager that loads the model and keeps it from being evicted while in use."""
+        entry = self._entry(name)
+        with self._lock:
+            entry.in_use += 1
+        try:
+            yield self.get(name)
+        finally:
+            with self._lock:
+                entry.in_use -= 1
+                entry.last_used = time.time()
+
+    def warmup(self, *names: str) -> threading.Thread | None:
+        """
+        Loads the given models on a background thread. Load errors are only
+        recorded. Models that are loaded, already loading or failed to load in
+        the last WARMUP_RETRY_SECONDS are skipped, so a page that asks on every
+        rerun doesn't pile up threads waiting on the same load. Returns the
+        thread, or None if there was nothing to load.
+        """
+        now = time.monotonic()
+        with self._lock:
+            entries = [self._entry(name) for name in names]
+            names = [e.name for e in entries if not e.loaded and not e.loading
+                     and (e.failed_at is None or now - e.failed_at >= WARMUP_RETRY_SECONDS)]
+            for name in names:
+                self._entries[name].loading = True
+        if not names:
+            return None
+
+        def run():
+            for name in names:
+                try:
+                    self.get(name)
+                except Exception as e:
+                    print(f"Warm-up of model '{name}' failed: {e}")
+
+        thread = threading.Thread(target=run, name="model-warmup", daemon=True)
+        thread.start()
+        return thread
+
+    def is_loaded(self, name: str) -> bool:
+        return self._entry(name).loaded
+
+    def unload(self, name: str) -> bool:
+        """Unloads a model. Returns False if it wasn't loaded or is in use."""
+        entry = self._entry(name)
+        with entry.lock:
+            if not entry.loaded or entry.in_use:
+                return False
+            start = time.perf_counter()
+            model, entry.model, entry.loaded = entry.model, None, False
+            if entry.unloader is not None:
+                try:
+                    entry.unloader(model)
+                except Exception as e:
+                    print(f"Error unloading model '{name}': {e}")
+            del model
+            gc.collect()
+            torch = sys.modules.get("torch")
+            if torch is not None:
+                if torch.cuda.is_available():
+                    torch.cuda.empty_cache()
+                if hasattr(torch, "mps") and torch.backends.mps.is_available():
+                    torch.mps.empty_cache()
+            entry.last_unload_seconds = time.perf_counter() - start
+            entry.unloads += 1
+            entry.size_mb = 0.0
+        print(f"Model '{name}' unloaded.")
+        return True
+
+    def resident_mb(self) -> float:
+        return sum(e.size_mb for e in self._entries.values() if e.loaded)
+
+    def _enforce_budget(self, keep: str | None = None):
+        if not self.budget_mb:
+            return
+        with self._lock:
+            candidates = sorted(
+                (e for e in self._entries.values() if e.loaded and not e.in_use and e.name != keep),
+                key=lambda e: e.last_used,
+            )
+        for entry in candidates:
+            if self.resident_mb() <= self.budget_mb:
+                break
+            self.unload(entry.name)
+
+    def evict_idle(self, now: float | None = None) -> list[str]:
+        """Unloads every model that has been idle longer than idle_seconds."""
+        if not self.idle_seconds:
+            return []
+        now = time.time() if now is None else now
+        evicted = []
+        for entry in list(self._entries.values()):
+            if entry.loaded and not entry.in_use and now - entry.last_used > self.idle_seconds:
+                if self.unload(entry.name):
+                    evicted.append(entry.name)
+        return evicted
+
+    def _start_reaper(self):
+        if not self.idle_seconds or (self._reaper is not None and self._reaper.is_alive()):
+            return
+
+        def reap():
+            while True:
+                time.sleep(self.reap_interval)
+                self.evict_idle()
+
+        with self._lock:
+            if self._reaper is None or not self._reaper.is_alive():
+                self._reaper = threading.Thread(target=reap, name="model-reaper", daemon=True)
+                self._reaper.start()
+
+    def status(self) -> list[dict]:
+        """Residency and timing information for every registered model."""
+        now = time.time()
+        return [
+            {
+                "name": e.name,
+                "loaded": e.loaded,
+                "size_mb": round(e.size_mb, 1),
+                "in_use": e.in_use,
+                "idle_seconds": round(now - e.last_used, 1) if e.last_used else None,
+                "loads": e.loads,
+                "unloads": e.unloads,
+                "last_load_seconds": e.last_load_seconds,
+                "last_unload_seconds": e.last_unload_seconds,
+                "error": e.error,
+            }
+            for e in self._entries.values()
+        ]
+
+
+# Shared registry used by image_gen, voice_utils and face_utils
+registry = ModelRegistry()
@@ -0,0 +1,565 @@
+import argparse
+import hmac
+import ipaddress
+import json
+import os
+import queue
+import re
+import secrets
+import signal
+import socket
+import socketserver
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from backend import metrics
+from backend.model_client import MODELS, SOCKET_PATH, TOKEN_PATH, LocalBackend
+
+# Model-serving daemon: one long-lived process that owns the models and
+# serves every Streamlit session and the command-line client over HTTP on a
+# Unix socket (backend/model_client.py is the client).
+#
+# The socket is readable by this user only. With --port the daemon listens on
+# loopback TCP and every request must carry a shared token (Authorization:
+# Bearer), from SAHILGPT_DAEMON_TOKEN or generated into model_client.TOKEN_PATH
+# (mode 0600): /v1/code runs arbitrary code and /v1/face/verify is the login
+# check, so no other local user may call them. Other hosts are refused
+# without --allow-remote (the token then travels in clear text).
+#
+#     python -m backend.model_server [--socket PATH] [--port N] [--limit tts=4] [--warmup face whisper]
+#
+# Each kind of request has its own work queue with a fixed number of worker
+# threads, so e.g. two sessions can't run Whisper at once and a burst of TTS
+# requests doesn't wait behind a transcription. Requests beyond a queue's
+# workers wait; past max_pending waiting requests the daemon answers 503 and
+# the client backs off. Image jobs go through image_jobs' scheduler, which
+# already runs them one batch at a time. Models stay loaded (subject to the
+# registry's idle and memory limits) when the app restarts.
+
+# Worker threads per queue; SAHILGPT_DAEMON_LIMITS="tts=4,code=2" or --limit override them
+DEFAULT_LIMITS = {"face": 1, "transcribe": 1, "tts": 2, "code": int(os.environ.get("SAHILGPT_CODE_POOL_SIZE", "2"))}
+MAX_PENDING = int(os.environ.get("SAHILGPT_DAEMON_MAX_PENDING", "32"))  # waiting requests per queue
+STREAM_BUFFER = 64  # output chunks buffered between a code worker and a slow client
+
+
+def parse_limits(specs) -> dict:
+    """["tts=4", "code=2"] (or "tts=4,code=2") -> {"tts": 4, "code": 2}."""
+    if isinstance(specs, str):
+        specs = specs.split(",")
+    limits = {}
+    for spec in specs:
+        if not spec.strip():
+            continue
+        name, _, value = spec.partition("=")
+        if name.strip() not in DEFAULT_LIMITS:
+            raise ValueError(f"Unknown queue '{name.strip()}' (one of {', '.join(DEFAULT_LIMITS)})")
+        limits[name.strip()] = int(value)
+    return limits
+
+
+# --- Work queues ---
+
+class QueueFull(Exception):
+    """The queue's workers are busy and max_pending requests are already waiting."""
+
+
+class WorkQueue:
+    """
+    Runs one kind of request on a fixed number of worker threads.
+
+    call() and stream() block the calling (connection) thread until a worker
+    has run the request, and raise QueueFull when max_pending requests are
+    already waiting. Wait and run times are recorded as
+    daemon.<name>.wait and daemon.<name> in metrics.
+    """
+
+    def __init__(self, name: str, workers: int, max_pending: int = MAX_PENDING):
+        self.name = name
+        self.workers = workers
+        self.max_pending = max_pending
+        self.waiting = 0
+        self.running = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(workers, thread_name_prefix=f"daemon-{name}")
+
+    def _admit(self) -> float:
+        with self._lock:
+            if self.waiting >= self.max_pending:
+                self.rejected += 1
+                metrics.increment(f"daemon.{self.name}.rejected")
+                raise QueueFull(f"The {self.name} queue is full ({self.max_pending} requests waiting)")
+            self.waiting += 1
+        return time.perf_counter()
+
+    def _start(self, submitted: float):
+        with self._lock:
+            self.waiting -= 1
+            self.running += 1
+        metrics.observe(f"daemon.{self.name}.wait", time.perf_counter() - submitted)
+
+    def _finish(self, ok: bool):
+        with self._lock:
+            self.running -= 1
+            if ok:
+                self.completed += 1
+            else:
+                self.failed += 1
+
+    def call(self, fn, *args, **kwargs):
+        """Runs fn(*args, **kwargs) on a worker and returns (or raises) its result."""
+        submitted = self._admit()
+
+        def job():
+            self._start(submitted)
+            ok = False
+            try:
+                with metrics.timer(f"daemon.{self.name}"):
+                    result = fn(*args, **kwargs)
+                ok = True
+                return result
+            finally:
+                self._finish(ok)
+
+        return self._pool.submit(job).result()
+
+    def stream(self, fn, *args, **kwargs):
+        """
+        Runs the generator fn(*args, **kwargs) on a worker and yields its
+        items on the calling thread. Closing the returned generator (e.g. the
+        client went away) closes fn's generator after its current item.
+        """
+        submitted = self._admit()
+        items = queue.Queue(STREAM_BUFFER)
+        stop = threading.Event()
+        end = object()
+
+        def put(item) -> bool:
+            while not stop.is_set():
+                try:
+                    items.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+
+        def job():
+            self._start(submitted)
+            ok, error = False, None
+            try:
+                with metrics.timer(f"daemon.{self.name}"):
+                    generator = fn(*args, **kwargs)
+                    try:
+                        for item in generator:
+                            if not put(item):
+                                break
+                    finally:
+                        generator.close()
+                ok = True
+            except Exception as e:
+                error = e
+            finally:
+                self._finish(ok)
+                put((end, error))
+
+        self._pool.submit(job)
+        try:
+            while True:
+                item = items.get()
+                if isinstance(item, tuple) and item and item[0] is end:
+                    if item[1] is not None:
+                        raise item[1]
+                    return
+                yield item
+        finally:
+            stop.set()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"workers": self.workers, "max_pending": self.max_pending, "waiting": self.waiting,
+                    "running": self.running, "completed": self.completed, "failed": self.failed,
+                    "rejected": self.rejected}
+
+    def close(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+
+# --- Request handling ---
+
+class RequestError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+class Request:
+    def __init__(self, body: bytes, headers, query: dict, args: tuple):
+        self.body = body
+        self.headers = headers
+        self.query = query
+        self.args = args
+
+    def json(self) -> dict:
+        try:
+            return json.loads(self.body or b"{}")
+        except ValueError:
+            raise RequestError(400, "Request body is not valid JSON") from None
+
+
+class ModelServer:
+    """
+    The daemon's endpoints. Each handler takes a Request and returns a dict
+    (sent as JSON), a (bytes, headers) pair or a generator of JSON-able items
+    (streamed as NDJSON). backend does the work (a LocalBackend by default).
+    """
+
+    ROUTES = [
+        ("GET", r"/v1/health", "health"),
+        ("GET", r"/v1/status", "status"),
+        ("POST", r"/v1/warmup", "warmup"),
+        ("POST", r"/v1/face/verify", "verify_face"),
+        ("POST", r"/v1/transcribe", "transcribe"),
+        ("GET", r"/v1/tts", "tts_engine"),
+        ("POST", r"/v1/tts", "synthesize"),
+        ("POST", r"/v1/image/jobs", "submit_image"),
+        ("GET", r"/v1/image/jobs/(\w+)", "image_status"),
+        ("GET", r"/v1/image/jobs/(\w+)/image", "image_bytes"),
+        ("DELETE", r"/v1/image/jobs/(\w+)", "cancel_image"),
+        ("POST", r"/v1/code", "run_code"),
+    ]
+
+    def __init__(self, backend=None, limits: dict | None = None, max_pending: int = MAX_PENDING):
+        self.backend = backend or LocalBackend()
+        limits = {**DEFAULT_LIMITS, **(limits or {})}
+        self.queues = {name: WorkQueue(name, workers, max_pending) for name, workers in limits.items()}
+        self.max_pending = max_pending
+        self.started = time.time()
+        self.routes = [(method, re.compile(pattern + "$"), getattr(self, name)) for method, pattern, name in self.ROUTES]
+
+    def route(self, method: str, path: str):
+        """(handler, path arguments) for a request, or raises RequestError(404/405)."""
+        allowed = False
+        for route_method, pattern, handler in self.routes:
+            match = pattern.match(path)
+            if match:
+                if route_method == method:
+                    return handler, match.groups()
+                allowed = True
+        raise RequestError(405 if allowed else 404, f"No endpoint {method} {path}")
+
+    def health(self, request: Request) -> dict:
+        return {"ok": True, "pid": os.getpid(), "uptime_s": time.time() - self.started}
+
+    def status(self, request: Request) -> dict:
+        status = self.backend.status()
+        status.update(remote=True, pid=os.getpid(), uptime_s=time.time() - self.started,
+                      queues={name: q.stats() for name, q in self.queues.items()},
+                      image_queue={"queued": self.backend.pending_images(), "max_pending": self.max_pending},
+                      metrics=metrics.snapshot())
+        return status
+
+    def warmup(self, request: Request) -> dict:
+        names = request.json().get("models", [])
+        unknown = [name for name in names if name not in MODELS and name != "code"]
+        if unknown:
+            raise RequestError(400, f"Unknown model(s): {', '.join(unknown)}")
+        return {"started": self.backend.warmup(*names)}
+
+    def verify_face(self, request: Request) -> dict:
+        return {"verified": bool(self.queues["face"].call(self.backend.verify_face, request.body))}
+
+    def transcribe(self, request: Request) -> dict:
+        options = json.loads(request.headers.get("X-Whisper-Options") or "{}")
+        if request.headers.get("Content-Type") == "audio/x-float32":
+            import numpy as np
+            audio, sample_rate = np.frombuffer(request.body, dtype="<f4"), None
+        else:
+            audio, sample_rate = request.body, int(request.query.get("sample_rate", 0)) or None
+        return {"text": self.queues["transcribe"].call(self.backend.transcribe, audio, sample_rate, **options)}
+
+    def tts_engine(self, request: Request) -> dict:
+        from backend import tts
+
+        try:
+            engine = self.backend.tts_engine(request.query.get("engine"))
+        except KeyError as e:
+            raise RequestError(400, f"Unknown TTS engine {e}") from None
+        except tts.TTSUnavailable as e:
+            raise RequestError(501, str(e)) from None
+        return {"name": engine.name, "audio_format": engine.audio_format, "default_voice": engine.default_voice}
+
+    def synthesize(self, request: Request):
+        payload = request.json()
+        if not payload.get("text"):
+            raise RequestError(400, "Missing 'text'")
+        engine = self.tts_engine(Request(b"", {}, {"engine": payload.get("engine")}, ()))
+        audio = self.queues["tts"].call(self.backend.synthesize, payload["text"], engine["name"],
+                                        payload.get("voice"), payload.get("use_cache", True))
+        return audio, {"Content-Type": f"audio/{engine['audio_format']}", "X-Engine": engine["name"]}
+
+    def submit_image(self, request: Request) -> dict:
+        payload = request.json()
+        if not payload.get("prompt"):
+            raise RequestError(400, "Missing 'prompt'")
+        if self.backend.pending_images() >= self.max_pending:
+            metrics.increment("daemon.image.rejected")
+            raise QueueFull(f"The image queue is full ({self.max_pending} jobs waiting)")
+        params = {key: payload[key] for key in ("steps", "width", "height", "guidance_scale") if payload.get(key)}
+        try:
+            job_id = self.backend.submit_image(payload["prompt"], seed=payload.get("seed"),
+                                               profile=payload.get("profile"), **params)
+        except KeyError:
+            raise RequestError(400, f"Unknown performance profile '{payload.get('profile')}'") from None
+        return {"id": job_id}
+
+    def image_status(self, request: Request) -> dict:
+        job = self.backend.image_status(request.args[0])
+        if job is None:
+            raise RequestError(404, "No such image job")
+        return job
+
+    def image_bytes(self, request: Request):
+        image = self.backend.image_bytes(request.args[0])
+        if image is None:
+            raise RequestError(404, "Image not available")
+        return image, {"Content-Type": "image/png"}
+
+    def cancel_image(self, request: Request) -> dict:
+        return {"cancelled": self.backend.cancel_image(request.args[0])}
+
+    def run_code(self, request: Request):
+        payload = request.json()
+        if not isinstance(payload.get("code"), str):
+            raise RequestError(400, "Missing 'code'")
+        return self.queues["code"].stream(self.backend.stream_code, payload["code"], payload.get("timeout"),
+                                          payload.get("use_cache", False))
+
+    def close(self):
+        for work_queue in self.queues.values():
+            work_queue.close()
+
+
+class DaemonHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive: a client thread reuses one connection
+    server_version = "SAHILGPT-daemon"
+
+    def address_string(self) -> str:
+        # Unix socket peers have no address
+        return self.client_address[0] if isinstance(self.client_address, tuple) else "local"
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def handle_one_request(self):
+        try:
+            super().handle_one_request()
+        except (BrokenPipeError, ConnectionResetError):
+            self.close_connection = True  # the client went away before reading the response
+
+    def do_GET(self):
+        self._dispatch()
+
+    def do_POST(self):
+        self._dispatch()
+
+    def do_DELETE(self):
+        self._dispatch()
+
+    def _dispatch(self):
+        url = urlparse(self.path)
+        body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        server = self.server.model_server
+        token = self.server.token
+        if token and not hmac.compare_digest(self.headers.get("Authorization", ""), f"Bearer {token}"):
+            return self._send_json(401, {"error": "Missing or wrong daemon token"})
+        try:
+            handler, args = server.route(self.command, url.path)
+            query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+            result = handler(Request(body, self.headers, query, args))
+        except RequestError as e:
+            return self._send_json(e.status, {"error": str(e)})
+        except QueueFull as e:
+            return self._send_json(503, {"error": str(e)}, {"Retry-After": "1"})
+        except Exception as e:
+            print(f"Daemon error in {self.command} {url.path}: {e}")
+            return self._send_json(500, {"error": str(e)})
+        if isinstance(result, dict):
+            self._send_json(200, result)
+        elif isinstance(result, tuple):
+            data, headers = result
+            self._send(200, data, headers)
+        else:
+            self._send_stream(result)
+
+    def _send(self, status: int, data: bytes, headers: dict):
+        self.send_response(status)
+        for key, value in headers.items():
+            self.send_header(key, value)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_json(self, status: int, payload: dict, headers: dict | None = None):
+        self._send(status, json.dumps(payload, default=str).encode(), {"Content-Type": "application/json",
+                                                                       **(headers or {})})
+
+    def _send_stream(self, items):
+        """Writes each item as a JSON line in its own HTTP chunk, as soon as it is produced."""
+        # Wait for the first item before sending the headers, so a full queue
+        # or a failure to start is still answered with an error status
+        try:
+            first = next(items, None)
+        except QueueFull as e:
+            return self._send_json(503, {"error": str(e)}, {"Retry-After": "1"})
+        except Exception as e:
+            print(f"Daemon error while streaming: {e}")
+            return self._send_json(500, {"error": str(e)})
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        try:
+            if first is not None:
+                self._write_chunk(first)
+            for item in items:
+                self._write_chunk(item)
+        except Exception as e:
+            if not isinstance(e, (BrokenPipeError, ConnectionResetError)):
+                print(f"Daemon error while streaming: {e}")
+            # The response can't be completed; the client sees the connection close
+            self.close_connection = True
+            return
+        finally:
+            items.close()
+        self.wfile.write(b"0\r\n\r\n")
+
+    def _write_chunk(self, item):
+        line = (json.dumps(item) + "\n").encode()
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(line), line))
+
+
+class UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def _claim_socket(path: str):
+    """Removes a stale socket file; exits if a daemon is already listening on it."""
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        return
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.connect(path)
+    except OSError:
+        os.unlink(path)
+        return
+    finally:
+        probe.close()
+    raise SystemExit(f"A model daemon is already listening on {path}")
+
+
+def _is_loopback(host: str) -> bool:
+    if host == "localhost":
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+
+def _daemon_token(path: str = TOKEN_PATH) -> str:
+    """SAHILGPT_DAEMON_TOKEN, or a new random token written to path for this user's clients only."""
+    token = os.environ.get("SAHILGPT_DAEMON_TOKEN")
+    if token:
+        return token
+    token = secrets.token_urlsafe(32)
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    if os.path.exists(path):
+        os.unlink(path)  # O_CREAT doesn't change the mode of an existing file
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    with os.fdopen(fd, "w") as f:
+        f.write(token)
+    return token
+
+
+def serve(model_server: ModelServer, socket_path: str = SOCKET_PATH, host: str | None = None,
+          port: int | None = None, verbose: bool = False, ready=None, allow_remote: bool = False):
+    """
+    Serves until SIGINT/SIGTERM (or server.shutdown()). ready(server) is
+    called once listening. On TCP (port) every request needs the token (see
+    _daemon_token), and host must be a loopback address unless allow_remote.
+    """
+    token = None
+    if port is not None:
+        host = host or "127.0.0.1"
+        if not _is_loopback(host) and not allow_remote:
+            raise SystemExit(f"Refusing to listen on {host}: the daemon runs code and checks logins. "
+                             "Use a loopback address, or --allow-remote on a trusted network.")
+        token = _daemon_token()
+        server = ThreadingHTTPServer((host, port), DaemonHandler)
+        address = f"http://{server.server_address[0]}:{server.server_address[1]}"
+    else:
+        _claim_socket(socket_path)
+        server = UnixHTTPServer(socket_path, DaemonHandler)
+        os.chmod(socket_path, 0o600)  # face verification is a login check: only this user may ask
+        address = socket_path
+    server.token = token
+    server.daemon_threads = True
+    server.model_server = model_server
+    server.verbose = verbose
+
+    def stop(signum, frame):
+        threading.Thread(target=server.shutdown, daemon=True).start()
+
+    if threading.current_thread() is threading.main_thread():
+        signal.signal(signal.SIGTERM, stop)
+        signal.signal(signal.SIGINT, stop)
+    print(f"Model daemon listening on {address} (pid {os.getpid()}); queues: "
+          + ", ".join(f"{name}={q.workers}" for name, q in model_server.queues.items()))
+    if ready is not None:
+        ready(server)
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        model_server.close()
+        if port is None and os.path.exists(socket_path):
+            os.unlink(socket_path)
+        print("Model daemon stopped.")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m backend.model_server",
+                                     description="Serves the SAHILGPT models to the app and the CLI.")
+    parser.add_argument("--socket", default=SOCKET_PATH, help="Unix socket path (default: %(default)s)")
+    parser.add_argument("--host", help="listen on TCP instead (with --port); loopback only, default 127.0.0.1")
+    parser.add_argument("--port", type=int, help="TCP port; clients need SAHILGPT_DAEMON_URL=http://host:port "
+                                                 "and the token (SAHILGPT_DAEMON_TOKEN or the token file)")
+    parser.add_argument("--allow-remote", action="store_true",
+                        help="allow a non-loopback --host (anyone with the token can run code)")
+    parser.add_argument("--limit", action="append", default=[], metavar="QUEUE=N",
+                        help=f"worker threads of a queue ({', '.join(DEFAULT_LIMITS)}); repeatable")
+    parser.add_argument("--max-pending", type=int, default=MAX_PENDING,
+                        help="waiting requests per queue before answering 503 (default: %(default)s)")
+    parser.add_argument("--warmup", nargs="*", default=[], choices=[*MODELS, "code"], help="models to load at start")
+    parser.add_argument("--verbose", action="store_true", help="log every request")
+    args = parser.parse_args(argv)
+
+    try:
+        limits = {**parse_limits(os.environ.get("SAHILGPT_DAEMON_LIMITS", "")), **parse_limits(args.limit)}
+    except ValueError as e:
+        parser.error(str(e))
+    model_server = ModelServer(limits=limits, max_pending=args.max_pending)
+    if args.warmup:
+        model_server.backend.warmup(*args.warmup)
+    serve(model_server, args.socket, args.host, args.port, args.verbose, allow_remote=args.allow_remote)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,460 @@
+import atexit
+import fnmatch
+import heapq
+import json
+import os
+import queue
+import re
+import threading
+import time
+from collections import OrderedDict
+from itertools import islice
+
+from backend import result_cache
+
+# An index of recent activity per project (each subdirectory of the projects
+# directory). One parallel recursive scan builds it, a watchdog observer keeps
+# it current, and it is saved to disk so a restart answers immediately.
+# Projects are kept in most-recently-active-first order, so "last project" is
+# the first entry and "top N" the first N.
+
+INDEX_PATH = "data/project_index.json"
+SCAN_WORKERS = min(32, (os.cpu_count() or 4) * 4)  # scanning is I/O bound
+RECENT_FILES = 10  # most recently modified files remembered per project
+SAVE_INTERVAL = 30  # seconds between saves after a change
+RESCAN_INTERVAL = 300  # seconds between full rescans when the tree can't be watched
+
+# Never indexed, whatever the .gitignore files say (gitignore syntax)
+DEFAULT_IGNORES = [
+    ".git/", "node_modules/", ".venv/", "venv/", "env/", "__pycache__/", ".mypy_cache/", ".pytest_cache/",
+    ".ruff_cache/", ".tox/", ".next/", ".cache/", ".idea/", ".DS_Store", "*.pyc", "*.swp", "*~",
+]
+
+# --- Ignore rules ---
+
+def _glob_to_regex(pattern: str) -> str:
+    regex, i = "", 0
+    while i < len(pattern):
+        if pattern.startswith("**/", i):
+            regex += "(?:.*/)?"
+            i += 3
+        elif pattern.startswith("**", i):
+            regex += ".*"
+            i += 2
+        elif pattern[i] == "*":
+            regex += "[^/]*"
+            i += 1
+        elif pattern[i] == "?":
+            regex += "[^/]"
+            i += 1
+        elif pattern[i] == "[":
+            end = pattern.find("]", i + 1)
+            if end == -1:
+                regex += re.escape(pattern[i])
+                i += 1
+            else:
+                regex += fnmatch.translate(pattern[i:end + 1])[4:-3]  # strip fnmatch's (?s:...)\Z
+                i = end + 1
+        else:
+            regex += re.escape(pattern[i])
+            i += 1
+    return regex
+
+
+class IgnoreRules:
+    """
+    The patterns of one .gitignore file, relative to the directory it is in.
+    Supports comments, negation (!), directory-only patterns (trailing /),
+    anchoring (a / anywhere but the end) and *, ?, [..] and ** wildcards.
+    """
+
+    def __init__(self, directory: str, lines: list[str]):
+        self.directory = directory
+        self.rules = []  # (regex, negate, dir_only)
+        for line in lines:
+            line = line.rstrip("\n").rstrip()
+            if not line or line.startswith("#"):
+                continue
+            negate = line.startswith("!")
+            if negate:
+                line = line[1:]
+            dir_only = line.endswith("/")
+            line = line.rstrip("/") if dir_only else line
+            anchored = "/" in line  # before the leading / is stripped: "/build/" only matches at the top
+            regex = _glob_to_regex(line.lstrip("/"))
+            regex = f"^{regex}$" if anchored else f"^(?:.*/)?{regex}$"
+            self.rules.append((re.compile(regex), negate, dir_only))
+        self._prefix_len = len(directory.rstrip(os.sep)) + 1
+        # Without ! rules the order doesn't matter: one alternation per kind of path is enough
+        self._combined = None
+        if not any(negate for _, negate, _ in self.rules):
+            file_rules = [r.pattern for r, _, dir_only in self.rules if not dir_only]
+            self._combined = (re.compile("|".join(file_rules)) if file_rules else None,
+                              re.compile("|".join(r.pattern for r, _, _ in self.rules)) if self.rules else None)
+
+    @classmethod
+    def from_file(cls, directory: str):
+        try:
+            with open(os.path.join(directory, ".gitignore"), errors="replace") as f:
+                return cls(directory, f.readlines())
+        except OSError:
+            return None
+
+    def match(self, path: str, is_dir: bool) -> bool | None:
+        """True (ignored), False (re-included by a ! rule) or None (no rule matches)."""
+        rel_path = path[self._prefix_len:]  # paths passed in are always below self.directory
+        if os.sep != "/":
+            rel_path = rel_path.replace(os.sep, "/")
+        if self._combined is not None:
+            regex = self._combined[1 if is_dir else 0]
+            return True if regex is not None and regex.match(rel_path) else None
+        result = None
+        for regex, negate, dir_only in self.rules:
+            if dir_only and not is_dir:
+                continue
+            if regex.match(rel_path):
+                result = not negate
+        return result
+
+
+def is_ignored(rules: tuple, path: str, is_dir: bool) -> bool:
+    """Applies a stack of IgnoreRules (outermost first); the innermost matching rule wins."""
+    for rule_set in reversed(rules):
+        result = rule_set.match(path, is_dir)
+        if result is not None:
+            return result
+    return False
+
+# --- Index ---
+
+class ProjectActivity:
+    __slots__ = ("name", "path", "last_modified", "recent_files", "file_count")
+
+    def __init__(self, name: str, path: str, last_modified: float = 0.0, recent_files=None, file_count: int = 0):
+        self.name = name
+        self.path = path
+        self.last_modified = last_modified
+        self.recent_files = recent_files or []  # [(path, mtime)], newest first
+        self.file_count = file_count
+
+    def touch(self, path: str, mtime: float, removed: bool = False):
+        recent = [entry for entry in self.recent_files if entry[0] != path]
+        if not removed:
+            recent.insert(0, (path, mtime))
+        self.recent_files = recent[:RECENT_FILES]
+        self.last_modified = max(self.last_modified, mtime)
+
+    def as_dict(self) -> dict:
+        return {"name": self.name, "path": self.path, "last_modified": self.last_modified,
+                "recent_files": [list(entry) for entry in self.recent_files], "file_count": self.file_count}
+
+
+class ProjectIndex:
+    """
+    Most-recently-active-first index of the projects under base_dir.
+
+    start() loads the saved index (if any), rescans in the background to pick
+    up changes made while the app wasn't running, then watches the tree with
+    watchdog. The scan and the watcher skip DEFAULT_IGNORES and whatever the
+    projects' .gitignore files exclude. last_project() is O(1) and top(n) is
+    O(n); both work from the saved index while the first scan is running.
+
+    One recursive watch covers base_dir. On Linux inotify still places watches
+    inside ignored directories (node_modules, .venv, ...; their events are
+    dropped), so a large tree can use up fs.inotify.max_user_watches. When the
+    watch can't be set up the index falls back to a full rescan every
+    RESCAN_INTERVAL seconds; raising the limit brings live updates back.
+    """
+
+    def __init__(self, base_dir: str, index_path: str = INDEX_PATH, workers: int = SCAN_WORKERS):
+        self.base_dir = os.path.abspath(base_dir)
+        self.index_path = index_path
+        self.workers = workers
+        self.ready = threading.Event()  # set once the first full scan has finished
+        self.scan_seconds = None
+        self._projects = OrderedDict()  # name -> ProjectActivity, most recent first
+        self._dirs = {}  # indexed directory -> tuple of IgnoreRules that apply inside it
+        self._lock = threading.RLock()
+        self._dirty = False
+        self._observer = None
+        self._saver = None
+        self._stopped = threading.Event()
+
+    # --- Queries ---
+
+    def last_project(self) -> str | None:
+        with self._lock:
+            for project in self._projects.values():
+                return project.path
+        return None
+
+    def top(self, n: int = 5) -> list[dict]:
+        """The n most recently active projects with their most recently edited files."""
+        with self._lock:
+            return [project.as_dict() for project in islice(self._projects.values(), n)]
+
+    # --- Lifecycle ---
+
+    def start(self):
+        self.load()
+        threading.Thread(target=self._initial_scan, name="project-scan", daemon=True).start()
+        return self
+
+    def _initial_scan(self):
+        try:
+            self.rescan()
+            self.watch()
+        except Exception as e:
+            print(f"Error indexing projects in '{self.base_dir}': {e}")
+        finally:
+            self.ready.set()
+
+    def stop(self):
+        self._stopped.set()
+        if self._observer is not None:
+            self._observer.stop()
+            self._observer = None
+        self.save()
+
+    def load(self) -> bool:
+        try:
+            with open(self.index_path) as f:
+                data = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return False
+        if data.get("base_dir") != self.base_dir:
+            return False
+        projects = [ProjectActivity(p["name"], p["path"], p["last_modified"],
+                                    [tuple(entry) for entry in p["recent_files"]], p["file_count"])
+                    for p in data["projects"]]
+        self._replace(projects)
+        return True
+
+    def save(self):
+        with self._lock:
+            data = {"base_dir": self.base_dir, "saved_at": time.time(),
+                    "projects": [project.as_dict() for project in self._projects.values()]}
+            self._dirty = False
+        os.makedirs(os.path.dirname(self.index_path) or ".", exist_ok=True)
+        tmp_path = self.index_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(data, f)
+        os.replace(tmp_path, self.index_path)
+
+    def _replace(self, projects: list[ProjectActivity]):
+        projects.sort(key=lambda p: p.last_modified, reverse=True)
+        with self._lock:
+            self._projects = OrderedDict((p.name, p) for p in projects)
+        result_cache.invalidate("projects")
+
+    # --- Scanning ---
+
+    def rescan(self):
+        """Full parallel scan of base_dir; replaces the index when done."""
+        start = time.perf_counter()
+        base_rules = (IgnoreRules(self.base_dir, DEFAULT_IGNORES),)
+        projects, dirs = {}, {}
+        try:
+            entries = list(os.scandir(self.base_dir))
+        except OSError:
+            print(f"Error: Scan directory '{self.base_dir}' not found.")
+            return
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False) and not is_ignored(base_rules, entry.path, True):
+                projects[entry.name] = ProjectActivity(entry.name, entry.path)
+        self._scan_trees([(p.path, p, base_rules) for p in projects.values()], dirs)
+        with self._lock:
+            self._dirs = dirs
+        self._replace(list(projects.values()))
+        self.scan_seconds = time.perf_counter() - start
+        print(f"Indexed {len(projects)} projects ({sum(p.file_count for p in projects.values())} files) "
+              f"in {self.scan_seconds:.2f}s")
+        self.save()
+
+    def _scan_trees(self, roots: list, dirs: dict, workers: int | None = None):
+        """Scans directory trees on a pool of threads, one directory per task."""
+        tasks = queue.Queue()
+        for root in roots:
+            tasks.put(root)
+
+        def worker():
+            while True:
+                task = tasks.get()
+                if task is None:
+                    return
+                try:
+                    self._scan_dir(*task, tasks, dirs)
+                except Exception as e:
+                    print(f"Error scanning '{task[0]}': {e}")
+                finally:
+                    tasks.task_done()
+
+        threads = [threading.Thread(target=worker, daemon=True) for _ in range(workers or self.workers)]
+        for thread in threads:
+            thread.start()
+        tasks.join()
+        for _ in threads:
+            tasks.put(None)
+
+    def _scan_dir(self, directory: str, project: ProjectActivity, rules: tuple, tasks, dirs):
+        own_rules = IgnoreRules.from_file(directory)
+        if own_rules is not None:
+            rules = rules + (own_rules,)
+        files = []
+        try:
+            entries = list(os.scandir(directory))
+        except OSError:
+            return  # unreadable or removed mid-scan
+        for entry in entries:
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    if not is_ignored(rules, entry.path, True):
+                        tasks.put((entry.path, project, rules))
+                elif entry.is_file(follow_symlinks=False) and not is_ignored(rules, entry.path, False):
+                    files.append((entry.stat(follow_symlinks=False).st_mtime, entry.path))
+            except OSError:
+                continue
+        recent = heapq.nlargest(RECENT_FILES, files)
+        with self._lock:
+            dirs[directory] = rules
+            project.file_count += len(files)
+            if recent:
+                merged = heapq.nlargest(RECENT_FILES, [(m, p) for p, m in project.recent_files] + recent)
+                project.recent_files = [(p, m) for m, p in merged]
+                project.last_modified = max(project.last_modified, merged[0][0])
+
+    # --- Watching ---
+
+    def watch(self):
+        try:
+            from watchdog.events import FileSystemEventHandler
+            from watchdog.observers import Observer
+        except ImportError:
+            print("watchdog is not installed; the project index won't update until the next rescan.")
+            return
+
+        index = self
+
+        class Handler(FileSystemEventHandler):
+            def on_any_event(self, event):
+                if event.event_type in ("opened", "closed", "closed_no_write"):
+                    return
+                try:
+                    index._on_event(event.event_type, event.src_path, event.is_directory)
+                    if getattr(event, "dest_path", ""):
+                        index._on_event("created", event.dest_path, event.is_directory)
+                except Exception as e:
+                    print(f"Error updating project index: {e}")
+
+        observer = Observer()
+        observer.schedule(Handler(), self.base_dir, recursive=True)
+        observer.daemon = True
+        try:
+            observer.start()
+        except OSError as e:
+            # ENOSPC/EMFILE: inotify's max_user_watches or max_user_instances is used up
+            print(f"Can't watch '{self.base_dir}' ({e}); rescanning it every {RESCAN_INTERVAL}s instead.")
+            threading.Thread(target=self._poll, name="project-rescan", daemon=True).start()
+            return
+        self._observer = observer
+
+    def _poll(self):
+        while not self._stopped.wait(RESCAN_INTERVAL):
+            try:
+                self.rescan()
+            except Exception as e:
+                print(f"Error indexing projects in '{self.base_dir}': {e}")
+
+    def _on_event(self, event_type: str, path: str, is_dir: bool):
+        path = os.fsdecode(path)
+        rel_path = os.path.relpath(path, self.base_dir)
+        if rel_path.startswith(".."):
+            return
+        parts = rel_path.split(os.sep)
+        if len(parts) == 1:
+            self._on_project_event(event_type, path, is_dir)
+            return
+        parent = os.path.dirname(path)
+        with self._lock:
+            rules = self._dirs.get(parent)
+            project = self._projects.get(parts[0])
+        if rules is None or project is None or is_ignored(rules, path, is_dir):
+            return  # inside an ignored (or not yet indexed) directory
+        removed = event_type in ("deleted", "moved")
+        if is_dir:
+            if removed:
+                with self._lock:
+                    prefix = path + os.sep
+                    for directory in [d for d in self._dirs if d == path or d.startswith(prefix)]:
+                        del self._dirs[directory]
+            elif event_type == "created":
+                self._scan_trees([(path, project, rules)], self._dirs, workers=2)
+            return
+        if os.path.basename(path) == ".gitignore":
+            # Applies to events from now on; directories below keep their rules until the next rescan
+            own_rules = IgnoreRules.from_file(parent)
+            with self._lock:
+                self._dirs[parent] = tuple(r for r in rules if r.directory != parent) + ((own_rules,) if own_rules else ())
+        self._record(project, path, event_type)
+
+    def _on_project_event(self, event_type: str, path: str, is_dir: bool):
+        if not is_dir:
+            return  # files directly in base_dir aren't projects
+        name = os.path.basename(path)
+        if event_type in ("deleted", "moved"):
+            with self._lock:
+                self._projects.pop(name, None)
+            self._mark_dirty()
+        elif event_type == "created" and not is_ignored((IgnoreRules(self.base_dir, DEFAULT_IGNORES),), path, True):
+            project = ProjectActivity(name, path, time.time())
+            with self._lock:
+                self._projects[name] = project
+                self._projects.move_to_end(name, last=False)
+            self._scan_trees([(path, project, (IgnoreRules(self.base_dir, DEFAULT_IGNORES),))], self._dirs, workers=2)
+            self._mark_dirty()
+
+    def _record(self, project: ProjectActivity, path: str, event_type: str):
+        removed = event_type in ("deleted", "moved")
+        try:
+            mtime = os.stat(path).st_mtime
+        except OSError:
+            mtime, removed = time.time(), True  # deleting a file counts as activity too
+        with self._lock:
+            if event_type == "created":
+                project.file_count += 1
+            elif removed:
+                project.file_count = max(0, project.file_count - 1)
+            project.touch(path, mtime, removed)
+            if project.name in self._projects:
+                self._projects.move_to_end(project.name, last=False)
+        self._mark_dirty()
+
+    def _mark_dirty(self):
+        result_cache.invalidate("projects")
+        with self._lock:
+            self._dirty = True
+            if self._saver is not None:
+                return
+            self._saver = threading.Timer(SAVE_INTERVAL, self._save_if_dirty)
+            self._saver.daemon = True
+            self._saver.start()
+
+    def _save_if_dirty(self):
+        with self._lock:
+            self._saver = None
+            dirty = self._dirty
+        if dirty:
+            self.save()
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+def get_index(base_dir: str) -> ProjectIndex:
+    """Returns the started index for base_dir, creating it on first use."""
+    base_dir = os.path.abspath(base_dir)
+    with _indexes_lock:
+        if base_dir not in _indexes:
+            index = _indexes[base_dir] = ProjectIndex(base_dir).start()
+            atexit.register(index.stop)
+        return _indexes[base_dir]
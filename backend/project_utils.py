@@ -1,10 +1,15 @@
 import os
 import datetime
 
+from backend import project_index, result_cache
+
+@result_cache.cached(ttl=10, tags=("projects",))
 def find_last_project(scan_directory: str) -> str | None:
     """
-    Scans the first level of subdirectories in a given path and returns
-    the one with the most recent modification time.
+    Returns the project (subdirectory of scan_directory) with the most recently
+    modified file, from the project activity index. Until the index has data
+    (first run, initial scan still going) this falls back to scanning the
+    first level of subdirectories and comparing their modification times.
 
     Args:
         scan_directory: The absolute path to the directory to scan (e.g., "/Users/sahil/Documents/dev").
@@ -12,6 +17,14 @@ def find_last_project(scan_directory: str) -> str | None:
     Returns:
         The path of the most recently modified subdirectory, or None if not found.
     """
+    index = project_index.get_index(scan_directory)
+    last_project = index.last_project()
+    if last_project is not None or index.ready.is_set():
+        return last_project
+    return scan_top_level(scan_directory)
+
+def scan_top_level(scan_directory: str) -> str | None:
+    """The old, approximate answer: the subdirectory with the newest directory mtime."""
     latest_time = 0
     latest_project_path = None
 
@@ -0,0 +1,101 @@
+import functools
+import os
+import threading
+import time
+from collections import OrderedDict
+
+# Streamlit re-runs the whole page script on every click, so the same backend
+# reads repeat constantly. @cached keeps their results for a TTL, and writers
+# call invalidate(tag) so a change shows up on the very next rerun instead of
+# after the TTL. SAHILGPT_RESULT_CACHE=0 turns caching off.
+
+ENABLED = os.environ.get("SAHILGPT_RESULT_CACHE", "1") != "0"
+
+_functions = {}  # qualified name -> CachedFunction
+_lock = threading.Lock()
+
+
+class CachedFunction:
+    """
+    A function whose results are cached per argument tuple for ttl seconds
+    (up to max_entries argument tuples, least recently used dropped first).
+    Calls with unhashable arguments are not cached.
+    """
+
+    def __init__(self, fn, ttl: float, tags: tuple = (), max_entries: int = 128):
+        functools.update_wrapper(self, fn)
+        self.fn = fn
+        self.name = f"{fn.__module__}.{fn.__qualname__}"
+        self.ttl = ttl
+        self.tags = tuple(tags)
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self._entries = OrderedDict()  # key -> (expires_at, value)
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, *args, **kwargs):
+        if not ENABLED:
+            return self.fn(*args, **kwargs)
+        key = (args, tuple(sorted(kwargs.items())))
+        try:
+            hash(key)
+        except TypeError:
+            return self.fn(*args, **kwargs)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self.hits += 1
+                self._entries.move_to_end(key)
+                return entry[1]
+            self.misses += 1
+            generation = self._generation
+        value = self.fn(*args, **kwargs)
+        with self._lock:
+            # Don't store a result that an invalidation during the call made stale
+            if generation == self._generation:
+                self._entries[key] = (time.monotonic() + self.ttl, value)
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return value
+
+    def invalidate(self):
+        with self._lock:
+            self._entries.clear()
+            self._generation += 1
+            self.invalidations += 1
+
+    def stats(self) -> dict:
+        calls = self.hits + self.misses
+        return {"function": self.name, "ttl_s": self.ttl, "tags": ", ".join(self.tags), "hits": self.hits,
+                "misses": self.misses, "hit_rate": self.hits / calls if calls else 0.0,
+                "invalidations": self.invalidations, "entries": len(self._entries)}
+
+
+def cached(ttl: float, tags: tuple = (), max_entries: int = 128):
+    """Decorator: caches the function's results for ttl seconds; invalidate(tag) clears them."""
+    def decorator(fn):
+        cached_fn = CachedFunction(fn, ttl, tags, max_entries)
+        with _lock:
+            _functions[cached_fn.name] = cached_fn
+        return cached_fn
+    return decorator
+
+
+def invalidate(*tags: str):
+    """Clears every cached function carrying any of the tags (all of them if no tag is given)."""
+    with _lock:
+        functions = list(_functions.values())
+    for cached_fn in functions:
+        if not tags or set(tags) & set(cached_fn.tags):
+            cached_fn.invalidate()
+
+
+def stats() -> list[dict]:
+    """Per-function hit/miss counters, for the dashboard."""
+    with _lock:
+        functions = list(_functions.values())
+    return [cached_fn.stats() for cached_fn in functions]
@@ -0,0 +1,177 @@
+import importlib
+import importlib.abc
+import os
+import sys
+import threading
+import time
+
+from backend import metrics
+
+# Startup of the Streamlit app. The entry point imports this module first and
+# everything else through lazy_module(), so a page only pays for the backend
+# modules it actually touches: Home and Login render without SQLAlchemy,
+# torch, diffusers or Whisper (the model modules import those on first use).
+#
+# With SAHILGPT_PROFILE_STARTUP=1 every import from here on is timed (like
+# python -X importtime) and the first render prints a report: import time per
+# module and time-to-first-render. Streamlit itself is imported by
+# `streamlit run` before the script starts and isn't included.
+
+SCRIPT_START = time.perf_counter()
+PROFILE = os.environ.get("SAHILGPT_PROFILE_STARTUP", "0") == "1"
+
+# Modules that must not be imported to paint Home or Login (benchmarks/bench_startup.py --check)
+HEAVY_MODULES = ("torch", "torchvision", "diffusers", "transformers", "accelerate", "whisper",
+                 "face_recognition", "dlib", "gtts", "sounddevice", "pyaudio")
+
+
+def heavy_modules_loaded() -> list[str]:
+    return [name for name in HEAVY_MODULES if name in sys.modules]
+
+# --- Lazy modules ---
+
+class LazyModule:
+    """Stands in for a module and imports it on first attribute access."""
+
+    def __init__(self, name: str):
+        self.__dict__["_lazy_name"] = name
+
+    def __getattr__(self, attr):
+        # importlib.import_module is thread-safe (and returns the cached module after the first call)
+        return getattr(importlib.import_module(self._lazy_name), attr)
+
+    def __setattr__(self, attr, value):
+        setattr(importlib.import_module(self._lazy_name), attr, value)
+
+    def __repr__(self):
+        state = "loaded" if self._lazy_name in sys.modules else "not loaded"
+        return f"<lazy module {self._lazy_name!r} ({state})>"
+
+
+def lazy_module(name: str):
+    """The module if it's already imported, otherwise a LazyModule for it."""
+    return sys.modules.get(name) or LazyModule(name)
+
+# --- Import profiler ---
+
+class _TimedLoader:
+    """Wraps a loader to time exec_module (the module's own code, including its imports)."""
+
+    def __init__(self, loader, profiler):
+        self.loader = loader
+        self.profiler = profiler
+
+    def __getattr__(self, attr):
+        return getattr(self.loader, attr)
+
+    def create_module(self, spec):
+        return self.loader.create_module(spec)
+
+    def exec_module(self, module):
+        # Put the real loader back before the module runs, for code that inspects __loader__
+        module.__loader__ = self.loader
+        if module.__spec__ is not None:
+            module.__spec__.loader = self.loader
+        self.profiler.begin(module.__name__)
+        try:
+            self.loader.exec_module(module)
+        finally:
+            self.profiler.end(module.__name__)
+
+
+class ImportProfiler(importlib.abc.MetaPathFinder):
+    """Records self and cumulative import time per module (seconds), per thread."""
+
+    def __init__(self):
+        self.modules = {}  # name -> [self, cumulative, depth]
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def find_spec(self, name, path, target=None):
+        if getattr(self._local, "finding", False):
+            return None
+        self._local.finding = True
+        try:
+            for finder in sys.meta_path:
+                if finder is self or not hasattr(finder, "find_spec"):
+                    continue
+                spec = finder.find_spec(name, path, target)
+                if spec is not None:
+                    break
+            else:
+                return None
+        finally:
+            self._local.finding = False
+        if spec.loader is not None and hasattr(spec.loader, "exec_module"):
+            spec.loader = _TimedLoader(spec.loader, self)
+        return spec
+
+    def begin(self, name: str):
+        stack = self._local.__dict__.setdefault("stack", [])
+        stack.append([name, time.perf_counter(), 0.0])
+
+    def end(self, name: str):
+        stack = self._local.stack
+        _, start, children = stack.pop()
+        cumulative = time.perf_counter() - start
+        if stack:
+            stack[-1][2] += cumulative
+        with self._lock:
+            self.modules[name] = [cumulative - children, cumulative, len(stack)]
+
+    def install(self):
+        if self not in sys.meta_path:
+            sys.meta_path.insert(0, self)
+
+    def uninstall(self):
+        if self in sys.meta_path:
+            sys.meta_path.remove(self)
+
+    def report(self, limit: int = 30) -> list[dict]:
+        """The slowest imports by cumulative time (ms); depth 0 are the ones the app asked for."""
+        with self._lock:
+            rows = sorted(self.modules.items(), key=lambda item: item[1][1], reverse=True)[:limit]
+        return [{"module": name, "self_ms": own * 1000, "cumulative_ms": cumulative * 1000, "depth": depth}
+                for name, (own, cumulative, depth) in rows]
+
+
+profiler = None
+if PROFILE:
+    profiler = ImportProfiler()
+    profiler.install()
+
+# --- First render ---
+
+first_render = None  # {"page", "seconds", "modules", "heavy", "imports"} once the first page has rendered
+_first_render_lock = threading.Lock()
+
+def first_render_done(page: str) -> dict | None:
+    """
+    Called at the end of every script run; the first call records
+    time-to-first-render (from the import of this module) and, in profile
+    mode, prints the import report and stops timing imports.
+    """
+    global first_render
+    if first_render is not None:
+        return first_render
+    with _first_render_lock:
+        if first_render is not None:
+            return first_render
+        seconds = time.perf_counter() - SCRIPT_START
+        metrics.observe("startup.first_render", seconds)
+        report = {"page": page, "seconds": seconds, "modules": len(sys.modules), "heavy": heavy_modules_loaded(),
+                  "imports": profiler.report() if profiler else []}
+        if profiler:
+            profiler.uninstall()
+            print(format_report(report))
+        first_render = report
+        return report
+
+
+def format_report(report: dict) -> str:
+    lines = [f"Startup profile: first render of {report['page']} after {report['seconds'] * 1000:.0f} ms, "
+             f"{report['modules']} modules loaded" + (f" (heavy: {', '.join(report['heavy'])})" if report["heavy"] else ""),
+             f"{'self ms':>10} {'cumul. ms':>10}  module"]
+    for row in report["imports"]:
+        lines.append(f"{row['self_ms']:>10.1f} {row['cumulative_ms']:>10.1f}  {'  ' * row['depth']}{row['module']}")
+    return "\n".join(lines)
@@ -0,0 +1,411 @@
+import os
+import queue
+import re
+import shutil
+import subprocess
+import threading
+import time
+import wave
+from io import BytesIO
+
+import numpy as np
+
+from backend import metrics
+from backend.disk_cache import DiskCache, make_key
+from backend.model_registry import registry
+
+# Text-to-speech engines share one interface, synthesize(text, voice) -> audio
+# bytes, so the chat page doesn't care which one is installed. Replies are
+# spoken sentence by sentence: the first sentence plays while the rest are
+# still being synthesized (or even generated by the LLM).
+
+AUDIO_CACHE_DIR = "data/audio_cache"
+AUDIO_CACHE_BUDGET_BYTES = int(os.environ.get("SAHILGPT_AUDIO_CACHE_MB", "256")) * 1024 * 1024
+
+# --- Engines ---
+
+class TTSEngine:
+    """Base class. Subclasses set name/audio_format and implement synthesize()."""
+    name = "base"
+    audio_format = "wav"  # "wav" or "mp3"; used for st.audio's mime type and for joining clips
+    default_voice = ""
+
+    def available(self) -> bool:
+        return True
+
+    def synthesize(self, text: str, voice: str | None = None) -> bytes:
+        raise NotImplementedError
+
+
+class TTSUnavailable(RuntimeError):
+    """No text-to-speech engine is installed."""
+
+
+class StubEngine(TTSEngine):
+    """
+    Offline stand-in for tests and benchmarks: a short tone per sentence
+    (length proportional to the text) after a simulated synthesis delay.
+    Only used when asked for by name (never picked automatically).
+    """
+    name = "stub"
+    default_voice = "tone"
+
+    def __init__(self, seconds_per_char: float = 0.0, sample_rate: int = 16000):
+        self.seconds_per_char = seconds_per_char
+        self.sample_rate = sample_rate
+        self.calls = 0
+
+    def synthesize(self, text: str, voice: str | None = None) -> bytes:
+        self.calls += 1
+        if self.seconds_per_char:
+            time.sleep(len(text) * self.seconds_per_char)
+        duration = min(10.0, 0.06 * len(text))
+        t = np.arange(int(duration * self.sample_rate)) / self.sample_rate
+        samples = (0.2 * np.sin(2 * np.pi * 440 * t) * 32767).astype("<i2")
+        return pcm_to_wav(samples.tobytes(), self.sample_rate)
+
+
+class EspeakEngine(TTSEngine):
+    """eSpeak NG through its command line: fully offline, fast, robotic."""
+    name = "espeak"
+    default_voice = "en-us"
+
+    def __init__(self, rate: int = 175):
+        self.rate = rate
+        self.binary = shutil.which("espeak-ng") or shutil.which("espeak")
+
+    def available(self) -> bool:
+        return self.binary is not None
+
+    def synthesize(self, text: str, voice: str | None = None) -> bytes:
+        result = subprocess.run([self.binary, "--stdout", "-v", voice or self.default_voice, "-s", str(self.rate), text],
+                                capture_output=True, check=True, timeout=60)
+        return result.stdout
+
+
+PIPER_MODEL_NAME = "piper_voice"
+PIPER_MODEL_PATH = os.environ.get("SAHILGPT_PIPER_MODEL", "data/piper/en_US-lessac-medium.onnx")
+
+def _load_piper():
+    from piper.voice import PiperVoice
+
+    print(f"Loading Piper voice '{PIPER_MODEL_PATH}'...")
+    return PiperVoice.load(PIPER_MODEL_PATH)
+
+registry.register(PIPER_MODEL_NAME, _load_piper)
+
+
+class PiperEngine(TTSEngine):
+    """Piper neural TTS (offline, near-natural). Needs piper-tts and a downloaded .onnx voice."""
+    name = "piper"
+    default_voice = os.path.basename(PIPER_MODEL_PATH)
+
+    def available(self) -> bool:
+        if not os.path.exists(PIPER_MODEL_PATH):
+            return False
+        try:
+            import piper  # noqa: F401
+        except ImportError:
+            return False
+        return True
+
+    def synthesize(self, text: str, voice: str | None = None) -> bytes:
+        # The voice is fixed by the loaded model
+        buffer = BytesIO()
+        with registry.use(PIPER_MODEL_NAME) as piper_voice, wave.open(buffer, "wb") as wav_file:
+            if hasattr(piper_voice, "synthesize_wav"):
+                piper_voice.synthesize_wav(text, wav_file)
+            else:
+                piper_voice.synthesize(text, wav_file)
+        return buffer.getvalue()
+
+
+class GTTSEngine(TTSEngine):
+    """Google Translate TTS. Online only; kept as a fallback when no local engine is installed."""
+    name = "gtts"
+    audio_format = "mp3"
+    default_voice = "en"
+
+    def available(self) -> bool:
+        try:
+            import gtts  # noqa: F401
+        except ImportError:
+            return False
+        return True
+
+    def synthesize(self, text: str, voice: str | None = None) -> bytes:
+        from gtts import gTTS
+
+        buffer = BytesIO()
+        gTTS(text=text, lang=voice or self.default_voice, slow=False).write_to_fp(buffer)
+        return buffer.getvalue()
+
+
+ENGINES = {"piper": PiperEngine, "espeak": EspeakEngine, "gtts": GTTSEngine, "stub": StubEngine}
+_engines = {}
+_engines_lock = threading.Lock()
+
+def get_engine(name: str | None = None) -> TTSEngine:
+    """
+    Returns the named engine, or SAHILGPT_TTS_ENGINE, or the first available
+    one in order of preference (piper, espeak, gtts). Raises TTSUnavailable if
+    none of them is installed.
+    """
+    name = name or os.environ.get("SAHILGPT_TTS_ENGINE")
+    with _engines_lock:
+        if name is None:
+            for candidate in ("piper", "espeak", "gtts"):
+                engine = _engines.get(candidate) or ENGINES[candidate]()
+                if engine.available():
+                    name = candidate
+                    break
+            else:
+                raise TTSUnavailable("No text-to-speech engine found (install piper-tts, espeak-ng or gTTS).")
+            if name == "gtts":
+                print("No offline TTS engine found (install piper-tts or espeak-ng); falling back to gTTS.")
+        if name not in _engines:
+            _engines[name] = ENGINES[name]()
+        return _engines[name]
+
+# --- Audio helpers ---
+
+def pcm_to_wav(pcm: bytes, sample_rate: int, channels: int = 1, sample_width: int = 2) -> bytes:
+    buffer = BytesIO()
+    with wave.open(buffer, "wb") as wav_file:
+        wav_file.setnchannels(channels)
+        wav_file.setsampwidth(sample_width)
+        wav_file.setframerate(sample_rate)
+        wav_file.writeframes(pcm)
+    return buffer.getvalue()
+
+def join_audio(clips: list[bytes], audio_format: str = "wav") -> bytes:
+    """Concatenates clips from one engine into a single file."""
+    if audio_format != "wav" or len(clips) == 1:
+        return b"".join(clips)  # MP3 frames can simply be concatenated
+    frames, params = [], None
+    for clip in clips:
+        with wave.open(BytesIO(clip), "rb") as wav_file:
+            params = params or wav_file.getparams()
+            frames.append(wav_file.readframes(wav_file.getnframes()))
+    buffer = BytesIO()
+    with wave.open(buffer, "wb") as wav_file:
+        wav_file.setparams(params)
+        wav_file.writeframes(b"".join(frames))
+    return buffer.getvalue()
+
+# --- Sentences ---
+
+_SENTENCE_END = re.compile(r'(?<=[.!?…])["\')\]]*\s+|\n{2,}|\n(?=\s*(?:[-*•]|\d+\.)\s)')
+_MARKDOWN = re.compile(r"[*_#`>|]+")
+CODE_FENCE = "```"
+MIN_SENTENCE_CHARS = 20  # shorter fragments are merged with the next sentence
+
+def speakable(text: str) -> str:
+    """Drops markdown symbols, which shouldn't be read aloud."""
+    return _MARKDOWN.sub("", text)
+
+def split_sentences(text: str) -> tuple[list[str], str]:
+    """
+    Splits off the complete sentences at the start of text.
+    Returns (sentences, remainder); the remainder may still grow.
+    """
+    sentences, start = [], 0
+    for match in _SENTENCE_END.finditer(text):
+        sentence = text[start:match.end()].strip()
+        if len(sentence) >= MIN_SENTENCE_CHARS:
+            sentences.append(sentence)
+            start = match.end()
+    return sentences, text[start:]
+
+# --- Cache ---
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_cache() -> DiskCache:
+    """LRU cache of synthesized sentences, keyed by hash(engine, voice, text)."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = DiskCache(AUDIO_CACHE_DIR, AUDIO_CACHE_BUDGET_BYTES, suffix=".audio")
+        return _cache
+
+@metrics.timed()
+def synthesize(text: str, engine: TTSEngine | None = None, voice: str | None = None, use_cache: bool = True) -> bytes:
+    """Synthesizes one piece of text, going through the audio cache."""
+    engine = engine or get_engine()
+    voice = voice or engine.default_voice
+    key = make_key("tts-v1", engine.name, voice, text)
+    if use_cache:
+        audio = get_cache().get(key)
+        if audio is not None:
+            return audio
+    audio = engine.synthesize(text, voice)
+    if use_cache:
+        get_cache().put(key, audio)
+    return audio
+
+# --- Streaming ---
+
+class SpeechStream:
+    """
+    Turns streamed text into a stream of audio clips, one per sentence.
+
+    feed() takes text as it arrives (e.g. LLM tokens); fenced code blocks are
+    skipped and every completed sentence is handed to a background thread that synthesizes it and calls
+    on_audio(sentence, audio). close() flushes the last partial sentence and
+    waits for synthesis to finish. time_to_first_audio is measured from the
+    first feed() to the first clip being ready.
+    """
+
+    def __init__(self, engine: TTSEngine | None = None, voice: str | None = None, on_audio=None,
+                 use_cache: bool = True):
+        self.engine = engine or get_engine()
+        self.voice = voice
+        self.on_audio = on_audio
+        self.use_cache = use_cache
+        self.clips = []
+        self.errors = []
+        self.time_to_first_audio = None
+        self._raw = ""     # text not yet checked for code fences
+        self._buffer = ""  # prose waiting for its sentence to end
+        self._in_code = False
+        self._started = None
+        self._queue = queue.Queue()
+        self._cancelled = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="tts", daemon=True)
+        self._thread.start()
+
+    def feed(self, text: str):
+        if self._started is None:
+            self._started = time.perf_counter()
+        self._raw += text
+        while True:
+            fence = self._raw.find(CODE_FENCE)
+            if fence == -1:
+                if self._in_code:
+                    self._raw = self._raw[-(len(CODE_FENCE) - 1):]
+                else:
+                    # Trailing backticks may be the start of a fence
+                    prose = self._raw.rstrip("`")
+                    self._buffer += prose
+                    self._raw = self._raw[len(prose):]
+                break
+            if not self._in_code:
+                self._buffer += self._raw[:fence] + "\n\n"  # a code block ends the sentence before it
+            self._raw = self._raw[fence + len(CODE_FENCE):]
+            self._in_code = not self._in_code
+        sentences, self._buffer = split_sentences(self._buffer)
+        for sentence in sentences:
+            self._enqueue(sentence)
+
+    def close(self, timeout: float | None = None):
+        if not self._in_code:
+            self._buffer += self._raw
+        self._enqueue(self._buffer.strip())
+        self._raw = self._buffer = ""
+        self._queue.put(None)
+        self._thread.join(timeout)
+
+    def cancel(self):
+        """Stops after the sentence being synthesized (which isn't played); queued sentences are dropped."""
+        self._cancelled.set()
+        while True:
+            try:
+                self._queue.get_nowait()
+            except queue.Empty:
+                break
+        self._queue.put(None)
+
+    def audio(self) -> bytes | None:
+        """All clips so far joined into one file."""
+        return join_audio(self.clips, self.engine.audio_format) if self.clips else None
+
+    def _enqueue(self, sentence: str):
+        sentence = speakable(sentence).strip()
+        if any(ch.isalnum() for ch in sentence):
+            self._queue.put(sentence)
+
+    def _run(self):
+        while True:
+            sentence = self._queue.get()
+            if sentence is None or self._cancelled.is_set():
+                return
+            try:
+                audio = synthesize(sentence, self.engine, self.voice, self.use_cache)
+            except Exception as e:
+                print(f"Error in text_to_speech: {e}")
+                self.errors.append(str(e))
+                continue
+            if self.time_to_first_audio is None:
+                self.time_to_first_audio = time.perf_counter() - self._started
+            if self._cancelled.is_set():
+                return
+            self.clips.append(audio)
+            if self.on_audio is not None:
+                self.on_audio(sentence, audio)
+
+def speak_text(text: str, engine: TTSEngine | None = None, voice: str | None = None) -> bytes | None:
+    """Synthesizes a whole reply sentence by sentence (cached) and returns one audio file."""
+    stream = SpeechStream(engine, voice)
+    stream.feed(text)
+    stream.close()
+    return stream.audio()
+
+# --- Local playback ---
+
+class AudioPlayer:
+    """
+    Plays WAV clips in order on this computer's speakers (via PyAudio, which
+    the microphone input already needs), so the first sentence of a reply is
+    heard while later ones are still being synthesized.
+    """
+
+    def __init__(self):
+        import pyaudio
+
+        self._pyaudio = pyaudio.PyAudio()
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="audio-player", daemon=True)
+        self._thread.start()
+
+    def play(self, audio: bytes):
+        self._queue.put(audio)
+
+    def clear(self):
+        """Drops the clips waiting to play (the one playing finishes)."""
+        while True:
+            try:
+                self._queue.get_nowait()
+            except queue.Empty:
+                break
+
+    def _run(self):
+        while True:
+            audio = self._queue.get()
+            try:
+                with wave.open(BytesIO(audio), "rb") as wav_file:
+                    stream = self._pyaudio.open(format=self._pyaudio.get_format_from_width(wav_file.getsampwidth()),
+                                                channels=wav_file.getnchannels(), rate=wav_file.getframerate(),
+                                                output=True)
+                    stream.write(wav_file.readframes(wav_file.getnframes()))
+                    stream.stop_stream()
+                    stream.close()
+            except Exception as e:
+                print(f"Error playing audio: {e}")
+
+_player = None
+_player_failed = False
+_player_lock = threading.Lock()
+
+def get_player() -> AudioPlayer | None:
+    """The shared local player, or None if PyAudio isn't available."""
+    global _player, _player_failed
+    with _player_lock:
+        if _player is None and not _player_failed:
+            try:
+                _player = AudioPlayer()
+            except Exception as e:
+                print(f"Local audio playback unavailable: {e}")
+                _player_failed = True
+        return _player
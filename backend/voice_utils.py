@@ -1,90 +1,355 @@
-from gtts import gTTS
 import os
-import speech_recognition as sr
-import whisper
-import tempfile
+import queue
+import threading
+import time
+import wave
+from concurrent.futures import ThreadPoolExecutor
 from io import BytesIO
 
-# --- Text-to-Speech (Existing) ---
+import numpy as np
 
-AUDIO_DIR = "data/audio_cache"
-os.makedirs(AUDIO_DIR, exist_ok=True)
+from backend import metrics, tts
+from backend.model_registry import registry
 
+# --- Text-to-Speech ---
+# Engines, sentence streaming and the audio cache live in backend/tts.py.
+
+@metrics.timed()
 def text_to_speech(text: str) -> bytes | None:
     """
-    Converts a string of text into MP3 audio bytes using gTTS.
-    Returns the audio as bytes, not a file path, so Streamlit can serve it directly.
+    Converts a string of text into audio bytes (WAV for the offline engines)
+    with the default TTS engine. Returns the audio as bytes, not a file path,
+    so Streamlit can serve it directly.
     """
     try:
-        # Create audio in memory using BytesIO
-        audio_buffer = BytesIO()
-        tts = gTTS(text=text, lang='en', slow=False)
-        tts.write_to_fp(audio_buffer)
-        audio_buffer.seek(0)  # Reset pointer to beginning
-        return audio_buffer.getvalue()  # Return the bytes
+        return tts.speak_text(text)
     except Exception as e:
         print(f"Error in text_to_speech: {e}")
         return None
 
-# --- Speech-to-Text (New) ---
+# --- Speech-to-Text ---
+# Audio never touches the disk: WAV/PCM bytes and numpy arrays are converted
+# to the float32 16 kHz array Whisper takes directly. speech_recognition and
+# whisper are imported when the microphone is used or the model is loaded.
 
-# Load the whisper model. This happens once when the app starts.
+# The Whisper model is loaded on first use (or warm-up) by the model registry
+# and unloaded again when it has been idle for a while.
 # 'base' is a good balance of speed and accuracy for local use.
-try:
-    print("Loading Whisper 'base' model (this may take a moment)...")
-    whisper_model = whisper.load_model("base")
+WHISPER_MODEL_NAME = "whisper"
+WHISPER_MODEL_SIZE = os.environ.get("SAHILGPT_WHISPER_MODEL", "base")
+WHISPER_LANGUAGE = os.environ.get("SAHILGPT_WHISPER_LANGUAGE") or None  # None = detect
+SAMPLE_RATE = 16000  # what Whisper expects
+
+def _load_whisper():
+    import whisper
+
+    print(f"Loading Whisper '{WHISPER_MODEL_SIZE}' model (this may take a moment)...")
+    model = whisper.load_model(WHISPER_MODEL_SIZE)
     print("Whisper model loaded successfully.")
-except Exception as e:
-    print(f"Error loading Whisper model: {e}")
-    whisper_model = None
+    return model
+
+registry.register(WHISPER_MODEL_NAME, _load_whisper)
 
-def transcribe_audio_from_mic() -> str | None:
+def warmup():
+    """Starts loading Whisper in the background."""
+    return registry.warmup(WHISPER_MODEL_NAME)
+
+def _resample(samples: np.ndarray, from_rate: int, to_rate: int) -> np.ndarray:
+    # Linear interpolation is plenty for speech going into Whisper's 80-bin mel spectrogram
+    if from_rate == to_rate or len(samples) == 0:
+        return samples
+    duration = len(samples) / from_rate
+    target = np.arange(int(duration * to_rate)) / to_rate
+    return np.interp(target, np.arange(len(samples)) / from_rate, samples).astype(np.float32)
+
+def load_audio(audio, sample_rate: int | None = None) -> np.ndarray:
     """
-    Listens for audio from the microphone, saves it to a temp file,
-    transcribes it using Whisper, and returns the text.
+    Converts audio to the mono float32 16 kHz array Whisper takes, in memory.
+
+    Args:
+        audio: WAV bytes, raw 16-bit little-endian PCM bytes (pass sample_rate),
+            a numpy array (int16 or float in [-1, 1], mono or (samples, channels)),
+            or a file path (WAV is read directly, other formats go through
+            Whisper's ffmpeg decoder).
+        sample_rate: Rate of raw PCM / arrays. Defaults to 16 kHz.
     """
-    if not whisper_model:
-        print("Whisper model is not loaded. Cannot transcribe.")
-        return None
-        
-    r = sr.Recognizer()
-    with sr.Microphone() as source:
+    channels = 1
+    if isinstance(audio, str):
+        if not audio.lower().endswith(".wav"):
+            import whisper
+            return whisper.load_audio(audio)
+        with open(audio, "rb") as f:
+            audio = f.read()
+    if isinstance(audio, (bytes, bytearray, memoryview)):
+        audio = bytes(audio)
+        if audio[:4] == b"RIFF":
+            with wave.open(BytesIO(audio), "rb") as wav_file:
+                if wav_file.getsampwidth() != 2:
+                    raise ValueError("Only 16-bit WAV audio is supported.")
+                sample_rate, channels = wav_file.getframerate(), wav_file.getnchannels()
+                audio = wav_file.readframes(wav_file.getnframes())
+        audio = np.frombuffer(audio, dtype="<i2")
+        if channels > 1:
+            audio = audio.reshape(-1, channels)
+    samples = np.asarray(audio)
+    if samples.ndim > 1:
+        samples = samples.mean(axis=1)
+    if samples.dtype.kind in "iu":
+        samples = samples.astype(np.float32) / 32768.0
+    return _resample(samples.astype(np.float32, copy=False), sample_rate or SAMPLE_RATE, SAMPLE_RATE)
+
+def _decode_options(options: dict) -> dict:
+    return {"fp16": False, "language": WHISPER_LANGUAGE, **options}  # fp16=False if not on GPU
+
+@metrics.timed()
+def transcribe(audio, sample_rate: int | None = None, model=None, **options) -> str:
+    """
+    Transcribes one clip (any input load_audio() accepts) and returns the text.
+    model defaults to the registry's Whisper; options are passed to transcribe().
+    """
+    samples = load_audio(audio, sample_rate)
+    if model is not None:
+        return model.transcribe(samples, **_decode_options(options))["text"].strip()
+    with registry.use(WHISPER_MODEL_NAME) as whisper_model:
+        return whisper_model.transcribe(samples, **_decode_options(options))["text"].strip()
+
+@metrics.timed()
+def transcribe_batch(sources: list, model=None, decode_workers: int = 2, **options) -> list[str]:
+    """
+    Transcribes many clips or files with one model. Decoding and resampling of
+    the next inputs runs on a thread pool while the current one is transcribed.
+    """
+    if not sources:
+        return []
+    with ThreadPoolExecutor(max_workers=decode_workers) as pool:
+        decoded = pool.map(load_audio, sources)  # runs ahead of the loop below
+        if model is not None:
+            return [transcribe(samples, model=model, **options) for samples in decoded]
+        with registry.use(WHISPER_MODEL_NAME) as whisper_model:
+            return [transcribe(samples, model=whisper_model, **options) for samples in decoded]
+
+# --- Streaming transcription ---
+
+class EnergyVAD:
+    """
+    Energy-based voice activity detection on 30 ms frames.
+
+    The noise floor is tracked on non-speech frames; a frame is speech when
+    its RMS is threshold_ratio times the floor (and above min_rms). A segment
+    ends after min_silence_ms of silence or at max_segment_s, and segments
+    with less than min_speech_ms of speech are dropped. pre_roll_ms of audio
+    before the onset is kept so the first syllable isn't clipped.
+    """
+
+    def __init__(self, frame_ms: int = 30, threshold_ratio: float = 3.0, min_rms: float = 0.01,
+                 min_silence_ms: int = 600, min_speech_ms: int = 250, max_segment_s: float = 15.0,
+                 pre_roll_ms: int = 300):
+        self.frame = SAMPLE_RATE * frame_ms // 1000
+        self.threshold_ratio = threshold_ratio
+        self.min_rms = min_rms
+        self.min_silence_frames = min_silence_ms // frame_ms
+        self.min_speech_frames = max(1, min_speech_ms // frame_ms)
+        self.max_segment_frames = int(max_segment_s * 1000 / frame_ms)
+        self.pre_roll_frames = pre_roll_ms // frame_ms
+        self.noise_floor = None
+        self.in_speech = False
+        self.segments_emitted = 0
+        self._pending = np.zeros(0, dtype=np.float32)
+        self._frames = []  # frames of the current segment (or pre-roll)
+        self._speech_frames = 0
+        self._silent_frames = 0
+
+    def process(self, samples: np.ndarray) -> list[np.ndarray]:
+        """Consumes 16 kHz float32 samples and returns the segments completed by them."""
+        samples = np.concatenate([self._pending, samples])
+        usable = len(samples) - len(samples) % self.frame
+        self._pending = samples[usable:]
+        completed = []
+        for frame in samples[:usable].reshape(-1, self.frame):
+            rms = float(np.sqrt(np.mean(frame * frame)))
+            if self.noise_floor is None:
+                self.noise_floor = rms
+            is_speech = rms > max(self.min_rms, self.noise_floor * self.threshold_ratio)
+            if not is_speech:
+                self.noise_floor = 0.95 * self.noise_floor + 0.05 * rms
+            self._frames.append(frame)
+            if not self.in_speech:
+                if is_speech:
+                    self.in_speech = True
+                    self._speech_frames, self._silent_frames = 1, 0
+                else:
+                    del self._frames[:-self.pre_roll_frames or len(self._frames)]
+                continue
+            if is_speech:
+                self._speech_frames += 1
+                self._silent_frames = 0
+            else:
+                self._silent_frames += 1
+            if self._silent_frames >= self.min_silence_frames or len(self._frames) >= self.max_segment_frames:
+                segment = self._end_segment()
+                if segment is not None:
+                    completed.append(segment)
+        return completed
+
+    def current(self) -> np.ndarray | None:
+        """Audio of the segment in progress, if any."""
+        return np.concatenate(self._frames) if self.in_speech else None
+
+    def flush(self) -> list[np.ndarray]:
+        """Ends the segment in progress (e.g. when the stream ends)."""
+        if not self.in_speech:
+            return []
+        segment = self._end_segment()
+        return [segment] if segment is not None else []
+
+    def _end_segment(self) -> np.ndarray | None:
+        segment = np.concatenate(self._frames)
+        keep = self._speech_frames >= self.min_speech_frames
+        self.in_speech = False
+        self._frames, self._speech_frames, self._silent_frames = [], 0, 0
+        if not keep:
+            return None
+        self.segments_emitted += 1
+        return segment
+
+
+class StreamingTranscriber:
+    """
+    Transcribes audio while it is still being recorded.
+
+    feed() takes audio chunks (anything load_audio() accepts). The VAD cuts
+    the stream into speech segments; each finished segment is transcribed on
+    a background thread and appended to `finals`, and while a segment is in
+    progress it is re-transcribed every partial_interval seconds of new audio
+    to update `partial`. Stale partials are skipped when newer work is queued.
+    on_partial(text)/on_final(text) are called from the background thread.
+    """
+
+    def __init__(self, model=None, vad: EnergyVAD | None = None, partial_interval: float = 1.0,
+                 on_partial=None, on_final=None, **options):
+        self.model = model
+        self.vad = vad or EnergyVAD()
+        self.partial_interval = partial_interval
+        self.on_partial = on_partial
+        self.on_final = on_final
+        # Partials are re-decoded every second; don't let them condition on each other
+        self.options = {"condition_on_previous_text": False, **options}
+        self.finals = []
+        self.partial = ""
+        self.audio_seconds = 0.0
+        self.processing_seconds = 0.0
+        self.final_latencies = []  # seconds from a segment ending to its final text
+        self._last_partial_samples = 0
+        self._lock = threading.Lock()
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="whisper-stream", daemon=True)
+        self._thread.start()
+
+    @property
+    def text(self) -> str:
+        with self._lock:
+            return " ".join(t for t in self.finals + [self.partial] if t)
+
+    @property
+    def real_time_factor(self) -> float | None:
+        """Transcription time per second of audio (below 1 keeps up with real time)."""
+        return self.processing_seconds / self.audio_seconds if self.audio_seconds else None
+
+    def feed(self, audio, sample_rate: int | None = None):
+        samples = load_audio(audio, sample_rate)
+        self.audio_seconds += len(samples) / SAMPLE_RATE
+        for segment in self.vad.process(samples):
+            self._submit_final(segment)
+        current = self.vad.current()
+        if current is None:
+            self._last_partial_samples = 0
+        elif len(current) - self._last_partial_samples >= self.partial_interval * SAMPLE_RATE:
+            self._last_partial_samples = len(current)
+            self._queue.put(("partial", current, time.perf_counter()))
+
+    def finish(self, timeout: float | None = None) -> str:
+        """Transcribes whatever is still buffered, waits for the worker and returns the full text."""
+        for segment in self.vad.flush():
+            self._submit_final(segment)
+        self._queue.put(None)
+        self._thread.join(timeout)
+        return self.text
+
+    def _submit_final(self, segment: np.ndarray):
+        self._last_partial_samples = 0
+        self._queue.put(("final", segment, time.perf_counter()))
+
+    def _transcribe(self, samples: np.ndarray) -> str:
+        start = time.perf_counter()
+        try:
+            return transcribe(samples, model=self.model, **self.options)
+        except Exception as e:
+            print(f"Error during transcription: {e}")
+            return ""
+        finally:
+            self.processing_seconds += time.perf_counter() - start
+
+    def _run(self):
+        while True:
+            job = self._queue.get()
+            if job is None:
+                return
+            kind, samples, submitted = job
+            if kind == "partial":
+                if not self._queue.empty():
+                    continue  # a newer partial or the final is already waiting
+                text = self._transcribe(samples)
+                with self._lock:
+                    self.partial = text
+                if self.on_partial is not None:
+                    self.on_partial(self.text)
+            else:
+                text = self._transcribe(samples)
+                with self._lock:
+                    self.finals.append(text)
+                    self.partial = ""
+                self.final_latencies.append(time.perf_counter() - submitted)
+                if self.on_final is not None:
+                    self.on_final(text)
+
+@metrics.timed()
+def transcribe_audio_from_mic(on_partial=None, timeout: float = 5, phrase_time_limit: float = 15,
+                              model=None) -> str | None:
+    """
+    Listens on the microphone and transcribes while the user speaks; returns
+    the text once they pause (or None if nothing was said). on_partial(text)
+    is called from this thread whenever the running transcript changes, so
+    it may update the UI. model defaults to the registry's Whisper (the app
+    passes the model daemon's, see model_client).
+    """
+    import speech_recognition as sr
+
+    # Load Whisper (if it isn't resident) while we are still listening; the
+    # transcriber's first registry.use() waits for the load to finish
+    if model is None and not registry.is_loaded(WHISPER_MODEL_NAME):
+        warmup()
+
+    with sr.Microphone(sample_rate=SAMPLE_RATE) as source:
         print("Adjusting for ambient noise...")
-        r.adjust_for_ambient_noise(source, duration=0.5)
+        noise = source.stream.read(int(SAMPLE_RATE * 0.5))
+        vad = EnergyVAD(max_segment_s=phrase_time_limit)
+        vad.process(load_audio(noise))  # seeds the noise floor
+        transcriber = StreamingTranscriber(model=model, vad=vad)
         print("Listening...")
-        
-        try:
-            # Listen for audio. Adjust timeouts as needed.
-            audio = r.listen(source, timeout=5, phrase_time_limit=15)
-        except sr.WaitTimeoutError:
-            print("Listening timed out waiting for phrase to start.")
-            return None
+        start, shown = time.monotonic(), ""
+        while True:
+            transcriber.feed(source.stream.read(source.CHUNK))
+            if on_partial is not None and transcriber.text != shown:
+                shown = transcriber.text
+                on_partial(shown)
+            if vad.segments_emitted and not vad.in_speech:
+                break  # the user paused after speaking
+            if not vad.segments_emitted and not vad.in_speech and time.monotonic() - start > timeout:
+                print("Listening timed out waiting for phrase to start.")
+                break
 
-    print("Audio captured. Transcribing...")
-    
-    try:
-        # Save audio to a temporary WAV file
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".wav") as tmp_file:
-            tmp_file.write(audio.get_wav_data())
-            tmp_filepath = tmp_file.name
-
-        # Transcribe using Whisper
-        result = whisper_model.transcribe(tmp_filepath, fp16=False) # fp16=False if not on GPU
-        transcribed_text = result["text"]
-        
-        print(f"Transcribed: {transcribed_text}")
-        
-        # Clean up the temp file
-        os.remove(tmp_filepath)
-        
-        if not transcribed_text.strip():
-            return None # Return None if transcription is empty
-            
-        return transcribed_text
-        
-    except sr.UnknownValueError:
-        print("Whisper could not understand audio")
-        return None
-    except Exception as e:
-        print(f"Error during transcription: {e}")
-        return None
\ No newline at end of file
+    transcribed_text = transcriber.finish()
+    print(f"Transcribed: {transcribed_text}")
+    if transcriber.real_time_factor is not None:
+        print(f"Real-time factor: {transcriber.real_time_factor:.2f}")
+    return transcribed_text or None  # None if transcription is empty
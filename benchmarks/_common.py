@@ -0,0 +1,58 @@
+"""Shared helpers for the benchmark scripts."""
+import json
+import os
+import resource
+import statistics
+import sys
+
+# Make `backend` importable when a benchmark is run as a script
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if ROOT_DIR not in sys.path:
+    sys.path.insert(0, ROOT_DIR)
+
+
+def percentile(values, pct: float) -> float:
+    """Nearest-rank percentile of a list of numbers (pct in 0-100)."""
+    if not values:
+        return float("nan")
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, round(pct / 100 * len(ordered) + 0.5) - 1))
+    return ordered[index]
+
+
+def latency_summary(latencies, wall_time: float | None = None) -> dict:
+    """p50/p95/p99/mean latency in milliseconds, plus throughput if wall_time is given."""
+    summary = {
+        "count": len(latencies),
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p95_ms": percentile(latencies, 95) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "mean_ms": statistics.fmean(latencies) * 1000 if latencies else float("nan"),
+    }
+    if wall_time:
+        summary["per_sec"] = len(latencies) / wall_time
+    return summary
+
+
+def peak_rss_mb() -> float:
+    """Peak resident set size of this process so far, in MB."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS reports bytes
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def print_table(title: str, rows: dict):
+    """Prints {name: {metric: value}} as an aligned table."""
+    print(f"\n== {title} ==")
+    for name, metrics in rows.items():
+        parts = []
+        for key, value in metrics.items():
+            parts.append(f"{key}={value:.2f}" if isinstance(value, float) else f"{key}={value}")
+        print(f"  {name:<28} " + "  ".join(parts))
+
+
+def save_json(path: str | None, results: dict):
+    if path:
+        with open(path, "w") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+        print(f"\nResults written to {path}")
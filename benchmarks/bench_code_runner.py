@@ -0,0 +1,85 @@
+"""
+Compares run_code_safely's cold path (new interpreter per run) with the
+pre-warmed WorkerPool over a small snippet corpus (trivial, import-heavy,
+CPU-bound, large output), plus a result-cache hit and parallel submission
+throughput.
+
+    python benchmarks/bench_code_runner.py --runs 30
+"""
+import argparse
+import tempfile
+import time
+
+import _common  # noqa: F401  (sets up sys.path)
+from _common import latency_summary, print_table, save_json
+
+from backend import code_runner
+
+TRIVIAL = 'print("Hello, Sahil!")'
+IMPORT_HEAVY = (
+    "import json, decimal, asyncio, email.mime.multipart, http.client, xml.dom.minidom, sqlite3, statistics\n"
+    "print(statistics.mean([1, 2, 3]))"
+)
+IMPORT_HEAVY_MODULES = ["json", "decimal", "asyncio", "email.mime.multipart", "http.client",
+                        "xml.dom.minidom", "sqlite3", "statistics"]
+CPU_BOUND = "print(sum(i * i for i in range(200_000)))"
+LARGE_OUTPUT = "for i in range(5000):\n    print('line', i)"
+# Lists the descriptors a snippet can use besides 0-2; the worker's protocol pipes must not be among them
+OPEN_FDS = (
+    "import os\n"
+    "fds = []\n"
+    "for fd in range(3, 256):\n"
+    "    try:\n"
+    "        os.fstat(fd)\n"
+    "        fds.append(fd)\n"
+    "    except OSError:\n"
+    "        pass\n"
+    "print(fds)"
+)
+SNIPPETS = {"trivial": TRIVIAL, "import_heavy": IMPORT_HEAVY, "cpu_bound": CPU_BOUND, "large_output": LARGE_OUTPUT}
+
+
+def _time_runs(fn, code, runs):
+    latencies = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        result = fn(code)
+        latencies.append(time.perf_counter() - start)
+        assert result["returncode"] == 0, result["stderr"]
+    return latency_summary(latencies)
+
+
+def run(runs: int = 30, parallel: int = 4) -> dict:
+    results = {}
+    for name, code in SNIPPETS.items():
+        results[f"cold_{name}"] = _time_runs(code_runner.run_code_safely, code, runs)
+
+    pool = code_runner.WorkerPool(size=parallel, preload=IMPORT_HEAVY_MODULES)
+    pool.run("pass")  # wait for a warm worker
+    inherited = pool.run(OPEN_FDS)["stdout"].strip()
+    assert inherited == "[]", f"pooled snippet can use inherited descriptors {inherited}"
+    for name, code in SNIPPETS.items():
+        results[f"pool_{name}"] = _time_runs(pool.run, code, runs)
+
+    code_runner.CACHE_DIR = tempfile.mkdtemp(prefix="sahilgpt-code-cache-")
+    cached = lambda code: code_runner.run_code_safely(code, use_pool=True, use_cache=True)
+    cached(IMPORT_HEAVY)  # populate
+    results["cached_import_heavy"] = _time_runs(cached, IMPORT_HEAVY, runs)
+
+    jobs = [TRIVIAL] * (runs * parallel)
+    start = time.perf_counter()
+    pool.run_many(jobs)
+    results["pool_parallel_trivial"] = {"jobs": len(jobs), "per_sec": len(jobs) / (time.perf_counter() - start)}
+    pool.close()
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=30)
+    parser.add_argument("--parallel", type=int, default=4)
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+    results = run(args.runs, args.parallel)
+    print_table("Code runner (latency in ms, per_sec = snippets/sec)", results)
+    save_json(args.json, results)
@@ -0,0 +1,122 @@
+"""
+Replays a synthetic multi-turn chat against the stand-in Ollama server (which
+charges prompt evaluation only for tokens after the longest cached prefix, and
+a model load when keep_alive has run out) and reports prompt-eval tokens and
+time per turn for:
+
+  stateless         the old chat page: only the latest prompt, no memory
+  full_history      every turn re-sent, no window (grows without bound)
+  slide_every_turn  the newest turns that fit the budget, re-cut every turn
+  conversation      conversation.Conversation (budgeted window, compaction,
+                    background summaries)
+  conversation_keep_alive_0
+                    the same, but letting the model unload after each turn
+
+    python benchmarks/bench_conversation.py --turns 40 --budget 3000
+"""
+import argparse
+import random
+
+import _common  # noqa: F401  (sets up sys.path)
+from _common import latency_summary, percentile, print_table, save_json
+
+from backend import conversation, llm_client, llm_utils
+from backend.llm_utils import estimate_tokens
+from fake_ollama import FakeOllamaServer
+
+WORDS = ("python streamlit project weather music recipe travel budget docker rust garden camera "
+         "invoice meeting thesis physics guitar marathon kubernetes the a of to and in is it for").split()
+SYSTEM = conversation.DEFAULT_SYSTEM
+
+
+def user_messages(turns: int, seed: int = 0) -> list[str]:
+    rng = random.Random(seed)
+    return [" ".join(rng.choice(WORDS) for _ in range(rng.randint(30, 120))) for _ in range(turns)]
+
+
+def _chat(messages, history):
+    stats = {"window_tokens": sum(estimate_tokens(m["content"]) for m in messages)}
+    reply = "".join(llm_utils.stream_chat(messages, stats)).strip()
+    history += [messages[-1], {"role": "assistant", "content": reply}]
+    return stats
+
+
+def _window(history, budget):
+    """The newest messages (whole turns) that fit the budget."""
+    kept, used = [], estimate_tokens(SYSTEM)
+    for i in range(len(history) - 2, -1, -2):
+        cost = sum(estimate_tokens(m["content"]) for m in history[i:i + 2])
+        if used + cost > budget:
+            break
+        kept = history[i:i + 2] + kept
+        used += cost
+    return kept
+
+
+def run_strategy(name: str, prompts: list[str], budget: int) -> list[dict]:
+    history, turns = [], []
+    chat = conversation.Conversation(token_budget=budget, keep_alive=0 if name.endswith("keep_alive_0") else None)
+    for prompt in prompts:
+        user = {"role": "user", "content": prompt}
+        if name == "stateless":
+            stats = {"window_tokens": estimate_tokens(prompt)}
+            "".join(llm_utils.stream_llm_response(prompt, stats))
+        elif name == "full_history":
+            stats = _chat([{"role": "system", "content": SYSTEM}] + history + [user], history)
+        elif name == "slide_every_turn":
+            stats = _chat([{"role": "system", "content": SYSTEM}] + _window(history, budget) + [user], history)
+        else:
+            stats = {}
+            chat.send(prompt, stats)
+            # Let the summary land between turns, as it would while the user reads and types
+            chat.wait_for_summary()
+        turns.append(stats)
+    return turns
+
+
+def summarize(turns: list[dict], loads: int, requests: int) -> dict:
+    counts = [t["prompt_eval_count"] or 0 for t in turns]
+    return dict(
+        latency_summary([t["prompt_eval_time"] for t in turns]),
+        eval_tokens_mean=sum(counts) / len(counts),
+        eval_tokens_p95=percentile(counts, 95),
+        eval_tokens_last=counts[-1],
+        ttft_p50_ms=percentile([t["ttft"] for t in turns], 50) * 1000,
+        context_tokens_last=turns[-1]["window_tokens"],
+        model_loads=loads,
+        requests=requests,
+    )
+
+
+STRATEGIES = ["stateless", "full_history", "slide_every_turn", "conversation", "conversation_keep_alive_0"]
+
+
+def run(turns: int = 40, budget: int = 3000, prompt_token_delay: float = 0.0002, load_delay: float = 0.3,
+        per_turn: bool = False) -> dict:
+    prompts = user_messages(turns)
+    reply = " ".join(random.Random(1).choice(WORDS) for _ in range(60))
+    results = {}
+    for name in STRATEGIES:
+        with FakeOllamaServer(first_token_delay=0.002, token_delay=0.0005, reply=reply,
+                              prompt_token_delay=prompt_token_delay, load_delay=load_delay) as server:
+            llm_client.configure(base_url=server.base_url)
+            stats = run_strategy(name, prompts, budget)
+            results[name] = summarize(stats, server.loads, len(server.requests))
+        if per_turn:
+            print(f"{name:<28} eval tokens per turn: " + " ".join(str(t["prompt_eval_count"]) for t in stats))
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--turns", type=int, default=40)
+    parser.add_argument("--budget", type=int, default=3000, help="conversation token budget")
+    parser.add_argument("--prompt-token-delay", type=float, default=0.0002,
+                        help="stand-in prompt evaluation cost per uncached token (s)")
+    parser.add_argument("--load-delay", type=float, default=0.3, help="stand-in model load time (s)")
+    parser.add_argument("--per-turn", action="store_true", help="print prompt-eval tokens of every turn")
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+    results = run(args.turns, args.budget, args.prompt_token_delay, args.load_delay, args.per_turn)
+    print_table("Conversation prompt evaluation (ms = prompt-eval time per turn)", results)
+    save_json(args.json, results)
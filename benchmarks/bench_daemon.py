@@ -0,0 +1,234 @@
+"""
+Load test of the model daemon. Simulated Streamlit sessions send a mix of
+face verify, transcribe, TTS and run-code requests back to back for a fixed
+time, either
+
+  in_process  straight to the models on each session's own thread (the app
+              before the daemon: no admission control, the models live in
+              the UI process and are reloaded when it restarts)
+  daemon      through model_client to a daemon process with per-model queues
+
+and reports requests/sec, latency per request kind, how many inferences ran
+at once, rejected (503) requests and the first request after a frontend
+restart (the in-process models have to load again; the daemon's are warm).
+
+The models are stand-ins: a fixed amount of numpy work behind the model
+registry, with a simulated load time. Code runs in the real worker pool.
+
+    python benchmarks/bench_daemon.py --sessions 8 --seconds 10
+"""
+import argparse
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import _common  # noqa: F401  (sets up sys.path)
+import numpy as np
+from _common import latency_summary, percentile, print_table, save_json
+
+import fake_face
+from backend import model_client, tts
+from backend.model_registry import registry
+
+# Request mix of a session: kind -> weight
+MIX = {"verify_face": 2, "transcribe": 2, "tts": 5, "code": 1}
+WORK_MS = {"verify_face": 40, "transcribe": 120, "tts": 15}  # stand-in inference cost, single-threaded
+CODE = "print(sum(range(10 ** 5)))"
+SENTENCES = ["The weather looks fine for a walk this afternoon.", "Your build finished without errors.",
+             "I found three projects that match that name.", "Here is a short summary of the meeting notes."]
+
+
+def iterations_per_ms() -> float:
+    """Calibrates the stand-in inference (a small matmul chain) on this machine."""
+    a = np.random.default_rng(0).random((128, 128), dtype=np.float32)
+    start = time.perf_counter()
+    for _ in range(200):
+        a = np.tanh(a @ a)
+    return 200 / ((time.perf_counter() - start) * 1000)
+
+
+class StandInBackend(model_client.LocalBackend):
+    """LocalBackend whose face, Whisper and TTS models are numpy stand-ins of a fixed cost."""
+
+    def __init__(self, per_ms: float, load_delay: float):
+        self.per_ms = per_ms
+        self.active = 0
+        self.max_active = 0
+        self._lock = threading.Lock()
+        for name in ("bench_face", "bench_whisper", "bench_tts"):
+            registry.register(name, lambda: (time.sleep(load_delay),
+                                             np.random.default_rng(0).random((128, 128), dtype=np.float32))[1])
+
+    def _infer(self, model: str, kind: str):
+        with registry.use(model) as weights:
+            with self._lock:
+                self.active += 1
+                self.max_active = max(self.max_active, self.active)
+            try:
+                a = weights
+                for _ in range(int(WORK_MS[kind] * self.per_ms)):
+                    a = np.tanh(a @ weights)
+            finally:
+                with self._lock:
+                    self.active -= 1
+
+    def warmup(self, *names: str) -> list[str]:
+        for name in ("bench_face", "bench_whisper", "bench_tts"):
+            registry.get(name)
+        return list(names)
+
+    def status(self) -> dict:
+        return dict(super().status(), max_concurrent_inferences=self.max_active)
+
+    def verify_face(self, image) -> bool:
+        model_client._read_bytes(image)
+        self._infer("bench_face", "verify_face")
+        return True
+
+    def transcribe(self, audio, sample_rate: int | None = None, **options) -> str:
+        self._infer("bench_whisper", "transcribe")
+        return "stand-in transcript"
+
+    def tts_engine(self, name: str | None = None):
+        return tts.StubEngine()
+
+    def synthesize(self, text: str, engine: str | None = None, voice: str | None = None,
+                   use_cache: bool = True) -> bytes:
+        self._infer("bench_tts", "tts")
+        return tts.StubEngine().synthesize(text)
+
+
+def payloads() -> dict:
+    audio = (0.1 * np.sin(np.arange(3 * 16000) / 10)).astype(np.float32)  # 3 s of 16 kHz audio
+    return {"photo": fake_face.make_photo(1, size=(640, 480)), "audio": audio}
+
+
+def session(backend, kind_order: list[str], data: dict, deadline: float, results: dict, lock):
+    for kind in kind_order:
+        if time.perf_counter() > deadline:
+            break
+        start = time.perf_counter()
+        error = False
+        try:
+            if kind == "verify_face":
+                backend.verify_face(data["photo"])
+            elif kind == "transcribe":
+                backend.transcribe(data["audio"])
+            elif kind == "tts":
+                backend.synthesize(random.choice(SENTENCES), use_cache=False)
+            else:
+                error = backend.run_code(CODE)["returncode"] != 0
+        except model_client.DaemonError:
+            error = True
+        with lock:
+            if error:
+                results["errors"] += 1
+            else:
+                results[kind].append(time.perf_counter() - start)
+
+
+def load_test(backend, sessions: int, seconds: float) -> dict:
+    data = payloads()
+    results, lock = {"errors": 0, **{kind: [] for kind in MIX}}, threading.Lock()
+    kinds = list(MIX)
+    weights = [MIX[kind] for kind in kinds]
+    deadline = time.perf_counter() + seconds
+    threads = [threading.Thread(target=session, args=(
+        backend, random.Random(i).choices(kinds, weights, k=100000), data, deadline, results, lock))
+        for i in range(sessions)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - start
+    everything = [latency for kind in MIX for latency in results[kind]]
+    summary = dict(latency_summary(everything, wall), errors=results["errors"])
+    for kind in MIX:
+        summary[f"{kind}_p50_ms"] = percentile(results[kind], 50) * 1000
+        summary[f"{kind}_p95_ms"] = percentile(results[kind], 95) * 1000
+    return summary
+
+
+def first_request_ms(backend, photo: bytes) -> float:
+    start = time.perf_counter()
+    backend.verify_face(photo)
+    return (time.perf_counter() - start) * 1000
+
+
+def start_daemon(socket_path: str, per_ms: float, load_delay: float, limits: list[str]) -> subprocess.Popen:
+    command = [sys.executable, os.path.abspath(__file__), "--serve", socket_path, "--per-ms", str(per_ms),
+               "--load-delay", str(load_delay), *(arg for limit in limits for arg in ("--limit", limit))]
+    process = subprocess.Popen(command)
+    client = model_client.DaemonClient(socket_path)
+    for _ in range(200):
+        if client.ping():
+            return process
+        time.sleep(0.05)
+    process.kill()
+    raise RuntimeError("The daemon didn't start")
+
+
+def serve(socket_path: str, per_ms: float, load_delay: float, limits: list[str]):
+    from backend import model_server
+
+    backend = StandInBackend(per_ms, load_delay)
+    backend.warmup()
+    server = model_server.ModelServer(backend, limits=model_server.parse_limits(limits))
+    model_server.serve(server, socket_path)
+
+
+def run(sessions: int = 8, seconds: float = 10.0, load_delay: float = 2.0, limits: list[str] = ()) -> dict:
+    per_ms = iterations_per_ms()
+    photo = payloads()["photo"]
+    results = {}
+
+    local = StandInBackend(per_ms, load_delay)
+    restart = first_request_ms(local, photo)  # a fresh UI process: the model isn't loaded yet
+    local.warmup()
+    results["in_process"] = dict(load_test(local, sessions, seconds), first_request_after_restart_ms=restart,
+                                 max_concurrent_inferences=local.max_active)
+
+    socket_path = os.path.join(tempfile.mkdtemp(prefix="sahilgpt-daemon-"), "daemon.sock")
+    daemon = start_daemon(socket_path, per_ms, load_delay, list(limits))
+    try:
+        client = model_client.DaemonClient(socket_path)
+        summary = load_test(client, sessions, seconds)
+        # A restarted frontend is a new client talking to the same, still warm, daemon
+        restart = first_request_ms(model_client.DaemonClient(socket_path), photo)
+        status = client.status()
+        pings = []
+        for _ in range(200):
+            start = time.perf_counter()
+            client._json("GET", "/v1/health")
+            pings.append(time.perf_counter() - start)
+        results["daemon"] = dict(summary, first_request_after_restart_ms=restart,
+                                 max_concurrent_inferences=status["max_concurrent_inferences"],
+                                 rejected=sum(q["rejected"] for q in status["queues"].values()))
+        results["daemon_round_trip"] = latency_summary(pings)
+    finally:
+        daemon.terminate()
+        daemon.wait()
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=8, help="concurrent sessions")
+    parser.add_argument("--seconds", type=float, default=10.0, help="length of each load test")
+    parser.add_argument("--load-delay", type=float, default=2.0, help="stand-in model load time (s)")
+    parser.add_argument("--limit", action="append", default=[], metavar="QUEUE=N", help="daemon queue limits")
+    parser.add_argument("--serve", metavar="SOCKET", help=argparse.SUPPRESS)
+    parser.add_argument("--per-ms", type=float, help=argparse.SUPPRESS)
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+    if args.serve:
+        serve(args.serve, args.per_ms, args.load_delay, args.limit)
+        sys.exit(0)
+    results = run(args.sessions, args.seconds, args.load_delay, args.limit)
+    print_table(f"Model daemon load test ({args.sessions} sessions, {args.seconds:.0f} s)", results)
+    save_json(args.json, results)
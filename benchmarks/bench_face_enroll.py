@@ -0,0 +1,101 @@
+"""
+Enrolls a set of synthetic high-resolution JPEG photos (some blurry, some
+with two faces) through the old path (full-resolution decode, every photo
+serially, no quality filter) and through the new one (reduced-size decode,
+quality filter, one process or a pool), reporting images/sec. Also compares
+the gallery file size of the old float64 layout with the float32 one and the
+time to identify an enrolled face vs reject a stranger.
+
+Uses the stand-in detector/encoder from fake_face.py.
+
+    python benchmarks/bench_face_enroll.py --photos 16 --workers 4
+"""
+import argparse
+import functools
+import io
+import time
+
+import _common  # noqa: F401  (sets up sys.path)
+import numpy as np
+from PIL import Image
+
+import fake_face
+from _common import latency_summary, print_table, save_json
+from backend import face_utils
+
+DETECT = functools.partial(fake_face.detect, model="hog")
+
+
+def make_photos(count: int, size) -> list[bytes]:
+    """count photos of person 1: every 4th blurry, every 8th (offset) with a second face."""
+    photos = []
+    for i in range(count):
+        blur = 2 if i % 4 == 3 else 0
+        faces = 2 if i % 8 == 5 else 1
+        photos.append(fake_face.make_photo(1, size=size, faces=faces, blur=blur, seed=i))
+    return photos
+
+
+def legacy_enroll(photos) -> list:
+    """The old enroll_face loop: full-resolution decode, mirror, detect and encode each photo."""
+    encodings = []
+    for photo in photos:
+        image = np.array(Image.open(io.BytesIO(photo)).transpose(Image.FLIP_LEFT_RIGHT))
+        boxes = DETECT(image)
+        found = fake_face.encode(image, boxes[:1]) if boxes else []
+        if found:
+            encodings.append(found[0])
+    return encodings
+
+
+def _timed(fn, count: int) -> tuple[dict, object]:
+    start = time.perf_counter()
+    value = fn()
+    elapsed = time.perf_counter() - start
+    return {"images_per_sec": count / elapsed, "s": elapsed}, value
+
+
+def run(photos: int = 16, workers: int = 4, size=(3000, 2000)) -> dict:
+    data = make_photos(photos, size)
+    results = {}
+    results["legacy_full_res_serial"], _ = _timed(lambda: legacy_enroll(data), photos)
+    for label, n in (("downscaled_serial", 1), (f"downscaled_pool_{workers}", workers)):
+        results[label], extracted = _timed(lambda: face_utils.extract_enrollment_encodings(
+            data, workers=n, detect_fn=DETECT, encode_fn=fake_face.encode), photos)
+
+    reasons = [reason or "used" for _, reason in extracted]
+    results["quality_filter"] = {reason: reasons.count(reason) for reason in sorted(set(reasons))}
+
+    encodings = np.stack([encoding for encoding, _ in extracted if encoding is not None])
+    identities = {"user": encodings, "someone_else": fake_face.enrolled_encoding(3)[None, :]}
+    legacy_bytes = sum(2 + len(name) + 4 + enc.size * 8 for name, enc in identities.items()) + 7
+    results["gallery_bytes"] = {"float64_v1": legacy_bytes, "float32_v2": len(face_utils.pack_gallery(identities))}
+
+    gallery = face_utils.FaceGallery(encoding_path="/nonexistent", key_path="/nonexistent")
+    gallery.refresh = lambda: None
+    identities, centroids = face_utils.unpack_gallery(face_utils.pack_gallery(identities), with_centroids=True)
+    gallery._set(identities, centroids)
+    # A new photo of the enrolled person vs a photo of someone else
+    login, stranger = (face_utils.extract_enrollment_encoding(
+        fake_face.make_photo(person, size=size, seed=1000), detect_fn=DETECT, encode_fn=fake_face.encode)[0]
+        for person in (1, 7))
+    for label, encoding in (("identify_enrolled", login), ("identify_stranger", stranger)):
+        latencies = []
+        for _ in range(2000):
+            start = time.perf_counter()
+            match = gallery.identify(encoding)
+            latencies.append(time.perf_counter() - start)
+        results[label] = dict(latency_summary(latencies), matched=match is not None)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--photos", type=int, default=16)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--size", type=int, nargs=2, default=(3000, 2000), metavar=("WIDTH", "HEIGHT"))
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+    results = run(args.photos, args.workers, tuple(args.size))
+    print_table("Face enrollment", results)
+    save_json(args.json, results)
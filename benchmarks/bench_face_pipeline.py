@@ -0,0 +1,110 @@
+"""
+Replays a synthetic webcam sequence through the old per-frame verification
+path and through face_pipeline.LiveFaceVerifier with different settings,
+reporting frames/sec and time-to-decision.
+
+Uses the stand-in detector/encoder from fake_face.py by default. Pass
+--real to use face_recognition with frames from --frames (a .npy file of
+BGR frames, e.g. recorded with np.save).
+
+    python benchmarks/bench_face_pipeline.py
+"""
+import argparse
+import time
+
+import _common  # noqa: F401  (sets up sys.path)
+import numpy as np
+from PIL import Image
+
+import fake_face
+from _common import print_table, save_json
+from backend import face_utils
+from backend.face_pipeline import LiveFaceVerifier
+
+
+def legacy_verify(frame, gallery, detect, encode, model="cnn"):
+    """The pre-pipeline verify_face_from_frame: PIL round trip, full-res detection, every frame."""
+    frame_rgb = frame[:, :, ::-1]
+    login_image = np.array(Image.fromarray(frame_rgb).transpose(Image.FLIP_LEFT_RIGHT))
+    boxes = detect(login_image, model)
+    if not boxes:
+        return False
+    match = gallery.match(encode(login_image, boxes)[0])
+    return match is not None and match[1] <= face_utils.MATCH_TOLERANCE
+
+
+def bench_legacy(frames, gallery, detect, encode):
+    start = time.perf_counter()
+    decided_at = None
+    for frame in frames:
+        if legacy_verify(frame, gallery, detect, encode) and decided_at is None:
+            decided_at = time.perf_counter() - start
+    elapsed = time.perf_counter() - start
+    return {"fps": len(frames) / elapsed, "time_to_decision_ms": (decided_at or float("nan")) * 1000,
+            "decision": "accept" if decided_at is not None else "none"}
+
+
+def bench_pipeline(frames, gallery, detect, encode, **settings):
+    verifier = LiveFaceVerifier(detect_fn=detect, encode_fn=encode, gallery=gallery,
+                                reject_after=10 ** 9, **settings)
+    start = time.perf_counter()
+    decision_ms = None
+    for frame in frames:
+        result = verifier.process(frame)
+        if result["decision"]:
+            if decision_ms is None:
+                decision_ms = (time.perf_counter() - start) * 1000
+            # Keep going (with a fresh vote) to measure steady-state throughput
+            verifier.reset()
+    elapsed = time.perf_counter() - start
+    return {"fps": len(frames) / elapsed, "time_to_decision_ms": decision_ms or float("nan"),
+            "decision": "accept" if decision_ms is not None else "none"}
+
+
+CONFIGS = {
+    "pipeline_cnn_full_res": dict(detector="cnn", downscale=1.0, keyframe_interval=1),
+    "pipeline_hog_full_res": dict(detector="hog", downscale=1.0, keyframe_interval=1),
+    "pipeline_hog_half": dict(detector="hog", downscale=0.5, keyframe_interval=1),
+    "pipeline_hog_half_track5": dict(detector="hog", downscale=0.5, keyframe_interval=5),
+    "pipeline_hog_quarter_track5_skip2": dict(detector="hog", downscale=0.25, keyframe_interval=5, frame_skip=2),
+}
+
+
+def run(frame_count: int = 120, real: bool = False, frames_path: str | None = None) -> dict:
+    gallery = face_utils.FaceGallery(encoding_path="/nonexistent", key_path="/nonexistent")
+    if real:
+        detect, encode = None, None
+        frames = list(np.load(frames_path)) if frames_path else fake_face.make_frames(frame_count)
+        gallery.refresh = lambda: None
+        gallery._set(face_utils.gallery.as_dict())
+    else:
+        detect, encode = fake_face.detect, fake_face.encode
+        frames = fake_face.make_frames(frame_count)
+        gallery.refresh = lambda: None
+        gallery._set({"user": fake_face.enrolled_encoding(1)[None, :],
+                      "someone_else": fake_face.enrolled_encoding(2)[None, :]})
+
+    results = {"legacy_per_frame_cnn": bench_legacy(frames, gallery, detect or _real_detect, encode or _real_encode)}
+    for name, settings in CONFIGS.items():
+        results[name] = bench_pipeline(frames, gallery, detect, encode, **settings)
+    return results
+
+
+def _real_detect(image, model):
+    return face_utils.registry.get(face_utils.FACE_MODELS_NAME).face_locations(image, model=model)
+
+
+def _real_encode(image, boxes):
+    return face_utils.registry.get(face_utils.FACE_MODELS_NAME).face_encodings(image, boxes)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--frames", help=".npy file with recorded BGR frames (for --real)")
+    parser.add_argument("--count", type=int, default=120, help="number of synthetic frames")
+    parser.add_argument("--real", action="store_true", help="use face_recognition and the enrolled gallery")
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+    results = run(args.count, args.real, args.frames)
+    print_table("Live face verification", results)
+    save_json(args.json, results)
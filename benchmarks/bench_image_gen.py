@@ -0,0 +1,138 @@
+"""
+Seconds per denoising step, seconds per image and peak RSS for each of
+image_gen's performance profiles.
+
+Each profile runs in its own subprocess so peak RSS is per profile. By
+default the pipeline is a tiny randomly initialized Stable Diffusion built
+from configs (no download, no network), with every resolution divided by 8 so
+the relative cost of the profiles shows in seconds rather than minutes;
+--real runs the actual model at full resolution.
+
+    python benchmarks/bench_image_gen.py --images 3
+    python benchmarks/bench_image_gen.py --real --profiles fast draft --images 1
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import _common  # noqa: F401  (sets up sys.path)
+from _common import peak_rss_mb, print_table, save_json
+
+from backend import image_gen
+
+TINY_SCALE = 8  # tiny pipeline resolutions are the profile's divided by this
+
+
+def _write_tiny_tokenizer(directory: str):
+    # A byte-level vocabulary with no merges: every character is its own token
+    from transformers.models.clip.tokenization_clip import bytes_to_unicode
+
+    symbols = list(bytes_to_unicode().values())
+    vocab = {"<|startoftext|>": 0, "<|endoftext|>": 1}
+    for symbol in symbols + [s + "</w>" for s in symbols]:
+        vocab.setdefault(symbol, len(vocab))
+    with open(os.path.join(directory, "vocab.json"), "w") as f:
+        json.dump(vocab, f)
+    with open(os.path.join(directory, "merges.txt"), "w") as f:
+        f.write("#version: 0.2\n")
+    return len(vocab)
+
+
+def tiny_pipeline():
+    """A randomly initialized, few-MB StableDiffusionPipeline (same layout as diffusers' own tests)."""
+    import torch
+    from diffusers import AutoencoderKL, PNDMScheduler, StableDiffusionPipeline, UNet2DConditionModel
+    from transformers import CLIPTextConfig, CLIPTextModel, CLIPTokenizer
+
+    torch.manual_seed(0)
+    unet = UNet2DConditionModel(
+        block_out_channels=(32, 64), layers_per_block=2, sample_size=32, in_channels=4, out_channels=4,
+        down_block_types=("DownBlock2D", "CrossAttnDownBlock2D"),
+        up_block_types=("CrossAttnUpBlock2D", "UpBlock2D"), cross_attention_dim=32,
+    )
+    vae = AutoencoderKL(
+        block_out_channels=[32, 64], in_channels=3, out_channels=3, latent_channels=4,
+        down_block_types=["DownEncoderBlock2D", "DownEncoderBlock2D"],
+        up_block_types=["UpDecoderBlock2D", "UpDecoderBlock2D"],
+    )
+    tokenizer_dir = tempfile.mkdtemp(prefix="sahilgpt-tiny-tokenizer-")
+    vocab_size = _write_tiny_tokenizer(tokenizer_dir)
+    tokenizer = CLIPTokenizer(os.path.join(tokenizer_dir, "vocab.json"), os.path.join(tokenizer_dir, "merges.txt"))
+    text_encoder = CLIPTextModel(CLIPTextConfig(
+        bos_token_id=0, eos_token_id=1, pad_token_id=1, hidden_size=32, intermediate_size=37,
+        num_attention_heads=4, num_hidden_layers=5, vocab_size=vocab_size,
+    ))
+    scheduler = PNDMScheduler(beta_start=0.00085, beta_end=0.012, beta_schedule="scaled_linear",
+                              skip_prk_steps=True, set_alpha_to_one=False, steps_offset=1)
+    return StableDiffusionPipeline(
+        vae=vae, text_encoder=text_encoder, tokenizer=tokenizer, unet=unet, scheduler=scheduler,
+        safety_checker=None, feature_extractor=None, requires_safety_checker=False,
+    )
+
+
+def run_profile(profile: str, images: int, real: bool) -> dict:
+    """Runs in the child process: loads the pipeline and times `images` generations."""
+    start = time.perf_counter()
+    pipe = image_gen.load_pipeline() if real else tiny_pipeline()
+    load_s = time.perf_counter() - start
+
+    params = image_gen.resolve_params(profile)
+    if not real:
+        params["width"] //= TINY_SCALE
+        params["height"] //= TINY_SCALE
+
+    step_times, image_times = [], []
+    first_image_s = None
+    for i in range(images + 1):  # the first image is a warm-up (and compiles, if enabled)
+        stamps = []
+        start = time.perf_counter()
+        image_gen.run_pipeline(pipe, ["a watercolor painting of a lighthouse at dusk"], seeds=[i],
+                               on_step=lambda step, total: stamps.append(time.perf_counter()), **params)
+        elapsed = time.perf_counter() - start
+        if i == 0:
+            first_image_s = elapsed
+            continue
+        image_times.append(elapsed)
+        step_times.extend(b - a for a, b in zip([start] + stamps, stamps))
+
+    return {
+        "steps": params["steps"], "size": f"{params['width']}x{params['height']}",
+        "precision": image_gen.precision(profile), "load_s": load_s, "first_image_s": first_image_s,
+        "s_per_step": statistics.median(step_times), "s_per_image": statistics.fmean(image_times),
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def run(profiles: list[str] | None = None, images: int = 3, real: bool = False) -> dict:
+    results = {}
+    for profile in profiles or list(image_gen.PROFILES):
+        command = [sys.executable, os.path.abspath(__file__), "--child", profile, "--images", str(images)]
+        if real:
+            command.append("--real")
+        # image_gen creates data/ in the working directory on import
+        workdir = os.getcwd() if real else tempfile.mkdtemp(prefix="sahilgpt-bench-image-")
+        output = subprocess.run(command, capture_output=True, text=True, check=True, cwd=workdir).stdout
+        results[profile] = json.loads(output.strip().splitlines()[-1])
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--profiles", nargs="+", choices=list(image_gen.PROFILES))
+    parser.add_argument("--images", type=int, default=3, help="timed images per profile (after one warm-up)")
+    parser.add_argument("--real", action="store_true", help="benchmark the real Stable Diffusion model")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+    if args.child:
+        print(json.dumps(run_profile(args.child, args.images, args.real)))
+        sys.exit(0)
+    results = run(args.profiles, args.images, args.real)
+    print_table("Image generation profiles (tiny random pipeline)" if not args.real else "Image generation profiles",
+                results)
+    save_json(args.json, results)
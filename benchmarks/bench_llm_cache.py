@@ -0,0 +1,117 @@
+"""
+LLM reply cache: a stream of questions where users repeat themselves (some
+questions come back often, some with different case or punctuation) is sent
+through llm_utils.stream_llm_response without and with use_cache, against
+the stand-in Ollama server. Reports time per question (ttft and whole
+reply) for misses and hits, the hit rate by match type, the lookup time of
+the in-memory tier and of SQLite (a fresh LLMCache on the same file, as after a restart),
+and that sampled requests bypass the cache.
+
+    python benchmarks/bench_llm_cache.py --questions 200 --distinct 40
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+
+import _common  # noqa: F401  (sets up sys.path)
+from _common import latency_summary, print_table, save_json
+
+TMP_DIR = tempfile.mkdtemp(prefix="sahilgpt-bench-")
+os.environ["SAHILGPT_LLM_CACHE_PATH"] = os.path.join(TMP_DIR, "llm_cache.db")
+
+from fake_ollama import FakeOllamaServer  # noqa: E402
+from backend import llm_cache, llm_client, llm_utils, metrics  # noqa: E402
+
+REPLY = " ".join(["Here is a fairly detailed answer to the question you asked."] * 8)  # ~90 tokens
+TOPICS = ("python decorators", "the weather tomorrow", "my last project", "sorting algorithms", "git rebase",
+          "unit conversion", "a pasta recipe", "the meeting notes", "regular expressions", "sleep schedules")
+
+
+def questions(n: int, distinct: int, seed: int = 0) -> list[str]:
+    """Zipf-like repeats; a third of the repeats are retyped with other case or punctuation."""
+    rng = random.Random(seed)
+    pool = [f"Can you explain {TOPICS[i % len(TOPICS)]} (part {i})?" for i in range(distinct)]
+    weights = [1 / (rank + 1) for rank in range(distinct)]
+    asked, out = set(), []
+    for _ in range(n):
+        question = rng.choices(pool, weights)[0]
+        if question in asked and rng.random() < 0.33:
+            question = question.lower().rstrip("?") + "  "
+        asked.add(question)
+        out.append(question)
+    return out
+
+
+def ask_all(prompts: list[str], use_cache: bool) -> dict:
+    misses, hits, ttfts_hit, ttfts_miss = [], [], [], []
+    matches = {}
+    start = time.perf_counter()
+    for prompt in prompts:
+        stats = {}
+        t = time.perf_counter()
+        "".join(llm_utils.stream_llm_response(prompt, stats, use_cache=use_cache))
+        elapsed = time.perf_counter() - t
+        if stats["cached"]:
+            hits.append(elapsed)
+            ttfts_hit.append(stats["ttft"])
+            matches[stats["cached"]] = matches.get(stats["cached"], 0) + 1
+        else:
+            misses.append(elapsed)
+            ttfts_miss.append(stats["ttft"])
+    wall = time.perf_counter() - start
+    summary = {"total_s": wall, "questions": len(prompts), "hits": len(hits), "hit_rate": len(hits) / len(prompts),
+               "miss_reply_ms": latency_summary(misses)["p50_ms"], "miss_ttft_ms": latency_summary(ttfts_miss)["p50_ms"]}
+    if hits:
+        summary.update(hit_reply_ms=latency_summary(hits)["p50_ms"], hit_p99_ms=latency_summary(hits)["p99_ms"],
+                       hit_ttft_ms=latency_summary(ttfts_hit)["p50_ms"],
+                       **{f"{match}_hits": count for match, count in matches.items()})
+    return summary
+
+
+def lookup_ms(cache: llm_cache.LLMCache, prompts: list[str]) -> float:
+    latencies = []
+    for prompt in prompts:
+        key = llm_cache.RequestKey("generate", prompt)
+        start = time.perf_counter()
+        cache.get(key)
+        latencies.append(time.perf_counter() - start)
+    return latency_summary(latencies)["p50_ms"]
+
+
+def run(n: int = 100, distinct: int = 20, first_token_delay: float = 0.3, token_delay: float = 0.01) -> dict:
+    prompts = questions(n, distinct)
+    results = {}
+    with FakeOllamaServer(first_token_delay=first_token_delay, token_delay=token_delay, reply=REPLY) as server:
+        llm_client.configure(base_url=server.base_url, options={"temperature": 0})
+        results["no_cache"] = ask_all(prompts, use_cache=False)
+        results["cache"] = ask_all(prompts, use_cache=True)
+
+        # The same cache file in a fresh LLMCache: the SQLite tier, as after an app restart
+        unique = sorted(set(prompts))
+        results["lookup"] = {"hot_ms": lookup_ms(llm_cache.get_cache(), unique),
+                             "sqlite_ms": lookup_ms(llm_cache.LLMCache(hot_entries=0), unique),
+                             "miss_ms": lookup_ms(llm_cache.get_cache(), [f"never asked {i}" for i in range(50)])}
+        results["lookup"]["size_kb"] = llm_cache.get_cache().stats()["size_bytes"] / 1024
+
+        # Default sampling (temperature 0.8): every request goes to the model
+        llm_client.configure(base_url=server.base_url)
+        sampled = ask_all(prompts[:20], use_cache=True)
+        results["sampled"] = {"hits": sampled["hits"], "bypassed": llm_cache.get_cache().stats()["bypassed"]}
+    results["metrics"] = {name: value for name, value in metrics.snapshot()["counters"].items()
+                          if name.startswith("llm_cache.")}
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--questions", type=int, default=100)
+    parser.add_argument("--distinct", type=int, default=20, help="different questions in the stream")
+    parser.add_argument("--first-token-delay", type=float, default=0.3, help="stand-in prompt eval time (s)")
+    parser.add_argument("--token-delay", type=float, default=0.01, help="stand-in time per token (s)")
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+    results = run(args.questions, args.distinct, args.first_token_delay, args.token_delay)
+    print_table(f"LLM reply cache ({args.questions} questions, {args.distinct} distinct)", results)
+    save_json(args.json, results)
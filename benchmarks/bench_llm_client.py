@@ -0,0 +1,83 @@
+"""
+Benchmarks the pooled Ollama client against one-off requests.post calls,
+using the stand-in server from fake_ollama.py.
+
+    python benchmarks/bench_llm_client.py --requests 200 --concurrency 8
+"""
+import argparse
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import _common  # noqa: F401  (sets up sys.path)
+import requests
+
+from _common import latency_summary, print_table, save_json
+from fake_ollama import FakeOllamaServer
+from backend.llm_client import OllamaClient
+
+
+def _timed(fn):
+    start = time.perf_counter()
+    fn()
+    return time.perf_counter() - start
+
+
+def bench_one_off(base_url, n, concurrency):
+    """The old path: a fresh connection per request, no shared limits."""
+    def call(i):
+        return _timed(lambda: requests.post(f"{base_url}/api/generate", timeout=60,
+                                            json={"model": "m", "prompt": f"q{i}", "stream": False}).json())
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        latencies = list(pool.map(call, range(n)))
+    return latency_summary(latencies, time.perf_counter() - start)
+
+
+def bench_pooled_threads(client, n, concurrency):
+    """Many sessions calling the shared client's blocking API at once."""
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        latencies = list(pool.map(lambda i: _timed(lambda: client.generate(f"q{i}")), range(n)))
+    return latency_summary(latencies, time.perf_counter() - start)
+
+
+def bench_async_batch(client, n):
+    """One asyncio caller submitting the whole batch."""
+    async def one(i):
+        start = time.perf_counter()
+        await client.agenerate(f"q{i}")
+        return time.perf_counter() - start
+
+    async def main():
+        return await asyncio.gather(*(one(i) for i in range(n)))
+
+    start = time.perf_counter()
+    latencies = asyncio.run(main())
+    return latency_summary(latencies, time.perf_counter() - start)
+
+
+def run(n: int = 200, concurrency: int = 8, first_token_delay: float = 0.01,
+        token_delay: float = 0.001) -> dict:
+    with FakeOllamaServer(first_token_delay=first_token_delay, token_delay=token_delay) as server:
+        client = OllamaClient(base_url=server.base_url, max_in_flight=concurrency)
+        results = {
+            "one_off_requests": bench_one_off(server.base_url, n, concurrency),
+            "pooled_client_threads": bench_pooled_threads(client, n, concurrency),
+            "async_client_batch": bench_async_batch(client, n),
+        }
+        client.close()
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--first-token-delay", type=float, default=0.01)
+    parser.add_argument("--token-delay", type=float, default=0.001)
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+    results = run(args.requests, args.concurrency, args.first_token_delay, args.token_delay)
+    print_table("Ollama client (latency in ms, per_sec = requests/sec)", results)
+    save_json(args.json, results)
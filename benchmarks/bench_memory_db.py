@@ -0,0 +1,81 @@
+"""
+Compares memory_db.add_memory paths: the original one (rollback journal, one
+commit + refresh per row), the synchronous path with WAL pragmas, and
+write-behind mode. Reports inserts/sec and caller-side latency.
+
+    python benchmarks/bench_memory_db.py --rows 2000
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import _common  # noqa: F401  (sets up sys.path)
+from _common import latency_summary, print_table, save_json
+
+TMP_DIR = tempfile.mkdtemp(prefix="sahilgpt-bench-")
+os.environ["SAHILGPT_DB_PATH"] = os.path.join(TMP_DIR, "memory.db")
+
+import sqlalchemy as db
+from sqlalchemy.orm import sessionmaker
+
+from backend import memory_db
+
+
+def bench_legacy(rows: int) -> dict:
+    """The pre-WAL add_memory: default journal, commit and refresh per row."""
+    engine = db.create_engine(f"sqlite:///{os.path.join(TMP_DIR, 'legacy.db')}")
+    memory_db.Base.metadata.create_all(bind=engine)
+    Session = sessionmaker(bind=engine)
+    latencies = []
+    start = time.perf_counter()
+    for i in range(rows):
+        t = time.perf_counter()
+        session = Session()
+        memory = memory_db.Memory(content=f"Chat: User said 'message {i}'")
+        session.add(memory)
+        session.commit()
+        session.refresh(memory)
+        session.close()
+        latencies.append(time.perf_counter() - t)
+    return latency_summary(latencies, time.perf_counter() - start)
+
+
+def bench_add_memory(rows: int) -> dict:
+    latencies = []
+    start = time.perf_counter()
+    for i in range(rows):
+        t = time.perf_counter()
+        memory_db.add_memory(f"Chat: User said 'message {i}'")
+        latencies.append(time.perf_counter() - t)
+    return latency_summary(latencies, time.perf_counter() - start)
+
+
+def bench_write_behind(rows: int) -> dict:
+    writer = memory_db.enable_write_behind()
+    summary = bench_add_memory(rows)
+    # Throughput includes getting everything onto disk
+    start = time.perf_counter()
+    memory_db.disable_write_behind()
+    drain = time.perf_counter() - start
+    summary["per_sec"] = rows / (rows / summary["per_sec"] + drain)
+    summary["batches"] = writer.batches_written
+    return summary
+
+
+def run(rows: int = 2000) -> dict:
+    return {
+        "legacy_commit_per_row": bench_legacy(rows),
+        "sync_wal": bench_add_memory(rows),
+        "write_behind": bench_write_behind(rows),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=2000)
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+    results = run(args.rows)
+    print_table("add_memory (caller latency in ms, per_sec = inserts/sec)", results)
+    save_json(args.json, results)
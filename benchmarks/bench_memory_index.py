@@ -0,0 +1,86 @@
+"""
+Measures the semantic memory index: embedding + append throughput with the
+hashing embedder, and top-k search latency over a large index (1M rows by
+default) in float32 and int8 form.
+
+    python benchmarks/bench_memory_index.py --rows 1000000
+"""
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+import _common  # noqa: F401  (sets up sys.path)
+import numpy as np
+from _common import latency_summary, peak_rss_mb, print_table, save_json
+
+if "SAHILGPT_DB_PATH" not in os.environ:
+    os.environ["SAHILGPT_DB_PATH"] = os.path.join(tempfile.mkdtemp(prefix="sahilgpt-bench-"), "memory.db")
+
+from backend.memory_index import HashingEmbedder, VectorIndex
+from bench_memory_search import fake_content
+
+
+def bench_embed_and_add(directory: str, rows: int) -> dict:
+    import random
+    rng = random.Random(0)
+    texts = [fake_content(rng) for _ in range(rows)]
+    embedder = HashingEmbedder()
+    index = VectorIndex(directory, embedder.dim, embedder.name)
+    start = time.perf_counter()
+    for offset in range(0, rows, 1000):
+        batch = texts[offset:offset + 1000]
+        index.add(range(offset + 1, offset + 1 + len(batch)), embedder.embed(batch))
+    elapsed = time.perf_counter() - start
+    return {"rows": rows, "rows_per_sec": rows / elapsed}
+
+
+def bench_search(directory: str, rows: int, quantize: bool, k: int, repeat: int) -> dict:
+    dim = 256
+    index = VectorIndex(directory, dim, "random", quantize=quantize, initial_capacity=rows)
+    rng = np.random.default_rng(0)
+    start = time.perf_counter()
+    for offset in range(0, rows, 100000):
+        n = min(100000, rows - offset)
+        vectors = rng.standard_normal((n, dim), dtype=np.float32)
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        index.add(np.arange(offset + 1, offset + 1 + n), vectors)
+    build = time.perf_counter() - start
+    queries = rng.standard_normal((repeat, dim), dtype=np.float32)
+    index.search(queries[0], k)  # fault the pages in once
+    latencies = []
+    for query in queries:
+        t = time.perf_counter()
+        index.search(query / np.linalg.norm(query), k)
+        latencies.append(time.perf_counter() - t)
+    summary = latency_summary(latencies)
+    summary["build_s"] = build
+    summary["disk_mb"] = sum(os.path.getsize(os.path.join(directory, f)) for f in os.listdir(directory)) / 2 ** 20
+    return summary
+
+
+def run(rows: int = 1_000_000, k: int = 5, repeat: int = 20) -> dict:
+    tmp = tempfile.mkdtemp(prefix="sahilgpt-index-")
+    try:
+        results = {
+            "embed_and_add_hashing": bench_embed_and_add(os.path.join(tmp, "hashing"), min(rows, 50000)),
+            "search_float32": bench_search(os.path.join(tmp, "f32"), rows, False, k, repeat),
+            "search_int8": bench_search(os.path.join(tmp, "i8"), rows, True, k, repeat),
+        }
+        results["search_int8"]["peak_rss_mb"] = peak_rss_mb()
+        return results
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+    results = run(args.rows, args.k, args.repeat)
+    print_table(f"Memory index, {args.rows} rows (search latency in ms)", results)
+    save_json(args.json, results)
@@ -0,0 +1,170 @@
+"""
+Memory retention on a synthetic multi-year log: builds a memory database with
+--years of events (chat, code runs, logins, images, projects), then reports
+database size and query latency before and after memory_retention.compact(),
+how long compaction took, the latency of add_memory calls made while it ran
+(against the same writer when idle), and the latency of archive queries.
+
+--legacy builds the database without auto_vacuum, like one created before the
+retention policy existed, so compaction includes the one-time conversion.
+
+    python benchmarks/bench_memory_retention.py --rows 300000 --years 3
+"""
+import argparse
+import datetime
+import os
+import random
+import sqlite3
+import tempfile
+import threading
+import time
+
+import _common  # noqa: F401  (sets up sys.path)
+from _common import latency_summary, print_table, save_json
+
+TMP_DIR = tempfile.mkdtemp(prefix="sahilgpt-bench-")
+os.environ["SAHILGPT_DB_PATH"] = os.path.join(TMP_DIR, "memory.db")
+os.environ["SAHILGPT_MEMORY_ARCHIVE_DIR"] = os.path.join(TMP_DIR, "memory_archive")
+os.environ["SAHILGPT_RESULT_CACHE"] = "0"  # measure the queries, not the cache
+
+from backend import memory_db, memory_retention
+
+WORDS = ("project deploy weather python summary meeting notes budget travel recipe music build error "
+         "garden invoice report schedule laptop camera lecture").split()
+# Synthetic event mix: kind -> weight
+MIX = {"chat": 40, "code_run": 30, "login": 15, "failed_login": 3, "image": 6, "project": 6}
+
+
+def event(rng: random.Random, kind: str) -> str:
+    words = " ".join(rng.choices(WORDS, k=rng.randint(3, 12)))
+    if kind == "chat":
+        return f"Chat: User said '{words}'"
+    if kind == "image":
+        return f"User generated image with prompt: '{words}'"
+    if kind == "project":
+        return f"User action: Open project '/Users/me/CODING/{rng.choice(WORDS)}_{rng.randint(1, 30)}'."
+    return memory_retention.ROLLUP_EVENTS[kind]
+
+
+def build_log(rows: int, years: float, now: datetime.datetime, legacy: bool):
+    rng = random.Random(0)
+    kinds, weights = list(MIX), list(MIX.values())
+    span = datetime.timedelta(days=365 * years)
+    stamps = sorted(now - span * rng.random() for _ in range(rows))
+    table = memory_db.Memory.__table__
+    with memory_db.engine.begin() as conn:
+        for i in range(0, rows, 10000):
+            conn.execute(table.insert(), [{"timestamp": ts, "content": event(rng, rng.choices(kinds, weights)[0])}
+                                          for ts in stamps[i:i + 10000]])
+    with memory_db.engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        if legacy:
+            conn.exec_driver_sql("PRAGMA auto_vacuum=NONE")
+            conn.exec_driver_sql("VACUUM")
+        conn.exec_driver_sql("PRAGMA wal_checkpoint(TRUNCATE)").fetchall()
+
+
+def timed(fn, repeat: int) -> float:
+    """Median ms of repeat calls."""
+    latencies = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        latencies.append(time.perf_counter() - start)
+    return latency_summary(latencies)["p50_ms"]
+
+
+def backup_ms() -> float:
+    target = os.path.join(TMP_DIR, "backup.db")
+    start = time.perf_counter()
+    with sqlite3.connect(memory_db.DB_PATH) as source, sqlite3.connect(target) as dest:
+        source.backup(dest)
+    elapsed = (time.perf_counter() - start) * 1000
+    os.remove(target)
+    return elapsed
+
+
+def count_rows() -> int:
+    with memory_db.engine.connect() as conn:
+        return conn.exec_driver_sql("SELECT count(*) FROM memories").scalar()
+
+
+def measure(now: datetime.datetime, repeat: int) -> dict:
+    last_month = now - datetime.timedelta(days=30)
+    size = memory_retention.database_size()
+    return {
+        "rows": count_rows(),
+        "db_mb": size["file_bytes"] / 1e6,
+        "list_ms": timed(lambda: memory_db.list_memories(50), repeat),
+        "search_ms": timed(lambda: memory_db.search_memories("budget travel"), repeat),
+        "search_last_month_ms": timed(lambda: memory_db.search_memories("deploy", last_month, now), repeat),
+        "count_ms": timed(count_rows, repeat),
+        "backup_ms": backup_ms(),
+    }
+
+
+def writer(stop: threading.Event, latencies: list):
+    i = 0
+    while not stop.is_set():
+        start = time.perf_counter()
+        memory_db.add_memory(f"Chat: User said 'writer {i}'")
+        latencies.append(time.perf_counter() - start)
+        i += 1
+        time.sleep(0.005)
+
+
+def writer_latency(seconds: float) -> dict:
+    stop, latencies = threading.Event(), []
+    thread = threading.Thread(target=writer, args=(stop, latencies))
+    thread.start()
+    time.sleep(seconds)
+    stop.set()
+    thread.join()
+    return latency_summary(latencies)
+
+
+def run(rows: int = 300000, years: float = 3.0, repeat: int = 20, legacy: bool = False) -> dict:
+    now = datetime.datetime.utcnow()
+    start = time.perf_counter()
+    build_log(rows, years, now, legacy)
+    print(f"Built {rows} memories over {years:g} years in {time.perf_counter() - start:.1f}s")
+    results = {"before": measure(now, repeat), "writer_idle": writer_latency(1.0)}
+
+    stop, latencies = threading.Event(), []
+    thread = threading.Thread(target=writer, args=(stop, latencies))
+    thread.start()
+    report = memory_retention.compact(now)
+    stop.set()
+    thread.join()
+    results["writer_during_compaction"] = latency_summary(latencies)
+    results["compaction"] = {
+        "compact_s": report["seconds"],
+        "rows_archived": report["rolled_up"] + report["archived_by_age"],
+        "rolled_up": report["rolled_up"],
+        "vacuumed_pages": report["vacuumed_pages"],
+    }
+    results["after"] = measure(now, repeat)
+
+    stats = memory_retention.archive_stats()
+    year_ago = now - datetime.timedelta(days=365 + 30)
+    results["archive"] = {
+        "segments": stats["segments"],
+        "archive_mb": stats["bytes"] / 1e6,
+        "search_all_ms": timed(lambda: memory_retention.search_archive("budget travel"), max(1, repeat // 4)),
+        "search_one_month_ms": timed(lambda: memory_retention.search_archive(
+            "deploy", year_ago, year_ago + datetime.timedelta(days=30)), repeat),
+        "rollup_counts_ms": timed(memory_retention.rollup_counts, repeat),
+    }
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=300000, help="memories in the synthetic log")
+    parser.add_argument("--years", type=float, default=3.0, help="time span of the log")
+    parser.add_argument("--repeat", type=int, default=20, help="runs of each query")
+    parser.add_argument("--legacy", action="store_true", help="start from a database without auto_vacuum")
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+    results = run(args.rows, args.years, args.repeat, args.legacy)
+    print_table(f"Memory retention ({args.rows} memories over {args.years:g} years)", results)
+    save_json(args.json, results)
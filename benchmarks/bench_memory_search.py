@@ -0,0 +1,105 @@
+"""
+Seeds a memory log (1M rows by default) and measures query latency for the
+newest page, keyset vs OFFSET deep pages, full-text search and time ranges.
+
+    python benchmarks/bench_memory_search.py --rows 1000000
+"""
+import argparse
+import datetime
+import os
+import random
+import tempfile
+import time
+
+import _common  # noqa: F401  (sets up sys.path)
+from _common import latency_summary, print_table, save_json
+
+if "SAHILGPT_DB_PATH" not in os.environ:
+    os.environ["SAHILGPT_DB_PATH"] = os.path.join(tempfile.mkdtemp(prefix="sahilgpt-bench-"), "memory.db")
+
+from sqlalchemy import text
+
+from backend import memory_db
+
+TEMPLATES = [
+    "User ran code.",
+    "User logged in successfully via face scan.",
+    "Failed login attempt via face scan.",
+    "Chat: User said '{a} {b} {c}'",
+    "User generated image with prompt: '{a} {b}'",
+    "User action: Open project '/Users/sahil/CODING/{a}-{b}'.",
+]
+WORDS = ("python streamlit project weather music recipe travel budget docker rust "
+         "garden camera invoice meeting thesis physics guitar marathon kubernetes").split()
+START = datetime.datetime(2022, 1, 1)
+SPAN_SECONDS = 3 * 365 * 24 * 3600
+
+
+def fake_content(rng: random.Random) -> str:
+    return rng.choice(TEMPLATES).format(a=rng.choice(WORDS), b=rng.choice(WORDS), c=rng.choice(WORDS))
+
+
+def seed(rows: int, batch: int = 50000, seed_value: int = 0):
+    """Appends `rows` synthetic memories spread evenly over three years."""
+    rng = random.Random(seed_value)
+    step = SPAN_SECONDS / rows
+    with memory_db.engine.begin() as conn:
+        for offset in range(0, rows, batch):
+            params = [
+                {"ts": START + datetime.timedelta(seconds=i * step), "content": fake_content(rng)}
+                for i in range(offset, min(rows, offset + batch))
+            ]
+            conn.execute(text("INSERT INTO memories (timestamp, content) VALUES (:ts, :content)"), params)
+
+
+def _time(fn, repeat: int) -> dict:
+    latencies = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        latencies.append(time.perf_counter() - start)
+    return latency_summary(latencies)
+
+
+def _offset_page(offset: int, limit: int = 50):
+    with memory_db.engine.connect() as conn:
+        return conn.execute(text(
+            "SELECT id, timestamp, content FROM memories ORDER BY timestamp DESC, id DESC "
+            "LIMIT :limit OFFSET :offset"), {"limit": limit, "offset": offset}).fetchall()
+
+
+def run(rows: int = 1_000_000, repeat: int = 20) -> dict:
+    existing = memory_db.engine.connect().execute(text("SELECT count(*) FROM memories")).scalar()
+    if existing < rows:
+        start = time.perf_counter()
+        seed(rows - existing)
+        print(f"Seeded {rows - existing} rows in {time.perf_counter() - start:.1f}s")
+
+    # A cursor about half-way through the log
+    middle = _offset_page(rows // 2, 1)[0]
+    middle_cursor = (datetime.datetime.fromisoformat(str(middle.timestamp)), middle.id)
+    range_start = START + datetime.timedelta(days=400)
+
+    return {
+        "newest_page": _time(lambda: memory_db.list_memories(50), repeat),
+        "deep_page_offset": _time(lambda: _offset_page(rows // 2), max(3, repeat // 5)),
+        "deep_page_keyset": _time(lambda: memory_db.search_memories(cursor=middle_cursor), repeat),
+        "search_common_word": _time(lambda: memory_db.search_memories("project"), repeat),
+        "search_two_words": _time(lambda: memory_db.search_memories("guitar marathon"), repeat),
+        "search_no_match": _time(lambda: memory_db.search_memories("zzzunknown"), repeat),
+        "time_range_week": _time(lambda: memory_db.search_memories(
+            start=range_start, end=range_start + datetime.timedelta(days=7)), repeat),
+        "search_in_time_range": _time(lambda: memory_db.search_memories(
+            "docker", start=range_start, end=range_start + datetime.timedelta(days=30)), repeat),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+    results = run(args.rows, args.repeat)
+    print_table(f"Memory queries over {args.rows} rows (latency in ms)", results)
+    save_json(args.json, results)
@@ -0,0 +1,109 @@
+"""
+Builds a synthetic projects directory (nested source trees plus
+node_modules/.venv noise) and measures the project activity index: the
+initial recursive scan with one thread vs the parallel pool, last-project and
+top-N query latency, how long a file edit takes to show up via watchdog, and
+whether the old top-level-mtime scan finds the right project. A few
+.gitignore patterns are checked against their expected matches first.
+
+    python benchmarks/bench_project_index.py --projects 20 --files 5000
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import _common  # noqa: F401  (sets up sys.path)
+from _common import latency_summary, print_table, save_json
+
+from backend import project_index, project_utils
+
+
+# (pattern, path below /p, is_dir, expected match)
+IGNORE_CASES = [
+    ("/build/", "build", True, True), ("/build/", "src/build", True, None), ("/build/", "build", False, None),
+    ("build/", "build", True, True), ("build/", "src/build", True, True), ("build/", "src/build", False, None),
+    ("docs/out/", "docs/out", True, True), ("docs/out/", "x/docs/out", True, None),
+    ("*.log", "a/b.log", False, True), ("/*.log", "a/b.log", False, None),
+]
+
+
+def check_ignore_rules() -> dict:
+    for pattern, path, is_dir, expected in IGNORE_CASES:
+        got = project_index.IgnoreRules("/p", [pattern]).match("/p/" + path, is_dir)
+        assert got == expected, f"{pattern!r} on {path!r} (dir={is_dir}): {got}, expected {expected}"
+    return {"cases": len(IGNORE_CASES), "correct": True}
+
+
+def make_tree(base_dir: str, projects: int, files: int) -> list[str]:
+    """files source files per project spread over nested dirs, plus as many ignored ones."""
+    names = []
+    old = time.time() - 86400
+    for p in range(projects):
+        name = f"project_{p:03d}"
+        names.append(name)
+        for f in range(files):
+            directory = os.path.join(base_dir, name, "src", f"pkg{f % 20}", f"mod{f % 7}")
+            noise = os.path.join(base_dir, name, "node_modules" if p % 2 else ".venv", f"dep{f % 50}", "lib")
+            for d, filename in ((directory, f"file{f}.py"), (noise, f"dep{f}.js")):
+                os.makedirs(d, exist_ok=True)
+                path = os.path.join(d, filename)
+                with open(path, "w") as fh:
+                    fh.write("x")
+                os.utime(path, (old + p, old + p))
+        with open(os.path.join(base_dir, name, ".gitignore"), "w") as fh:
+            fh.write("*.log\nbuild/\n")
+    return names
+
+
+def run(projects: int = 20, files: int = 5000, queries: int = 10000) -> dict:
+    base_dir = tempfile.mkdtemp(prefix="sahilgpt-projects-")
+    index_path = os.path.join(tempfile.mkdtemp(prefix="sahilgpt-project-index-"), "index.json")
+    names = make_tree(base_dir, projects, files)
+    results = {"ignore_rules": check_ignore_rules()}
+
+    for label, workers in (("scan_1_thread", 1), ("scan_parallel", project_index.SCAN_WORKERS)):
+        index = project_index.ProjectIndex(base_dir, index_path=index_path, workers=workers)
+        start = time.perf_counter()
+        index.rescan()
+        results[label] = {"s": time.perf_counter() - start, "workers": workers,
+                          "files": sum(p["file_count"] for p in index.top(projects))}
+
+    latencies = []
+    for _ in range(queries):
+        start = time.perf_counter()
+        index.last_project()
+        index.top(5)
+        latencies.append(time.perf_counter() - start)
+    results["query_last_and_top5"] = latency_summary(latencies)
+
+    # Edit a deep file in the oldest project and wait for the index to notice
+    index.watch()
+    time.sleep(0.5)
+    target = os.path.join(base_dir, names[0], "src", "pkg3", "mod3", "file3.py")
+    start = time.perf_counter()
+    with open(target, "a") as fh:
+        fh.write("edited")
+    while index.last_project() != os.path.join(base_dir, names[0]) and time.perf_counter() - start < 5:
+        time.sleep(0.001)
+    results["edit_to_index"] = {"ms": (time.perf_counter() - start) * 1000,
+                                "correct": index.last_project() == os.path.join(base_dir, names[0])}
+    index.stop()
+
+    start = time.perf_counter()
+    old_answer = project_utils.scan_top_level(base_dir)
+    results["old_top_level_scan"] = {"ms": (time.perf_counter() - start) * 1000,
+                                     "correct": old_answer == os.path.join(base_dir, names[0])}
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--projects", type=int, default=20)
+    parser.add_argument("--files", type=int, default=5000, help="source files per project (plus as many ignored)")
+    parser.add_argument("--queries", type=int, default=10000)
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+    results = run(args.projects, args.files, args.queries)
+    print_table("Project activity index", results)
+    save_json(args.json, results)
@@ -0,0 +1,86 @@
+"""
+Backend time of a Streamlit rerun (the reads the Home, Dashboard and
+Memories pages make on every interaction) with the result cache off and on,
+and the first rerun after a write, which has to miss.
+
+    python benchmarks/bench_rerun.py --rows 100000 --reruns 200
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import _common  # noqa: F401  (sets up sys.path)
+from _common import latency_summary, print_table, save_json
+
+# Everything the pages touch lives in a temp dir (the DB, the enrollment file)
+WORKDIR = tempfile.mkdtemp(prefix="sahilgpt-bench-rerun-")
+if "SAHILGPT_DB_PATH" not in os.environ:
+    os.environ["SAHILGPT_DB_PATH"] = os.path.join(WORKDIR, "memory.db")
+os.chdir(WORKDIR)
+
+from backend import face_utils, memory_db, project_index, project_utils, result_cache  # noqa: E402
+from bench_memory_search import seed  # noqa: E402
+
+
+def make_projects(base_dir: str, projects: int = 30, files: int = 200):
+    for p in range(projects):
+        directory = os.path.join(base_dir, f"project_{p:02d}", "src")
+        os.makedirs(directory, exist_ok=True)
+        for f in range(files):
+            with open(os.path.join(directory, f"file{f}.py"), "w") as fh:
+                fh.write("x")
+
+
+def rerun(projects_dir: str):
+    # The backend reads of home_page, dashboard_page and memories_page
+    face_utils.is_user_enrolled()
+    project_utils.find_last_project(projects_dir)
+    memory_db.search_memories(None, None, None, cursor=None, limit=50)
+
+
+def _time_reruns(projects_dir: str, reruns: int) -> dict:
+    latencies = []
+    for _ in range(reruns):
+        start = time.perf_counter()
+        rerun(projects_dir)
+        latencies.append(time.perf_counter() - start)
+    return latency_summary(latencies)
+
+
+def run(rows: int = 100_000, reruns: int = 200) -> dict:
+    seed(rows)
+    projects_dir = os.path.join(WORKDIR, "projects")
+    make_projects(projects_dir)
+    project_index.get_index(projects_dir).ready.wait(30)
+
+    results = {}
+    result_cache.ENABLED = False
+    results["uncached"] = _time_reruns(projects_dir, reruns)
+    result_cache.ENABLED = True
+    rerun(projects_dir)  # populate
+    results["cached"] = _time_reruns(projects_dir, reruns)
+
+    after_write = []
+    for _ in range(min(reruns, 50)):
+        memory_db.add_memory("User ran code.")
+        start = time.perf_counter()
+        rerun(projects_dir)
+        after_write.append(time.perf_counter() - start)
+    results["after_write"] = latency_summary(after_write)
+
+    for row in result_cache.stats():
+        results[row["function"].split(".")[-1]] = {"hits": row["hits"], "misses": row["misses"],
+                                                   "invalidations": row["invalidations"]}
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--reruns", type=int, default=200)
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+    results = run(args.rows, args.reruns)
+    print_table("Rerun backend latency (ms)", results)
+    save_json(args.json, results)
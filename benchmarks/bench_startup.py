@@ -0,0 +1,192 @@
+"""
+Cold start of the Streamlit app: renders the Home and Login pages with
+Streamlit's AppTest, each in a fresh Python process, and reports
+time-to-first-render, how many modules were loaded and the slowest imports
+(SAHILGPT_PROFILE_STARTUP=1). "eager_imports" is what the app paid before
+it imported the backend lazily: every backend module up front.
+
+With --check it is the startup guard: it exits with status 1 if the first
+render of Home or Login imported a heavy module (torch, diffusers, Whisper,
+face_recognition, ...; Login may load the face models, which it warms up on
+purpose). run_suite runs it that way.
+
+Without Streamlit installed (or with --stub) the script runs under a stand-in
+streamlit module whose widgets do nothing and return nothing, which is
+enough to see what a page imports; its timings leave out Streamlit's own
+work and aren't comparable with AppTest's.
+
+    python benchmarks/bench_startup.py --repeat 3
+    python benchmarks/bench_startup.py --check
+"""
+import argparse
+import importlib.util
+import json
+import os
+import statistics
+import runpy
+import subprocess
+import sys
+import tempfile
+import time
+import types
+
+import _common  # noqa: F401  (sets up sys.path)
+from _common import print_table, save_json
+
+APP_PATH = os.path.join(_common.ROOT_DIR, "frontend", "streamlit_app.py")
+PAGES = ("Home", "Login")
+# Heavy modules a page may import on purpose
+ALLOWED = {"Login": ("face_recognition", "dlib")}
+EAGER_MODULES = ("face_utils", "memory_db", "conversation", "code_runner", "project_utils", "project_index",
+                 "image_gen", "voice_utils", "model_client", "memory_index", "memory_retention", "tts")
+
+
+def child(page: str) -> dict:
+    """Runs in the fresh process: one render of the page."""
+    from streamlit.testing.v1 import AppTest
+
+    before = len(sys.modules)
+    start = time.perf_counter()
+    app = AppTest.from_file(APP_PATH, default_timeout=120)
+    app.session_state["page"] = page
+    app.run()
+    elapsed = time.perf_counter() - start
+    if app.exception:
+        raise RuntimeError(f"{page} page raised: {app.exception[0].message}")
+    from backend import startup
+
+    render = startup.first_render or {}
+    return {"run_ms": elapsed * 1000, "first_render_ms": render.get("seconds", float("nan")) * 1000,
+            "modules_loaded": len(sys.modules) - before, "heavy": startup.heavy_modules_loaded(),
+            "imports": render.get("imports", [])[:10]}
+
+
+class _StubElement:
+    """Any widget or container of the stand-in streamlit: callable, a context manager, falsy."""
+
+    def __call__(self, *args, **kwargs):
+        return self
+
+    def __getattr__(self, name):
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def __bool__(self):
+        return False
+
+    def __iter__(self):
+        return iter(())
+
+
+class _SessionState(dict):
+    def __getattr__(self, name):
+        try:
+            return self[name]
+        except KeyError:
+            raise AttributeError(name) from None
+
+    def __setattr__(self, name, value):
+        self[name] = value
+
+    def __delattr__(self, name):
+        del self[name]
+
+
+def _stub_streamlit() -> types.ModuleType:
+    module = types.ModuleType("streamlit")
+    element = _StubElement()
+    module.session_state = _SessionState()
+    module.columns = lambda spec, *args, **kwargs: [element] * (spec if isinstance(spec, int) else len(spec))
+    module.__getattr__ = lambda name: element
+    return module
+
+
+def stub_child(page: str) -> dict:
+    """Runs in the fresh process: one run of the script under the stand-in streamlit module."""
+    st = sys.modules["streamlit"] = _stub_streamlit()
+    st.session_state["page"] = page
+    before = len(sys.modules)
+    start = time.perf_counter()
+    runpy.run_path(APP_PATH, run_name="__main__")
+    elapsed = time.perf_counter() - start
+    from backend import startup
+
+    render = startup.first_render or {}
+    return {"run_ms": elapsed * 1000, "first_render_ms": render.get("seconds", float("nan")) * 1000,
+            "modules_loaded": len(sys.modules) - before, "heavy": startup.heavy_modules_loaded(),
+            "imports": render.get("imports", [])[:10]}
+
+
+def eager_child() -> dict:
+    start = time.perf_counter()
+    for name in EAGER_MODULES:
+        __import__(f"backend.{name}")
+    return {"import_ms": (time.perf_counter() - start) * 1000}
+
+
+def spawn(*args: str) -> dict:
+    workdir = tempfile.mkdtemp(prefix="sahilgpt-bench-startup-")
+    env = dict(os.environ, SAHILGPT_PROFILE_STARTUP="1", SAHILGPT_DAEMON="off",
+               SAHILGPT_DB_PATH=os.path.join(workdir, "memory.db"))
+    process = subprocess.run([sys.executable, os.path.abspath(__file__), *args], cwd=workdir, env=env,
+                             capture_output=True, text=True)
+    if process.returncode != 0:
+        raise RuntimeError(f"{' '.join(args)} failed:\n{process.stderr.strip()}")
+    # The last JSON line; the app may print (the profile report, model warmup) before it
+    return json.loads(next(line for line in reversed(process.stdout.splitlines()) if line.startswith("{")))
+
+
+# page -> heavy modules its first render imported that it shouldn't have (filled by run)
+disallowed = {}
+
+
+def run(repeat: int = 3, stub: bool = False) -> dict:
+    results = {}
+    child_args = ("--stub",) if stub else ()
+    for page in PAGES:
+        runs = [spawn("--child", page, *child_args) for _ in range(repeat)]
+        disallowed[page] = sorted({name for r in runs for name in r["heavy"]} - set(ALLOWED.get(page, ())))
+        results[page.lower()] = {
+            "first_render_ms": statistics.median(r["first_render_ms"] for r in runs),
+            "run_ms": statistics.median(r["run_ms"] for r in runs),
+            "modules_loaded": runs[0]["modules_loaded"],
+            "heavy_modules": len(disallowed[page]),
+        }
+        print(f"\nSlowest imports for {page} (ms, self / cumulative):")
+        for row in runs[0]["imports"]:
+            print(f"  {row['self_ms']:8.1f} {row['cumulative_ms']:8.1f}  {row['module']}")
+    results["eager_imports"] = {"import_ms": statistics.median(spawn("--eager")["import_ms"] for _ in range(repeat))}
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=3, help="fresh processes per page (median)")
+    parser.add_argument("--check", action="store_true", help="exit 1 if Home or Login import a heavy module")
+    parser.add_argument("--stub", action="store_true",
+                        help="render under a stand-in streamlit module (the default when Streamlit isn't installed)")
+    parser.add_argument("--child", choices=PAGES, help=argparse.SUPPRESS)
+    parser.add_argument("--eager", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+    stub = args.stub or importlib.util.find_spec("streamlit") is None
+    if args.child:
+        print(json.dumps(stub_child(args.child) if stub else child(args.child)))
+        sys.exit(0)
+    if args.eager:
+        print(json.dumps(eager_child()))
+        sys.exit(0)
+    results = run(1 if args.check else args.repeat, stub)
+    print_table("Startup (first render in a fresh process" + (", stand-in streamlit)" if stub else ")"), results)
+    save_json(args.json, results)
+    failed = {page: names for page, names in disallowed.items() if names}
+    for page, names in failed.items():
+        print(f"FAIL: the {page} page imported {', '.join(names)}")
+    if args.check:
+        print("Startup guard: " + ("failed" if failed else "ok, no heavy imports on Home or Login"))
+        sys.exit(1 if failed else 0)
@@ -0,0 +1,183 @@
+"""
+Real-time factor (transcription seconds per second of audio) of
+voice_utils' in-memory transcription: batch mode over a set of clips and
+streaming mode with VAD chunking and partial transcripts. With Whisper
+installed it also times the old temp-file round trip for comparison.
+
+The audio samples are generated into a temp directory: speech from a local
+TTS engine when one is installed (eSpeak NG / Piper), otherwise voiced
+tone bursts with pauses, which exercise the VAD and the data path but not
+Whisper's accuracy. Without Whisper a stand-in model whose cost is
+proportional to the audio length is used (--stub-rtf).
+
+    python benchmarks/bench_transcribe.py --clips 8
+    python benchmarks/bench_transcribe.py --whisper-model tiny
+"""
+import argparse
+import os
+import statistics
+import tempfile
+import time
+
+import numpy as np
+
+import _common  # noqa: F401  (sets up sys.path)
+from _common import print_table, save_json
+
+from backend import tts, voice_utils
+
+SR = voice_utils.SAMPLE_RATE
+SENTENCES = [
+    "Open the memories page and show me what I did last week.",
+    "Generate an image of a lighthouse at dusk in watercolor.",
+    "What was the last project I worked on?",
+    "Run the script again with a longer timeout please.",
+    "Remind me to back up the database tomorrow morning.",
+    "How many tokens per second is the model generating right now?",
+]
+
+
+class StubWhisper:
+    """Stand-in for a Whisper model: sleeps rtf seconds per second of audio."""
+
+    def __init__(self, rtf: float = 0.05):
+        self.rtf = rtf
+
+    def transcribe(self, audio, **options):
+        seconds = len(audio) / SR
+        time.sleep(seconds * self.rtf)
+        return {"text": f" ({seconds:.1f}s of speech)"}
+
+
+def _tone_utterance(rng, seconds: float) -> np.ndarray:
+    # Voiced "syllables": a pitch-modulated harmonic tone with a syllable-rate envelope
+    t = np.arange(int(seconds * SR)) / SR
+    pitch = 140 + 30 * np.sin(2 * np.pi * 0.7 * t + rng.uniform(0, 6))
+    phase = 2 * np.pi * np.cumsum(pitch) / SR
+    voice = sum(np.sin(k * phase) / k for k in range(1, 6))
+    envelope = 0.5 + 0.5 * np.sin(2 * np.pi * 4 * t) ** 2
+    return (0.15 * voice * envelope).astype(np.float32)
+
+
+def make_samples(directory: str, clips: int) -> list[str]:
+    """Writes `clips` WAV files of two utterances each and returns their paths."""
+    try:
+        engine = tts.get_engine()
+    except tts.TTSUnavailable:
+        engine = None
+    use_speech = engine is not None and engine.name in ("espeak", "piper")
+    rng = np.random.default_rng(0)
+    paths = []
+    for i in range(clips):
+        parts = [rng.normal(0, 0.003, int(SR * 0.4)).astype(np.float32)]
+        for j in range(2):
+            if use_speech:
+                utterance = voice_utils.load_audio(engine.synthesize(SENTENCES[(2 * i + j) % len(SENTENCES)]))
+            else:
+                utterance = _tone_utterance(rng, rng.uniform(1.5, 4.0))
+            parts += [utterance, rng.normal(0, 0.003, int(SR * 0.9)).astype(np.float32)]
+        audio = np.concatenate(parts)
+        path = os.path.join(directory, f"sample_{i:02d}.wav")
+        with open(path, "wb") as f:
+            f.write(tts.pcm_to_wav((np.clip(audio, -1, 1) * 32767).astype("<i2").tobytes(), SR))
+        paths.append(path)
+    return paths
+
+
+def _audio_seconds(paths) -> float:
+    return sum(len(voice_utils.load_audio(path)) for path in paths) / SR
+
+
+def bench_batch(model, paths) -> dict:
+    start = time.perf_counter()
+    texts = voice_utils.transcribe_batch(paths, model=model)
+    elapsed = time.perf_counter() - start
+    return {"clips": len(texts), "rtf": elapsed / _audio_seconds(paths)}
+
+
+def bench_temp_file(model, paths) -> dict:
+    # The previous implementation: write a temp WAV, let Whisper decode it with ffmpeg
+    import whisper
+
+    load_times = []
+    start = time.perf_counter()
+    for path in paths:
+        with open(path, "rb") as f:
+            data = f.read()
+        t0 = time.perf_counter()
+        with tempfile.NamedTemporaryFile(delete=False, suffix=".wav") as tmp_file:
+            tmp_file.write(data)
+        samples = whisper.load_audio(tmp_file.name)
+        os.remove(tmp_file.name)
+        load_times.append(time.perf_counter() - t0)
+        model.transcribe(samples, fp16=False)
+    elapsed = time.perf_counter() - start
+    return {"clips": len(paths), "rtf": elapsed / _audio_seconds(paths),
+            "load_ms": statistics.median(load_times) * 1000}
+
+
+def bench_in_memory_load(paths) -> dict:
+    blobs = []
+    for path in paths:
+        with open(path, "rb") as f:
+            blobs.append(f.read())
+    times = []
+    for blob in blobs:
+        t0 = time.perf_counter()
+        voice_utils.load_audio(blob)
+        times.append(time.perf_counter() - t0)
+    return {"load_ms": statistics.median(times) * 1000}
+
+
+def bench_streaming(model, paths, chunk_ms: int = 100) -> dict:
+    rtfs, latencies, first_partials, segments = [], [], [], 0
+    chunk = SR * chunk_ms // 1000
+    for path in paths:
+        audio = voice_utils.load_audio(path)
+        first_partial = []
+        start = time.perf_counter()
+        transcriber = voice_utils.StreamingTranscriber(
+            model=model, on_partial=lambda text: first_partial or first_partial.append(time.perf_counter() - start))
+        for i in range(0, len(audio), chunk):
+            transcriber.feed(audio[i:i + chunk])
+        transcriber.finish()
+        rtfs.append(transcriber.real_time_factor)
+        latencies += transcriber.final_latencies
+        first_partials += first_partial
+        segments += len(transcriber.finals)
+    return {
+        "segments": segments, "rtf": statistics.fmean(rtfs),
+        "final_latency_ms": statistics.median(latencies) * 1000 if latencies else float("nan"),
+        "first_partial_ms": statistics.median(first_partials) * 1000 if first_partials else float("nan"),
+    }
+
+
+def run(clips: int = 8, whisper_model: str | None = None, stub_rtf: float = 0.05) -> dict:
+    directory = tempfile.mkdtemp(prefix="sahilgpt-audio-samples-")
+    paths = make_samples(directory, clips)
+    if whisper_model:
+        import whisper
+        model = whisper.load_model(whisper_model)
+    else:
+        model = StubWhisper(stub_rtf)
+    results = {
+        "in_memory_load": bench_in_memory_load(paths),
+        "batch": bench_batch(model, paths),
+        "streaming": bench_streaming(model, paths),
+    }
+    if whisper_model:
+        results["temp_file_batch"] = bench_temp_file(model, paths)
+    results["samples"] = {"clips": clips, "audio_s": _audio_seconds(paths)}
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clips", type=int, default=8)
+    parser.add_argument("--whisper-model", help="e.g. tiny or base (needs openai-whisper); default: stand-in model")
+    parser.add_argument("--stub-rtf", type=float, default=0.05, help="stand-in model cost per second of audio")
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+    results = run(args.clips, args.whisper_model, args.stub_rtf)
+    print_table("Transcription (rtf = processing seconds per audio second)", results)
+    save_json(args.json, results)
@@ -0,0 +1,88 @@
+"""
+Time to first audio for a streamed chat reply: synthesizing the whole reply
+after the LLM finishes (the old behaviour) versus sentence-level streaming
+while tokens are still arriving, and streaming again with a warm audio cache.
+
+Tokens arrive at a fixed rate to stand in for the LLM. The stub engine
+simulates synthesis cost per character; --engine espeak (or piper) measures
+a real local engine instead.
+
+    python benchmarks/bench_tts.py --runs 5
+    python benchmarks/bench_tts.py --engine espeak
+"""
+import argparse
+import statistics
+import tempfile
+import time
+
+import _common  # noqa: F401  (sets up sys.path)
+from _common import print_table, save_json
+
+from backend import tts
+
+REPLY = (
+    "Sure, here's a quick overview of how the project is organised. "
+    "The backend folder holds one module per feature, such as memory, face recognition and image generation. "
+    "The frontend is a single Streamlit app that imports those modules. "
+    "Models are loaded lazily by the registry and unloaded when they have been idle. "
+    "If you want to add a feature, start with a backend module and then add a page for it. "
+    "Let me know if you'd like a walkthrough of any of these parts!"
+)
+
+
+def _tokens(text: str, chars_per_token: int = 4):
+    for i in range(0, len(text), chars_per_token):
+        yield text[i:i + chars_per_token]
+
+
+def _stream_reply(token_delay: float, on_token):
+    for token in _tokens(REPLY):
+        time.sleep(token_delay)
+        on_token(token)
+
+
+def whole_reply(engine, token_delay: float) -> float:
+    chunks = []
+    start = time.perf_counter()
+    _stream_reply(token_delay, chunks.append)
+    tts.synthesize(tts.speakable("".join(chunks)), engine, use_cache=False)
+    return time.perf_counter() - start
+
+
+def streamed(engine, token_delay: float, use_cache: bool) -> float:
+    speech = tts.SpeechStream(engine, use_cache=use_cache)
+    _stream_reply(token_delay, speech.feed)
+    speech.close()
+    return speech.time_to_first_audio
+
+
+def run(engine_name: str = "stub", runs: int = 5, token_delay: float = 0.02, seconds_per_char: float = 0.002) -> dict:
+    tts.AUDIO_CACHE_DIR = tempfile.mkdtemp(prefix="sahilgpt-audio-cache-")
+    tts._cache = None
+    engine = tts.StubEngine(seconds_per_char) if engine_name == "stub" else tts.get_engine(engine_name)
+    cases = {
+        "whole_reply": lambda: whole_reply(engine, token_delay),
+        "sentence_stream": lambda: streamed(engine, token_delay, use_cache=False),
+        "sentence_stream_cached": lambda: streamed(engine, token_delay, use_cache=True),
+    }
+    streamed(engine, token_delay, use_cache=True)  # warm the cache
+    results = {}
+    for name, case in cases.items():
+        times = [case() for _ in range(runs)]
+        results[name] = {"ttfa_ms": statistics.median(times) * 1000, "runs": runs}
+    generation_ms = len(list(_tokens(REPLY))) * token_delay * 1000
+    results["llm_generation"] = {"total_ms": generation_ms}
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--engine", default="stub", choices=list(tts.ENGINES))
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--token-delay", type=float, default=0.02, help="seconds between LLM tokens")
+    parser.add_argument("--seconds-per-char", type=float, default=0.002, help="stub engine synthesis cost")
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+    results = run(args.engine, args.runs, args.token_delay, args.seconds_per_char)
+    print_table(f"Time to first audio ({args.engine} engine)", results)
+    save_json(args.json, results)
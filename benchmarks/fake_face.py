@@ -0,0 +1,117 @@
+"""
+Synthetic webcam frames, enrollment photos and stand-ins for
+face_recognition's detector and encoder, so the face pipeline and enrollment
+can be benchmarked without dlib or a camera.
+
+The stand-ins do real numpy work proportional to the number of pixels they
+see (like HOG/CNN detection does), so downscaling, frame skipping and
+tracking show up in the numbers.
+"""
+import io
+
+import numpy as np
+from PIL import Image, ImageFilter
+
+FRAME_SHAPE = (480, 640, 3)
+FACE_SIZE = 160
+
+
+def make_face_texture(seed: int, size: int = FACE_SIZE) -> np.ndarray:
+    """A bright, person-specific pattern standing in for a face."""
+    rng = np.random.default_rng(seed)
+    return rng.integers(215, 248, size=(size, size, 3), dtype=np.uint8)
+
+
+def make_frames(count: int = 120, seed: int = 0, person: int = 1, shape=FRAME_SHAPE,
+                face_every: int = 1) -> list[np.ndarray]:
+    """
+    BGR frames with one face drifting slowly across a noisy background.
+    face_every > 1 leaves the face out of some frames (looking away).
+    """
+    rng = np.random.default_rng(seed)
+    background = rng.integers(0, 180, size=shape, dtype=np.uint8)
+    face = make_face_texture(person)
+    frames = []
+    height, width = shape[:2]
+    for i in range(count):
+        frame = background.copy()
+        if i % face_every == 0:
+            y = 100 + int(20 * np.sin(i / 15))
+            x = 200 + int(40 * np.cos(i / 20))
+            frame[y:y + FACE_SIZE, x:x + FACE_SIZE] = face
+        noise = rng.integers(0, 8, size=shape, dtype=np.uint8)
+        frames.append(frame + noise)
+    return frames
+
+
+def detect(image: np.ndarray, model: str = "hog"):
+    """Finds the bright squares (side by side). "cnn" does several times the work of "hog"."""
+    passes = 8 if model == "cnn" else 1
+    gray = image.mean(axis=2)
+    for _ in range(passes):
+        # Gradient energy over the whole image, the dominant cost of real detectors
+        np.abs(np.diff(gray, axis=0)).sum() + np.abs(np.diff(gray, axis=1)).sum()
+    mask = gray > 212
+    cols = np.flatnonzero(mask.any(axis=0))
+    boxes = []
+    # One box per run of bright columns
+    for run in np.split(cols, np.flatnonzero(np.diff(cols) > 1) + 1):
+        if len(run) < 8:
+            continue
+        rows = np.flatnonzero(mask[:, run[0]:run[-1] + 1].any(axis=1))
+        if len(rows) >= 8:
+            boxes.append((int(rows[0]), int(run[-1]) + 1, int(rows[-1]) + 1, int(run[0])))
+    return boxes
+
+
+# Scaled so the same face lands around 0.15 apart and different faces around 0.9
+_PROJECTION = np.random.default_rng(1234).normal(size=(16 * 16, 128)) / 16 / 100
+
+
+def encode(image: np.ndarray, boxes):
+    """A 128-d "encoding" of each box: a fixed random projection of a 16x16 thumbnail."""
+    encodings = []
+    for top, right, bottom, left in boxes:
+        # Re-align on the face inside a margin around the box, like the landmark
+        # step of a real encoder does, so slightly stale (tracked) boxes still work
+        margin = (bottom - top) // 4
+        region = image[max(0, top - margin):bottom + margin, max(0, left - margin):right + margin]
+        gray = region.mean(axis=2)
+        mask = gray > 212
+        rows, cols = np.flatnonzero(mask.any(axis=1)), np.flatnonzero(mask.any(axis=0))
+        if len(rows) < 8 or len(cols) < 8:
+            continue
+        crop = gray[rows[0]:rows[-1] + 1, cols[0]:cols[-1] + 1]
+        ys = np.linspace(0, crop.shape[0] - 1, 16).astype(int)
+        xs = np.linspace(0, crop.shape[1] - 1, 16).astype(int)
+        thumb = crop[np.ix_(ys, xs)].reshape(-1)
+        encodings.append((thumb - thumb.mean()) @ _PROJECTION)
+    return encodings
+
+
+def enrolled_encoding(person: int = 1) -> np.ndarray:
+    """What enrollment would store for `person` (mirrored, like the login frames)."""
+    face = make_face_texture(person)[:, ::-1, ::-1]
+    return encode(np.ascontiguousarray(face), [(0, FACE_SIZE, FACE_SIZE, 0)])[0]
+
+
+def make_photo(person: int = 1, size=(3000, 2000), faces: int = 1, blur: float = 0, seed: int = 0,
+               quality: int = 90) -> bytes:
+    """
+    A JPEG "enrollment photo": faces (upscaled, so they survive downscaling)
+    side by side on a noisy background, optionally Gaussian-blurred.
+    """
+    rng = np.random.default_rng(seed)
+    width, height = size
+    background = rng.integers(0, 180, size=(height, width, 3), dtype=np.uint8)
+    face_px = min(height // 2, width // (2 * faces + 1))
+    for i in range(faces):
+        face = Image.fromarray(make_face_texture(person + i)).resize((face_px, face_px), Image.NEAREST)
+        y, x = height // 4, face_px // 2 + i * 2 * face_px
+        background[y:y + face_px, x:x + face_px] = np.asarray(face)
+    image = Image.fromarray(background[:, :, ::-1])  # the textures are BGR, like the frames
+    if blur:
+        image = image.filter(ImageFilter.GaussianBlur(blur * face_px / FACE_SIZE))
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG", quality=quality)
+    return buffer.getvalue()
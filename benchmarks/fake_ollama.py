@@ -0,0 +1,244 @@
+"""
+A local stand-in for the Ollama HTTP API, for benchmarks and offline testing.
+
+Implements enough of /api/generate and /api/chat to exercise the real
+clients: non-streaming replies, chunked NDJSON streaming with a configurable
+time-to-first-token and per-token delay, keep-alive connections and the
+timing fields Ollama reports.
+
+Optionally it also models the costs a conversation cares about: prompt
+evaluation proportional to the tokens after the longest prefix cached in one
+of a few KV-cache slots (like Ollama's runner), and a model load whenever the
+previous request's keep_alive has run out.
+
+    with FakeOllamaServer(first_token_delay=0.05, token_delay=0.01) as server:
+        llm_client.configure(base_url=server.base_url)
+"""
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive + chunked responses
+    disable_nagle_algorithm = True  # small NDJSON writes must not wait for ACKs
+
+    def log_message(self, *args):
+        pass
+
+    def _read_json(self) -> dict:
+        length = int(self.headers.get("Content-Length", 0))
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def _send_json(self, data: dict, status: int = 200):
+        body = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _write_chunk(self, data: dict):
+        line = (json.dumps(data) + "\n").encode()
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(line), line))
+        self.wfile.flush()
+
+    def do_GET(self):
+        if self.path == "/api/tags":
+            self._send_json({"models": [{"name": self.server.owner.model}]})
+        else:
+            self._send_json({"error": "not found"}, status=404)
+
+    def do_POST(self):
+        owner = self.server.owner
+        request = self._read_json()
+        owner._record(self.path, request)
+
+        if self.path not in ("/api/generate", "/api/chat"):
+            self._send_json({"error": "not found"}, status=404)
+            return
+        chat = self.path == "/api/chat"
+
+        tokens = owner.reply_tokens(request)
+        start = time.perf_counter()
+        prompt_tokens, prompt_seconds, load_seconds = owner.prepare(request, tokens)
+        time.sleep(load_seconds + prompt_seconds)
+
+        def message(text, done=False, **fields):
+            if chat:
+                return {"model": request.get("model"), "message": {"role": "assistant", "content": text},
+                        "done": done, **fields}
+            return {"model": request.get("model"), "response": text, "done": done, **fields}
+
+        if not request.get("stream", True):
+            time.sleep(owner.token_delay * max(0, len(tokens) - 1))
+            self._send_json(message("".join(tokens), True, **owner.final_fields(
+                request, len(tokens), prompt_tokens, prompt_seconds, load_seconds, start)))
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        try:
+            for i, token in enumerate(tokens):
+                if i:
+                    time.sleep(owner.token_delay)
+                self._write_chunk(message(token))
+            self._write_chunk(message("", True, **owner.final_fields(
+                request, len(tokens), prompt_tokens, prompt_seconds, load_seconds, start)))
+            self.wfile.write(b"0\r\n\r\n")
+        except (BrokenPipeError, ConnectionResetError):
+            # Client hung up mid-stream (cancellation)
+            owner.cancelled += 1
+            self.close_connection = True
+
+
+class FakeOllamaServer:
+    """
+    Args:
+        first_token_delay: Seconds before the first token (simulated prompt eval).
+        token_delay: Seconds between tokens.
+        reply: Text of every reply; split on spaces into tokens.
+        model: Model name reported by /api/tags.
+        prompt_token_delay: Seconds per prompt token that isn't in a KV-cache
+            slot (prompt tokens are whitespace-separated words).
+        load_delay: Seconds to load the model when it isn't loaded (first
+            request, or the last request's keep_alive has expired).
+        slots: Number of KV-cache slots (Ollama's OLLAMA_NUM_PARALLEL).
+    """
+
+    def __init__(self, first_token_delay: float = 0.02, token_delay: float = 0.005,
+                 reply: str = "This is a reply from the stand-in Ollama server.",
+                 model: str = "llama3.1:70b", host: str = "127.0.0.1", port: int = 0,
+                 prompt_token_delay: float = 0.0, load_delay: float = 0.0, slots: int = 4):
+        self.first_token_delay = first_token_delay
+        self.token_delay = token_delay
+        self.reply = reply
+        self.model = model
+        self.prompt_token_delay = prompt_token_delay
+        self.load_delay = load_delay
+        self.slots = slots
+        self.requests = []
+        self.cancelled = 0
+        self.loads = 0
+        self._cache = []  # token lists, most recently used last
+        self._loaded_until = None
+        self._lock = threading.Lock()
+        self._httpd = ThreadingHTTPServer((host, port), _Handler)
+        self._httpd.daemon_threads = True
+        self._httpd.owner = self
+        self._thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def reply_tokens(self, request: dict) -> list[str]:
+        words = self.reply.split(" ")
+        return [w if i == 0 else " " + w for i, w in enumerate(words)]
+
+    @staticmethod
+    def prompt_tokens(request: dict) -> list[str]:
+        if "messages" in request:
+            tokens = []
+            for message in request["messages"]:
+                tokens.append(f"<{message.get('role')}>")
+                tokens += str(message.get("content", "")).split()
+            return tokens + ["<assistant>"]
+        return str(request.get("system", "")).split() + str(request.get("prompt", "")).split()
+
+    @staticmethod
+    def keep_alive_seconds(value) -> float:
+        if value is None:
+            return 300.0
+        if isinstance(value, str) and value[-1:] in ("s", "m", "h"):
+            return float(value[:-1]) * {"s": 1, "m": 60, "h": 3600}[value[-1]]
+        value = float(value)
+        return float("inf") if value < 0 else value
+
+    def prepare(self, request: dict, reply_tokens: list[str]) -> tuple[int, float]:
+        """
+        Loads the model if needed and finds the KV-cache slot sharing the longest
+        prefix with the prompt. Returns (prompt tokens evaluated, prompt eval
+        seconds, load seconds).
+        """
+        tokens = self.prompt_tokens(request)
+        with self._lock:
+            now = time.monotonic()
+            load_seconds = 0.0
+            if self._loaded_until is None or now > self._loaded_until:
+                self.loads += 1
+                self._cache.clear()
+                load_seconds = self.load_delay
+            self._loaded_until = now + self.keep_alive_seconds(request.get("keep_alive"))
+            best, best_prefix = None, 0
+            for i, cached in enumerate(self._cache):
+                prefix = 0
+                for a, b in zip(cached, tokens):
+                    if a != b:
+                        break
+                    prefix += 1
+                if prefix > best_prefix:
+                    best, best_prefix = i, prefix
+            if best is not None:
+                self._cache.pop(best)
+            elif len(self._cache) >= self.slots:
+                self._cache.pop(0)
+            # The slot now holds the prompt and the reply about to be generated
+            self._cache.append(tokens + "".join(reply_tokens).split())
+        evaluated = len(tokens) - best_prefix
+        return evaluated, self.first_token_delay + evaluated * self.prompt_token_delay, load_seconds
+
+    def final_fields(self, request: dict, eval_count: int, prompt_eval_count: int,
+                     prompt_seconds: float, load_seconds: float, start: float) -> dict:
+        total_ns = int((time.perf_counter() - start) * 1e9)
+        return {
+            "total_duration": total_ns,
+            "load_duration": int(load_seconds * 1e9),
+            "prompt_eval_count": prompt_eval_count,
+            "prompt_eval_duration": int(prompt_seconds * 1e9),
+            "eval_count": eval_count,
+            "eval_duration": max(1, int(self.token_delay * eval_count * 1e9)),
+        }
+
+    def _record(self, path: str, request: dict):
+        with self._lock:
+            self.requests.append((path, request))
+
+    def start(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Run a stand-in Ollama server.")
+    parser.add_argument("--port", type=int, default=11434)
+    parser.add_argument("--first-token-delay", type=float, default=0.2)
+    parser.add_argument("--token-delay", type=float, default=0.03)
+    parser.add_argument("--prompt-token-delay", type=float, default=0.0)
+    parser.add_argument("--load-delay", type=float, default=0.0)
+    args = parser.parse_args()
+    server = FakeOllamaServer(args.first_token_delay, args.token_delay, port=args.port,
+                              prompt_token_delay=args.prompt_token_delay, load_delay=args.load_delay)
+    print(f"Stand-in Ollama listening on {server.base_url}")
+    server.start()
+    try:
+        server._thread.join()
+    except KeyboardInterrupt:
+        server.stop()
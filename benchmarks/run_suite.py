@@ -0,0 +1,260 @@
+"""
+Runs every benchmark offline (fake Ollama server, synthetic faces and
+frames, tiny random diffusion pipeline, generated speech clips, seeded
+SQLite, snippet corpora), each in its own process with a fresh temp dir and
+database, and collects latency percentiles, throughput and peak memory.
+
+Results can be saved as a JSON baseline and later runs compared against it;
+the run exits with status 1 when any metric regresses by more than the
+threshold (or a benchmark fails), so it can gate a change.
+
+    python benchmarks/run_suite.py --repeat 3 --save-baseline
+    python benchmarks/run_suite.py --repeat 3 --compare --threshold 0.25
+    python benchmarks/run_suite.py --only memory_db tts --compare
+    python benchmarks/run_suite.py --full --json results.json
+
+Baselines are machine specific; save one on the box the comparisons run on.
+"""
+import argparse
+import datetime
+import importlib.util
+import json
+import math
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+import _common  # noqa: F401  (sets up sys.path)
+from _common import save_json
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_BASELINE = os.path.join(BENCH_DIR, "baselines", "baseline.json")
+DEFAULT_THRESHOLD = 0.25
+# Time metrics where both values are below this are noise, not regressions
+NOISE_FLOOR_MS = 0.1
+# p95/p99 of fewer samples than this is just the slowest one or two; not compared
+TAIL_MIN_COUNT = 50
+
+# name -> (quick-suite arguments, modules the benchmark needs)
+BENCHMARKS = {
+    "llm_client": (["--requests", "100"], ()),
+    "llm_cache": (["--questions", "60", "--distinct", "15", "--first-token-delay", "0.05", "--token-delay", "0.002"], ()),
+    "conversation": (["--turns", "30", "--load-delay", "0.1"], ()),
+    "face_pipeline": (["--count", "60"], ()),
+    "face_enroll": (["--photos", "8", "--workers", "2"], ()),
+    "image_gen": (["--images", "1"], ("torch", "diffusers", "transformers")),
+    "transcribe": (["--clips", "4"], ()),
+    "tts": (["--runs", "3"], ()),
+    "memory_db": (["--rows", "1000"], ()),
+    "memory_search": (["--rows", "50000", "--repeat", "10"], ()),
+    "memory_index": (["--rows", "50000", "--repeat", "10"], ()),
+    "code_runner": (["--runs", "10", "--parallel", "2"], ()),
+    "project_index": (["--projects", "5", "--files", "1000", "--queries", "2000"], ()),
+    "rerun": (["--rows", "20000", "--reruns", "50"], ()),
+    "daemon": (["--sessions", "4", "--seconds", "3", "--load-delay", "0.5"], ()),
+    "memory_retention": (["--rows", "30000", "--years", "2", "--repeat", "5"], ()),
+    "startup": (["--check"], ()),  # the startup guard; fails the suite if Home or Login import a heavy module
+}
+
+LOWER_IS_BETTER = ("ms", "s", "rtf", "mb")
+HIGHER_IS_BETTER = ("per_sec", "fps", "hit_rate", "speedup")
+
+
+def direction(metric: str) -> int:
+    """-1 if a larger value is worse, 1 if a smaller value is worse, 0 if informational."""
+    suffix = metric.rsplit("_", 1)[-1]
+    if metric.endswith(HIGHER_IS_BETTER):
+        return 1
+    if suffix in LOWER_IS_BETTER:
+        return -1
+    return 0
+
+
+def missing_modules(modules) -> list[str]:
+    return [name for name in modules if importlib.util.find_spec(name) is None]
+
+
+def run_benchmark(name: str, args: list[str], verbose: bool = False) -> dict:
+    """Runs benchmarks/bench_<name>.py in a child process; returns its results plus wall time and peak RSS."""
+    workdir = tempfile.mkdtemp(prefix=f"sahilgpt-suite-{name}-")
+    json_path = os.path.join(workdir, "results.json")
+    env = dict(os.environ, SAHILGPT_DB_PATH=os.path.join(workdir, "memory.db"), PYTHONUNBUFFERED="1")
+    command = [sys.executable, os.path.join(BENCH_DIR, f"bench_{name}.py"), *args, "--json", json_path]
+
+    start = time.perf_counter()
+    # cwd is the temp dir so data/ caches the backend creates don't land in the repo
+    process = subprocess.Popen(command, cwd=workdir, env=env, stdout=subprocess.PIPE,
+                               stderr=subprocess.STDOUT, text=True)
+    output = process.stdout.read()
+    # wait4 gives this child's own rusage (RUSAGE_CHILDREN would be the max over all of them)
+    _, status, usage = os.wait4(process.pid, 0)
+    process.returncode = os.waitstatus_to_exitcode(status)
+    wall = time.perf_counter() - start
+    if verbose or process.returncode != 0:
+        print(output)
+
+    entry = {"wall_s": wall, "peak_rss_mb": usage.ru_maxrss / 1024, "returncode": process.returncode}
+    if process.returncode != 0 or not os.path.exists(json_path):
+        entry["error"] = output.strip().splitlines()[-1] if output.strip() else f"exit status {process.returncode}"
+        return entry
+    with open(json_path) as f:
+        entry["cases"] = json.load(f)
+    return entry
+
+
+def best_of(entries: list[dict]) -> dict:
+    """Merges repeated runs of one benchmark, keeping each metric's best value (less noise than any one run)."""
+    merged = json.loads(json.dumps(entries[0]))
+    for entry in entries[1:]:
+        if "error" in entry:
+            return entry
+        for metric in ("wall_s", "peak_rss_mb"):
+            merged[metric] = min(merged[metric], entry[metric])
+        for case, metrics in entry.get("cases", {}).items():
+            target = merged["cases"].get(case)
+            if not isinstance(metrics, dict) or not isinstance(target, dict):
+                continue
+            for metric, value in metrics.items():
+                sign = direction(metric)
+                old = target.get(metric)
+                if sign and isinstance(value, (int, float)) and isinstance(old, (int, float)):
+                    target[metric] = max(old, value) if sign > 0 else min(old, value)
+    merged["runs"] = len(entries)
+    return merged
+
+
+def flatten(report: dict) -> dict:
+    """{"bench/case/metric": value} for every numeric or boolean metric in a suite report."""
+    flat = {}
+    for name, entry in report["benchmarks"].items():
+        for metric in ("wall_s", "peak_rss_mb"):
+            if metric in entry:
+                flat[f"{name}/process/{metric}"] = entry[metric]
+        for case, metrics in entry.get("cases", {}).items():
+            if not isinstance(metrics, dict):
+                continue
+            for metric, value in metrics.items():
+                if isinstance(value, (int, float)):
+                    flat[f"{name}/{case}/{metric}"] = value
+    return flat
+
+
+def compare(report: dict, baseline: dict, threshold: float) -> tuple[list, list]:
+    """Returns (regressions, improvements) as (key, baseline value, current value, relative change) rows."""
+    current, previous = flatten(report), flatten(baseline)
+    regressions, improvements = [], []
+    for key, value in sorted(current.items()):
+        if key not in previous:
+            continue
+        old = previous[key]
+        metric = key.rsplit("/", 1)[-1]
+        if isinstance(old, bool) or isinstance(value, bool):
+            if old and not value:
+                regressions.append((key, old, value, float("nan")))
+            continue
+        if metric in ("p95_ms", "p99_ms"):
+            case = key.rsplit("/", 1)[0]
+            if min(current.get(f"{case}/count", 0), previous.get(f"{case}/count", 0)) < TAIL_MIN_COUNT:
+                continue
+        sign = direction(metric)
+        if not sign or not old or math.isnan(old) or math.isnan(value):
+            continue
+        unit = metric.rsplit("_", 1)[-1]
+        if unit in ("ms", "s") and max(old, value) * (1000 if unit == "s" else 1) < NOISE_FLOOR_MS:
+            continue
+        change = (value - old) / abs(old)
+        if -sign * change > threshold:
+            regressions.append((key, old, value, change))
+        elif sign * change > threshold:
+            improvements.append((key, old, value, change))
+    return regressions, improvements
+
+
+def print_changes(title: str, rows: list):
+    print(f"\n== {title} ==")
+    if not rows:
+        print("  none")
+    for key, old, value, change in rows:
+        print(f"  {key:<58} {old:>12.4g} -> {value:<12.4g} {change:+.0%}")
+
+
+def print_report(report: dict):
+    for name, entry in report["benchmarks"].items():
+        status = entry.get("error") or entry.get("skipped") or "ok"
+        print(f"\n== {name} ({status}, {entry.get('wall_s', 0):.1f} s, peak {entry.get('peak_rss_mb', 0):.0f} MB) ==")
+        for case, metrics in entry.get("cases", {}).items():
+            if not isinstance(metrics, dict):
+                continue
+            parts = [f"{key}={value:.2f}" if isinstance(value, float) else f"{key}={value}"
+                     for key, value in metrics.items()]
+            print(f"  {case:<28} " + "  ".join(parts))
+
+
+def run(only: list[str] | None = None, full: bool = False, repeat: int = 1, verbose: bool = False) -> dict:
+    report = {
+        "created": datetime.datetime.now().isoformat(timespec="seconds"),
+        "suite": "full" if full else "quick",
+        "repeat": repeat,
+        "machine": {"platform": platform.platform(), "python": platform.python_version(),
+                    "cpus": os.cpu_count(), "node": platform.node()},
+        "benchmarks": {},
+    }
+    for name, (args, requires) in BENCHMARKS.items():
+        if only and name not in only:
+            continue
+        missing = missing_modules(requires)
+        if missing:
+            report["benchmarks"][name] = {"skipped": f"needs {', '.join(missing)}"}
+            print(f"-- {name}: skipped (needs {', '.join(missing)})")
+            continue
+        print(f"-- {name} ...", flush=True)
+        entries = []
+        for _ in range(repeat):
+            entries.append(run_benchmark(name, [] if full else args, verbose))
+            if "error" in entries[-1]:
+                break
+        report["benchmarks"][name] = best_of(entries)
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--only", nargs="+", choices=list(BENCHMARKS), help="run just these benchmarks")
+    parser.add_argument("--full", action="store_true", help="use each benchmark's default (larger) sizes")
+    parser.add_argument("--repeat", type=int, default=1, help="run each benchmark N times and keep the best values")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="baseline file (default: %(default)s)")
+    parser.add_argument("--save-baseline", action="store_true", help="write the results as the new baseline")
+    parser.add_argument("--compare", action="store_true", help="fail if a metric regressed past the threshold")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="allowed relative regression, e.g. 0.25 = 25%% (default: %(default)s)")
+    parser.add_argument("--verbose", action="store_true", help="show each benchmark's own output")
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+
+    report = run(args.only, args.full, args.repeat, args.verbose)
+    print_report(report)
+    save_json(args.json, report)
+    failed = [name for name, entry in report["benchmarks"].items() if "error" in entry]
+
+    exit_code = 0
+    if args.compare:
+        if not os.path.exists(args.baseline):
+            sys.exit(f"No baseline at {args.baseline}; run with --save-baseline first")
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline.get("suite") != report["suite"]:
+            print(f"\nWarning: baseline is from the {baseline.get('suite')} suite, this run is {report['suite']}")
+        regressions, improvements = compare(report, baseline, args.threshold)
+        print_changes(f"Improvements beyond {args.threshold:.0%}", improvements)
+        print_changes(f"Regressions beyond {args.threshold:.0%}", regressions)
+        exit_code = 1 if regressions else 0
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(os.path.abspath(args.baseline)), exist_ok=True)
+        save_json(args.baseline, report)
+    if failed:
+        print(f"\nFailed: {', '.join(failed)}")
+        exit_code = 1
+    sys.exit(exit_code)
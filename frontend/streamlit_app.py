@@ -1,14 +1,21 @@
-import streamlit as st
 import sys
 import os
 import subprocess
-import numpy as np
 import time
+import datetime
 
 # Add backend to Python path
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
-from backend import face_utils, memory_db, llm_utils, code_runner, project_utils, image_gen, voice_utils
+# First, so SAHILGPT_PROFILE_STARTUP=1 can time every import after it
+from backend import startup, result_cache, metrics
+import streamlit as st
+
+# Imported when a page first uses them, so Home and Login load neither SQLAlchemy nor the model code
+(face_utils, memory_db, conversation, code_runner, project_utils, project_index, image_gen, voice_utils,
+ model_client, memory_index, memory_retention, tts, llm_cache) = (startup.lazy_module(f"backend.{name}") for name in (
+    "face_utils", "memory_db", "conversation", "code_runner", "project_utils", "project_index", "image_gen",
+    "voice_utils", "model_client", "memory_index", "memory_retention", "tts", "llm_cache"))
 
 # --- CONFIGURATION ---
 PROJECTS_BASE_DIR = os.path.expanduser("~/CODING") 
@@ -38,15 +45,21 @@ def home_page():
 
 def enroll_page():
     st.title("👤 Face Enrollment")
-    st.markdown("Upload 2-3 clear photos of your face.")
+    st.markdown("Upload a few clear photos of your face (more photos make matching more reliable).")
     uploaded_files = st.file_uploader("Choose images...", type=["jpg", "jpeg", "png"], accept_multiple_files=True)
     if st.button("Enroll My Face"):
         if uploaded_files:
             with st.spinner("Processing..."):
-                if face_utils.enroll_face(uploaded_files):
-                    st.success("Enrollment successful!"); memory_db.add_memory("User enrolled face.")
+                report = {}
+                enrolled = face_utils.enroll_face(uploaded_files, report=report)
+                skipped = ", ".join(f"{count} {reason}" for reason, count in report.get("skipped", {}).items())
+                if enrolled:
+                    st.success(f"Enrollment successful! Used {report['used']} of {len(uploaded_files)} photos.")
+                    memory_db.add_memory("User enrolled face.")
+                    if skipped:
+                        st.info(f"Skipped photos: {skipped}.")
                 else:
-                    st.error("Could not find a face in the images.")
+                    st.error(f"Could not find a usable face in the images ({skipped}).")
         else:
             st.warning("Please upload at least one image.")
     if st.button("Back to Home"): render_page("Home")
@@ -56,12 +69,15 @@ def enroll_page():
 def login_page():
     st.title("🔒 Face Scan Login")
     st.markdown("Please look at the camera to log in.")
+    # Load the face models while the user is getting in front of the camera
+    backend = model_client.get_backend()
+    backend.warmup("face")
     
     login_image = st.camera_input("Scan your face")
     
     if login_image:
         with st.spinner("Verifying..."):
-            if face_utils.verify_face(login_image):
+            if backend.verify_face(login_image):
                 st.session_state["auth"] = True
                 st.session_state["page"] = "Dashboard"
                 memory_db.add_memory("User logged in successfully via face scan.")
@@ -103,12 +119,50 @@ def dashboard_page():
     else:
         st.error(f"Could not find any projects in `{PROJECTS_BASE_DIR}`. Please check the path.")
 
+    with st.expander("🕒 Recent projects"):
+        index = project_index.get_index(PROJECTS_BASE_DIR)
+        if not index.ready.is_set():
+            st.caption("Indexing projects...")
+        for project in index.top(5):
+            edited = datetime.datetime.fromtimestamp(project["last_modified"]).strftime("%Y-%m-%d %H:%M")
+            st.markdown(f"**{project['name']}** · last edit {edited} · {project['file_count']} files")
+            for path, _ in project["recent_files"][:3]:
+                st.caption(f"`{os.path.relpath(path, project['path'])}`")
+
+    with st.expander("🧠 Loaded models"):
+        status = model_client.get_backend().status()
+        st.caption(("Model daemon" if status["remote"] else "In this process")
+                   + f" · resident: ~{status['resident_mb']:.0f} MB"
+                   + (f" of {status['budget_mb']:.0f} MB budget" if status["budget_mb"] else ""))
+        st.table(status["models"])
+        if status["queues"]:
+            st.table([{"queue": name, **stats} for name, stats in status["queues"].items()])
+
+    with st.expander("⚡ Result cache"):
+        st.table(result_cache.stats())
+        st.caption("LLM reply cache")
+        st.table([llm_cache.get_cache().stats()])
+
 def chat_page():
     if not st.session_state.get("auth"): st.warning("Access denied."); render_page("Login"); return
     st.title("💬 Chat with SAHILGPT")
-    speak_output = st.toggle("Speak responses", value=True)
+    no_speech = st.session_state.get("speech_unavailable")
+    speak_output = st.toggle("Speak responses", value=not no_speech, disabled=bool(no_speech), help=no_speech)
+    use_memories = st.toggle("Use memories", value=True, help="Add relevant past memories to the prompt.")
+    reuse_replies = st.toggle("Reuse cached replies", value=False,
+                              help="Answers deterministically (temperature 0), so a question asked before is answered instantly from the reply cache.")
     if "messages" not in st.session_state:
         st.session_state.messages = []
+    if "conversation" not in st.session_state:
+        st.session_state.conversation = conversation.Conversation()
+    chat = st.session_state.conversation
+    options = {k: v for k, v in (chat.options or {}).items() if k != "temperature"}
+    chat.options = {**options, "temperature": 0} if reuse_replies else options or None
+    chat.use_cache = reuse_replies
+    if st.session_state.messages and st.button("🧹 New conversation"):
+        st.session_state.messages = []
+        st.session_state.conversation.reset()
+        st.rerun()
     for message in st.session_state.messages:
         with st.chat_message(message["role"]):
             st.markdown(message["content"])
@@ -125,7 +179,9 @@ def chat_page():
         st.markdown("<div style='margin-top: 30px;'></div>", unsafe_allow_html=True)
         if st.button("🎤"):
             with st.spinner("Listening..."):
-                voice_prompt = voice_utils.transcribe_audio_from_mic()
+                heard = col1.empty()  # running transcript while the user speaks
+                voice_prompt = voice_utils.transcribe_audio_from_mic(on_partial=lambda text: heard.caption(text),
+                                                                    model=model_client.get_backend().whisper())
                 if voice_prompt:
                     st.session_state.voice_prompt = voice_prompt
                     st.rerun()
@@ -136,28 +192,125 @@ def chat_page():
         with st.chat_message("user"):
             st.markdown(processed_prompt)
         with st.chat_message("assistant"):
-            with st.spinner("Thinking..."):
-                response = llm_utils.get_llm_response(processed_prompt)
-                st.markdown(response)
-                if speak_output:
-                    audio_file_path = voice_utils.text_to_speech(response)
-                    if audio_file_path:
-                        st.audio(audio_file_path, autoplay=True)
-        st.session_state.messages.append({"role": "assistant", "content": response})
+            context = memory_index.memory_context(processed_prompt) if use_memories else None
+            speech = start_speech() if speak_output else None
+            response = stream_chat_response(processed_prompt, speech, context)
+            if speech is not None:
+                finish_speech(speech, spoken=not response.startswith("Error"))
         memory_db.add_memory(f"Chat: User said '{processed_prompt}'")
 
+def start_speech():
+    """
+    Starts sentence-by-sentence speech for the reply being streamed. Sentences
+    play on this computer's speakers as soon as they are synthesized when
+    PyAudio is available; otherwise the whole reply plays in the browser.
+    With the model daemon running, synthesis (and its cache) happens there.
+    Returns None (and turns speech off for the session) if no TTS engine is
+    installed.
+    """
+    backend = model_client.get_backend()
+    try:
+        engine = backend.tts_engine()
+    except (tts.TTSUnavailable, model_client.DaemonError) as e:
+        st.session_state.speech_unavailable = str(e)
+        st.warning(f"Speech is turned off: {e}")
+        return None
+    player = tts.get_player() if engine.audio_format == "wav" else None
+    on_audio = (lambda sentence, audio: player.play(audio)) if player else None
+    return tts.SpeechStream(engine, on_audio=on_audio, use_cache=not backend.remote)
+
+def stop_speech(speech):
+    """Stops synthesis and drops the sentences not yet played on the speakers."""
+    speech.cancel()
+    player = tts.get_player() if speech.on_audio is not None else None
+    if player is not None:
+        player.clear()
+
+def finish_speech(speech, spoken: bool = True):
+    if not spoken:
+        stop_speech(speech)
+        return
+    speech.close()
+    audio = speech.audio()
+    if audio:
+        st.audio(audio, format=f"audio/{speech.engine.audio_format}", autoplay=speech.on_audio is None)
+        if speech.time_to_first_audio is not None:
+            st.caption(f"First audio in {speech.time_to_first_audio:.2f}s ({speech.engine.name})")
+
+def stream_chat_response(prompt, speech=None, context=None):
+    """
+    Renders the assistant's reply token by token and returns the full text.
+    The prompt goes to the session's conversation, so the model sees the
+    earlier turns; context (recalled memories) is sent with this turn only.
+    If the run is interrupted (new input, page change), whatever arrived so far
+    is kept in the chat history. Tokens are also fed to speech (a
+    tts.SpeechStream), so the first sentence is spoken while the rest streams.
+    """
+    placeholder = st.empty()
+    placeholder.markdown("Thinking...")
+    response = ""
+    stats = {}
+    stream = st.session_state.conversation.stream(prompt, stats, context)
+    last_render = 0.0
+    finished = False
+    try:
+        for token in stream:
+            response += token
+            if speech is not None and not stats.get("error"):
+                speech.feed(token)
+            # Re-rendering markdown on every token is wasteful for fast models
+            if time.perf_counter() - last_render > 0.05:
+                placeholder.markdown(response + "▌")
+                last_render = time.perf_counter()
+        placeholder.markdown(response)
+        finished = True
+    finally:
+        stream.close()
+        if speech is not None and (not finished or stats.get("cancelled")):
+            stop_speech(speech)  # the user moved on; don't keep talking over the next run
+        response = response.strip()
+        if stats.get("cancelled") and response:
+            response += " *(interrupted)*"
+        st.session_state.messages.append({"role": "assistant", "content": response})
+    if stats.get("cached"):
+        st.caption(f"Cached reply ({stats['cached']} match) in {stats['total_time'] * 1000:.0f} ms")
+    elif stats.get("ttft") is not None:
+        caption = f"First token in {stats['ttft']:.2f}s"
+        if stats.get("tokens_per_sec"):
+            caption += f" · {stats['tokens_per_sec']:.1f} tokens/s"
+        if stats.get("prompt_eval_count") is not None and stats.get("prompt_eval_time") is not None:
+            caption += f" · {stats['prompt_eval_count']} prompt tokens evaluated in {stats['prompt_eval_time']:.2f}s"
+        st.caption(caption)
+    return response
+
 def code_runner_page():
     if not st.session_state.get("auth"): st.warning("Access denied."); render_page("Login"); return
     st.title("‍💻 Code Runner Sandbox")
     st.warning("This is a sandbox environment. The code runs locally on your machine.")
     default_code = 'import platform\n\nprint("Hello, Sahil!")\nprint(f"You are running Python {platform.python_version()}")'
     code_input = st.text_area("Enter Python code:", value=default_code, height=250)
+    timeout = st.number_input("Timeout (seconds)", min_value=1, max_value=300, value=code_runner.DEFAULT_TIMEOUT)
+    use_cache = st.checkbox("Reuse cached output", value=False,
+                            help="Only for deterministic code: an unchanged snippet returns its previous output instantly.")
     if st.button("Run Code"):
+        memory_db.add_memory("User ran code.")
+        st.subheader("Output:")
+        stdout_box = st.empty()
+        stderr_header, stderr_box = st.empty(), st.empty()
+        stdout, stderr = "", ""
+        last_render = 0.0
         with st.spinner("Executing..."):
-            result = code_runner.run_code_safely(code_input)
-            memory_db.add_memory("User ran code.")
-            st.subheader("Output:"); st.code(result["stdout"], language='bash')
-            if result["stderr"]: st.subheader("Errors:"); st.code(result["stderr"], language='bash')
+            for stream, data in model_client.get_backend().stream_code(code_input, timeout=timeout, use_cache=use_cache):
+                if stream == "stdout":
+                    stdout += data
+                elif stream == "stderr":
+                    stderr += data
+                # Redraw at most ~10 times a second; always draw the final state
+                if stream == "exit" or time.perf_counter() - last_render > 0.1:
+                    stdout_box.code(stdout, language='bash')
+                    if stderr:
+                        stderr_header.subheader("Errors:"); stderr_box.code(stderr, language='bash')
+                    last_render = time.perf_counter()
 
 # --- THIS IS THE NEW, CORRECTED IMAGE PAGE ---
 def image_gen_page():
@@ -165,35 +318,163 @@ def image_gen_page():
     
     st.title("🎨 Image Generation")
     st.markdown("Generate an image using a local Stable Diffusion model.")
-    st.warning("This will be VERY slow on a CPU (5-15 minutes). Please be patient.")
+    st.warning("This is slow on a CPU. Faster profiles use fewer steps and a smaller image.")
+    # Start loading Stable Diffusion while the user types the prompt
+    backend = model_client.get_backend()
+    backend.warmup("image")
     
     prompt = st.text_input("Enter a prompt for the image:")
+    col1, col2 = st.columns([3, 1])
+    seed = col1.number_input("Seed", min_value=0, max_value=image_gen.MAX_SEED, value=42,
+                             help="The same prompt and seed give the same image, returned instantly from the cache.")
+    random_seed = col2.checkbox("Random seed", value=False)
+    profiles = list(image_gen.PROFILES)
+    profile = st.selectbox("Performance profile", profiles, index=profiles.index(image_gen.DEFAULT_PROFILE),
+                           format_func=lambda name: f"{name} ({image_gen.PROFILES[name]['steps']} steps, "
+                                                    f"{image_gen.PROFILES[name]['size']}px)")
     
+    # Jobs run on a background worker; the page only submits them and polls their status
+    job_ids = st.session_state.setdefault("image_jobs", [])
     if st.button("Generate Image"):
         if prompt:
-            with st.spinner(f"Generating '{prompt}'... This will take several minutes."):
-                # The backend function now returns a FILE PATH
-                image_filepath = image_gen.generate_image(prompt)
-                
-                # Check if the path is an error message or a real file
-                if image_filepath.startswith("Error"):
-                    st.error(image_filepath)
-                else:
-                    st.success("Generation complete!")
-                    st.image(image_filepath) # Display the real image
-                    memory_db.add_memory(f"User generated image with prompt: '{prompt}'")
+            job_ids.append(backend.submit_image(prompt, seed=None if random_seed else int(seed), profile=profile))
         else:
             st.warning("Please enter a prompt.")
 
+    active = False
+    try:
+        for job_id in reversed(job_ids):
+            job = backend.image_status(job_id)
+            if job is None:
+                continue
+            st.markdown(f"**{job['prompt']}** · seed {job['seed']} · {job['params']['profile']}")
+            if job["status"] == "queued":
+                active = True
+                position = job["queue_position"]
+                st.info(f"Queued (position {position + 1})." if position is not None else "Queued.")
+            elif job["status"] == "running":
+                active = True
+                batch = f" · batched with {job['batch_size'] - 1} other prompt(s)" if job["batch_size"] > 1 else ""
+                st.progress(job["progress"], text=f"Step {job['step']}/{job['total_steps']}{batch}")
+            elif job["status"] == "done":
+                image = backend.image_bytes(job_id)
+                if image is not None:
+                    st.image(image)
+                else:
+                    st.caption("This image has since been evicted from the cache; generate it again with the same seed.")
+            elif job["status"] == "failed":
+                st.error(f"An error occurred: {job['error']}")
+            else:
+                st.caption("Cancelled.")
+            if job["status"] in ("queued", "running"):
+                if st.button("Cancel", key=f"cancel_{job_id}"):
+                    backend.cancel_image(job_id)
+                    st.rerun()
+            elif job_id not in st.session_state.setdefault("image_jobs_logged", set()):
+                st.session_state["image_jobs_logged"].add(job_id)
+                if job["status"] == "done":
+                    memory_db.add_memory(f"User generated image with prompt: '{job['prompt']}'")
+    except model_client.DaemonError as e:
+        active = False
+        if e.status_code is not None:
+            st.error(f"The model daemon couldn't report the image jobs: {e}")
+        else:
+            # The daemon went away, and its jobs with it: forget them and look for a backend again
+            job_ids.clear()
+            model_client.reprobe()
+            st.warning(f"Lost contact with the model daemon ({e}); its image jobs are gone.")
+
+    if active:
+        time.sleep(1)
+        st.rerun()
+
 def memories_page():
     if not st.session_state.get("auth"): st.warning("Access denied."); render_page("Login"); return
     st.title("📝 Memory Log")
-    memories = memory_db.list_memories()
-    if not memories: st.info("No memories recorded yet.")
+    col1, col2 = st.columns([0.6, 0.4])
+    with col1:
+        query = st.text_input("Search memories", placeholder="e.g. project, logged in")
+    with col2:
+        date_range = st.date_input("Date range", value=(), help="Leave empty to search all time.")
+    start = end = None
+    if len(date_range) >= 1:
+        start = datetime.datetime.combine(date_range[0], datetime.time.min)
+        end = datetime.datetime.combine(date_range[-1], datetime.time.min) + datetime.timedelta(days=1)
+
+    # Keyset pagination: keep the cursor of every page we've moved past, reset on new filters
+    filters = (query, start, end)
+    if st.session_state.get("memory_filters") != filters:
+        st.session_state["memory_filters"] = filters
+        st.session_state["memory_cursors"] = [None]
+    cursors = st.session_state["memory_cursors"]
+
+    memories, next_cursor = memory_db.search_memories(query, start, end, cursor=cursors[-1], limit=50)
+    if not memories: st.info("No memories found." if query or start else "No memories recorded yet.")
     else:
         for mem in memories:
             st.markdown(f"**{mem.timestamp.strftime('%Y-%m-%d %H:%M:%S')}** - `{mem.content}`")
 
+    col1, col2 = st.columns(2)
+    with col1:
+        if len(cursors) > 1 and st.button("← Newer"):
+            cursors.pop(); st.rerun()
+    with col2:
+        if next_cursor is not None and st.button("Older →"):
+            cursors.append(next_cursor); st.rerun()
+
+    with st.expander("Archive"):
+        stats = memory_retention.archive_stats()
+        st.markdown(f"{stats['rows']} archived memories in {stats['segments']} monthly segments "
+                    f"({stats['bytes'] / 1e6:.1f} MB)" + (f", {stats['oldest']} to {stats['newest']}." if stats["rows"] else "."))
+        if query or start:
+            archived = memory_retention.search_archive(query, start, end, limit=50)
+            for mem in archived:
+                st.markdown(f"**{mem.timestamp.strftime('%Y-%m-%d %H:%M:%S')}** - `{mem.content}`")
+        counts = memory_retention.rollup_counts(start.date() if start else None, end.date() if end else None)
+        if counts:
+            st.markdown("Archived events per day")
+            st.dataframe(counts[:500], use_container_width=True)
+        if st.button("Compact now"):
+            with st.spinner("Archiving old memories..."):
+                report = memory_retention.compact()
+            if "skipped" in report: st.info(f"Skipped: {report['skipped']}.")
+            else:
+                st.success(f"Moved {report.get('rolled_up', 0) + report.get('archived_by_age', 0) + report.get('archived_by_size', 0)} "
+                           f"memories to the archive; database {report['size_before']['file_bytes'] / 1e6:.1f} → "
+                           f"{report['size_after']['file_bytes'] / 1e6:.1f} MB.")
+
+def performance_page():
+    if not st.session_state.get("auth"): st.warning("Access denied."); render_page("Login"); return
+    st.title("📈 Performance")
+    st.markdown("Latency of backend operations since the app started.")
+    snapshot = metrics.snapshot()
+    if not snapshot["operations"]:
+        st.info("Nothing recorded yet. Use the other pages and come back.")
+    else:
+        st.dataframe([{"operation": name, **{key: round(value, 2) if isinstance(value, float) else value
+                                               for key, value in summary.items()}}
+                      for name, summary in snapshot["operations"].items()], use_container_width=True)
+    if snapshot["counters"]:
+        st.subheader("Counters")
+        st.table([{"counter": name, "value": value} for name, value in snapshot["counters"].items()])
+    with st.expander("Recent spans"):
+        st.dataframe(metrics.recent_spans(200), use_container_width=True)
+    if startup.first_render:
+        with st.expander("Startup"):
+            st.markdown(f"First render ({startup.first_render['page']}) after "
+                        f"{startup.first_render['seconds'] * 1000:.0f} ms with {startup.first_render['modules']} modules loaded.")
+            if startup.first_render["imports"]:
+                st.dataframe(startup.first_render["imports"], use_container_width=True)
+            else:
+                st.caption("Run with SAHILGPT_PROFILE_STARTUP=1 to see import time per module.")
+    col1, col2, col3 = st.columns(3)
+    col1.download_button("Export JSON", metrics.export_json(), file_name="sahilgpt_metrics.json",
+                         mime="application/json")
+    col2.download_button("Export Prometheus", metrics.export_prometheus(), file_name="sahilgpt_metrics.prom",
+                         mime="text/plain")
+    if col3.button("Reset"):
+        metrics.reset(); st.rerun()
+
 # --- Sidebar and Page Router ---
 with st.sidebar:
     st.title("SAHILGPT OS")
@@ -205,6 +486,7 @@ with st.sidebar:
         st.button("‍💻 Code Runner", on_click=render_page, args=("Code Runner",))
         st.button("🎨 Image Generation", on_click=render_page, args=("Image Generation",))
         st.button("📝 Memories", on_click=render_page, args=("Memories",))
+        st.button("📈 Performance", on_click=render_page, args=("Performance",))
         if st.button("Logout"): 
             st.session_state.clear()
             render_page("Home")
@@ -217,7 +499,13 @@ with st.sidebar:
 page_map = {
     "Home": home_page, "Enroll Face": enroll_page, "Login": login_page,
     "Dashboard": dashboard_page, "Chat": chat_page, "Code Runner": code_runner_page,
-    "Image Generation": image_gen_page, "Memories": memories_page
+    "Image Generation": image_gen_page, "Memories": memories_page,
+    "Performance": performance_page
 }
 page_to_render = page_map.get(st.session_state.get("page", "Home"))
-page_to_render()
\ No newline at end of file
+page_to_render()
+
+if st.session_state.get("auth"):
+    # Archive old memories in the background (once per process; not needed to show Home or Login)
+    memory_retention.start_background()
+startup.first_render_done(st.session_state.get("page", "Home"))
\ No newline at end of file